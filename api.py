@@ -0,0 +1,627 @@
+"""API local (HTTP/JSON) sobre o registro de riscos dos projetos
+
+Serviço asyncio, só com a biblioteca padrão, que expõe o mesmo modelo de dados do
+dashboard (o RegistroRiscos de `st.session_state.riscos`, carregado do banco) para
+outras ferramentas da rede local:
+
+    GET    /projetos
+    GET    /projetos/{id}
+    GET    /projetos/{id}/riscos?inicio=0&limite=100&classificacao=Alto&busca=texto
+    POST   /projetos/{id}/riscos
+    GET    /projetos/{id}/riscos/{risco_id}
+    PATCH  /projetos/{id}/riscos/{risco_id}
+    DELETE /projetos/{id}/riscos/{risco_id}
+    GET    /projetos/{id}/agregados?classificacao=Alto
+    GET    /projetos/{id}/ranking?criterio=residual|score&classificacao=Alto,Médio
+    POST   /projetos/{id}/relatorio
+    GET    /relatorios/{chave}
+    GET    /relatorios/{chave}/docx
+
+Os projetos ficam em um cache em memória compartilhado pelas requisições, validado
+pela versão do projeto no banco (incrementada a cada gravação, inclusive pelo
+dashboard): um projeto só é recarregado quando outro processo o alterou. As
+alterações feitas pela API são gravadas no banco e aplicadas no cache, e as
+respostas de agregados e ranking ficam guardadas até a próxima alteração.
+
+Uso:
+    python api.py --porta 8600
+    curl http://127.0.0.1:8600/projetos/1/ranking
+    curl -X PATCH -H "X-Usuario: SPU 1" -d '{"impacto_nivel": "Alto"}' http://127.0.0.1:8600/projetos/1/riscos/42
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from banco_dados import (
+    buscar_riscos, carregar_registro_riscos, estado_projeto, init_db, inserir_risco_db, atualizar_risco_db,
+    listar_projetos, registrar_acao, registrar_alteracao_risco, remover_risco_db
+)
+from motor_riscos import (
+    CLASSIFICACOES, ESCALAS_IMPACTO, ESCALAS_PROBABILIDADE, MatrizRiscos, calcular_risco_inerente,
+    classificar_risco
+)
+from relatorio import Document, GERENCIADOR_RELATORIOS
+
+PORTA_PADRAO = int(os.environ.get('SAROI_API_PORTA', 8600))
+TAMANHO_MAXIMO_CORPO = 1024 * 1024
+LIMITE_PADRAO_RISCOS = 100
+USUARIO_PADRAO = 'api'
+
+TIPO_JSON = 'application/json; charset=utf-8'
+TIPO_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Campos de um risco que a API aceita na criação e na edição
+CAMPOS_TEXTO_API = ('risco_chave', 'descricao', 'contexto_especifico', 'justificativa_fator_probabilidade')
+CAMPOS_ESCALARES_API = CAMPOS_TEXTO_API + ('impacto_nivel', 'probabilidade_nivel')
+CAMPOS_EDITAVEIS = CAMPOS_ESCALARES_API + ('modalidades', 'justificativas_modalidades')
+
+logger = logging.getLogger(__name__)
+
+
+class ErroApi(Exception):
+    """Erro que vira uma resposta JSON {"erro": mensagem} com o status informado"""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+def _converter_json(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"{type(valor).__name__} não é serializável em JSON")
+
+
+def codificar_json(dados):
+    return json.dumps(dados, ensure_ascii=False, default=_converter_json).encode('utf-8')
+
+
+def resposta_json(dados, status=200):
+    return status, codificar_json(dados), TIPO_JSON
+
+
+class ProjetoEmCache:
+    """Registro de riscos de um projeto em memória, com os dados derivados calculados sob demanda"""
+
+    def __init__(self, projeto_id, nome, versao, riscos, modalidades):
+        self.projeto_id = projeto_id
+        self.nome = nome
+        self.versao = versao
+        self.riscos = riscos
+        self.modalidades = modalidades
+        self.invalidar()
+
+    def invalidar(self):
+        """Descarta os dados derivados dos riscos (após uma alteração)"""
+        self._posicoes = None
+        self._matriz = None
+        self._classificacoes = None
+        self.respostas = {}
+
+    @property
+    def posicoes(self):
+        """id do risco -> posição no registro"""
+        if self._posicoes is None:
+            self._posicoes = {risco.get('id'): i for i, risco in enumerate(self.riscos)}
+        return self._posicoes
+
+    @property
+    def matriz(self):
+        if self._matriz is None:
+            self._matriz = MatrizRiscos.de_riscos(self.riscos, self.modalidades)
+        return self._matriz
+
+    @property
+    def classificacoes(self):
+        if self._classificacoes is None:
+            self._classificacoes = np.array([risco.get('classificacao') for risco in self.riscos], dtype=object)
+        return self._classificacoes
+
+    def indices(self, classes):
+        """Posições dos riscos das classificações informadas (None = todos)"""
+        if not classes:
+            return None
+        return np.flatnonzero(np.isin(self.classificacoes, list(classes)))
+
+    def risco(self, risco_id):
+        posicao = self.posicoes.get(risco_id)
+        if posicao is None:
+            raise ErroApi(404, f"Risco {risco_id} não encontrado no projeto {self.projeto_id}")
+        return posicao, self.riscos[posicao]
+
+
+class CacheProjetos:
+    """Projetos carregados, compartilhados pelas requisições e validados pela versão no banco"""
+
+    def __init__(self):
+        self._projetos = {}
+        self._carregando = {}
+        self._locks = {}
+
+    async def obter(self, projeto_id):
+        estado = await asyncio.to_thread(estado_projeto, projeto_id)
+        if estado is None:
+            raise ErroApi(404, f"Projeto {projeto_id} não encontrado")
+        projeto = self._projetos.get(projeto_id)
+        if projeto is not None and projeto.versao == estado[1]:
+            return projeto
+
+        # Uma única carga por projeto, mesmo com várias requisições esperando por ela
+        tarefa = self._carregando.get(projeto_id)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(self._carregar(projeto_id))
+            self._carregando[projeto_id] = tarefa
+            tarefa.add_done_callback(lambda _: self._carregando.pop(projeto_id, None))
+        return await asyncio.shield(tarefa)
+
+    async def _carregar(self, projeto_id):
+        def carregar():
+            # A versão é lida antes dos riscos: uma gravação no meio da carga só provoca outra carga
+            estado = estado_projeto(projeto_id)
+            if estado is None:
+                return None
+            return estado, carregar_registro_riscos(projeto_id)
+
+        carregado = await asyncio.to_thread(carregar)
+        if carregado is None:
+            raise ErroApi(404, f"Projeto {projeto_id} não encontrado")
+        (nome, versao), (riscos, modalidades) = carregado
+        projeto = ProjetoEmCache(projeto_id, nome, versao, riscos, modalidades)
+        self._projetos[projeto_id] = projeto
+        return projeto
+
+    @asynccontextmanager
+    async def alteracao(self, projeto_id):
+        """Projeto para uma alteração: as gravações de um mesmo projeto são feitas uma de cada vez
+
+        Se a gravação avançou a versão do banco em exatamente um passo, as alterações
+        feitas no projeto dentro do bloco valem para o cache; se outro processo também
+        gravou (ou o bloco falhou depois de gravar), o projeto é descartado e recarregado
+        na próxima requisição.
+        """
+        async with self.lock(projeto_id):
+            projeto = await self.obter(projeto_id)
+            versao = projeto.versao
+            concluido = False
+            try:
+                yield projeto
+                concluido = True
+            finally:
+                estado = await asyncio.to_thread(estado_projeto, projeto_id)
+                versao_atual = estado[1] if estado is not None else None
+                if concluido and versao_atual in (versao, versao + 1):
+                    projeto.versao = versao_atual
+                    projeto.invalidar()
+                elif versao_atual != versao:
+                    self._descartar(projeto)
+
+    def lock(self, projeto_id):
+        """Lock das alterações do projeto: quem o detém vê o registro sem alterações em andamento"""
+        return self._locks.setdefault(projeto_id, asyncio.Lock())
+
+    def _descartar(self, projeto):
+        if self._projetos.get(projeto.projeto_id) is projeto:
+            del self._projetos[projeto.projeto_id]
+
+
+def _inteiro(valor, nome, minimo=0):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ErroApi(400, f"'{nome}' deve ser um número inteiro") from None
+    if numero < minimo:
+        raise ErroApi(400, f"'{nome}' deve ser pelo menos {minimo}")
+    return numero
+
+
+def _classes(consulta):
+    """Classificações pedidas em ?classificacao= (repetido ou separado por vírgulas)"""
+    classes = [classe.strip() for valor in consulta.get('classificacao', ()) for classe in valor.split(',')]
+    classes = [classe for classe in classes if classe]
+    invalidas = set(classes) - set(CLASSIFICACOES)
+    if invalidas:
+        raise ErroApi(400, f"Classificação inválida: {', '.join(sorted(invalidas))}")
+    return tuple(sorted(set(classes)))
+
+
+def _validar_campos(dados, modalidades):
+    """Valida o corpo de criação/edição de um risco, retornando só os campos aceitos"""
+    if not isinstance(dados, dict):
+        raise ErroApi(400, "O corpo deve ser um objeto JSON")
+    desconhecidos = set(dados) - set(CAMPOS_EDITAVEIS)
+    if desconhecidos:
+        raise ErroApi(400, f"Campos não aceitos: {', '.join(sorted(desconhecidos))}")
+
+    for campo in CAMPOS_TEXTO_API:
+        if campo in dados and not isinstance(dados[campo], str):
+            raise ErroApi(400, f"'{campo}' deve ser um texto")
+    if 'risco_chave' in dados and not dados['risco_chave'].strip():
+        raise ErroApi(400, "'risco_chave' não pode ser vazio")
+    if 'impacto_nivel' in dados and dados['impacto_nivel'] not in ESCALAS_IMPACTO:
+        raise ErroApi(400, f"'impacto_nivel' deve ser um de: {', '.join(ESCALAS_IMPACTO)}")
+    if 'probabilidade_nivel' in dados and dados['probabilidade_nivel'] not in ESCALAS_PROBABILIDADE:
+        raise ErroApi(400, f"'probabilidade_nivel' deve ser um de: {', '.join(ESCALAS_PROBABILIDADE)}")
+
+    for campo in ('modalidades', 'justificativas_modalidades'):
+        valores = dados.get(campo, {})
+        if not isinstance(valores, dict):
+            raise ErroApi(400, f"'{campo}' deve ser um objeto modalidade -> valor")
+        desconhecidas = set(valores) - set(modalidades)
+        if desconhecidas:
+            raise ErroApi(400, f"Modalidades inexistentes no projeto: {', '.join(sorted(desconhecidas))}")
+    for modalidade, fator in dados.get('modalidades', {}).items():
+        # null retira a modalidade do risco (não aplicável)
+        if fator is not None and (isinstance(fator, bool) or not isinstance(fator, (int, float))
+                                  or not 0 <= fator <= 1):
+            raise ErroApi(400, f"Fator de '{modalidade}' deve ser um número entre 0 e 1 (ou null)")
+    for modalidade, justificativa in dados.get('justificativas_modalidades', {}).items():
+        if not isinstance(justificativa, str):
+            raise ErroApi(400, f"Justificativa de '{modalidade}' deve ser um texto")
+    return dados
+
+
+def _avaliar(risco):
+    """Valores, risco inerente e classificação a partir dos níveis de impacto e probabilidade"""
+    risco['impacto_valor'] = ESCALAS_IMPACTO[risco['impacto_nivel']]['valor']
+    risco['probabilidade_valor'] = ESCALAS_PROBABILIDADE[risco['probabilidade_nivel']]['valor']
+    risco['risco_inerente'] = calcular_risco_inerente(risco['impacto_valor'], risco['probabilidade_valor'])
+    risco['classificacao'] = classificar_risco(risco['risco_inerente'])[0]
+
+
+def _agora():
+    return datetime.now().strftime("%d/%m/%Y %H:%M")
+
+
+def _estado_relatorio(tarefa):
+    return {
+        'chave': tarefa.chave,
+        'progresso': tarefa.progresso,
+        'etapa': tarefa.etapa,
+        'concluido': tarefa.finalizada and tarefa.erro is None,
+        'data_geracao': tarefa.data_geracao.isoformat(timespec='seconds') if tarefa.data_geracao else None,
+        'erro': tarefa.erro
+    }
+
+
+class ServicoApi:
+    """Rotas da API sobre o cache de projetos"""
+
+    def __init__(self):
+        self.cache = CacheProjetos()
+        self.rotas = [
+            (re.compile(padrao), metodos)
+            for padrao, metodos in (
+                (r'/projetos', {'GET': self.listar_projetos}),
+                (r'/projetos/(\d+)', {'GET': self.obter_projeto}),
+                (r'/projetos/(\d+)/riscos', {'GET': self.listar_riscos, 'POST': self.criar_risco}),
+                (r'/projetos/(\d+)/riscos/(\d+)', {
+                    'GET': self.obter_risco, 'PATCH': self.editar_risco, 'DELETE': self.remover_risco
+                }),
+                (r'/projetos/(\d+)/agregados', {'GET': self.agregados}),
+                (r'/projetos/(\d+)/ranking', {'GET': self.ranking}),
+                (r'/projetos/(\d+)/relatorio', {'POST': self.solicitar_relatorio}),
+                (r'/relatorios/([0-9a-f]+)', {'GET': self.estado_relatorio}),
+                (r'/relatorios/([0-9a-f]+)/docx', {'GET': self.baixar_relatorio}),
+            )
+        ]
+
+    async def despachar(self, metodo, alvo, cabecalhos, corpo):
+        """(status, corpo, tipo) da resposta a uma requisição"""
+        try:
+            partes = urlsplit(alvo)
+            caminho = unquote(partes.path).rstrip('/') or '/'
+            for padrao, metodos in self.rotas:
+                encontrado = padrao.fullmatch(caminho)
+                if encontrado is None:
+                    continue
+                rota = metodos.get(metodo)
+                if rota is None:
+                    raise ErroApi(405, f"Método {metodo} não permitido em {caminho}")
+                requisicao = {
+                    'consulta': parse_qs(partes.query),
+                    'usuario': cabecalhos.get('x-usuario') or USUARIO_PADRAO,
+                    'corpo': corpo
+                }
+                return await rota(requisicao, *(int(g) if g.isdigit() else g for g in encontrado.groups()))
+            raise ErroApi(404, f"Rota não encontrada: {caminho}")
+        except ErroApi as e:
+            return resposta_json({'erro': e.mensagem}, e.status)
+        except Exception:
+            logger.exception("Erro ao atender %s %s", metodo, alvo)
+            return resposta_json({'erro': "Erro interno"}, 500)
+
+    @staticmethod
+    def _json_corpo(requisicao):
+        try:
+            return json.loads(requisicao['corpo'] or b'{}')
+        except ValueError:
+            raise ErroApi(400, "Corpo não é um JSON válido") from None
+
+    async def listar_projetos(self, requisicao):
+        projetos = await asyncio.to_thread(listar_projetos)
+        return resposta_json([{'id': projeto_id, 'nome': nome} for projeto_id, nome in projetos])
+
+    async def obter_projeto(self, requisicao, projeto_id):
+        projeto = await self.cache.obter(projeto_id)
+        return resposta_json({
+            'id': projeto.projeto_id,
+            'nome': projeto.nome,
+            'versao': projeto.versao,
+            'modalidades': projeto.modalidades,
+            'total_riscos': len(projeto.riscos)
+        })
+
+    async def listar_riscos(self, requisicao, projeto_id):
+        consulta = requisicao['consulta']
+        inicio = _inteiro(consulta.get('inicio', ['0'])[0], 'inicio')
+        limite = _inteiro(consulta.get('limite', [LIMITE_PADRAO_RISCOS])[0], 'limite', minimo=1)
+        classes = _classes(consulta)
+        busca = consulta.get('busca', [''])[0].strip()
+
+        projeto = await self.cache.obter(projeto_id)
+        if busca:
+            ids = await asyncio.to_thread(buscar_riscos, projeto_id, busca)
+            posicoes = [projeto.posicoes[risco_id] for risco_id in ids if risco_id in projeto.posicoes]
+        else:
+            posicoes = range(len(projeto.riscos))
+        if classes:
+            posicoes = [i for i in posicoes if projeto.riscos[i].get('classificacao') in classes]
+
+        return resposta_json({
+            'total': len(posicoes),
+            'inicio': inicio,
+            'riscos': [projeto.riscos[i].como_dict() for i in posicoes[inicio:inicio + limite]]
+        })
+
+    async def obter_risco(self, requisicao, projeto_id, risco_id):
+        projeto = await self.cache.obter(projeto_id)
+        return resposta_json(projeto.risco(risco_id)[1].como_dict())
+
+    async def criar_risco(self, requisicao, projeto_id):
+        dados = self._json_corpo(requisicao)
+        async with self.cache.alteracao(projeto_id) as projeto:
+            dados = _validar_campos(dados, projeto.modalidades)
+            for campo in ('risco_chave', 'impacto_nivel', 'probabilidade_nivel'):
+                if campo not in dados:
+                    raise ErroApi(400, f"Campo obrigatório ausente: '{campo}'")
+
+            risco = {campo: dados.get(campo, "") for campo in CAMPOS_TEXTO_API}
+            risco['justificativa_fator_probabilidade'] = dados.get(
+                'justificativa_fator_probabilidade', risco['contexto_especifico']
+            )
+            risco.update(
+                impacto_nivel=dados['impacto_nivel'],
+                probabilidade_nivel=dados['probabilidade_nivel'],
+                modalidades={m: f for m, f in dados.get('modalidades', {}).items() if f is not None},
+                justificativas_modalidades=dict(dados.get('justificativas_modalidades', {})),
+                personalizado=True,
+                criado_por=requisicao['usuario'],
+                data_criacao=_agora()
+            )
+            _avaliar(risco)
+
+            def gravar():
+                risco['id'] = inserir_risco_db(projeto_id, risco)
+                registrar_alteracao_risco(requisicao['usuario'], "Criou risco", risco)
+
+            await asyncio.to_thread(gravar)
+            projeto.riscos.append(risco)
+        return resposta_json(projeto.riscos[-1].como_dict(), 201)
+
+    async def editar_risco(self, requisicao, projeto_id, risco_id):
+        dados = self._json_corpo(requisicao)
+        async with self.cache.alteracao(projeto_id) as projeto:
+            dados = _validar_campos(dados, projeto.modalidades)
+            posicao, anterior = projeto.risco(risco_id)
+
+            atual = anterior.copy()
+            for campo in CAMPOS_ESCALARES_API:
+                if campo in dados:
+                    atual[campo] = dados[campo]
+            fatores = atual['modalidades']
+            for modalidade, fator in dados.get('modalidades', {}).items():
+                if fator is None:
+                    fatores.pop(modalidade, None)
+                else:
+                    fatores[modalidade] = fator
+            atual['justificativas_modalidades'].update(dados.get('justificativas_modalidades', {}))
+            if atual.get('impacto_nivel') in ESCALAS_IMPACTO and atual.get('probabilidade_nivel') in ESCALAS_PROBABILIDADE:
+                _avaliar(atual)
+            atual['editado'] = True
+            atual['data_edicao'] = _agora()
+
+            def gravar():
+                atualizar_risco_db(anterior, atual)
+                registrar_alteracao_risco(requisicao['usuario'], "Editou risco", atual, anterior)
+
+            await asyncio.to_thread(gravar)
+            projeto.riscos[posicao] = atual
+        return resposta_json(atual.como_dict())
+
+    async def remover_risco(self, requisicao, projeto_id, risco_id):
+        async with self.cache.alteracao(projeto_id) as projeto:
+            posicao, risco = projeto.risco(risco_id)
+
+            def gravar():
+                remover_risco_db(risco_id)
+                registrar_acao(requisicao['usuario'], "Removeu risco",
+                               {'risco': risco.get('risco_chave'), 'id': risco_id})
+
+            await asyncio.to_thread(gravar)
+            del projeto.riscos[posicao]
+        return 204, b'', TIPO_JSON
+
+    async def agregados(self, requisicao, projeto_id):
+        classes = _classes(requisicao['consulta'])
+        projeto = await self.cache.obter(projeto_id)
+        chave = ('agregados', classes)
+        if chave not in projeto.respostas:
+            indices = projeto.indices(classes)
+            resultado = projeto.matriz.agregar(indices)
+            contagem = projeto.classificacoes if indices is None else projeto.classificacoes[indices]
+            projeto.respostas[chave] = codificar_json({
+                'projeto': projeto.nome,
+                'versao': projeto.versao,
+                'total_riscos': resultado.total_riscos,
+                'risco_inerente_total': resultado.risco_inerente_total,
+                'por_classificacao': {classe: int((contagem == classe).sum()) for classe in CLASSIFICACOES},
+                'modalidades': [{'modalidade': modalidade, **resultado.dados(j)}
+                                for j, modalidade in enumerate(resultado.modalidades)]
+            })
+        return 200, projeto.respostas[chave], TIPO_JSON
+
+    async def ranking(self, requisicao, projeto_id):
+        consulta = requisicao['consulta']
+        criterio = consulta.get('criterio', ['residual'])[0]
+        if criterio not in ('residual', 'score'):
+            raise ErroApi(400, "'criterio' deve ser 'residual' ou 'score'")
+        classes = _classes(consulta)
+        projeto = await self.cache.obter(projeto_id)
+        chave = ('ranking', criterio, classes)
+        if chave not in projeto.respostas:
+            resultado = projeto.matriz.agregar(projeto.indices(classes))
+            ordem = resultado.ranking if criterio == 'residual' else resultado.ranking_score
+            ordem = [j for j in ordem if resultado.riscos_aplicaveis[j] > 0]
+            projeto.respostas[chave] = codificar_json({
+                'projeto': projeto.nome,
+                'versao': projeto.versao,
+                'criterio': criterio,
+                'total_riscos': resultado.total_riscos,
+                'modalidade_recomendada': resultado.modalidades[ordem[0]] if ordem else None,
+                'ranking': [{'posicao': posicao, 'modalidade': resultado.modalidades[j], **resultado.dados(j)}
+                            for posicao, j in enumerate(ordem, 1)]
+            })
+        return 200, projeto.respostas[chave], TIPO_JSON
+
+    async def solicitar_relatorio(self, requisicao, projeto_id):
+        if Document is None:
+            raise ErroApi(501, "A geração de relatórios exige a biblioteca python-docx")
+        dados = self._json_corpo(requisicao)
+        identificacao = dados.get('identificacao', {}) if isinstance(dados, dict) else None
+        if not isinstance(identificacao, dict):
+            raise ErroApi(400, "'identificacao' deve ser um objeto (nome, unidade, orgao, email)")
+        identificacao = {campo: str(identificacao.get(campo, '')) for campo in ('nome', 'unidade', 'orgao', 'email')}
+
+        # O pedido (hash e cópia dos dados) roda fora do loop, com as alterações do projeto suspensas
+        async with self.cache.lock(projeto_id):
+            projeto = await self.cache.obter(projeto_id)
+            tarefa = await asyncio.to_thread(
+                GERENCIADOR_RELATORIOS.solicitar, projeto.riscos, projeto.modalidades, projeto.nome, identificacao,
+                versao=('api', projeto_id, projeto.versao)
+            )
+        return resposta_json(_estado_relatorio(tarefa), 202)
+
+    @staticmethod
+    def _tarefa(chave):
+        tarefa = GERENCIADOR_RELATORIOS.obter(chave)
+        if tarefa is None:
+            raise ErroApi(404, f"Relatório {chave} não encontrado (pode ter sido descartado do cache)")
+        return tarefa
+
+    async def estado_relatorio(self, requisicao, chave):
+        return resposta_json(_estado_relatorio(self._tarefa(chave)))
+
+    async def baixar_relatorio(self, requisicao, chave):
+        tarefa = self._tarefa(chave)
+        if tarefa.erro is not None:
+            raise ErroApi(500, f"Falha ao gerar o relatório: {tarefa.erro}")
+        if not tarefa.finalizada:
+            raise ErroApi(409, f"Relatório ainda em geração ({tarefa.progresso:.0%}: {tarefa.etapa})")
+        return 200, tarefa.conteudo, TIPO_DOCX
+
+
+async def _responder(escritor, status, corpo, tipo, manter_conexao):
+    cabecalho = (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: {tipo}\r\n"
+        f"Content-Length: {len(corpo)}\r\n"
+        f"Connection: {'keep-alive' if manter_conexao else 'close'}\r\n\r\n"
+    )
+    escritor.write(cabecalho.encode('latin-1') + corpo)
+    await escritor.drain()
+
+
+async def atender_conexao(servico, leitor, escritor):
+    """HTTP/1.1 mínimo: uma requisição por vez na conexão, com corpo por Content-Length"""
+    try:
+        while True:
+            try:
+                cabecalho = await leitor.readuntil(b'\r\n\r\n')
+            except asyncio.LimitOverrunError:
+                await _responder(escritor, 431, codificar_json({'erro': "Cabeçalhos muito grandes"}), TIPO_JSON, False)
+                break
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+
+            linhas = cabecalho.decode('latin-1').split('\r\n')
+            try:
+                metodo, alvo, versao_http = linhas[0].split(' ')
+            except ValueError:
+                await _responder(escritor, 400, codificar_json({'erro': "Requisição inválida"}), TIPO_JSON, False)
+                break
+            cabecalhos = {}
+            for linha in linhas[1:]:
+                nome, _, valor = linha.partition(':')
+                if nome:
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+
+            if 'transfer-encoding' in cabecalhos:
+                await _responder(escritor, 501, codificar_json({'erro': "Use Content-Length em vez de Transfer-Encoding"}),
+                                 TIPO_JSON, False)
+                break
+            try:
+                tamanho = int(cabecalhos.get('content-length', 0))
+            except ValueError:
+                tamanho = -1
+            if not 0 <= tamanho <= TAMANHO_MAXIMO_CORPO:
+                await _responder(escritor, 413, codificar_json({'erro': "Corpo ausente ou muito grande"}), TIPO_JSON, False)
+                break
+            corpo = await leitor.readexactly(tamanho) if tamanho else b''
+
+            # No HTTP/1.1 a conexão continua aberta, salvo "Connection: close"
+            conexao = cabecalhos.get('connection', '').lower()
+            manter_conexao = conexao != 'close' if versao_http == 'HTTP/1.1' else conexao == 'keep-alive'
+            status, corpo_resposta, tipo = await servico.despachar(metodo, alvo, cabecalhos, corpo)
+            await _responder(escritor, status, corpo_resposta, tipo, manter_conexao)
+            if not manter_conexao:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        escritor.close()
+
+
+async def servir(host='127.0.0.1', porta=PORTA_PADRAO):
+    init_db()
+    servico = ServicoApi()
+    servidor = await asyncio.start_server(lambda leitor, escritor: atender_conexao(servico, leitor, escritor), host, porta)
+    logger.info("API SAROI em http://%s:%s", host, porta)
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API local (HTTP/JSON) do registro de riscos SAROI")
+    parser.add_argument('--host', default='127.0.0.1', help="endereço de escuta (padrão: só a máquina local)")
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO, help="porta (padrão: SAROI_API_PORTA ou 8600)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(servir(args.host, args.porta))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -5,22 +5,39 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
 from datetime import datetime
-import sqlite3
-import hashlib
-import json
 import os
-from io import BytesIO
+import tempfile
+import uuid
+
+from banco_dados import (
+    init_db, verificar_login, registrar_acao, registrar_alteracao_risco, obter_logs, resumir_logs,
+    listar_usuarios_logs, listar_acoes_logs, descarregar_logs, arquivar_logs, estatisticas_logs,
+    habilitar_vacuum_incremental, estado_risco_log, RETENCAO_LOGS_DIAS,
+    carregar_registro_riscos, salvar_registro_riscos, limpar_registro_riscos,
+    inserir_risco_db, atualizar_risco_db, adicionar_modalidade_db, remover_modalidade_db,
+    obter_ou_criar_projeto, listar_projetos, resumir_portfolio, resumir_projetos,
+    buscar_riscos, registrar_aspectos_riscos, serie_atividade_logs
+)
+from graficos import (
+    figura_em_cache, criar_heatmap_modalidades_melhorado, criar_heatmap_eficacia_melhorado,
+    criar_faixas_simulacao, criar_tornado_sensibilidade
+)
+from motor_riscos import (
+    ESCALAS_IMPACTO, ESCALAS_PROBABILIDADE,
+    AgregadosModalidades, MatrizRiscos, calcular_risco_inerente, classificar_risco, classificar_riscos
+)
+from exportacao import FORMATOS_EXPORTACAO, formatos_disponiveis
+from importacao import ImportadorRiscos, ler_planilha_em_lotes
+from registro_riscos import RegistroRiscos
+from otimizacao import AGRUPAMENTOS, METODOS, otimizar_modalidades
+from sensibilidade import analisar_sensibilidade
+from simulacao import ModeloIncerteza, simular
+
+from relatorio import Document, GERENCIADOR_RELATORIOS
 
 # É necessário instalar a biblioteca python-docx para gerar o relatório Word
-try:
-    from docx import Document
-    from docx.shared import Inches
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    from docx.enum.table import WD_ALIGN_VERTICAL
-    from docx.oxml.shared import OxmlElement, qn
-except ImportError:
+if Document is None:
     st.warning("⚠️ A biblioteca 'python-docx' não está instalada. A função de gerar relatórios em .docx estará desabilitada. Para habilitá-la, execute `pip install python-docx`.")
-    Document = None
 
 # Configuração da página
 st.set_page_config(
@@ -30,53 +47,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Escalas de avaliação baseadas na metodologia SAROI
-ESCALAS_IMPACTO = {
-    "Muito baixo": {
-        "valor": 1,
-        "descricao": "Degradação de operações causando impactos mínimos nos objetivos"
-    },
-    "Baixo": {
-        "valor": 2,
-        "descricao": "Degradação de operações causando impactos pequenos nos objetivos"
-    },
-    "Médio": {
-        "valor": 5,
-        "descricao": "Interrupção de operações causando impactos significativos mas recuperáveis"
-    },
-    "Alto": {
-        "valor": 8,
-        "descricao": "Interrupção de operações causando impactos de reversão muito difícil"
-    },
-    "Muito alto": {
-        "valor": 10,
-        "descricao": "Paralisação de operações causando impactos irreversíveis/catastróficos"
-    }
-}
-
-ESCALAS_PROBABILIDADE = {
-    "Muito baixa": {
-        "valor": 1,
-        "descricao": "Evento improvável de ocorrer. Não há elementos que indiquem essa possibilidade"
-    },
-    "Baixa": {
-        "valor": 2,
-        "descricao": "Evento raro de ocorrer. Poucos elementos indicam essa possibilidade"
-    },
-    "Média": {
-        "valor": 5,
-        "descricao": "Evento possível de ocorrer. Elementos indicam moderadamente essa possibilidade"
-    },
-    "Alta": {
-        "valor": 8,
-        "descricao": "Evento provável de ocorrer. Elementos indicam consistently essa possibilidade"
-    },
-    "Muito alta": {
-        "valor": 10,
-        "descricao": "Evento praticamente certo de ocorrer. Elementos indicam claramente essa possibilidade"
-    }
-}
-
 # Modalidades de mitigação padrão (baseadas na planilha fornecida)
 MODALIDADES_PADRAO = [
     "Permuta por imóvel já construído",
@@ -231,744 +201,156 @@ ASPECTOS_RISCOS = {
     }
 }
 
-# Funções para gerenciamento do banco de dados
-def init_db():
-    """Inicializa o banco de dados SQLite"""
-    conn = sqlite3.connect('riscos.db')
-    c = conn.cursor()
-    
-    # Tabela de usuários
-    c.execute('''CREATE TABLE IF NOT EXISTS usuarios
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 username TEXT UNIQUE NOT NULL,
-                 password_hash TEXT NOT NULL)''')
-    
-    # Tabela de logs de ações
-    c.execute('''CREATE TABLE IF NOT EXISTS logs
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                 username TEXT NOT NULL,
-                 acao TEXT NOT NULL,
-                 detalhes TEXT)''')
-    
-    # Inserir usuários padrão se não existirem
-    usuarios_padrao = [
-        ("SPU 1", hashlib.sha256("1234".encode()).hexdigest()),
-        ("SPU 2", hashlib.sha256("1234".encode()).hexdigest()),
-        ("SPU 3", hashlib.sha256("1234".encode()).hexdigest())
-    ]
-    
-    for usuario, senha_hash in usuarios_padrao:
-        try:
-            c.execute("INSERT INTO usuarios (username, password_hash) VALUES (?, ?)", 
-                      (usuario, senha_hash))
-        except sqlite3.IntegrityError:
-            pass  # Usuário já existe
-    
-    conn.commit()
-    conn.close()
+def marcar_dados_alterados(atualizar_agregados=None, atualizar_matriz=None):
+    """Invalida os resultados em cache após qualquer alteração em riscos ou modalidades
 
-def verificar_login(username, password):
-    """Verifica se as credenciais são válidas"""
-    conn = sqlite3.connect('riscos.db')
-    c = conn.cursor()
-    
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    c.execute("SELECT * FROM usuarios WHERE username = ? AND password_hash = ?", 
-              (username, password_hash))
-    
-    resultado = c.fetchone()
-    conn.close()
-    
-    return resultado is not None
+    `atualizar_agregados(agregados)` aplica a mesma alteração aos agregados por
+    modalidade e `atualizar_matriz(matriz)` à matriz de riscos, que continuam válidos
+    sem recálculo sobre todo o registro. Deve ser chamada depois da alteração em
+    st.session_state e antes de qualquer outra leitura dos agregados ou da matriz.
+    """
+    versao = st.session_state.get('versao_dados', 0)
+    st.session_state.versao_dados = versao + 1
+    cache = st.session_state.get('cache_agregados')
+    if atualizar_agregados is not None and cache is not None and cache['versao'] == versao:
+        atualizar_agregados(cache['agregados'])
+        cache.update(versao=versao + 1, resultado=None)
+    cache_matriz = st.session_state.get('cache_motor_riscos')
+    if atualizar_matriz is not None and cache_matriz is not None and cache_matriz['chave'][0] == versao:
+        atualizar_matriz(cache_matriz['matriz'])
+        cache_matriz['chave'] = (versao + 1, *cache_matriz['chave'][1:])
 
-def registrar_acao(username, acao, detalhes=None):
-    """Registra uma ação no log"""
-    conn = sqlite3.connect('riscos.db')
-    c = conn.cursor()
-    
-    c.execute("INSERT INTO logs (username, acao, detalhes) VALUES (?, ?, ?)",
-              (username, acao, json.dumps(detalhes) if detalhes else None))
-    
-    conn.commit()
-    conn.close()
+def obter_agregados():
+    """Agregados por modalidade do registro da sessão (recalculados só após alterações em lote)"""
+    versao = st.session_state.get('versao_dados', 0)
+    cache = st.session_state.get('cache_agregados')
+    if cache is None or cache['versao'] != versao:
+        agregados = AgregadosModalidades.de_riscos(st.session_state.riscos, st.session_state.modalidades)
+        cache = {'versao': versao, 'agregados': agregados, 'resultado': None}
+        st.session_state.cache_agregados = cache
+    return cache['agregados']
 
-def obter_logs():
-    """Obtém todos os logs do sistema"""
-    conn = sqlite3.connect('riscos.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT timestamp, username, acao, detalhes FROM logs ORDER BY timestamp DESC")
-    logs = c.fetchall()
-    conn.close()
+def obter_matriz_riscos():
+    """Retorna a matriz vetorizada dos riscos da sessão, reconstruída só quando os dados mudam"""
+    chave = (
+        st.session_state.get('versao_dados', 0),
+        len(st.session_state.riscos),
+        tuple(st.session_state.modalidades)
+    )
+    cache = st.session_state.get('cache_motor_riscos')
+    if cache is None or cache['chave'] != chave:
+        matriz = MatrizRiscos.de_riscos(st.session_state.riscos, st.session_state.modalidades)
+        cache = {'chave': chave, 'matriz': matriz}
+        st.session_state.cache_motor_riscos = cache
+    return cache['matriz']
+
+def obter_resultado_modalidades():
+    """Resultado agregado de todas as modalidades sobre todos os riscos (compartilhado pelas abas)"""
+    agregados = obter_agregados()
+    cache = st.session_state.cache_agregados
+    if cache['resultado'] is None:
+        cache['resultado'] = agregados.resultado()
+    return cache['resultado']
+
+def solicitar_relatorio_word():
+    """Inicia (ou reaproveita do cache) a geração do relatório Word com os dados atuais"""
+    # Identificação padrão do responsável, se o usuário não tiver informado outra
+    if st.session_state.get('identificacao_relatorio') is None:
+        st.session_state.identificacao_relatorio = {
+            'nome': st.session_state.user,
+            'unidade': 'Unidade Padrão',
+            'orgao': 'SPU',
+            'email': 'usuario@spu.gov.br'
+        }
     
-    return logs
+    # Identifica a sessão, o projeto e a versão dos seus dados: pedidos repetidos sem
+    # alterações não recalculam o hash nem copiam o registro
+    if 'sessao_relatorio' not in st.session_state:
+        st.session_state.sessao_relatorio = uuid.uuid4().hex
+    versao = (st.session_state.sessao_relatorio, st.session_state.projeto_id, st.session_state.get('versao_dados', 0))
+    
+    tarefa = GERENCIADOR_RELATORIOS.solicitar(
+        st.session_state.riscos,
+        st.session_state.modalidades,
+        st.session_state.get('nome_projeto', 'Projeto'),
+        st.session_state.identificacao_relatorio,
+        versao=versao
+    )
+    st.session_state.relatorio_chave = tarefa.chave
 
-def classificar_risco(valor_risco):
-    """Classifica o risco baseado no valor calculado"""
-    if valor_risco <= 10:
-        return "Baixo", "#28a745"
-    elif valor_risco <= 25:
-        return "Médio", "#ffc107"
+def exibir_relatorio_word():
+    """Mostra o progresso do relatório em geração ou o botão para baixá-lo"""
+    tarefa = GERENCIADOR_RELATORIOS.obter(st.session_state.relatorio_chave)
+    if tarefa is None:
+        del st.session_state['relatorio_chave']
+        return
+    
+    if not tarefa.finalizada:
+        acompanhar_relatorio_word()
+    elif tarefa.erro:
+        st.error(f"Erro ao gerar relatório: {tarefa.erro}")
     else:
-        return "Alto", "#dc3545"
+        nome_projeto_arquivo = st.session_state.get('nome_projeto', 'Projeto').replace(' ', '_')
+        st.download_button(
+            label="📥 Baixar Relatório Word",
+            data=tarefa.conteudo,
+            file_name=f"relatorio_riscos_{nome_projeto_arquivo}_{tarefa.data_geracao.strftime('%Y%m%d_%H%M')}.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            key="download_report_sidebar"
+        )
+        st.success("✅ Relatório gerado com sucesso!")
 
-def gerar_relatorio_word():
-    """Gera relatório completo e amplo em formato Word"""
-    if Document is None:
-        st.error("📋 A biblioteca python-docx não está instalada. Não é possível gerar o relatório.")
-        return None
-        
-    try:
-        # Obter nome do projeto da session_state
-        nome_projeto = st.session_state.get('nome_projeto', 'Projeto')
-        
-        # Criar documento
-        doc = Document()
-        
-        # Título principal com nome do projeto
-        title = doc.add_heading(f'RELATÓRIO EXECUTIVO DE AVALIAÇÃO DE RISCOS - {nome_projeto}', 0)
-        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # Subtítulo
-        subtitle = doc.add_heading("Metodologia - Análise Comparativa de Modalidades de Contratação", level=1)
-        subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # NOVO: Nome do Projeto como título dentro do documento
-        doc.add_heading(f"Projeto: {nome_projeto}", level=2)
-        doc.add_paragraph()
-        
-        # NOVA SEÇÃO: Informações do responsável pelo relatório
-        # Solicitar identificação do usuário se não estiver definida
-        if 'identificacao_relatorio' not in st.session_state or st.session_state.identificacao_relatorio is None:
-            st.session_state.identificacao_relatorio = {
-                'nome': st.session_state.user,
-                'unidade': 'Unidade Padrão',
-                'orgao': 'SPU',
-                'email': 'usuario@spu.gov.br'
-            }
-        
-        # Informações do relatório com identificação
-        info_para = doc.add_paragraph()
-        info_para.add_run("Data da Análise: ").bold = True
-        info_para.add_run(f"{datetime.now().strftime('%d/%m/%Y às %H:%M')}")
-        info_para.add_run("\nMetodologia: ").bold = True
-        info_para.add_run("Roteiro de Auditoria de Gestão de Riscos - SAROI")
-        info_para.add_run("\nVersão do Sistema: ").bold = True
-        info_para.add_run("2.0 - Análise Ampliada")
-        
-        # Adicionar informações do responsável
-        info_para.add_run("\n\nRESPONSÁVEL PELA ANÁLISE:").bold = True
-        info_para.add_run(f"\nNome: {st.session_state.identificacao_relatorio['nome']}")
-        info_para.add_run(f"\nUnidade: {st.session_state.identificacao_relatorio['unidade']}")
-        if st.session_state.identificacao_relatorio['orgao']:
-            info_para.add_run(f"\nÓrgão: {st.session_state.identificacao_relatorio['orgao']}")
-        if st.session_state.identificacao_relatorio['email']:
-            info_para.add_run(f"\nE-mail: {st.session_state.identificacao_relatorio['email']}")
-        
-        doc.add_paragraph()
-        
-        # 1. RESUMO EXECUTIVO
-        doc.add_heading('1. RESUMO EXECUTIVO', level=1)
-        
-        total_riscos = len(st.session_state.riscos)
-        riscos_altos = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Alto')
-        riscos_medios = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Médio')
-        riscos_baixos = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Baixo')
-        risco_inerente_total = sum(r['risco_inerente'] for r in st.session_state.riscos)
-        
-        # Calcular melhor e pior modalidade
-        risco_acumulado_por_modalidade = {}
-        for modalidade in st.session_state.modalidades:
-            risco_residual_total = 0
-            for risco in st.session_state.riscos:
-                if modalidade in risco['modalidades']:
-                    fator_mitigacao = risco['modalidades'][modalidade]
-                    risco_residual = risco['risco_inerente'] * fator_mitigacao
-                    risco_residual_total += risco_residual
-            risco_acumulado_por_modalidade[modalidade] = risco_residual_total
-        
-        melhor_modalidade = min(risco_acumulado_por_modalidade.keys(), 
-                               key=lambda x: risco_acumulado_por_modalidade[x])
-        pior_modalidade = max(risco_acumulado_por_modalidade.keys(), 
-                             key=lambda x: risco_acumulado_por_modalidade[x])
-        
-        # Tabela de Métricas Principais
-        doc.add_paragraph("MÉTRICAS PRINCIPAIS DO PROJETO:")
-        
-        df_metricas = pd.DataFrame({
-            "Métrica": ["Total de Riscos Analisados", "Riscos ALTOS", "Riscos MÉDIOS", "Riscos BAIXOS", "Risco Inerente Total"],
-            "Valor": [
-                f"{total_riscos}",
-                f"{riscos_altos} ({riscos_altos/total_riscos*100:.1f}%)",
-                f"{riscos_medios} ({riscos_medios/total_riscos*100:.1f}%)",
-                f"{riscos_baixos} ({riscos_baixos/total_riscos*100:.1f}%)",
-                f"{risco_inerente_total:.1f} pontos"
-            ]
-        })
-        
-        # Create a table and add data from the DataFrame
-        table_metrics = doc.add_table(df_metricas.shape[0] + 1, df_metricas.shape[1])
-        table_metrics.style = 'Table Grid'
-        
-        # Add headers
-        for j in range(df_metricas.shape[-1]):
-            table_metrics.cell(0, j).text = df_metricas.columns[j]
-        
-        # Add rows
-        for i in range(df_metricas.shape[0]):
-            row_cells = table_metrics.rows[i + 1].cells
-            for j in range(df_metricas.shape[-1]):
-                cell = row_cells[j]
-                cell.text = str(df_metricas.values[i, j])
-                
-                # Apply cell shading based on risk classification
-                if df_metricas.values[i, 0] == "Riscos ALTOS":
-                    shading_color = 'FFDDE6' # Light Red
-                elif df_metricas.values[i, 0] == "Riscos MÉDIOS":
-                    shading_color = 'FFF2CC' # Light Yellow
-                elif df_metricas.values[i, 0] == "Riscos BAIXOS":
-                    shading_color = 'D4EDDA' # Light Green
-                else:
-                    shading_color = None
-                
-                if shading_color:
-                    tc = cell._element.tcPr
-                    tc_shd = OxmlElement('w:shd')
-                    tc_shd.set(qn('w:val'), 'clear')
-                    tc_shd.set(qn('w:fill'), shading_color)
-                    tc.append(tc_shd)
+@st.fragment(run_every=0.5)
+def acompanhar_relatorio_word():
+    """Atualiza a barra de progresso até o relatório ficar pronto"""
+    tarefa = GERENCIADOR_RELATORIOS.obter(st.session_state.get('relatorio_chave'))
+    if tarefa is None or tarefa.finalizada:
+        st.rerun()
+    st.progress(tarefa.progresso, text=f"Gerando relatório... {tarefa.etapa}")
 
-        # Space before next paragraph
-        doc.add_paragraph()
-        
-        resumo = f"""
-        RESULTADO DA ANÁLISE COMPARATIVA:
-        • MODALIDADE RECOMENDADA: {melhor_modalidade}
-          - Risco Residual: {risco_acumulado_por_modalidade[melhor_modalidade]:.1f} pontos
-        • MODALIDADE DE MAIOR RISCO: {pior_modalidade}
-          - Risco Residual: {risco_acumulado_por_modalidade[pior_modalidade]:.1f} pontos
-        • DIFERENÇA DE RISCO: {risco_acumulado_por_modalidade[pior_modalidade] - risco_acumulado_por_modalidade[melhor_modalidade]:.1f} pontos
-        """
-        doc.add_paragraph(resumo)
-        
-        # 2. METODOLOGIA DETALHADA
-        doc.add_heading('2. METODOLOGIA E CRITÉRIOS DE AVALIAÇÃO', level=1)
-        metodologia = """
-        A avaliação seguiu rigorosamente a metodologia estabelecida no "Roteiro de Auditoria de 
-        Gestão de Riscos", aplicando escalas quantitativas padronizadas e critérios objetivos.
-        
-        2.1 ESCALAS DE AVALIAÇÃO
-        
-        IMPACTO (Consequências para os objetivos):
-        • Muito baixo (1): Degradação mínima das operações
-        • Baixo (2): Degradação pequena, facilmente recuperável
-        • Médio (5): Interrupção significativa mas recuperável
-        • Alto (8): Interrupção grave, reversão muito difícil
-        • Muito alto (10): Paralisação com impactos irreversíveis
-        
-        PROBABILIDADE (Chance de ocorrência):
-        • Muito baixa (1): Evento improvável, sem elementos indicativos
-        • Baixa (2): Evento raro, poucos elementos indicam possibilidade
-        • Média (5): Evento possível, elementos moderadamente indicativos
-        • Alta (8): Evento provável, elementos consistentemente indicativos
-        • Muito alta (10): Evento praticamente certo, elementos claramente indicativos
-        
-        2.2 CÁLCULO DO RISCO INERENTE
-        
-        O risco inerente é calculado pela multiplicação: IMPACTO × PROBABILIDADE
-        
-        2.3 CLASSIFICAÇÃO DOS RISCOS
-        
-        • BAIXO: Risco inerente ≤ 10 pontos
-        • MÉDIO: Risco inerente entre 11 e 25 pontos  
-        • ALTO: Risco inerente > 25 pontos
-        
-        2.4 CÁLCULO DO RISCO RESIDUAL
-        
-        Para cada modalidade, o risco residual é calculado aplicando-se o fator de mitigação:
-        RISCO RESIDUAL = RISCO INERENTE × FATOR DE MITIGAÇÃO
-        
-        Onde o fator de mitigação varia de 0,0 (elimina totalmente o risco) a 1,0 (não mitiga o risco).
-        """
-        doc.add_paragraph(metodologia)
-        
-        # 3. ANÁLISE DETALHADA DOS RISCOS
-        doc.add_heading('3. ANÁLISE DETALHADA DOS RISCOS IDENTIFICADOS', level=1)
-        
-        for i, risco in enumerate(st.session_state.riscos, 1):
-            doc.add_heading(f'3.{i} {risco["risco_chave"]}', level=2)
-            
-            # Avaliação quantitativa
-            aval_para = doc.add_paragraph()
-            aval_para.add_run("\nAVALIAÇÃO QUANTITATIVA:").bold = True
-            aval_para.add_run(f"\n• Impacto: {risco['impacto_valor']} ({risco['impacto_nivel']})\n")
-            aval_para.add_run("Justificativa do risco: ").bold = True
-            aval_para.add_run(risco.get("descricao", ""))
-            aval_para.add_run(f"\n\n• Probabilidade: {risco['probabilidade_valor']} ({risco['probabilidade_nivel']})\n")
-            aval_para.add_run("Justificativa de Probabilidade de ocorrência: ").bold = True
-            aval_para.add_run(risco.get("contexto_especifico", ""))
-            aval_para.add_run(f"\n\n• Risco Inerente: {risco['risco_inerente']} pontos")
-            aval_para.add_run(f"\n• Classificação: {risco['classificacao']}")
-            
-            # Análise por modalidade - AGORA EM TABELA
-            doc.add_heading('3.x Análise por Modalidade', level=3)
-            
-            table = doc.add_table(rows=1, cols=5)
-            table.style = 'Table Grid'
-            
-            hdr_cells = table.rows[0].cells
-            hdr_cells[0].text = 'Modalidade'
-            hdr_cells[1].text = 'Fator de Mitigação'
-            hdr_cells[2].text = 'Risco Residual'
-            hdr_cells[3].text = 'Eficácia (%)'
-            hdr_cells[4].text = 'Justificativa'
-            
-            justificativas_modalidades = risco.get("justificativas_modalidades", {})
-            for modalidade, fator in risco['modalidades'].items():
-                risco_residual = risco['risco_inerente'] * fator
-                eficacia = (1 - fator) * 100
-                
-                row_cells = table.add_row().cells
-                row_cells[0].text = modalidade
-                row_cells[1].text = f"{fator:.1f}"
-                row_cells[2].text = f"{risco_residual:.1f} ({classificar_risco(risco_residual)[0]})"
-                row_cells[3].text = f"{eficacia:.1f}%"
-                row_cells[4].text = justificativas_modalidades.get(modalidade, "")
-        
-        # 4. ANÁLISE COMPARATIVA DAS MODALIDADES
-        doc.add_heading('4. ANÁLISE COMPARATIVA DAS MODALIDADES', level=1)
-        
-        # Calcular dados comparativos detalhados
-        dados_comparativos = {}
-        
-        for modalidade in st.session_state.modalidades:
-            risco_residual_total = 0
-            risco_inerente_aplicavel = 0
-            count_riscos = 0
-            
-            for risco in st.session_state.riscos:
-                if modalidade in risco['modalidades']:
-                    fator_mitigacao = risco['modalidades'][modalidade]
-                    risco_residual = risco['risco_inerente'] * fator_mitigacao
-                    risco_residual_total += risco_residual
-                    risco_inerente_aplicavel += risco['risco_inerente']
-                    count_riscos += 1
-            
-            eficacia_total = ((risco_inerente_aplicavel - risco_residual_total) / risco_inerente_aplicavel * 100) if risco_inerente_aplicavel > 0 else 0
-            
-            dados_comparativos[modalidade] = {
-                'risco_residual_total': risco_residual_total,
-                'risco_inerente_aplicavel': risco_inerente_aplicavel,
-                'eficacia_percentual': eficacia_total,
-                'classificacao': classificar_risco(risco_residual_total)[0],
-                'riscos_aplicaveis': count_riscos
-            }
-        
-        # Tabela comparativa principal
-        doc.add_heading('4.1 Quadro Comparativo Consolidado', level=2)
-        
-        table = doc.add_table(rows=1, cols=6)
-        table.style = 'Table Grid'
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = 'Ranking'
-        hdr_cells[1].text = 'Modalidade'
-        hdr_cells[2].text = 'Risco Residual Total'
-        hdr_cells[3].text = 'Eficácia Mitigação (%)'
-        hdr_cells[4].text = 'Classificação Final'
-        hdr_cells[5].text = 'Riscos Aplicáveis'
-        
-        # Ordenar modalidades por risco residual
-        modalidades_ordenadas = sorted(dados_comparativos.items(), 
-                                       key=lambda x: x[1]['risco_residual_total'])
-        
-        for i, (modalidade, dados) in enumerate(modalidades_ordenadas, 1):
-            row_cells = table.add_row().cells
-            row_cells[0].text = f"{i}º"
-            row_cells[1].text = modalidade
-            row_cells[2].text = f"{dados['risco_residual_total']:.1f}"
-            row_cells[3].text = f"{dados['eficacia_percentual']:.1f}%"
-            row_cells[4].text = dados['classificacao']
-            row_cells[5].text = f"{dados['riscos_aplicaveis']}/{total_riscos}"
-        
-        # 4.2 Análise de Performance
-        doc.add_heading('4.2 Análise de Performance por Modalidade', level=2)
-        
-        for i, (modalidade, dados) in enumerate(modalidades_ordenadas, 1):
-            posicao_texto = "RECOMENDADA" if i == 1 else "NÃO RECOMENDADA" if i == len(modalidades_ordenadas) else f"{i}ª COLOCADA"
-            
-            performance_para = doc.add_paragraph()
-            performance_para.add_run(f"{modalidade} - {posicao_texto}").bold = True
-            performance_para.add_run(f"""
-            • Risco Residual Total: {dados['risco_residual_total']:.1f} pontos
-            • Eficácia de Mitigação: {dados['eficacia_percentual']:.1f}%
-            • Classificação de Risco: {dados['classificacao']}
-            • Redução Absoluta do Risco: {dados['risco_inerente_aplicavel'] - dados['risco_residual_total']:.1f} pontos
-            • Riscos Aplicáveis: {dados['riscos_aplicaveis']} de {total_riscos} riscos
-            """)
-        
-        # 5. MATRIZ DETALHADA DE RISCOS
-        doc.add_heading('5. MATRIZ DETALHADA DE RISCOS POR MODALIDADE', level=1)
-        
-        # Criar tabela expandida
-        num_cols = 3 + len(st.session_state.modalidades)
-        table = doc.add_table(rows=1, cols=num_cols)
-        table.style = 'Table Grid'
-        
-        # Cabeçalhos
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = 'Risco'
-        hdr_cells[1].text = 'Impacto'
-        hdr_cells[2].text = 'Probabilidade'
-        for i, modalidade in enumerate(st.session_state.modalidades):
-            col_name = modalidade[:15] + "..." if len(modalidade) > 15 else modalidade
-            hdr_cells[3 + i].text = col_name
-        
-        # Dados por risco
-        for risco in st.session_state.riscos:
-            row_cells = table.add_row().cells
-            risco_name = risco['risco_chave'][:25] + "..." if len(risco['risco_chave']) > 25 else risco['risco_chave']
-            row_cells[0].text = risco_name
-            row_cells[1].text = str(risco['impacto_valor'])
-            row_cells[2].text = str(risco['probabilidade_valor'])
-            
-            for i, modalidade in enumerate(st.session_state.modalidades):
-                if modalidade in risco['modalidades']:
-                    fator = risco['modalidades'][modalidade]
-                    risco_residual = risco['risco_inerente'] * fator
-                    row_cells[3 + i].text = f"{risco_residual:.1f}"
-                else:
-                    row_cells[3 + i].text = "N/A"
-        
-        # Linha de totais
-        row_cells = table.add_row().cells
-        row_cells[0].text = "TOTAL ACUMULADO"
-        row_cells[1].text = "-"
-        row_cells[2].text = "-"
-        
-        for i, modalidade in enumerate(st.session_state.modalidades):
-            if modalidade in dados_comparativos:
-                row_cells[3 + i].text = f"{dados_comparativos[modalidade]['risco_residual_total']:.1f}"
-            else:
-                row_cells[3 + i].text = "N/A"
-        
-        # 6. RECOMENDAÇÕES E CONCLUSÕES
-        doc.add_heading('6. RECOMENDAÇÕES EXECUTIVAS', level=1)
-        
-        melhor_modalidade_dados = dados_comparativos[melhor_modalidade]
-        pior_modalidade_dados = dados_comparativos[pior_modalidade]
-        
-        recomendacoes = f"""
-        6.1 MODALIDADE RECOMENDADA
-        
-        Com base na análise quantitativa realizada, recomenda-se a adoção da modalidade:
-        "{melhor_modalidade}"
-        
-        JUSTIFICATIVAS TÉCNICAS:
-        • Menor risco residual acumulado: {melhor_modalidade_dados['risco_residual_total']:.1f} pontos
-        • Maior eficácia de mitigação: {melhor_modalidade_dados['eficacia_percentual']:.1f}%
-        • Classificação de Risco: {melhor_modalidade_dados['classificacao']}
-        • Redução Absoluta do Risco: {melhor_modalidade_dados['risco_inerente_aplicavel'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos
-        • Riscos Aplicáveis: {melhor_modalidade_dados['riscos_aplicaveis']} de {total_riscos} riscos
-        
-        6.2 MODALIDADES NÃO RECOMENDADAS
-        
-        A modalidade de maior risco identificada é:
-        "{pior_modalidade}"
-        
-        RAZÕES PARA NÃO RECOMENDAÇÃO:
-        • Maior risco residual acumulado: {pior_modalidade_dados['risco_residual_total']:.1f} pontos
-        • Menor eficácia de mitigação: {pior_modalidade_dados['eficacia_percentual']:.1f}%
-        • Classificação de Risco: {pior_modalidade_dados['classificacao']}
-        
-        6.3 IMPACTO DA ESCOLHA DA MODALIDADE
-        
-        A diferença entre a melhor e pior modalidade é de {pior_modalidade_dados['risco_residual_total'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos de risco, 
-        representando {(pior_modalidade_dados['risco_residual_total'] - melhor_modalidade_dados['risco_residual_total'])/risco_inerente_total*100:.1f}% 
-        do risco total do projeto.
-        
-        Esta diferença demonstra a importância crítica da escolha adequada da modalidade de contratação 
-        para o sucesso do empreendimento.
-        """
-        doc.add_paragraph(recomendacoes)
-        
-        # 7. CONCLUSÕES FINAIS
-        doc.add_heading('7. CONCLUSÕES E CONSIDERAÇÕES FINAIS', level=1)
-        
-        conclusoes = f"""
-        A presente análise, baseada na metodologia consolidada do SAROI, permitiu uma avaliação 
-        objetiva e fundamentada das modalidades de contratação disponíveis para o projeto.
-        
-        PRINCIPAIS RESULTADOS:
-        
-        1. RISCO TOTAL DO PROJETO: {risco_inerente_total:.1f} pontos (antes da mitigação)
-        
-        2. ESTRATÉGIA ÓTIMA IDENTIFICADA: {melhor_modalidade}
-            - Reduz o risco total para {melhor_modalidade_dados['risco_residual_total']:.1f} pontos
-            - Eficácia de mitigação de {melhor_modalidade_dados['eficacia_percentual']:.1f}%
-            - Redução absoluta de {melhor_modalidade_dados['risco_inerente_aplicavel'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos de risco
-            
-        3. AMPLITUDE DE VARIAÇÃO: As modalidades analisadas apresentam variação de risco residual 
-            de {pior_modalidade_dados['risco_residual_total'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos, 
-            evidenciando a relevância da escolha estratégica.
-            
-        4. CONFORMIDADE METODOLÓGICA: A análise seguiu integralmente os preceitos estabelecidos 
-            pelo SAROI para gestão de riscos em projetos públicos, garantindo objetividade e 
-            fundamentação técnica para a tomada de decisão.
-        
-        CONSIDERAÇÕES PARA IMPLEMENTAÇÃO:
-        
-        • A modalidade recomendada deve ser implementada observando-se os aspectos específicos 
-          identificados na análise de cada risco.
-        • Recomenda-se o monitoramento contínuo dos fatores de risco durante a execução do projeto.
-        • Os resultados desta análise devem ser revisados caso ocorram mudanças significativas 
-          no contexto do projeto ou nas condições de mercado.
-        
-        Esta análise fornece base técnica sólida e metodologicamente consistente para a tomada 
-        de decisão, em total conformidade com as melhores práticas de gestão de riscos estabelecidas 
-        pelos órgãos de controle.
-        """
-        doc.add_paragraph(conclusoes)
-        
-        # ANEXOS
-        doc.add_heading('ANEXOS', level=1)
-        
-        # Anexo I - Escalas utilizadas
-        doc.add_heading('ANEXO I - Escalas de Avaliação Utilizadas', level=2)
-        
-        escalas_texto = """
-        ESCALA DE IMPACTO:
-        1 - Muito baixo: Degradação de operações causando impactos mínimos nos objetivos
-        2 - Baixo: Degradação de operações causando impactos pequenos nos objetivos  
-        5 - Médio: Interrupção de operações causando impactos significativos mas recuperáveis
-        8 - Alto: Interrupção de operações causando impactos de reversão muito difícil
-        10 - Muito alto: Paralisação de operações causando impactos irreversíveis/catastróficos
-        
-        ESCALA DE PROBABILIDADE:
-        1 - Muito baixa: Evento improvável de ocorrer. Não há elementos que indiquem essa possibilidade
-        2 - Baixa: Evento raro de ocorrer. Poucos elementos indicam essa possibilidade
-        5 - Média: Evento possível de ocorrer. Elementos indicam moderadamente essa possibilidade  
-        8 - Alta: Evento provável de ocorrer. Elementos indicam consistentemente essa possibilidade
-        10 - Muito alta: Evento praticamente certo de ocorrer. Elementos indicam claramente essa possibilidade
-        """
-        doc.add_paragraph(escalas_texto)
-        
-        # Rodapé
-        doc.add_paragraph()
-        doc.add_paragraph("_" * 50)
-        rodape = doc.add_paragraph()
-        rodape.add_run("Relatório gerado automaticamente pelo Sistema de Avaliação de Riscos SAROI v2.0").italic = True
-        rodape.add_run(f"\nData e hora: {datetime.now().strftime('%d/%m/%Y às %H:%M')}")
-        rodape.add_run(f"\nResponsável: {st.session_state.identificacao_relatorio['nome']} - {st.session_state.identificacao_relatorio['unidade']}")
-        if st.session_state.identificacao_relatorio['orgao']:
-            rodape.add_run(f"\nUnidade: {st.session_state.identificacao_relatorio['unidade']}")
-        rodape.add_run(f"\nTotal de páginas estimadas: {len(doc.paragraphs) // 20 + 1}")
-        
-        # Salvar em buffer
-        buffer = BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        
-        return buffer
-        
-    except ImportError:
-        st.error("📋 Para gerar relatórios Word, instale a biblioteca python-docx: pip install python-docx")
-        return None
-    except Exception as e:
-        st.error(f"Erro ao gerar relatório: {str(e)}")
-        return None
+def exportar_dados(formato):
+    """Grava a exportação em um arquivo temporário (em lotes) e oferece o download
 
-def calcular_risco_inerente(impacto, probabilidade):
-    """Calcula o risco inerente (Impacto x Probabilidade)"""
-    return impacto * probabilidade
+    A exportação não monta o texto do registro inteiro em memória, mas o
+    st.download_button lê o arquivo gerado e guarda o conteúdo no armazenamento de
+    mídia do Streamlit: o arquivo completo ainda fica na memória do processo (uma
+    cópia, em bytes) enquanto o botão estiver na página.
+    """
+    exportador, extensao, mime = FORMATOS_EXPORTACAO[formato]
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, f"avaliacao_riscos.{extensao}")
+        with open(caminho, 'wb') as arquivo:
+            exportador(st.session_state.riscos, st.session_state.modalidades, arquivo)
+        with open(caminho, 'rb') as arquivo:
+            st.download_button(
+                label=f"📥 Baixar arquivo {formato}",
+                data=arquivo,
+                file_name=f"avaliacao_riscos.{extensao}",
+                mime=mime
+            )
 
-def criar_heatmap_modalidades_melhorado(riscos_comparacao):
-    """Cria heatmap melhorado com mais clareza visual"""
-    
-    # Preparar dados para o heatmap
-    dados_heatmap = []
-    modalidades = st.session_state.modalidades
-    
-    for risco in riscos_comparacao:
-        linha_risco = []
-        for modalidade in modalidades:
-            if modalidade in risco['modalidades']:
-                fator_mitigacao = risco['modalidades'][modalidade]
-                risco_residual = risco['risco_inerente'] * fator_mitigacao
-                linha_risco.append(risco_residual)
-            else:
-                linha_risco.append(0)
-        dados_heatmap.append(linha_risco)
-    
-    # Criar labels mais limpos
-    labels_riscos = []
-    for risco in riscos_comparacao:
-        nome = risco['risco_chave']
-        if len(nome) > 30:
-            # Tentar quebrar em palavras-chave
-            palavras = nome.split()
-            if len(palavras) > 3:
-                nome = " ".join(palavras[:3]) + "..."
-            else:
-                nome = nome[:30] + "..."
-        labels_riscos.append(nome)
-    
-    labels_modalidades = []
-    for mod in modalidades:
-        if len(mod) > 25:
-            # Abreviar modalidades longas
-            if "Permuta" in mod:
-                nome = mod.replace("Permuta por ", "P.").replace(" (terreno", "(t.")
-            elif "Build to Suit" in mod:
-                nome = "Build to Suit (União)"
-            elif "Contratação" in mod:
-                nome = "Contrat. c/ dação"
-            else:
-                nome = mod[:25] + "..."
-        else:
-            nome = mod
-        labels_modalidades.append(nome)
-    
-    # Criar figura com customização melhorada
-    fig = go.Figure(data=go.Heatmap(
-        z=dados_heatmap,
-        x=labels_modalidades,
-        y=labels_riscos,
-        colorscale=[
-            [0.0, '#00ff00'],    # Verde para risco zero/muito baixo
-            [0.3, '#90EE90'],    # Verde claro
-            [0.5, '#ffff00'],    # Amarelo para risco médio
-            [0.7, '#FFA500'],    # Laranja
-            [1.0, '#ff0000']     # Vermelho para risco alto
-        ],
-        showscale=True,
-        colorbar=dict(
-            title="Risco Residual",
-            tickmode="linear",
-            tick0=0,
-            dtick=10
-        ),
-        text=[[f"{val:.1f}" if val > 0 else "0" for val in linha] for linha in dados_heatmap],
-        texttemplate="%{text}",
-        textfont={"size": 10, "color": "black"},
-        hoverongaps=False,
-        hovertemplate="<b>%{y}</b><br>" +
-                      "Modalidade: %{x}<br>" +
-                      "Risco Residual: %{z:.1f}<br>" +
-                      "<extra></extra>"
-    ))
-    
-    # Melhorar layout
-    fig.update_layout(
-        title={
-            'text': "Mapa de Calor: Risco Residual por Modalidade",
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {'size': 16, 'color': 'darkblue'}
-        },
-        xaxis_title="Modalidades de Contratação",
-        yaxis_title="Riscos Identificados",
-        width=1000,
-        height=700,
-        font=dict(size=11),
-        xaxis=dict(tickangle=45, side="bottom"),
-        yaxis=dict(autorange="reversed"),  # Inverter ordem para melhor leitura
-        margin=dict(l=200, r=100, t=100, b=150)
-    )
-    
-    return fig
+def fechar_projeto():
+    """Descarta da sessão os dados do projeto ativo"""
+    for chave in ('projeto_id', 'riscos', 'modalidades', 'simulacao', 'otimizacao', 'relatorio_chave'):
+        st.session_state.pop(chave, None)
+    marcar_dados_alterados()
 
-def criar_heatmap_eficacia_melhorado(riscos_comparacao):
-    """Cria heatmap de eficácia melhorado"""
-    
-    # Preparar dados para eficácia
-    dados_eficacia = []
-    modalidades = st.session_state.modalidades
-    
-    for risco in riscos_comparacao:
-        linha_eficacia = []
-        for modalidade in modalidades:
-            if modalidade in risco['modalidades']:
-                fator_mitigacao = risco['modalidades'][modalidade]
-                eficacia = (1 - fator_mitigacao) * 100  # Percentual de redução
-                linha_eficacia.append(eficacia)
-            else:
-                linha_eficacia.append(0)
-        dados_eficacia.append(linha_eficacia)
-    
-    # Usar os mesmos labels do heatmap anterior para consistência
-    labels_riscos = []
-    for risco in riscos_comparacao:
-        nome = risco['risco_chave']
-        if len(nome) > 30:
-            palavras = nome.split()
-            if len(palavras) > 3:
-                nome = " ".join(palavras[:3]) + "..."
-            else:
-                nome = nome[:30] + "..."
-        labels_riscos.append(nome)
-    
-    labels_modalidades = []
-    for mod in modalidades:
-        if len(mod) > 25:
-            if "Permuta" in mod:
-                nome = mod.replace("Permuta por ", "P.").replace(" (terreno", "(t.")
-            elif "Build to Suit" in mod:
-                nome = "Build to Suit (União)"
-            elif "Contratação" in mod:
-                nome = "Contrat. c/ dação"
-            else:
-                nome = mod[:25] + "..."
-        else:
-            nome = mod
-        labels_modalidades.append(nome)
-    
-    # Criar figura
-    fig = go.Figure(data=go.Heatmap(
-        z=dados_eficacia,
-        x=labels_modalidades,
-        y=labels_riscos,
-        colorscale='RdYlGn',  # Vermelho-Amarelo-Verde (invertido para eficácia)
-        showscale=True,
-        colorbar=dict(
-            title="Eficácia (%)",
-            tickmode="linear",
-            tick0=0,
-            dtick=20
-        ),
-        text=[[f"{val:.0f}%" if val > 0 else "0%" for val in linha] for linha in dados_eficacia],
-        texttemplate="%{text}",
-        textfont={"size": 10, "color": "black"},
-        hoverongaps=False,
-        hovertemplate="<b>%{y}</b><br>" +
-                      "Modalidade: %{x}<br>" +
-                      "Eficácia: %{z:.1f}%<br>" +
-                      "<extra></extra>"
-    ))
-    
-    # Layout
-    fig.update_layout(
-        title={
-            'text': "Mapa de Calor: Eficácia de Mitigação por Modalidade",
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {'size': 16, 'color': 'darkblue'}
-        },
-        xaxis_title="Modalidades de Contratação",
-        yaxis_title="Riscos Identificados",
-        width=1000,
-        height=700,
-        font=dict(size=11),
-        xaxis=dict(tickangle=45, side="bottom"),
-        yaxis=dict(autorange="reversed"),
-        margin=dict(l=200, r=100, t=100, b=150)
-    )
-    
-    return fig
+def abrir_projeto(nome_projeto):
+    """Torna o projeto informado o projeto ativo da sessão, cadastrando-o se for novo"""
+    fechar_projeto()
+    st.session_state.nome_projeto = nome_projeto
+    st.session_state.projeto_id = obter_ou_criar_projeto(nome_projeto, st.session_state.user)
 
 def inicializar_dados():
-    """Inicializa os dados padrão do sistema"""
+    """Carrega o registro de riscos do banco, semeando-o com a planilha na primeira execução"""
     if 'riscos' not in st.session_state:
+        # Carregamento preguiçoso: o registro é lido do banco uma única vez por sessão
+        riscos, modalidades = carregar_registro_riscos(st.session_state.projeto_id)
+        if modalidades:
+            st.session_state.riscos = riscos
+            st.session_state.modalidades = modalidades
+            return
+        
         riscos_iniciais = [
             {
                 'risco_chave': 'Descumprimento do Prazo de entrega',
@@ -1205,18 +587,68 @@ def inicializar_dados():
             if 'contexto_especifico' not in risco or not risco['contexto_especifico']:
                 risco['contexto_especifico'] = risco['justificativa_fator_probabilidade']
         
-        st.session_state.riscos = riscos_iniciais
+        st.session_state.riscos = RegistroRiscos(riscos_iniciais)
+        st.session_state.modalidades = MODALIDADES_PADRAO.copy()
+        salvar_registro_riscos(st.session_state.projeto_id, st.session_state.riscos, st.session_state.modalidades)
         
     if 'modalidades' not in st.session_state:
         st.session_state.modalidades = MODALIDADES_PADRAO.copy()
 
+def importar_planilha_riscos():
+    """Importação em lote de riscos a partir de uma planilha Excel ou CSV"""
+    with st.expander("📥 Importar riscos de planilha (Excel/CSV)"):
+        st.caption(
+            "Colunas obrigatórias: **Risco**, **Impacto** e **Probabilidade** (nível da escala SAROI "
+            "ou o valor correspondente). Opcionais: **Descrição**, **Contexto**, uma coluna por modalidade "
+            "com o fator de mitigação (0 a 1; vazio = não se aplica) e colunas **Justificativa - <modalidade>**."
+        )
+        arquivo = st.file_uploader("Planilha:", type=['xlsx', 'xlsm', 'csv', 'txt'], key="arquivo_importacao")
+
+        if arquivo is not None and st.button("📥 Importar riscos", type="primary"):
+            importador = ImportadorRiscos(
+                st.session_state.projeto_id, st.session_state.modalidades, st.session_state.user
+            )
+            andamento = st.empty()
+            try:
+                resultado = importador.importar(
+                    ler_planilha_em_lotes(arquivo.name, arquivo),
+                    progresso=lambda r: andamento.caption(f"⏳ {r.linhas_lidas} linhas processadas...")
+                )
+            except (ValueError, KeyError, OSError) as e:
+                st.error(f"❌ Não foi possível importar a planilha: {e}")
+                return
+            andamento.empty()
+
+            if resultado.riscos:
+                st.session_state.riscos.extend(resultado.riscos)
+                marcar_dados_alterados(lambda agregados: agregados.adicionar_riscos(resultado.riscos))
+                # O log guarda só o resumo: os riscos importados já estão no banco
+                registrar_acao(
+                    st.session_state.user,
+                    "Importou riscos",
+                    {"arquivo": arquivo.name, "importados": resultado.importados,
+                     "rejeitados": len(resultado.rejeitadas)}
+                )
+
+            st.success(f"✅ {resultado.importados} riscos importados de {resultado.linhas_lidas} linhas.")
+            if resultado.colunas_ignoradas:
+                st.info(f"Colunas ignoradas: {', '.join(resultado.colunas_ignoradas)}")
+            if resultado.rejeitadas:
+                st.warning(f"⚠️ {len(resultado.rejeitadas)} linhas rejeitadas:")
+                st.dataframe(
+                    pd.DataFrame(resultado.rejeitadas, columns=['Linha', 'Motivo']),
+                    use_container_width=True, hide_index=True
+                )
+
 def cadastro_riscos():
     st.header("📝 Cadastro de Riscos")
     
     if st.session_state.riscos:
         st.info(f"💡 **{len(st.session_state.riscos)} riscos** da planilha já estão carregados. Use o formulário abaixo para adicionar novos riscos.")
         st.info("💡 **Dica:** Para personalizar riscos existentes conforme seu caso concreto, use a aba '✏️ Editar Riscos'")
-    
+
+    importar_planilha_riscos()
+
     with st.form("cadastro_risco"):
         col1, col2 = st.columns(2)
         
@@ -1321,14 +753,12 @@ def cadastro_riscos():
                 'data_criacao': datetime.now().strftime("%d/%m/%Y %H:%M")
             }
             
+            novo_risco['id'] = inserir_risco_db(st.session_state.projeto_id, novo_risco)
             st.session_state.riscos.append(novo_risco)
+            marcar_dados_alterados(lambda agregados: agregados.adicionar_risco(novo_risco))
             
-            # Registrar a ação no log
-            registrar_acao(
-                st.session_state.user, 
-                "Criou risco", 
-                {"risco": risco_chave, "detalhes": novo_risco}
-            )
+            # Registrar a ação no log (estado do risco no repositório de auditoria)
+            registrar_alteracao_risco(st.session_state.user, "Criou risco", novo_risco)
             
             st.success(f"✅ Risco '{risco_chave}' salvo com sucesso!")
             st.rerun()
@@ -1513,6 +943,9 @@ def editar_riscos():
         submitted = st.form_submit_button("💾 Salvar Alterações", type="primary")
         
         if submitted:
+            # Cópia do estado anterior para gravar no banco apenas o que mudou
+            risco_anterior = risco_atual.copy()
+            
             # Atualizar o risco
             st.session_state.riscos[indice_risco].update({
                 'impacto_nivel': novo_impacto_nivel,
@@ -1528,21 +961,15 @@ def editar_riscos():
                 'editado': True,
                 'data_edicao': datetime.now().strftime("%d/%m/%Y %H:%M")
             })
-            
-            # Registrar a ação no log
-            registrar_acao(
-                st.session_state.user, 
-                "Editou risco", 
-                {"risco": risco_atual['risco_chave'], "alteracoes": {
-                    "impacto_anterior": risco_atual['impacto_valor'],
-                    "impacto_novo": novo_impacto_valor,
-                    "probabilidade_anterior": risco_atual['probabilidade_valor'],
-                    "probabilidade_novo": nova_probabilidade_valor,
-                    "risco_inerente_anterior": risco_atual['risco_inerente'],
-                    "risco_inerente_novo": novo_risco_inerente
-                }}
+            atualizar_risco_db(risco_anterior, risco_atual)
+            marcar_dados_alterados(
+                lambda agregados: agregados.atualizar_risco(risco_anterior, risco_atual),
+                lambda matriz: matriz.atualizar_risco(indice_risco, risco_atual)
             )
             
+            # Registrar a ação no log (diferença em relação ao estado anterior)
+            registrar_alteracao_risco(st.session_state.user, "Editou risco", risco_atual, risco_anterior)
+            
             st.success(f"✅ Risco '{risco_atual['risco_chave']}' atualizado com sucesso!")
             st.rerun()
 
@@ -1566,8 +993,9 @@ def analise_riscos():
     
     with col2:
         filtro_busca = st.text_input(
-            "Buscar por nome do risco:",
-            placeholder="Digite parte do nome..."
+            "Buscar nos riscos:",
+            placeholder="Nome, descrição, contexto, justificativas...",
+            help="Busca sem diferenciar acentos em todos os textos do risco, dos mais aos menos relevantes"
         )
     
     with col3:
@@ -1576,17 +1004,24 @@ def analise_riscos():
             ["Todos", "Originais da planilha", "Personalizados", "Adicionados"]
         )
     
+    # Busca textual no índice do banco: riscos encontrados, na ordem de relevância
+    candidatos = enumerate(st.session_state.riscos)
+    if filtro_busca.strip():
+        posicoes = {risco['id']: indice for indice, risco in enumerate(st.session_state.riscos)}
+        candidatos = [
+            (posicoes[risco_id], st.session_state.riscos[posicoes[risco_id]])
+            for risco_id in buscar_riscos(st.session_state.projeto_id, filtro_busca)
+            if risco_id in posicoes
+        ]
+    
     # Aplicar filtros
     riscos_filtrados = []
-    for risco in st.session_state.riscos:
+    indices_filtrados = []
+    for indice, risco in candidatos:
         # Filtro por classificação
         if risco['classificacao'] not in filtro_classificacao:
             continue
         
-        # Filtro por busca
-        if filtro_busca and filtro_busca.lower() not in risco['risco_chave'].lower():
-            continue
-        
         # Filtro por tipo
         if filtro_tipo == "Originais da planilha" and (risco.get('personalizado', False) or risco.get('editado', False)):
             continue
@@ -1596,6 +1031,7 @@ def analise_riscos():
             continue
         
         riscos_filtrados.append(risco)
+        indices_filtrados.append(indice)
     
     if not riscos_filtrados:
         st.warning("Nenhum risco encontrado com os filtros aplicados.")
@@ -1610,41 +1046,49 @@ def analise_riscos():
         df_class = pd.DataFrame({'Classificação': classificacoes})
         contagem_class = df_class['Classificação'].value_counts()
         
-        fig_pizza = px.pie(
+        fig_pizza = figura_em_cache('pizza_classificacao', contagem_class, lambda: px.pie(
             values=contagem_class.values,
             names=contagem_class.index,
             title="Distribuição de Riscos por Classificação",
             color_discrete_map={"Baixo": "#28a745", "Médio": "#ffc107", "Alto": "#dc3545"}
-        )
+        ))
         st.plotly_chart(fig_pizza, use_container_width=True)
     
     with col2:
         # Gráfico de dispersão Impacto x Probabilidade
-        df_scatter = pd.DataFrame(riscos_filtrados)
-        
-        # Adicionar indicador de personalização
-        df_scatter['Tipo'] = df_scatter.apply(
-            lambda row: 'Personalizado' if row.get('editado', False)
-            else ('Adicionado' if row.get('personalizado', False) else 'Original'), 
-            axis=1
-        )
+        # Somente as colunas usadas no gráfico, com indicador de personalização
+        df_scatter = pd.DataFrame({
+            campo: [r[campo] for r in riscos_filtrados]
+            for campo in ('probabilidade_valor', 'impacto_valor', 'risco_inerente')
+        })
+        df_scatter['Tipo'] = [
+            'Personalizado' if r.get('editado', False)
+            else ('Adicionado' if r.get('personalizado', False) else 'Original')
+            for r in riscos_filtrados
+        ]
+        df_scatter['risco_chave'] = [r['risco_chave'] for r in riscos_filtrados]
+        df_scatter['classificacao'] = [r['classificacao'] for r in riscos_filtrados]
+        
+        def criar_dispersao():
+            fig = px.scatter(
+                df_scatter,
+                x='probabilidade_valor',
+                y='impacto_valor',
+                size='risco_inerente',
+                color='Tipo',
+                hover_data=['risco_chave', 'classificacao'],
+                title="Matriz de Riscos (Impacto x Probabilidade)",
+                labels={'probabilidade_valor': 'Probabilidade', 'impacto_valor': 'Impacto'},
+                color_discrete_map={
+                    "Original": "#6c757d", 
+                    "Personalizado": "#007bff", 
+                    "Adicionado": "#28a745"
+                }
+            )
+            fig.update_layout(xaxis_range=[0, 11], yaxis_range=[0, 11])
+            return fig
         
-        fig_scatter = px.scatter(
-            df_scatter,
-            x='probabilidade_valor',
-            y='impacto_valor',
-            size='risco_inerente',
-            color='Tipo',
-            hover_data=['risco_chave', 'classificacao'],
-            title="Matriz de Riscos (Impacto x Probabilidade)",
-            labels={'probabilidade_valor': 'Probabilidade', 'impacto_valor': 'Impacto'},
-            color_discrete_map={
-                "Original": "#6c757d", 
-                "Personalizado": "#007bff", 
-                "Adicionado": "#28a745"
-            }
-        )
-        fig_scatter.update_layout(xaxis_range=[0, 11], yaxis_range=[0, 11])
+        fig_scatter = figura_em_cache('dispersao_riscos', df_scatter, criar_dispersao)
         st.plotly_chart(fig_scatter, use_container_width=True)
     
     # Tabela detalhada
@@ -1704,24 +1148,14 @@ def analise_riscos():
     
     # Calcular risco residual para os riscos filtrados
     if len(riscos_filtrados) > 1:  # Só mostrar se há mais de um risco
-        risco_residual_rapido = {}
+        resultado_filtrado = obter_matriz_riscos().agregar(indices_filtrados)
         
-        for modalidade in st.session_state.modalidades:
-            risco_total = 0
-            count = 0
-            
-            for risco in riscos_filtrados:
-                if modalidade in risco['modalidades']:
-                    risco_residual = risco['risco_inerente'] * risco['modalidades'][modalidade]
-                    risco_total += risco_residual
-                    count += 1
-            
-            if count > 0:
-                risco_residual_rapido[modalidade] = risco_total
-        
-        if risco_residual_rapido:
+        if resultado_filtrado.riscos_aplicaveis.any():
             # Mostrar as 3 melhores e 3 piores modalidades
-            modalidades_ordenadas = sorted(risco_residual_rapido.items(), key=lambda x: x[1])
+            modalidades_ordenadas = [
+                (modalidade, dados['risco_residual_total'])
+                for modalidade, dados in resultado_filtrado.ordenadas(somente_aplicaveis=True)
+            ]
             
             col1, col2 = st.columns(2)
             
@@ -1768,49 +1202,39 @@ def comparacao_modalidades():
     st.subheader("📊 Risco Residual Acumulado por Modalidade")
     st.info("💡 **Risco Residual Acumulado** = Soma de todos os riscos residuais para cada modalidade. Representa o risco total ao escolher uma estratégia.")
     
-    risco_acumulado_por_modalidade = {}
-    risco_inerente_total = sum(risco['risco_inerente'] for risco in riscos_comparacao)
+    # Agregação vetorizada sobre o subconjunto selecionado
+    matriz = obter_matriz_riscos()
+    resultado = matriz.agregar(indices_selecionados)
+    risco_inerente_total = resultado.risco_inerente_total
     
-    # Calcular dados detalhados e acumulados
-    dados_comparacao = []
-    
-    for modalidade in st.session_state.modalidades:
-        risco_residual_total = 0
-        riscos_modalidade = []
-        
-        for risco in riscos_comparacao:
-            if modalidade in risco['modalidades']:
-                fator_mitigacao = risco['modalidades'][modalidade]
-                risco_residual = risco['risco_inerente'] * fator_mitigacao
-                risco_residual_total += risco_residual
-                classificacao_residual, _ = classificar_risco(risco_residual)
-                
-                dados_comparacao.append({
-                    'Modalidade': modalidade,
-                    'Risco': risco['risco_chave'],
-                    'Risco_Inerente': risco['risco_inerente'],
-                    'Fator_Mitigacao': fator_mitigacao,
-                    'Risco_Residual': risco_residual,
-                    'Classificacao_Residual': classificacao_residual,
-                    'Reducao_Percentual': (1 - fator_mitigacao) * 100
-                })
-                
-                riscos_modalidade.append({
-                    'risco': risco['risco_chave'],
-                    'inerente': risco['risco_inerente'],
-                    'fator': fator_mitigacao,
-                    'residual': risco_residual
-                })
-        
-        # Armazenar dados acumulados
+    risco_acumulado_por_modalidade = {}
+    for j, modalidade in enumerate(resultado.modalidades):
+        dados = resultado.dados(j)
         risco_acumulado_por_modalidade[modalidade] = {
-            'risco_residual_total': risco_residual_total,
-            'risco_inerente_total': sum(r['inerente'] for r in riscos_modalidade),
-            'eficacia_percentual': ((sum(r['inerente'] for r in riscos_modalidade) - risco_residual_total) / sum(r['inerente'] for r in riscos_modalidade) * 100) if riscos_modalidade else 0,
-            'classificacao_total': classificar_risco(risco_residual_total)[0],
-            'detalhes': riscos_modalidade
+            'risco_residual_total': dados['risco_residual_total'],
+            'risco_inerente_total': dados['risco_inerente_aplicavel'],
+            'eficacia_percentual': dados['eficacia_percentual'],
+            'classificacao_total': dados['classificacao'],
+            'score': dados['score']
         }
     
+    # Dados detalhados (formato longo: uma linha por modalidade x risco aplicável)
+    indices = np.asarray(indices_selecionados, dtype=int)
+    aplicavel = matriz.aplicavel[indices]
+    colunas, linhas = np.nonzero(aplicavel.T)
+    fatores = matriz.fatores[indices][linhas, colunas]
+    inerentes = matriz.inerente[indices][linhas]
+    residuais = inerentes * fatores
+    dados_comparacao = pd.DataFrame({
+        'Modalidade': np.asarray(resultado.modalidades, dtype=object)[colunas],
+        'Risco': np.asarray([r['risco_chave'] for r in riscos_comparacao], dtype=object)[linhas],
+        'Risco_Inerente': inerentes,
+        'Fator_Mitigacao': fatores,
+        'Risco_Residual': residuais,
+        'Classificacao_Residual': classificar_riscos(residuais),
+        'Reducao_Percentual': (1 - fatores) * 100
+    })
+    
     # Visualização do Risco Acumulado
     col1, col2 = st.columns(2)
     
@@ -1826,21 +1250,25 @@ def comparacao_modalidades():
             'Eficacia_Percentual': eficacias
         })
         
-        fig_acumulado = px.bar(
-            df_acumulado,
-            x='Modalidade',
-            y='Risco_Residual_Total',
-            color='Eficacia_Percentual',
-            title="Risco Residual ACUMULADO por Modalidade",
-            labels={'Risco_Residual_Total': 'Risco Residual Total'},
-            color_continuous_scale='RdYlGn'
-        )
-        fig_acumulado.update_xaxes(tickangle=45)
+        def criar_barras_acumulado():
+            fig = px.bar(
+                df_acumulado,
+                x='Modalidade',
+                y='Risco_Residual_Total',
+                color='Eficacia_Percentual',
+                title="Risco Residual ACUMULADO por Modalidade",
+                labels={'Risco_Residual_Total': 'Risco Residual Total'},
+                color_continuous_scale='RdYlGn'
+            )
+            fig.update_xaxes(tickangle=45)
+            return fig
+        
+        fig_acumulado = figura_em_cache('barras_acumulado', df_acumulado, criar_barras_acumulado)
         st.plotly_chart(fig_acumulado, use_container_width=True)
     
     with col2:
         # Gráfico de eficácia comparativa
-        fig_eficacia = px.bar(
+        fig_eficacia = figura_em_cache('barras_eficacia', df_acumulado, lambda: px.bar(
             df_acumulado.sort_values('Eficacia_Percentual', ascending=True),
             x='Eficacia_Percentual',
             y='Modalidade',
@@ -1849,7 +1277,7 @@ def comparacao_modalidades():
             labels={'Eficacia_Percentual': 'Eficácia (%)'},
             color='Eficacia_Percentual',
             color_continuous_scale='RdYlGn'
-        )
+        ))
         st.plotly_chart(fig_eficacia, use_container_width=True)
     
     # Ranking de modalidades baseado no risco acumulado
@@ -1864,7 +1292,7 @@ def comparacao_modalidades():
             'Risco_Inerente_Total': dados['risco_inerente_total'],
             'Eficacia_Percentual': dados['eficacia_percentual'],
             'Classificacao_Total': dados['classificacao_total'],
-            'Score': dados['eficacia_percentual'] - (dados['risco_residual_total'] / 10)  # Score considerando eficácia e risco residual
+            'Score': dados['score']  # Score considerando eficácia e risco residual
         })
     
     df_ranking = pd.DataFrame(ranking_data)
@@ -1897,10 +1325,8 @@ def comparacao_modalidades():
     st.subheader("💡 Insights Automáticos")
     
     if risco_acumulado_por_modalidade:
-        melhor_modalidade = min(risco_acumulado_por_modalidade.keys(), 
-                               key=lambda x: risco_acumulado_por_modalidade[x]['risco_residual_total'])
-        pior_modalidade = max(risco_acumulado_por_modalidade.keys(), 
-                             key=lambda x: risco_acumulado_por_modalidade[x]['risco_residual_total'])
+        melhor_modalidade = resultado.modalidades[resultado.indice_melhor]
+        pior_modalidade = resultado.modalidades[resultado.indice_pior]
         
         col1, col2 = st.columns(2)
         
@@ -1932,8 +1358,11 @@ def comparacao_modalidades():
         - Risco inerente total (sem mitigação): **{risco_inerente_total:.1f}**
         """)
     
+    if len(resultado.modalidades) >= 2:
+        sensibilidade_ranking(indices_selecionados, matriz)
+    
     # Gráfico de composição detalhada
-    if not pd.DataFrame(dados_comparacao).empty:
+    if not dados_comparacao.empty:
         st.subheader("📈 Mapas de Calor Avançados")
         
         # Criar abas para diferentes visualizações
@@ -1943,21 +1372,34 @@ def comparacao_modalidades():
             "📊 Composição Detalhada"
         ])
         
+        # Matrizes dos riscos selecionados (zero onde a modalidade não se aplica)
+        nomes_riscos = [r['risco_chave'] for r in riscos_comparacao]
+        residuais_selecionados = matriz.residuais[indices]
+        eficacias_selecionadas = (1 - matriz.fatores[indices]) * 100 * aplicavel
+        
         with tab_heatmap1:
-            # Heatmap de risco residual melhorado
-            fig_heatmap_residual = criar_heatmap_modalidades_melhorado(riscos_comparacao)
+            # Heatmap de risco residual melhorado (servido do cache quando os dados não mudaram)
+            fig_heatmap_residual = figura_em_cache(
+                'heatmap_residual',
+                (nomes_riscos, resultado.modalidades, residuais_selecionados),
+                lambda: criar_heatmap_modalidades_melhorado(nomes_riscos, resultado.modalidades, residuais_selecionados)
+            )
             st.plotly_chart(fig_heatmap_residual, use_container_width=True)
             st.info("💡 **Interpretação:** Valores menores (verde) indicam menor risco residual. Valores maiores (vermelho) indicam maior risco residual.")
         
         with tab_heatmap2:
             # Heatmap de eficácia melhorado
-            fig_heatmap_eficacia = criar_heatmap_eficacia_melhorado(riscos_comparacao)
+            fig_heatmap_eficacia = figura_em_cache(
+                'heatmap_eficacia',
+                (nomes_riscos, resultado.modalidades, eficacias_selecionadas),
+                lambda: criar_heatmap_eficacia_melhorado(nomes_riscos, resultado.modalidades, eficacias_selecionadas)
+            )
             st.plotly_chart(fig_heatmap_eficacia, use_container_width=True)
             st.info("💡 **Interpretação:** Valores maiores (verde) indicam maior eficácia na mitigação do risco. Valores menores (vermelho) indicam menor eficácia.")
         
         with tab_composicao:
             # Tabela detalhada de composição
-            df_composicao = pd.DataFrame(dados_comparacao)
+            df_composicao = dados_comparacao
             df_composicao_pivot = df_composicao.pivot_table(
                 index='Risco',
                 columns='Modalidade',
@@ -1981,13 +1423,14 @@ def dashboard_geral():
         return
     
     # Métricas gerais
-    total_riscos = len(st.session_state.riscos)
-    riscos_altos = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Alto')
-    riscos_medios = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Médio')
-    riscos_baixos = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Baixo')
+    agregados = obter_agregados()
+    total_riscos = agregados.total_riscos
+    riscos_altos = agregados.contagem_classificacao['Alto']
+    riscos_medios = agregados.contagem_classificacao['Médio']
+    riscos_baixos = agregados.contagem_classificacao['Baixo']
     
-    risco_medio_inerente = np.mean([r['risco_inerente'] for r in st.session_state.riscos])
-    risco_inerente_total = sum(r['risco_inerente'] for r in st.session_state.riscos)
+    risco_inerente_total = agregados.risco_inerente_total
+    risco_medio_inerente = risco_inerente_total / total_riscos
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -2006,30 +1449,17 @@ def dashboard_geral():
     st.subheader("🛡️ Análise de Risco Residual Acumulado por Modalidade")
     st.info("💡 **Risco Residual Acumulado** = Soma de todos os riscos residuais para cada modalidade considerando TODOS os riscos.")
     
-    # Calcular risco residual acumulado para todas as modalidades
+    # Resultado acumulado de todas as modalidades (cache compartilhado com as demais abas)
+    resultado = obter_resultado_modalidades()
     risco_residual_por_modalidade = {}
     
-    for modalidade in st.session_state.modalidades:
-        risco_residual_total = 0
-        count_riscos = 0
-        
-        for risco in st.session_state.riscos:
-            if modalidade in risco['modalidades']:
-                fator_mitigacao = risco['modalidades'][modalidade]
-                risco_residual = risco['risco_inerente'] * fator_mitigacao
-                risco_residual_total += risco_residual
-                count_riscos += 1
-        
-        if count_riscos > 0:
-            eficacia_total = ((sum(r['risco_inerente'] for r in st.session_state.riscos if modalidade in r['modalidades']) - risco_residual_total) / 
-                              sum(r['risco_inerente'] for r in st.session_state.riscos if modalidade in r['modalidades']) * 100)
-            
-            risco_residual_por_modalidade[modalidade] = {
-                'risco_residual_total': risco_residual_total,
-                'eficacia_percentual': eficacia_total,
-                'classificacao': classificar_risco(risco_residual_total)[0],
-                'count_riscos': count_riscos
-            }
+    for modalidade, dados in resultado.ordenadas(somente_aplicaveis=True):
+        risco_residual_por_modalidade[modalidade] = {
+            'risco_residual_total': dados['risco_residual_total'],
+            'eficacia_percentual': dados['eficacia_percentual'],
+            'classificacao': dados['classificacao'],
+            'count_riscos': dados['riscos_aplicaveis']
+        }
     
     # Visualizar riscos residuais acumulados
     col1, col2 = st.columns(2)
@@ -2076,7 +1506,7 @@ def dashboard_geral():
                 'Eficacia': eficacias
             })
             
-            fig_residual = px.bar(
+            fig_residual = figura_em_cache('barras_residual', df_residual, lambda: px.bar(
                 df_residual.sort_values('Risco_Residual_Total'),
                 x='Risco_Residual_Total',
                 y='Modalidade',
@@ -2085,7 +1515,7 @@ def dashboard_geral():
                 color='Eficacia',
                 color_continuous_scale='RdYlGn',
                 labels={'Risco_Residual_Total': 'Risco Residual Total'}
-            )
+            ))
             st.plotly_chart(fig_residual, use_container_width=True)
     
     # Tabela resumo de todas as modalidades
@@ -2149,24 +1579,18 @@ def dashboard_geral():
         # Eficácia média das modalidades (original, baseado em redução percentual)
         st.subheader("📈 Eficácia Média das Modalidades (Individual)")
         
-        eficacia_modalidades = {}
-        for modalidade in st.session_state.modalidades:
-            reducoes = []
-            for risco in st.session_state.riscos:
-                if modalidade in risco['modalidades']:
-                    fator = risco['modalidades'][modalidade]
-                    reducao = (1 - fator) * 100
-                    reducoes.append(reducao)
-            
-            if reducoes:
-                eficacia_modalidades[modalidade] = np.mean(reducoes)
+        eficacia_modalidades = {
+            modalidade: resultado.eficacia_media_individual[j]
+            for j, modalidade in enumerate(resultado.modalidades)
+            if resultado.riscos_aplicaveis[j] > 0
+        }
         
         if eficacia_modalidades:
             df_eficacia = pd.DataFrame(list(eficacia_modalidades.items()), 
                                        columns=['Modalidade', 'Eficácia (%)'])
             df_eficacia = df_eficacia.sort_values('Eficácia (%)', ascending=True)
             
-            fig_eficacia = px.bar(
+            fig_eficacia = figura_em_cache('barras_eficacia_individual', df_eficacia, lambda: px.bar(
                 df_eficacia,
                 x='Eficácia (%)',
                 y='Modalidade',
@@ -2174,7 +1598,7 @@ def dashboard_geral():
                 title="Eficácia Média Individual",
                 color='Eficácia (%)',
                 color_continuous_scale='RdYlGn'
-            )
+            ))
             st.plotly_chart(fig_eficacia, use_container_width=True)
     
     # Matriz de calor consolidada
@@ -2192,35 +1616,39 @@ def dashboard_geral():
             posicoes_riscos.append((x, y, risco['risco_chave']))
         
         # Criar heatmap
-        fig_matriz = go.Figure(data=go.Heatmap(
-            z=matriz_riscos[1:, 1:],  # Excluir linha/coluna 0
-            x=list(range(1, 11)),
-            y=list(range(1, 11)),
-            colorscale='Reds',
-            showscale=True
-        ))
+        def criar_matriz_calor():
+            fig = go.Figure(data=go.Heatmap(
+                z=matriz_riscos[1:, 1:],  # Excluir linha/coluna 0
+                x=list(range(1, 11)),
+                y=list(range(1, 11)),
+                colorscale='Reds',
+                showscale=True
+            ))
+        
+            # Adicionar linhas de grade para delimitar zonas de risco
+            fig.add_hline(y=2.5, line_dash="dash", line_color="blue", opacity=0.5)
+            fig.add_hline(y=5.5, line_dash="dash", line_color="orange", opacity=0.5)
+            fig.add_vline(x=2.5, line_dash="dash", line_color="blue", opacity=0.5)
+            fig.add_vline(x=5.5, line_dash="dash", line_color="orange", opacity=0.5)
+        
+            # Adicionar anotações para as zonas
+            fig.add_annotation(x=1.5, y=1.5, text="BAIXO", showarrow=False, 
+                                     font=dict(size=12, color="green"))
+            fig.add_annotation(x=8, y=8, text="ALTO", showarrow=False, 
+                                     font=dict(size=12, color="red"))
+            fig.add_annotation(x=4, y=4, text="MÉDIO", showarrow=False, 
+                                     font=dict(size=12, color="orange"))
+        
+            fig.update_layout(
+                title="Matriz de Calor - Concentração de Riscos",
+                xaxis_title="Probabilidade",
+                yaxis_title="Impacto",
+                width=700,
+                height=500
+            )
+            return fig
         
-        # Adicionar linhas de grade para delimitar zonas de risco
-        fig_matriz.add_hline(y=2.5, line_dash="dash", line_color="blue", opacity=0.5)
-        fig_matriz.add_hline(y=5.5, line_dash="dash", line_color="orange", opacity=0.5)
-        fig_matriz.add_vline(x=2.5, line_dash="dash", line_color="blue", opacity=0.5)
-        fig_matriz.add_vline(x=5.5, line_dash="dash", line_color="orange", opacity=0.5)
-        
-        # Adicionar anotações para as zonas
-        fig_matriz.add_annotation(x=1.5, y=1.5, text="BAIXO", showarrow=False, 
-                                 font=dict(size=12, color="green"))
-        fig_matriz.add_annotation(x=8, y=8, text="ALTO", showarrow=False, 
-                                 font=dict(size=12, color="red"))
-        fig_matriz.add_annotation(x=4, y=4, text="MÉDIO", showarrow=False, 
-                                 font=dict(size=12, color="orange"))
-        
-        fig_matriz.update_layout(
-            title="Matriz de Calor - Concentração de Riscos",
-            xaxis_title="Probabilidade",
-            yaxis_title="Impacto",
-            width=700,
-            height=500
-        )
+        fig_matriz = figura_em_cache('matriz_calor', matriz_riscos, criar_matriz_calor)
         
         st.plotly_chart(fig_matriz, use_container_width=True)
     except Exception as e:
@@ -2257,24 +1685,413 @@ def dashboard_geral():
                 delta=f"{amplitude_risco/risco_inerente_total*100:.1f}% do total"
             )
 
+def sensibilidade_ranking(indices_selecionados, matriz):
+    """Tornado das entradas que mais afetam (ou invertem) a liderança do ranking por Score"""
+    st.subheader("🌪️ Sensibilidade do Ranking")
+    st.info("💡 Cada impacto, probabilidade e fator de mitigação é deslocado um passo para baixo e para cima "
+            "(nível vizinho da escala SAROI ou ±0,1 no fator), um de cada vez. A **vantagem** é o Score da "
+            "melhor modalidade menos o da segunda colocada: barras que cruzam o zero trocam a melhor modalidade.")
+    
+    # Recalculada só quando os dados, as modalidades ou a seleção de riscos mudam
+    chave = (st.session_state.get('versao_dados', 0), tuple(st.session_state.modalidades), tuple(indices_selecionados))
+    cache = st.session_state.get('cache_sensibilidade')
+    if cache is None or cache['chave'] != chave:
+        cache = {'chave': chave, 'resultado': analisar_sensibilidade(
+            st.session_state.riscos, st.session_state.modalidades, indices_selecionados, matriz=matriz
+        )}
+        st.session_state.cache_sensibilidade = cache
+    sensibilidade = cache['resultado']
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Melhor modalidade (Score)", sensibilidade.modalidade_melhor,
+                  f"vantagem de {sensibilidade.vantagem:.2f}", delta_color="off")
+    with col2:
+        st.metric("Perturbações avaliadas", f"{sensibilidade.perturbacoes:,}".replace(',', '.'))
+    with col3:
+        percentual = sensibilidade.inversoes / sensibilidade.perturbacoes * 100 if sensibilidade.perturbacoes else 0
+        st.metric("Perturbações que invertem o ranking", f"{sensibilidade.inversoes:,}".replace(',', '.'),
+                  f"{percentual:.1f}%", delta_color="off")
+    
+    limite = st.slider("Entradas exibidas no tornado:", min_value=5, max_value=50, value=15, step=5)
+    entradas = sensibilidade.entradas(limite)
+    if entradas.empty:
+        return
+    fig_tornado = figura_em_cache(
+        'tornado_sensibilidade',
+        (entradas, sensibilidade.vantagem, sensibilidade.modalidade_melhor),
+        lambda: criar_tornado_sensibilidade(entradas, sensibilidade.vantagem, sensibilidade.modalidade_melhor)
+    )
+    st.plotly_chart(fig_tornado, use_container_width=True)
+    
+    if sensibilidade.inversoes:
+        with st.expander(f"⚠️ Entradas que invertem o ranking ({sensibilidade.inversoes} perturbações)"):
+            st.dataframe(
+                sensibilidade.entradas(500, somente_inversoes=True).rename(columns={
+                    'Parametro': 'Parâmetro', 'Valor_Abaixo': 'Valor Abaixo', 'Valor_Acima': 'Valor Acima',
+                    'Vantagem_Abaixo': 'Vantagem Abaixo', 'Vantagem_Acima': 'Vantagem Acima',
+                    'Nova_Melhor': 'Nova Melhor'
+                }).drop(columns='Inverte'),
+                use_container_width=True,
+                hide_index=True
+            )
+    else:
+        st.success("✅ Nenhuma perturbação de um passo troca a melhor modalidade: o ranking é robusto.")
+
+def simulacao_incerteza():
+    st.header("🎲 Simulação de Incerteza (Monte Carlo)")
+    
+    if not st.session_state.riscos:
+        st.warning("⚠️ Nenhum risco cadastrado para simulação.")
+        return
+    
+    st.info("💡 Cada impacto, probabilidade e fator de mitigação passa a ser uma distribuição em torno do valor avaliado. "
+            "A simulação sorteia milhares de cenários e mostra a faixa de variação do risco residual acumulado "
+            "e a chance de cada modalidade ser a de menor risco.")
+    
+    with st.form("form_simulacao"):
+        col1, col2 = st.columns(2)
+        with col1:
+            distribuicao = st.radio(
+                "Distribuição de impacto e probabilidade:",
+                ['niveis', 'triangular'],
+                format_func=lambda d: {
+                    'niveis': "Níveis adjacentes da escala SAROI",
+                    'triangular': "Triangular entre os níveis adjacentes"
+                }[d]
+            )
+            espalhamento = st.slider(
+                "Chance de o nível real ser o vizinho (para cada lado):",
+                min_value=0.0, max_value=0.5, value=0.2, step=0.05,
+                help="Na distribuição triangular, qualquer valor acima de zero usa a faixa até os níveis vizinhos"
+            )
+        with col2:
+            amplitude_fatores = st.slider(
+                "Incerteza dos fatores de mitigação (±):",
+                min_value=0.0, max_value=0.5, value=0.1, step=0.05
+            )
+            amostras = st.select_slider(
+                "Número de cenários simulados:",
+                options=[10_000, 50_000, 100_000, 200_000, 500_000],
+                value=100_000
+            )
+        executar = st.form_submit_button("▶️ Executar Simulação", type="primary")
+    
+    parametros = (st.session_state.get('versao_dados', 0), distribuicao, espalhamento, amplitude_fatores, amostras)
+    if executar:
+        modelo = ModeloIncerteza.de_riscos(
+            st.session_state.riscos,
+            st.session_state.modalidades,
+            espalhamento=espalhamento,
+            amplitude_fatores=amplitude_fatores,
+            distribuicao=distribuicao
+        )
+        with st.spinner(f"Simulando {amostras:,} cenários...".replace(',', '.')):
+            st.session_state.simulacao = {'parametros': parametros, 'resultado': simular(modelo, amostras)}
+    
+    simulacao = st.session_state.get('simulacao')
+    if simulacao is None:
+        return
+    if simulacao['parametros'][0] != parametros[0]:
+        st.warning("⚠️ Os riscos foram alterados depois desta simulação. Execute-a novamente para atualizar.")
+    
+    resultado = simulacao['resultado']
+    resumo = resultado.como_dataframe()
+    
+    # Modalidade com maior chance de ser a melhor
+    melhor = resumo.iloc[0]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Modalidade mais provável de ser a melhor", melhor['Modalidade'])
+    with col2:
+        st.metric("Chance de ser a melhor", f"{melhor['Prob_Melhor']:.1f}%")
+    with col3:
+        st.metric("Faixa P5 - P95", f"{melhor['P5']:.1f} - {melhor['P95']:.1f}")
+    
+    fig_faixas = figura_em_cache('faixas_simulacao', resumo, lambda: criar_faixas_simulacao(resumo))
+    st.plotly_chart(fig_faixas, use_container_width=True)
+    
+    fig_melhor = figura_em_cache('probabilidade_melhor', resumo, lambda: px.bar(
+        resumo,
+        x='Modalidade',
+        y='Prob_Melhor',
+        title="Probabilidade de Cada Modalidade Ter o Menor Risco Residual",
+        labels={'Prob_Melhor': 'Probabilidade (%)'},
+        color='Prob_Melhor',
+        color_continuous_scale='RdYlGn'
+    ))
+    st.plotly_chart(fig_melhor, use_container_width=True)
+    
+    st.subheader("📋 Resumo da Simulação")
+    st.dataframe(
+        resumo.rename(columns={
+            'Media': 'Média',
+            'Desvio_Padrao': 'Desvio Padrão',
+            'Prob_Melhor': 'Chance de ser a Melhor (%)'
+        }).round(2),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption(f"{resultado.amostras:,} cenários simulados.".replace(',', '.'))
+
+def otimizacao_modalidades():
+    st.header("🧮 Otimização de Modalidades")
+    
+    if not st.session_state.riscos or not st.session_state.modalidades:
+        st.warning("⚠️ Cadastre riscos e modalidades para otimizar.")
+        return
+    
+    st.info("💡 Escolhe a modalidade de menor risco residual acumulado para o portfólio inteiro ou para cada grupo "
+            "de riscos, respeitando as modalidades excluídas, o risco residual máximo por risco e o número máximo "
+            "de modalidades distintas.")
+    
+    with st.form("form_otimizacao"):
+        col1, col2 = st.columns(2)
+        with col1:
+            agrupamento = st.selectbox(
+                "Escolher a modalidade para:",
+                list(AGRUPAMENTOS),
+                format_func=lambda chave: AGRUPAMENTOS[chave][0]
+            )
+            max_modalidades = st.number_input(
+                "Máximo de modalidades distintas (0 = sem limite):",
+                min_value=0, max_value=len(st.session_state.modalidades), value=0, step=1
+            )
+            metodo = st.radio(
+                "Método:",
+                METODOS,
+                format_func=lambda m: {
+                    'auto': "Exato (enumeração ou branch-and-bound)",
+                    'heuristico': "Heurística rápida (gulosa com trocas)"
+                }[m],
+                horizontal=True
+            )
+        with col2:
+            excluidas = st.multiselect("Modalidades excluídas:", st.session_state.modalidades)
+            limite_residual = st.number_input(
+                "Risco residual máximo por risco (0 = sem limite):",
+                min_value=0.0, max_value=100.0, value=0.0, step=1.0
+            )
+        executar = st.form_submit_button("▶️ Otimizar", type="primary")
+    
+    parametros = (st.session_state.get('versao_dados', 0), agrupamento, max_modalidades, tuple(excluidas),
+                  limite_residual, metodo)
+    if executar:
+        with st.spinner("Otimizando..."):
+            resultado = otimizar_modalidades(
+                st.session_state.riscos,
+                st.session_state.modalidades,
+                agrupamento=agrupamento,
+                max_modalidades=max_modalidades or None,
+                limite_residual=limite_residual or None,
+                excluidas=excluidas,
+                metodo=metodo,
+                matriz=obter_matriz_riscos()
+            )
+        st.session_state.otimizacao = {'parametros': parametros, 'resultado': resultado}
+    
+    otimizacao = st.session_state.get('otimizacao')
+    if otimizacao is None:
+        return
+    if otimizacao['parametros'][0] != parametros[0]:
+        st.warning("⚠️ Os riscos foram alterados depois desta otimização. Execute-a novamente para atualizar.")
+    
+    resultado = otimizacao['resultado']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            "Risco residual total otimizado",
+            f"{resultado.residual_total:.1f}",
+            f"{resultado.residual_total - resultado.residual_modalidade_unica:.1f} vs. melhor modalidade única",
+            delta_color="inverse"
+        )
+    with col2:
+        st.metric("Modalidades utilizadas", len(resultado.modalidades_usadas))
+    with col3:
+        st.metric("Método", resultado.metodo, "solução ótima" if resultado.exato else "melhor solução encontrada",
+                  delta_color="off")
+    
+    if resultado.modalidade_unica is not None:
+        st.caption(f"Referência: '{resultado.modalidade_unica}' para todos os riscos "
+                   f"(residual {resultado.residual_modalidade_unica:.1f}, sem o limite por risco). "
+                   f"Tempo de otimização: {resultado.tempo * 1000:.0f} ms.")
+    if not resultado.viavel:
+        grupos_sem_modalidade = [nome for nome, atribuido in zip(resultado.nomes_grupos, resultado.atribuidos)
+                                 if not atribuido]
+        st.error(f"❌ {len(grupos_sem_modalidade)} grupo(s) sem modalidade que respeite as restrições: "
+                 f"{', '.join(grupos_sem_modalidade[:10])}{'...' if len(grupos_sem_modalidade) > 10 else ''}")
+    
+    grupos = resultado.como_dataframe()
+    st.subheader("📋 Modalidade Escolhida por Grupo")
+    if 1 < len(grupos) <= 50:
+        fig_grupos = figura_em_cache('otimizacao_grupos', grupos, lambda: px.bar(
+            grupos.dropna(subset=['Modalidade']),
+            x='Grupo',
+            y=['Risco_Inerente', 'Risco_Residual'],
+            barmode='group',
+            hover_data=['Modalidade'],
+            title="Risco Inerente e Residual por Grupo na Modalidade Escolhida",
+            labels={'value': 'Risco', 'variable': ''}
+        ))
+        st.plotly_chart(fig_grupos, use_container_width=True)
+    st.dataframe(
+        grupos.rename(columns={'Risco_Inerente': 'Risco Inerente', 'Risco_Residual': 'Risco Residual'}).round(2),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    if agrupamento != 'risco':
+        with st.expander("🔎 Modalidade atribuída a cada risco"):
+            st.dataframe(
+                resultado.riscos_dataframe([r['risco_chave'] for r in st.session_state.riscos])
+                .rename(columns={'Risco_Residual': 'Risco Residual'}).round(2),
+                use_container_width=True,
+                hide_index=True
+            )
+
+def portfolio_projetos():
+    st.header("🗂️ Portfólio de Projetos")
+    
+    # Agregados calculados no banco: nenhum registro de outro projeto é carregado na sessão
+    projetos = pd.DataFrame(resumir_projetos(), columns=[
+        'id', 'Projeto', 'Riscos', 'Riscos Altos', 'Risco Inerente Total',
+        'Modalidade Recomendada', 'Risco Residual da Recomendada'
+    ])
+    if projetos.empty:
+        st.info("Nenhum projeto cadastrado.")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Projetos", len(projetos))
+    with col2:
+        st.metric("Riscos Cadastrados", int(projetos['Riscos'].sum()))
+    with col3:
+        st.metric("Risco Inerente Total", f"{projetos['Risco Inerente Total'].sum():.1f}")
+    
+    df_modalidades = pd.DataFrame(resumir_portfolio(), columns=[
+        'Modalidade', 'Projetos', 'Riscos_Aplicaveis', 'Risco_Inerente_Aplicavel',
+        'Risco_Residual_Total', 'Projetos_Melhor'
+    ])
+    if not df_modalidades.empty:
+        st.subheader("📊 Risco Residual Acumulado por Modalidade (todos os projetos)")
+        inerente = df_modalidades['Risco_Inerente_Aplicavel'].to_numpy(dtype=float)
+        residual = df_modalidades['Risco_Residual_Total'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df_modalidades['Eficacia_Percentual'] = np.where(inerente > 0, (inerente - residual) / inerente * 100, 0.0)
+        
+        def criar_barras_portfolio():
+            fig = px.bar(
+                df_modalidades,
+                x='Modalidade',
+                y='Risco_Residual_Total',
+                color='Eficacia_Percentual',
+                title="Risco Residual Acumulado do Portfólio por Modalidade",
+                labels={'Risco_Residual_Total': 'Risco Residual Total', 'Eficacia_Percentual': 'Eficácia (%)'},
+                hover_data=['Projetos', 'Projetos_Melhor'],
+                color_continuous_scale='RdYlGn'
+            )
+            fig.update_xaxes(tickangle=45)
+            return fig
+        
+        fig_portfolio = figura_em_cache('barras_portfolio', df_modalidades, criar_barras_portfolio)
+        st.plotly_chart(fig_portfolio, use_container_width=True)
+        
+        st.dataframe(
+            df_modalidades.rename(columns={
+                'Riscos_Aplicaveis': 'Riscos Aplicáveis',
+                'Risco_Inerente_Aplicavel': 'Risco Inerente Aplicável',
+                'Risco_Residual_Total': 'Risco Residual Total',
+                'Projetos_Melhor': 'Projetos em que é a Melhor',
+                'Eficacia_Percentual': 'Eficácia (%)'
+            }).round(1),
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    st.subheader("📁 Projetos")
+    st.dataframe(projetos.drop(columns='id').round(1), use_container_width=True, hide_index=True)
+    
+    # Trocar o projeto ativo da sessão
+    outros = [nome for _, nome in listar_projetos() if nome != st.session_state.get('nome_projeto')]
+    if outros:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            projeto_escolhido = st.selectbox("Abrir outro projeto:", outros)
+        with col2:
+            st.write("")
+            if st.button("📂 Abrir projeto"):
+                abrir_projeto(projeto_escolhido)
+                st.rerun()
+
+def retencao_logs():
+    """Tamanho do log de ações e arquivamento manual dos registros antigos"""
+    with st.expander("🗄️ Retenção dos logs"):
+        estatisticas = estatisticas_logs()
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("Logs ativos", f"{estatisticas['ativos']:,}".replace(',', '.'))
+        
+        with col2:
+            st.metric("Logs arquivados", f"{estatisticas['arquivados']:,}".replace(',', '.'))
+        
+        with col3:
+            st.metric("Banco / arquivo",
+                      f"{estatisticas['tamanho_banco'] / 2**20:.1f} / {estatisticas['tamanho_arquivo'] / 2**20:.1f} MB")
+        
+        idade_dias = st.number_input(
+            "Arquivar ações com mais de (dias):",
+            min_value=0,
+            value=RETENCAO_LOGS_DIAS,
+            step=30
+        )
+        
+        if st.button("🗄️ Arquivar logs antigos"):
+            with st.spinner("Arquivando logs..."):
+                arquivados = arquivar_logs(idade_dias)
+            registrar_acao(
+                st.session_state.user,
+                "Arquivou logs",
+                {"idade_dias": idade_dias, "registros": arquivados}
+            )
+            st.success(f"✅ {arquivados} registros arquivados.")
+        
+        if not estatisticas['vacuum_incremental']:
+            st.caption("O espaço liberado pelo arquivamento só é devolvido ao disco depois de converter o banco "
+                       "para vacuum incremental. A conversão reescreve o banco e o bloqueia até terminar.")
+            if st.button("🧹 Converter banco (manutenção)"):
+                with st.spinner("Reescrevendo o banco..."):
+                    habilitar_vacuum_incremental()
+                registrar_acao(st.session_state.user, "Converteu banco para vacuum incremental")
+                st.rerun()
+
 def visualizar_logs():
     st.header("📋 Log de Ações do Sistema")
     
-    # Obter logs do banco de dados
-    logs = obter_logs()
+    # Ações ainda na fila do escritor em segundo plano entram na consulta
+    descarregar_logs()
     
-    if not logs:
+    retencao_logs()
+    
+    incluir_arquivo = st.checkbox(
+        "Incluir logs arquivados",
+        help=f"Ações com mais de {RETENCAO_LOGS_DIAS} dias são movidas para o arquivo de logs"
+    )
+    
+    # Opções dos filtros obtidas pelos índices (sem carregar a tabela de logs)
+    usuarios = listar_usuarios_logs(incluir_arquivo)
+    
+    if not usuarios:
         st.info("📝 Nenhuma ação registrada ainda.")
         return
     
-    # Converter para DataFrame
-    df_logs = pd.DataFrame(logs, columns=['Data/Hora', 'Usuário', 'Ação', 'Detalhes'])
+    acoes = listar_acoes_logs(incluir_arquivo)
     
     # Filtros
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     
     with col1:
-        usuarios = df_logs['Usuário'].unique()
         usuario_filtro = st.multiselect(
             "Filtrar por usuário:",
             options=usuarios,
@@ -2282,48 +2099,181 @@ def visualizar_logs():
         )
     
     with col2:
-        acoes = df_logs['Ação'].unique()
         acao_filtro = st.multiselect(
             "Filtrar por ação:",
             options=acoes,
             default=acoes
         )
     
-    # Aplicar filtros
-    df_filtrado = df_logs[
-        (df_logs['Usuário'].isin(usuario_filtro)) & 
-        (df_logs['Ação'].isin(acao_filtro))
-    ]
+    with col3:
+        periodo = st.date_input(
+            "Filtrar por período:",
+            value=(),
+            format="DD/MM/YYYY"
+        )
+    
+    if not usuario_filtro or not acao_filtro:
+        st.warning("Selecione ao menos um usuário e uma ação.")
+        return
+    
+    # Filtros aplicados no SQL; seleção completa equivale a não filtrar
+    filtros = {
+        'usuarios': None if set(usuario_filtro) == set(usuarios) else usuario_filtro,
+        'acoes': None if set(acao_filtro) == set(acoes) else acao_filtro,
+        'data_inicio': periodo[0] if len(periodo) > 0 else None,
+        'data_fim': periodo[1] if len(periodo) > 1 else None,
+        'incluir_arquivo': incluir_arquivo
+    }
+    
+    tamanho_pagina = st.selectbox("Registros por página:", [25, 50, 100, 200], index=1)
+    
+    # Pilha de cursores (timestamp, id) do início de cada página; reinicia quando os filtros mudam
+    chave_filtros = repr((filtros, tamanho_pagina))
+    if st.session_state.get('logs_chave_filtros') != chave_filtros:
+        st.session_state.logs_chave_filtros = chave_filtros
+        st.session_state.logs_cursores = [None]
+    cursores = st.session_state.logs_cursores
+    
+    pagina = obter_logs(**filtros, cursor=cursores[-1], limite=tamanho_pagina + 1)
+    tem_proxima = len(pagina) > tamanho_pagina
+    pagina = pagina[:tamanho_pagina]
+    
+    df_filtrado = pd.DataFrame(
+        [linha[1:] for linha in pagina],
+        columns=['Data/Hora', 'Usuário', 'Ação', 'Detalhes']
+    )
     
     # Exibir tabela
     st.dataframe(df_filtrado, use_container_width=True)
     
-    # Estatísticas
+    col1, col2, col3 = st.columns([1, 2, 1])
+    
+    with col1:
+        if st.button("⬅️ Página anterior", disabled=len(cursores) == 1):
+            cursores.pop()
+            st.rerun()
+    
+    with col2:
+        st.caption(f"Página {len(cursores)}")
+    
+    with col3:
+        if st.button("Próxima página ➡️", disabled=not tem_proxima):
+            cursores.append((pagina[-1][1], pagina[-1][0]))
+            st.rerun()
+    
+    if not pagina:
+        st.info("Nenhuma ação encontrada com os filtros aplicados.")
+        return
+    
+    # Estado completo de um risco em um registro da página (reconstruído do repositório de auditoria)
+    registros_riscos = [linha for linha in pagina if linha[3] in ("Criou risco", "Editou risco")]
+    if registros_riscos:
+        with st.expander("🔎 Estado do risco em um registro"):
+            registro = st.selectbox(
+                "Registro:",
+                registros_riscos,
+                format_func=lambda linha: f"#{linha[0]} - {linha[1]} - {linha[3]} ({linha[2]})"
+            )
+            estado = estado_risco_log(registro[0])
+            if estado is None:
+                st.info("Registro anterior à auditoria por diferenças: estado completo indisponível.")
+            else:
+                st.json(estado)
+    
+    # Estatísticas (agregadas no SQL a partir do resumo por hora do log)
+    resumo = resumir_logs(**filtros)
+    acoes_por_usuario = pd.Series(dict(resumo['por_usuario']))
+    acoes_por_tipo = pd.Series(dict(resumo['por_acao']))
+    
     st.subheader("📊 Estatísticas de Atividade")
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Total de Ações", len(df_filtrado))
+        st.metric("Total de Ações", resumo['total'])
     
     with col2:
-        acoes_por_usuario = df_filtrado['Usuário'].value_counts()
         st.metric("Ações por Usuário", f"{len(acoes_por_usuario)} usuários")
     
     with col3:
         st.metric("Período Registrado", 
-                  f"{df_filtrado['Data/Hora'].min().split()[0]} a {df_filtrado['Data/Hora'].max().split()[0]}")
-    
-    # Gráfico de atividades por usuário
-    fig = px.bar(acoes_por_usuario, 
-                 x=acoes_por_usuario.index, 
-                 y=acoes_por_usuario.values,
-                 title="Ações por Usuário",
-                 labels={'x': 'Usuário', 'y': 'Número de Ações'})
+                  f"{resumo['inicio']:%d/%m/%Y} a {resumo['fim']:%d/%m/%Y}")
+    
+    # Atividade ao longo do tempo
+    granularidade = st.radio("Atividade por:", ["dia", "hora"], format_func=str.capitalize, horizontal=True)
+    serie = pd.DataFrame(serie_atividade_logs(**filtros, granularidade=granularidade), columns=['Período', 'Ações'])
+    serie['Período'] = pd.to_datetime(serie['Período'])
+    fig = px.bar(serie, x='Período', y='Ações', title="Atividade ao Longo do Tempo",
+                 labels={'Ações': 'Número de Ações'})
+    st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Gráfico de atividades por usuário
+        fig = px.bar(acoes_por_usuario, 
+                     x=acoes_por_usuario.index, 
+                     y=acoes_por_usuario.values,
+                     title="Ações por Usuário",
+                     labels={'x': 'Usuário', 'y': 'Número de Ações'})
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        fig = px.bar(acoes_por_tipo,
+                     x=acoes_por_tipo.values,
+                     y=acoes_por_tipo.index,
+                     orientation='h',
+                     title="Ações por Tipo",
+                     labels={'x': 'Número de Ações', 'y': 'Ação'})
+        st.plotly_chart(fig, use_container_width=True)
+    
+    por_hora = pd.Series(dict(serie_atividade_logs(**filtros, granularidade='hora_do_dia'))).reindex(
+        range(24), fill_value=0
+    )
+    fig = px.bar(por_hora, x=por_hora.index, y=por_hora.values, title="Ações por Hora do Dia (UTC)",
+                 labels={'x': 'Hora', 'y': 'Número de Ações'})
     st.plotly_chart(fig, use_container_width=True)
 
+# Visões principais: chave usada no link direto (?aba=...) -> (rótulo, função)
+VISOES = {
+    'editar': ("✏️ Editar Riscos", editar_riscos),
+    'cadastro': ("📝 Cadastro de Riscos", cadastro_riscos),
+    'analise': ("📊 Análise de Riscos", analise_riscos),
+    'comparacao': ("🔄 Comparação de Modalidades", comparacao_modalidades),
+    'dashboard': ("📈 Dashboard Geral", dashboard_geral),
+    'simulacao': ("🎲 Simulação", simulacao_incerteza),
+    'otimizacao': ("🧮 Otimização", otimizacao_modalidades),
+    'portfolio': ("🗂️ Portfólio", portfolio_projetos),
+    'logs': ("📋 Log de Ações", visualizar_logs)
+}
+
+def selecionar_visao():
+    """Seletor da visão ativa, sincronizado com o parâmetro ?aba= da URL (link direto)"""
+    if 'visao_ativa' not in st.session_state:
+        aba = st.query_params.get('aba')
+        st.session_state.visao_ativa = aba if aba in VISOES else next(iter(VISOES))
+    
+    visao = st.radio(
+        "Navegação",
+        list(VISOES),
+        format_func=lambda chave: VISOES[chave][0],
+        horizontal=True,
+        key='visao_ativa',
+        label_visibility="collapsed"
+    )
+    
+    if st.query_params.get('aba') != visao:
+        st.query_params['aba'] = visao
+    
+    st.divider()
+    return visao
+
 def main():
     # Inicializar banco de dados
     init_db()
+    registrar_aspectos_riscos({
+        risco_chave: " ".join(aspectos['impacto'] + aspectos['probabilidade'])
+        for risco_chave, aspectos in ASPECTOS_RISCOS.items()
+    })
     
     # Verificar se o usuário está logado
     if 'user' not in st.session_state:
@@ -2351,13 +2301,17 @@ def main():
                         st.error("Por favor, digite o nome do projeto")
                     elif verificar_login(username, password):
                         st.session_state.user = username
-                        st.session_state.nome_projeto = nome_projeto.strip()
+                        abrir_projeto(nome_projeto.strip())
                         st.rerun()
                     else:
                         st.error("Usuário ou senha incorretos")
         
         st.stop()
     
+    # Sessões abertas antes do cadastro de projetos
+    if 'projeto_id' not in st.session_state:
+        abrir_projeto(st.session_state.get('nome_projeto', 'Projeto'))
+    
     # Se está logado, mostrar a aplicação normal
     nome_projeto_titulo = st.session_state.get('nome_projeto', 'Projeto')
     st.title(f"🛡️Dashboard de Avaliação de Riscos   - {nome_projeto_titulo}")
@@ -2384,10 +2338,11 @@ def main():
         # Mostrar estatísticas dos riscos
         if st.session_state.riscos:
             st.subheader("📊 Estatísticas Atuais")
-            total = len(st.session_state.riscos)
-            altos = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Alto')
-            medios = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Médio')
-            baixos = sum(1 for r in st.session_state.riscos if r['classificacao'] == 'Baixo')
+            agregados = obter_agregados()
+            total = agregados.total_riscos
+            altos = agregados.contagem_classificacao['Alto']
+            medios = agregados.contagem_classificacao['Médio']
+            baixos = agregados.contagem_classificacao['Baixo']
             editados = sum(1 for r in st.session_state.riscos if r.get('editado', False))
             adicionados = sum(1 for r in st.session_state.riscos if r.get('personalizado', False))
             
@@ -2409,14 +2364,10 @@ def main():
         if st.button("➕ Adicionar") and nova_modalidade:
             if nova_modalidade not in st.session_state.modalidades:
                 st.session_state.modalidades.append(nova_modalidade)
-                # Adicionar a nova modalidade a todos os riscos existentes
-                for risco in st.session_state.riscos:
-                    if 'modalidades' not in risco:
-                        risco['modalidades'] = {}
-                    risco['modalidades'][nova_modalidade] = 0.5  # Valor padrão
-                    # Garante que a nova justificativa também seja adicionada
-                    risco.setdefault("justificativas_modalidades", {})[nova_modalidade] = ""
-                    risco.setdefault("justificativa_fator_probabilidade", "")
+                adicionar_modalidade_db(st.session_state.projeto_id, nova_modalidade, 0.5)
+                # A nova modalidade vale para todos os riscos com o fator padrão (sem percorrê-los)
+                st.session_state.riscos.adicionar_modalidade(nova_modalidade, 0.5, "")
+                marcar_dados_alterados(lambda agregados: agregados.adicionar_modalidade(nova_modalidade, 0.5))
                 st.success(f"Modalidade '{nova_modalidade}' adicionada!")
                 st.rerun()
             else:
@@ -2430,12 +2381,10 @@ def main():
             )
             if st.button("🗑️ Remover") and modalidade_remover != "Selecione...":
                 st.session_state.modalidades.remove(modalidade_remover)
+                remover_modalidade_db(st.session_state.projeto_id, modalidade_remover)
                 # Remover a modalidade de todos os riscos
-                for risco in st.session_state.riscos:
-                    if 'modalidades' in risco and modalidade_remover in risco['modalidades']:
-                        del risco['modalidades'][modalidade_remover]
-                    if 'justificativas_modalidades' in risco and modalidade_remover in risco['justificativas_modalidades']:
-                        del risco['justificativas_modalidades'][modalidade_remover]
+                st.session_state.riscos.remover_modalidade(modalidade_remover)
+                marcar_dados_alterados(lambda agregados: agregados.remover_modalidade(modalidade_remover))
                 st.success(f"Modalidade '{modalidade_remover}' removida!")
                 st.rerun()
         
@@ -2444,47 +2393,32 @@ def main():
         # Exportar/Importar dados
         st.subheader("📄 Gerenciar Dados")
         
-        # Botão para gerar relatório Word
+        # Botão para gerar relatório Word (gerado em segundo plano)
         if Document and st.button("📄 Gerar Relatório Word", help="Gera relatório completo em formato .docx"):
-            with st.spinner("Gerando relatório..."):
-                buffer = gerar_relatorio_word()
-                if buffer:
-                    nome_projeto_arquivo = st.session_state.get('nome_projeto', 'Projeto').replace(' ', '_')
-                    st.download_button(
-                        label="📥 Baixar Relatório Word",
-                        data=buffer,
-                        file_name=f"relatorio_riscos_{nome_projeto_arquivo}_{datetime.now().strftime('%Y%m%d_%H%M')}.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        key="download_report_sidebar"
-                    )
-                    st.success("✅ Relatório gerado com sucesso!")
-        
-        if st.button("💾 Exportar dados (JSON)"):
-            import json
-            dados_export = {
-                'riscos': st.session_state.riscos,
-                'modalidades': st.session_state.modalidades
-            }
-            json_string = json.dumps(dados_export, indent=2, ensure_ascii=False)
-            st.download_button(
-                label="📥 Baixar arquivo JSON",
-                data=json_string,
-                file_name="avaliacao_riscos.json",
-                mime="application/json"
-            )
+            solicitar_relatorio_word()
+        if Document and st.session_state.get('relatorio_chave'):
+            exibir_relatorio_word()
+        
+        formato_exportacao = st.selectbox("Formato de exportação:", formatos_disponiveis())
+        if st.button("💾 Exportar dados"):
+            exportar_dados(formato_exportacao)
         
         # Resetar dados
         if st.button("🔄 Recarregar dados originais"):
-            st.session_state.riscos = []
-            st.session_state.modalidades = []
+            limpar_registro_riscos(st.session_state.projeto_id)
+            del st.session_state['riscos']
+            del st.session_state['modalidades']
             inicializar_dados()
+            marcar_dados_alterados()
             st.success("Dados originais recarregados!")
             st.rerun()
         
         if st.button(" Limpar todos os dados"):
             if st.checkbox("⚠️ Confirmo que quero limpar todos os dados"):
-                st.session_state.riscos = []
+                st.session_state.riscos = RegistroRiscos()
                 st.session_state.modalidades = MODALIDADES_PADRAO.copy()
+                salvar_registro_riscos(st.session_state.projeto_id, st.session_state.riscos, st.session_state.modalidades)
+                marcar_dados_alterados()
                 st.success("Dados limpos!")
                 st.rerun()
             else:
@@ -2494,35 +2428,12 @@ def main():
         st.write(f"Usuário: **{st.session_state.user}**")
         if st.button("🚪 Sair"):
             st.session_state.user = None
+            fechar_projeto()
             st.rerun()
     
-    # Abas principais
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "✏️ Editar Riscos",
-        "📝 Cadastro de Riscos",
-        "📊 Análise de Riscos", 
-        "🔄 Comparação de Modalidades",
-        "📈 Dashboard Geral",
-        "📋 Log de Ações"
-    ])
-    
-    with tab1:
-        editar_riscos()
-    
-    with tab2:
-        cadastro_riscos()
-    
-    with tab3:
-        analise_riscos()
-    
-    with tab4:
-        comparacao_modalidades()
-    
-    with tab5:
-        dashboard_geral()
-    
-    with tab6:
-        visualizar_logs()
+    # Navegação principal: apenas a visão selecionada é executada a cada rerun
+    visao = selecionar_visao()
+    VISOES[visao][1]()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+"""Auditoria das alterações de riscos: estados endereçados por conteúdo e diferenças estruturadas
+
+Em vez de copiar o risco inteiro em cada registro do log, a criação grava só o hash
+do estado do risco e a edição grava o hash do estado anterior mais a diferença
+estruturada até o novo estado. Os estados ficam em um repositório endereçado pelo
+hash do seu conteúdo (estados iguais são gravados uma única vez) e os textos longos
+(descrições e justificativas) são trocados por referências ao hash do texto, de modo
+que um texto repetido em vários riscos ou estados é armazenado uma única vez.
+
+O estado completo do risco em qualquer registro do log é o estado referenciado mais
+a diferença (ver `reconstruir_estado`).
+"""
+import hashlib
+import json
+from collections.abc import Mapping
+
+from registro_riscos import como_dict
+
+# Textos com pelo menos esse número de caracteres são deduplicados por hash
+TAMANHO_MINIMO_TEXTO = 48
+
+# Chave da referência que substitui um texto longo: {"$texto": hash}
+CHAVE_TEXTO = '$texto'
+
+
+def calcular_hash(conteudo):
+    return hashlib.blake2b(conteudo.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def serializar(valor):
+    """JSON canônico (chaves ordenadas, sem espaços), base do hash dos estados"""
+    return json.dumps(valor, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def _referenciar_textos(valor, textos):
+    """Cópia de `valor` com os textos longos trocados por referências (acumuladas em `textos`)"""
+    if isinstance(valor, str):
+        if len(valor) < TAMANHO_MINIMO_TEXTO:
+            return valor
+        chave = calcular_hash(valor)
+        textos[chave] = valor
+        return {CHAVE_TEXTO: chave}
+    if isinstance(valor, Mapping):
+        return {campo: _referenciar_textos(item, textos) for campo, item in valor.items()}
+    return valor
+
+
+def resolver_textos(valor, textos):
+    """Troca as referências de texto de `valor` pelos textos (`textos`: hash -> texto)"""
+    if isinstance(valor, dict):
+        if len(valor) == 1 and CHAVE_TEXTO in valor:
+            return textos[valor[CHAVE_TEXTO]]
+        return {campo: resolver_textos(item, textos) for campo, item in valor.items()}
+    return valor
+
+
+def referencias_textos(valor):
+    """Hashes dos textos referenciados em `valor`"""
+    if isinstance(valor, dict):
+        if len(valor) == 1 and CHAVE_TEXTO in valor:
+            yield valor[CHAVE_TEXTO]
+        else:
+            for item in valor.values():
+                yield from referencias_textos(item)
+
+
+def diferenca(anterior, novo):
+    """Diferença estruturada entre dois estados
+
+    {'alterados': {campo: novo valor}, 'removidos': [campos], 'aninhados': {campo: diferença}},
+    só com as partes não vazias; dicionários presentes nos dois lados (como os fatores
+    por modalidade) são comparados campo a campo em 'aninhados'.
+    """
+    alterados = {}
+    aninhados = {}
+    for campo, valor in novo.items():
+        valor_anterior = anterior.get(campo)
+        if campo in anterior and valor_anterior == valor:
+            continue
+        if _e_dicionario(valor) and _e_dicionario(valor_anterior):
+            aninhados[campo] = diferenca(valor_anterior, valor)
+        else:
+            alterados[campo] = valor
+    removidos = [campo for campo in anterior if campo not in novo]
+
+    resultado = {}
+    if alterados:
+        resultado['alterados'] = alterados
+    if removidos:
+        resultado['removidos'] = removidos
+    if aninhados:
+        resultado['aninhados'] = aninhados
+    return resultado
+
+
+def _e_dicionario(valor):
+    return isinstance(valor, dict) and not (len(valor) == 1 and CHAVE_TEXTO in valor)
+
+
+def aplicar_diferenca(estado, diferenca_estado):
+    """Novo estado obtido aplicando `diferenca_estado` (ver `diferenca`) a `estado`"""
+    novo = dict(estado)
+    for campo in diferenca_estado.get('removidos', ()):
+        novo.pop(campo, None)
+    novo.update(diferenca_estado.get('alterados', {}))
+    for campo, diferenca_campo in diferenca_estado.get('aninhados', {}).items():
+        novo[campo] = aplicar_diferenca(novo.get(campo, {}), diferenca_campo)
+    return novo
+
+
+def auditar_risco(risco, anterior=None):
+    """Detalhes do log e objetos a armazenar para a criação (ou edição, com `anterior`) de um risco
+
+    Retorna (detalhes, textos, estados): `textos` e `estados` são listas de pares
+    (hash, conteúdo) a gravar no repositório. Na criação os detalhes referenciam o
+    estado do risco; na edição, o estado anterior e a diferença até o novo.
+    """
+    textos = {}
+    novo = _referenciar_textos(como_dict(risco), textos)
+    base = novo if anterior is None else _referenciar_textos(como_dict(anterior), textos)
+
+    estado = serializar(base)
+    chave_estado = calcular_hash(estado)
+    detalhes = {'risco': novo.get('risco_chave'), 'estado': chave_estado}
+    if anterior is not None:
+        detalhes['diferenca'] = diferenca(base, novo)
+    return detalhes, list(textos.items()), [(chave_estado, estado)]
+
+
+def reconstruir_estado(detalhes, obter_estado, obter_textos):
+    """Estado completo do risco em um registro de log de auditoria (None se não houver)
+
+    `obter_estado(hash)` devolve o JSON de um estado e `obter_textos(hashes)` um
+    dicionário hash -> texto. Registros no formato antigo, com a cópia do risco em
+    'detalhes', são devolvidos como estão.
+    """
+    if 'estado' not in detalhes:
+        return detalhes.get('detalhes')
+    estado = json.loads(obter_estado(detalhes['estado']))
+    if 'diferenca' in detalhes:
+        estado = aplicar_diferenca(estado, detalhes['diferenca'])
+    return resolver_textos(estado, obter_textos(set(referencias_textos(estado))))
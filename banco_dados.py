@@ -0,0 +1,1352 @@
+"""Camada de acesso ao banco SQLite: pool de conexões, esquema, usuários, logs, projetos e registro de riscos"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+
+from auditoria import auditar_risco, reconstruir_estado
+from registro_riscos import IndiceModalidades, RegistroRiscos
+
+# Caminho do banco (pode ser sobrescrito para execuções em lote ou testes)
+CAMINHO_BANCO = os.environ.get('SAROI_DB', 'riscos.db')
+
+# Tempo máximo (segundos) que uma conexão espera por um lock antes de falhar
+TIMEOUT_OCUPADO = 30
+TAMANHO_POOL = 8
+# Quantidade de comandos preparados mantidos em cache por conexão
+COMANDOS_EM_CACHE = 256
+
+# Durabilidade do log de ações: 'sincrono' grava e confirma cada ação antes de
+# retornar; 'lote' enfileira e grava em segundo plano, um commit por lote
+DURABILIDADE_LOG = os.environ.get('SAROI_DURABILIDADE_LOG', 'lote')
+TAMANHO_FILA_LOG = 10000
+TAMANHO_LOTE_LOG = 500
+# Intervalo máximo (segundos) entre a chegada de uma ação e o commit do seu lote
+INTERVALO_LOTE_LOG = 0.5
+
+# Retenção do log de ações: registros mais antigos que RETENCAO_LOGS_DIAS são movidos
+# para um banco de arquivo à parte (anexado às conexões como 'arquivo'), só de
+# inserção, com os detalhes compactados
+RETENCAO_LOGS_DIAS = int(os.environ.get('SAROI_RETENCAO_LOGS_DIAS', 180))
+TAMANHO_LOTE_ARQUIVAMENTO = 5000
+# Páginas devolvidas ao sistema de arquivos por passo de PRAGMA incremental_vacuum
+PAGINAS_VACUUM_POR_PASSO = 2000
+
+logger = logging.getLogger(__name__)
+
+# A versão do projeto é incrementada a cada gravação no seu registro (ver
+# _marcar_alteracao), para que caches em outros processos saibam quando recarregar
+SQL_CRIAR_PROJETOS = '''CREATE TABLE IF NOT EXISTS projetos
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+       nome TEXT UNIQUE NOT NULL,
+       criado_por TEXT,
+       data_criacao TEXT,
+       versao INTEGER NOT NULL DEFAULT 0)'''
+
+# Modalidades são por projeto (o mesmo nome pode existir em vários projetos). O fator
+# padrão vale para todo risco do projeto sem linha própria em fatores_mitigacao
+# (NULL = a modalidade só se aplica aos riscos com fator explícito)
+SQL_CRIAR_MODALIDADES = '''CREATE TABLE IF NOT EXISTS {tabela}
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+       projeto_id INTEGER REFERENCES projetos(id) ON DELETE CASCADE,
+       nome TEXT NOT NULL,
+       posicao INTEGER NOT NULL,
+       fator_padrao REAL,
+       justificativa_padrao TEXT NOT NULL DEFAULT '',
+       UNIQUE (projeto_id, nome))'''
+
+# Fatores explícitos de cada risco (fator NULL = modalidade não aplicável ao risco,
+# mesmo que tenha fator padrão)
+SQL_CRIAR_FATORES = '''CREATE TABLE IF NOT EXISTS {tabela}
+       (risco_id INTEGER NOT NULL REFERENCES riscos(id) ON DELETE CASCADE,
+       modalidade_id INTEGER NOT NULL REFERENCES modalidades(id) ON DELETE CASCADE,
+       fator REAL,
+       justificativa TEXT NOT NULL DEFAULT '',
+       PRIMARY KEY (risco_id, modalidade_id)) WITHOUT ROWID'''
+SQL_CRIAR_INDICE_FATORES = "CREATE INDEX IF NOT EXISTS idx_fatores_modalidade ON fatores_mitigacao (modalidade_id)"
+
+# Nome do projeto que recebe o registro de bancos anteriores ao cadastro de projetos
+PROJETO_MIGRADO = "Projeto"
+
+# Resumos do log de ações (ver resumir_logs): contagens por período, usuário e ação,
+# mantidas por gatilhos na inclusão e na remoção de logs ativos e pelo arquivamento
+# (que soma os registros movidos em `arquivados`), de modo que as estatísticas custam
+# o número de dias (ou horas) com atividade, não o de registros
+RESUMOS_LOGS = {
+    'logs_resumo_diario': ('dia',),
+    'logs_resumo_horario': ('dia', 'hora'),
+}
+# Colunas de período dos resumos: tipo e expressão sobre o timestamp do log
+COLUNAS_PERIODO_LOGS = {
+    'dia': ('TEXT', "date({timestamp})"),
+    'hora': ('INTEGER', "CAST(strftime('%H', {timestamp}) AS INTEGER)"),
+}
+
+
+def _periodo_logs(periodo, timestamp='timestamp'):
+    """Expressões das colunas de período de um resumo (`coluna AS coluna`)"""
+    return ", ".join(f"{COLUNAS_PERIODO_LOGS[coluna][1].format(timestamp=timestamp)} AS {coluna}"
+                     for coluna in periodo)
+
+
+def _esquema_resumo_logs(tabela, periodo):
+    """Tabela de um resumo do log e os gatilhos que a atualizam a cada ação gravada ou removida"""
+    chave = ", ".join((*periodo, 'username', 'acao'))
+    linha_removida = " AND ".join(
+        [f"{coluna} = {COLUNAS_PERIODO_LOGS[coluna][1].format(timestamp='old.timestamp')}" for coluna in periodo]
+        + ["username = old.username", "acao = old.acao"]
+    )
+    colunas = "".join(f"{coluna} {COLUNAS_PERIODO_LOGS[coluna][0]} NOT NULL,\n       " for coluna in periodo)
+    return [
+        f'''CREATE TABLE IF NOT EXISTS {tabela}
+       ({colunas}username TEXT NOT NULL,
+       acao TEXT NOT NULL,
+       ativos INTEGER NOT NULL DEFAULT 0,
+       arquivados INTEGER NOT NULL DEFAULT 0,
+       PRIMARY KEY ({chave})) WITHOUT ROWID''',
+        f'''CREATE TRIGGER IF NOT EXISTS {tabela}_inserir AFTER INSERT ON logs
+       BEGIN
+           INSERT INTO {tabela} ({chave}, ativos)
+           SELECT {_periodo_logs(periodo, 'new.timestamp')}, new.username, new.acao, 1 WHERE true
+           ON CONFLICT ({chave}) DO UPDATE SET ativos = ativos + 1;
+       END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {tabela}_excluir AFTER DELETE ON logs
+       BEGIN
+           UPDATE {tabela} SET ativos = ativos - 1 WHERE {linha_removida};
+       END''',
+    ]
+
+
+ESQUEMA = [
+    # Tabela de usuários
+    '''CREATE TABLE IF NOT EXISTS usuarios
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+       username TEXT UNIQUE NOT NULL,
+       password_hash TEXT NOT NULL)''',
+
+    # Tabela de logs de ações
+    '''CREATE TABLE IF NOT EXISTS logs
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+       timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+       username TEXT NOT NULL,
+       acao TEXT NOT NULL,
+       detalhes TEXT)''',
+
+    # Projetos: cada um com seu próprio registro de riscos e modalidades
+    SQL_CRIAR_PROJETOS,
+
+    # Registro persistente de riscos (normalizado: riscos x modalidades -> fatores)
+    '''CREATE TABLE IF NOT EXISTS riscos
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+       projeto_id INTEGER NOT NULL REFERENCES projetos(id) ON DELETE CASCADE,
+       risco_chave TEXT NOT NULL,
+       descricao TEXT,
+       impacto_nivel TEXT NOT NULL,
+       impacto_valor INTEGER NOT NULL,
+       probabilidade_nivel TEXT NOT NULL,
+       probabilidade_valor INTEGER NOT NULL,
+       risco_inerente REAL NOT NULL,
+       classificacao TEXT NOT NULL,
+       justificativa_fator_probabilidade TEXT,
+       contexto_especifico TEXT,
+       personalizado INTEGER NOT NULL DEFAULT 0,
+       editado INTEGER NOT NULL DEFAULT 0,
+       criado_por TEXT,
+       data_criacao TEXT,
+       data_edicao TEXT)''',
+
+    SQL_CRIAR_MODALIDADES.format(tabela='modalidades'),
+
+    SQL_CRIAR_FATORES.format(tabela='fatores_mitigacao'),
+
+    # Índices do visualizador de logs (filtros por usuário/ação + ordenação por data)
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_usuario_timestamp ON logs (username, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_acao_timestamp ON logs (acao, timestamp)",
+
+    # Resumos do log de ações por dia e por hora (ver RESUMOS_LOGS)
+    *[comando for tabela, periodo in RESUMOS_LOGS.items() for comando in _esquema_resumo_logs(tabela, periodo)],
+
+    # Arquivo do log de ações (detalhes compactados com zlib), com os mesmos índices
+    '''CREATE TABLE IF NOT EXISTS arquivo.logs
+       (id INTEGER PRIMARY KEY,
+       timestamp DATETIME NOT NULL,
+       username TEXT NOT NULL,
+       acao TEXT NOT NULL,
+       detalhes BLOB)''',
+    "CREATE INDEX IF NOT EXISTS arquivo.idx_logs_timestamp ON logs (timestamp)",
+    "CREATE INDEX IF NOT EXISTS arquivo.idx_logs_usuario_timestamp ON logs (username, timestamp)",
+    "CREATE INDEX IF NOT EXISTS arquivo.idx_logs_acao_timestamp ON logs (acao, timestamp)",
+
+    # Repositório da auditoria de riscos (ver auditoria.py): estados dos riscos e textos
+    # longos, endereçados pelo hash do conteúdo e referenciados pelos detalhes dos logs
+    '''CREATE TABLE IF NOT EXISTS estados_riscos
+       (hash TEXT PRIMARY KEY,
+       estado TEXT NOT NULL) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS textos_auditoria
+       (hash TEXT PRIMARY KEY,
+       texto TEXT NOT NULL) WITHOUT ROWID''',
+
+    # Busca textual dos riscos (ver buscar_riscos): um documento por risco (rowid = riscos.id),
+    # sem acentos e com índice de prefixos, mantido pelas funções que gravam os riscos
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS busca_riscos USING fts5
+       (risco_chave, descricao, contexto, justificativas, aspectos,
+       tokenize = 'unicode61 remove_diacritics 2', prefix = '3')''',
+    '''CREATE TRIGGER IF NOT EXISTS busca_riscos_excluir AFTER DELETE ON riscos
+       BEGIN DELETE FROM busca_riscos WHERE rowid = old.id; END''',
+    # Aspectos de impacto e probabilidade de cada risco da planilha (texto indexado na busca)
+    '''CREATE TABLE IF NOT EXISTS aspectos_riscos
+       (risco_chave TEXT PRIMARY KEY,
+       texto TEXT NOT NULL) WITHOUT ROWID''',
+
+    SQL_CRIAR_INDICE_FATORES,
+    "CREATE INDEX IF NOT EXISTS idx_riscos_projeto ON riscos (projeto_id)",
+    "CREATE INDEX IF NOT EXISTS idx_modalidades_projeto_posicao ON modalidades (projeto_id, posicao)",
+]
+
+USUARIOS_PADRAO = ["SPU 1", "SPU 2", "SPU 3"]
+
+
+def caminho_arquivo_logs(caminho=None):
+    """Caminho do banco de arquivo dos logs (ao lado do banco principal, salvo SAROI_DB_ARQUIVO_LOGS)"""
+    caminho = caminho or CAMINHO_BANCO
+    return os.environ.get('SAROI_DB_ARQUIVO_LOGS') or f"{os.path.splitext(caminho)[0]}_arquivo_logs.db"
+
+
+def _compactar(detalhes):
+    return zlib.compress(detalhes.encode('utf-8')) if detalhes is not None else None
+
+
+def _descompactar(detalhes):
+    return zlib.decompress(detalhes).decode('utf-8') if detalhes is not None else None
+
+
+class PoolConexoes:
+    """Pool de conexões SQLite compartilhado por todas as sessões do processo
+
+    O Streamlit executa cada rerun em uma thread nova, por isso as conexões são
+    reaproveitadas por um pool (e não por thread). Cada conexão é usada por uma
+    única thread por vez.
+    """
+
+    def __init__(self, caminho, tamanho_maximo=TAMANHO_POOL):
+        self.caminho = caminho
+        self._livres = queue.LifoQueue(maxsize=tamanho_maximo)
+
+    def _abrir(self):
+        conn = sqlite3.connect(
+            self.caminho,
+            timeout=TIMEOUT_OCUPADO,
+            check_same_thread=False,
+            cached_statements=COMANDOS_EM_CACHE
+        )
+        conn.execute("ATTACH DATABASE ? AS arquivo", (caminho_arquivo_logs(self.caminho),))
+        conn.create_function('descompactar', 1, _descompactar, deterministic=True)
+        # WAL: leitores não bloqueiam o escritor (e vice-versa); NORMAL evita fsync a cada commit
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA main.synchronous = NORMAL")
+        conn.execute("PRAGMA arquivo.synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {TIMEOUT_OCUPADO * 1000}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão do pool (abrindo uma nova se todas estiverem em uso)"""
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            conn = self._abrir()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._livres.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transacao(self):
+        """Conexão com commit ao final do bloco (ou rollback em caso de erro)"""
+        with self.conexao() as conn:
+            with conn:
+                yield conn
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas do pool"""
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_lock_pools = threading.Lock()
+_esquemas_inicializados = set()
+_lock_esquema = threading.Lock()
+
+
+def obter_pool(caminho=None):
+    """Retorna o pool de conexões do processo para o banco informado"""
+    caminho = caminho or CAMINHO_BANCO
+    pool = _pools.get(caminho)
+    if pool is None:
+        with _lock_pools:
+            pool = _pools.setdefault(caminho, PoolConexoes(caminho))
+    return pool
+
+
+def conexao():
+    """Atalho para emprestar uma conexão do pool padrão"""
+    return obter_pool().conexao()
+
+
+def transacao():
+    """Atalho para uma transação no pool padrão"""
+    return obter_pool().transacao()
+
+
+# Funções para gerenciamento do banco de dados
+def init_db():
+    """Inicializa o banco de dados SQLite (uma única vez por processo)"""
+    caminho = CAMINHO_BANCO
+    if caminho in _esquemas_inicializados:
+        return
+
+    with _lock_esquema:
+        if caminho in _esquemas_inicializados:
+            return
+
+        with obter_pool(caminho).conexao() as conn:
+            # Bancos novos já nascem com vacuum incremental (nos existentes a conversão,
+            # que reescreve o arquivo, é uma manutenção explícita: habilitar_vacuum_incremental)
+            if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM main.sqlite_master)").fetchone()[0]:
+                _habilitar_vacuum_incremental(conn)
+            _migrar_para_projetos(conn)
+
+        with obter_pool(caminho).transacao() as conn:
+            for comando in ESQUEMA:
+                conn.execute(comando)
+            _migrar_fatores_padrao(conn)
+            if 'versao' not in {linha[1] for linha in conn.execute("PRAGMA table_info(projetos)")}:
+                conn.execute("ALTER TABLE projetos ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+            for tabela, periodo in RESUMOS_LOGS.items():
+                if conn.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {tabela})").fetchone()[0]:
+                    _popular_resumo_logs(conn, tabela, periodo)
+            if conn.execute("SELECT EXISTS (SELECT 1 FROM riscos) AND NOT EXISTS (SELECT 1 FROM busca_riscos)").fetchone()[0]:
+                _indexar_riscos(conn, "1")
+
+            # Inserir usuários padrão se não existirem
+            senha_padrao = hashlib.sha256("1234".encode()).hexdigest()
+            conn.executemany(
+                "INSERT OR IGNORE INTO usuarios (username, password_hash) VALUES (?, ?)",
+                [(usuario, senha_padrao) for usuario in USUARIOS_PADRAO]
+            )
+
+        _esquemas_inicializados.add(caminho)
+
+
+def _popular_resumo_logs(conn, tabela, periodo):
+    """Preenche um resumo com os logs já gravados (bancos anteriores aos resumos)"""
+    chave = ", ".join((*periodo, 'username', 'acao'))
+    conn.execute(f'''
+        INSERT INTO {tabela} ({chave}, ativos, arquivados)
+        SELECT {_periodo_logs(periodo)}, username, acao, SUM(ativo), SUM(1 - ativo)
+        FROM (SELECT timestamp, username, acao, 1 AS ativo FROM main.logs
+              UNION ALL
+              SELECT timestamp, username, acao, 0 FROM arquivo.logs)
+        WHERE timestamp IS NOT NULL
+        GROUP BY {chave}
+    ''')
+
+
+def _vacuum_incremental_ativo(conn):
+    return conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2
+
+
+def _habilitar_vacuum_incremental(conn):
+    """Ativa auto_vacuum=INCREMENTAL no banco principal (reescrevendo-o uma única vez)"""
+    if not _vacuum_incremental_ativo(conn):
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+
+
+def habilitar_vacuum_incremental():
+    """Manutenção: converte um banco existente para vacuum incremental
+
+    O VACUUM reescreve o arquivo inteiro e bloqueia o banco (app e gravação dos logs)
+    até terminar; depois disso o arquivamento devolve o espaço liberado em passos curtos.
+    """
+    with conexao() as conn:
+        _habilitar_vacuum_incremental(conn)
+
+
+def _migrar_para_projetos(conn):
+    """Associa o registro único de bancos antigos (sem projeto_id) a um projeto"""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(riscos)")}
+    if not colunas or 'projeto_id' in colunas:
+        return
+
+    # A tabela de modalidades é recriada (a restrição UNIQUE muda), o que exige
+    # desligar as chaves estrangeiras para não apagar os fatores em cascata
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(riscos)")}
+        if 'projeto_id' not in colunas:
+            conn.execute(SQL_CRIAR_PROJETOS)
+            projeto_id = None
+            if conn.execute("SELECT EXISTS (SELECT 1 FROM riscos) OR EXISTS (SELECT 1 FROM modalidades)").fetchone()[0]:
+                projeto_id = conn.execute(
+                    "INSERT INTO projetos (nome, data_criacao) VALUES (?, ?)",
+                    (PROJETO_MIGRADO, datetime.now().strftime('%d/%m/%Y %H:%M'))
+                ).lastrowid
+
+            conn.execute("ALTER TABLE riscos ADD COLUMN projeto_id INTEGER REFERENCES projetos(id) ON DELETE CASCADE")
+            conn.execute("UPDATE riscos SET projeto_id = ?", (projeto_id,))
+
+            conn.execute(SQL_CRIAR_MODALIDADES.format(tabela='modalidades_migracao'))
+            conn.execute('''INSERT INTO modalidades_migracao (id, projeto_id, nome, posicao)
+                            SELECT id, ?, nome, posicao FROM modalidades''', (projeto_id,))
+            conn.execute("DROP TABLE modalidades")
+            conn.execute("ALTER TABLE modalidades_migracao RENAME TO modalidades")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+
+def _migrar_fatores_padrao(conn):
+    """Adiciona os fatores padrão às modalidades e permite fator NULL em bancos antigos"""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(modalidades)")}
+    if 'fator_padrao' not in colunas:
+        conn.execute("ALTER TABLE modalidades ADD COLUMN fator_padrao REAL")
+        conn.execute("ALTER TABLE modalidades ADD COLUMN justificativa_padrao TEXT NOT NULL DEFAULT ''")
+
+    # PRAGMA table_info: (cid, nome, tipo, notnull, padrão, pk)
+    fator_obrigatorio = any(linha[1] == 'fator' and linha[3]
+                            for linha in conn.execute("PRAGMA table_info(fatores_mitigacao)"))
+    if fator_obrigatorio:
+        conn.execute(SQL_CRIAR_FATORES.format(tabela='fatores_migracao'))
+        conn.execute("INSERT INTO fatores_migracao SELECT risco_id, modalidade_id, fator, justificativa FROM fatores_mitigacao")
+        conn.execute("DROP TABLE fatores_mitigacao")
+        conn.execute("ALTER TABLE fatores_migracao RENAME TO fatores_mitigacao")
+        conn.execute(SQL_CRIAR_INDICE_FATORES)
+
+
+def verificar_login(username, password):
+    """Verifica se as credenciais são válidas"""
+    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    with conexao() as conn:
+        resultado = conn.execute(
+            "SELECT 1 FROM usuarios WHERE username = ? AND password_hash = ?",
+            (username, password_hash)
+        ).fetchone()
+
+    return resultado is not None
+
+
+SQL_INSERIR_LOG = "INSERT INTO main.logs (timestamp, username, acao, detalhes) VALUES (?, ?, ?, ?)"
+SQL_INSERIR_ESTADO = "INSERT OR IGNORE INTO estados_riscos (hash, estado) VALUES (?, ?)"
+SQL_INSERIR_TEXTO = "INSERT OR IGNORE INTO textos_auditoria (hash, texto) VALUES (?, ?)"
+
+
+def _linha_log(registro):
+    """Converte (timestamp, username, acao, detalhes, ...) na linha gravada em logs"""
+    timestamp, username, acao, detalhes = registro[:4]
+    return timestamp, username, acao, json.dumps(detalhes) if detalhes else None
+
+
+def _gravar_registros(conn, registros):
+    """Grava registros de log e os objetos de auditoria que eles referenciam
+
+    Um registro é (timestamp, username, acao, detalhes) ou, para a auditoria de
+    riscos, (timestamp, username, acao, detalhes, textos, estados).
+    """
+    conn.executemany(SQL_INSERIR_LOG, [_linha_log(registro) for registro in registros])
+    auditados = [registro for registro in registros if len(registro) > 4]
+    if auditados:
+        conn.executemany(SQL_INSERIR_TEXTO, [texto for registro in auditados for texto in registro[4]])
+        conn.executemany(SQL_INSERIR_ESTADO, [estado for registro in auditados for estado in registro[5]])
+
+
+class EscritorLogs:
+    """Thread de fundo que grava o log de ações em lotes (group commit)
+
+    As ações entram em uma fila limitada; quando ela enche, quem registra espera
+    (contrapressão) em vez de acumular memória. A serialização dos detalhes em
+    JSON também é feita nesta thread, fora do rerun do Streamlit.
+    """
+
+    def __init__(self, caminho, tamanho_fila=TAMANHO_FILA_LOG, tamanho_lote=TAMANHO_LOTE_LOG,
+                 intervalo=INTERVALO_LOTE_LOG):
+        self.caminho = caminho
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = threading.Thread(target=self._executar, name="escritor-logs", daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, registro):
+        """Agenda a gravação de um registro (ver _gravar_registros)"""
+        self._fila.put(registro)
+
+    def _executar(self):
+        while True:
+            registro = self._fila.get()
+            if registro is None:
+                self._fila.task_done()
+                return
+
+            lote = [registro]
+            encerrar = False
+            # Acumula registros até completar o lote ou esgotar o intervalo
+            prazo = time.monotonic() + self.intervalo
+            while len(lote) < self.tamanho_lote:
+                try:
+                    proximo = self._fila.get(timeout=max(0, prazo - time.monotonic()))
+                except queue.Empty:
+                    break
+                if proximo is None:
+                    encerrar = True
+                    break
+                lote.append(proximo)
+
+            self._gravar(lote)
+            for _ in range(len(lote) + encerrar):
+                self._fila.task_done()
+            if encerrar:
+                return
+
+    def _gravar(self, lote):
+        try:
+            with obter_pool(self.caminho).transacao() as conn:
+                _gravar_registros(conn, lote)
+        except Exception:
+            logger.exception("Falha ao gravar lote de %d registros de log", len(lote))
+
+    def descarregar(self):
+        """Bloqueia até que todos os registros enfileirados estejam gravados"""
+        self._fila.join()
+
+    def encerrar(self):
+        """Grava o que estiver pendente e finaliza a thread"""
+        if self._thread.is_alive():
+            self._fila.put(None)
+            self._thread.join()
+
+
+_escritores_logs = {}
+_lock_escritores = threading.Lock()
+
+
+def _obter_escritor_logs():
+    """Escritor de logs do processo para o banco padrão (criado sob demanda)"""
+    caminho = CAMINHO_BANCO
+    escritor = _escritores_logs.get(caminho)
+    if escritor is None:
+        with _lock_escritores:
+            escritor = _escritores_logs.get(caminho)
+            if escritor is None:
+                escritor = _escritores_logs[caminho] = EscritorLogs(caminho)
+    return escritor
+
+
+def descarregar_logs():
+    """Garante que todas as ações já registradas estejam gravadas no banco"""
+    for escritor in list(_escritores_logs.values()):
+        escritor.descarregar()
+
+
+@atexit.register
+def encerrar_escritores_logs():
+    """Grava os logs pendentes no encerramento do processo"""
+    for escritor in list(_escritores_logs.values()):
+        escritor.encerrar()
+
+
+def registrar_acao(username, acao, detalhes=None, durabilidade=None):
+    """Registra uma ação no log
+
+    No modo 'lote' (padrão, ver DURABILIDADE_LOG) a gravação é feita em segundo
+    plano; `detalhes` não deve ser alterado pelo chamador após o registro.
+    """
+    _registrar((_agora_log(), username, acao, detalhes), durabilidade)
+
+
+def registrar_alteracao_risco(username, acao, risco, anterior=None, durabilidade=None):
+    """Registra a criação (ou a edição, com o estado `anterior`) de um risco no log de auditoria
+
+    Os detalhes do log guardam o hash do estado do risco e, na edição, a diferença
+    até o novo estado; estados e textos longos vão para o repositório endereçado
+    por conteúdo (ver auditoria.py e `estado_risco_log`).
+    """
+    detalhes, textos, estados = auditar_risco(risco, anterior)
+    _registrar((_agora_log(), username, acao, detalhes, textos, estados), durabilidade)
+
+
+def _agora_log():
+    # Mesmo formato de CURRENT_TIMESTAMP (UTC), capturado no momento da ação
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _registrar(registro, durabilidade):
+    if (durabilidade or DURABILIDADE_LOG) == 'sincrono':
+        with transacao() as conn:
+            _gravar_registros(conn, [registro])
+    else:
+        _obter_escritor_logs().enfileirar(registro)
+
+
+def estado_risco_log(log_id):
+    """Estado completo do risco no registro de log `log_id` (ativo ou arquivado)
+
+    Disponível para os registros de criação e edição de riscos; None para os demais
+    (e para edições registradas antes da auditoria por diferenças).
+    """
+    descarregar_logs()
+    with conexao() as conn:
+        linha = conn.execute(
+            "SELECT detalhes FROM main.logs WHERE id = ? "
+            "UNION ALL SELECT descompactar(detalhes) FROM arquivo.logs WHERE id = ?",
+            (log_id, log_id)
+        ).fetchone()
+        if linha is None or not linha[0]:
+            return None
+        detalhes = json.loads(linha[0])
+        if not isinstance(detalhes, dict):
+            return None
+
+        def obter_estado(chave):
+            return conn.execute("SELECT estado FROM estados_riscos WHERE hash = ?", (chave,)).fetchone()[0]
+
+        def obter_textos(chaves):
+            chaves = list(chaves)
+            if not chaves:
+                return {}
+            return dict(conn.execute(
+                f"SELECT hash, texto FROM textos_auditoria WHERE hash IN ({', '.join('?' * len(chaves))})",
+                chaves
+            ))
+
+        return reconstruir_estado(detalhes, obter_estado, obter_textos)
+
+
+def _filtros_logs(usuarios=None, acoes=None, data_inicio=None, data_fim=None, coluna_data='timestamp'):
+    """Monta a cláusula WHERE (e parâmetros) dos filtros do visualizador de logs
+
+    Listas vazias ou None não filtram; datas são inclusivas ('AAAA-MM-DD') e se
+    aplicam a `coluna_data` ('timestamp' em logs, 'dia' nos resumos).
+    """
+    condicoes = []
+    parametros = []
+    for coluna, valores in (('username', usuarios), ('acao', acoes)):
+        if valores:
+            valores = list(valores)
+            if len(valores) == 1:
+                condicoes.append(f"{coluna} = ?")
+            else:
+                condicoes.append(f"{coluna} IN ({', '.join('?' * len(valores))})")
+            parametros.extend(valores)
+    if data_inicio:
+        condicoes.append(f"{coluna_data} >= ?")
+        parametros.append(str(data_inicio))
+    if data_fim:
+        condicoes.append(f"{coluna_data} < date(?, '+1 day')")
+        parametros.append(str(data_fim))
+    return condicoes, parametros
+
+
+def _tabelas_logs(incluir_arquivo):
+    return ('main.logs', 'arquivo.logs') if incluir_arquivo else ('main.logs',)
+
+
+def obter_logs(usuarios=None, acoes=None, data_inicio=None, data_fim=None, cursor=None, limite=None,
+               incluir_arquivo=False):
+    """Obtém os logs do sistema, mais recentes primeiro, com filtros e paginação no SQL
+
+    A paginação é por chave (keyset): `cursor` é o par (timestamp, id) do último
+    registro da página anterior, de modo que cada página custa o mesmo
+    independentemente do tamanho da tabela. Com `incluir_arquivo` a consulta
+    abrange também os logs arquivados. Retorna linhas (id, timestamp, username,
+    acao, detalhes).
+    """
+    condicoes, parametros = _filtros_logs(usuarios, acoes, data_inicio, data_fim)
+    if cursor is not None:
+        condicoes.append("(timestamp, id) < (?, ?)")
+        parametros.extend(cursor)
+    where = (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
+    ordem = " ORDER BY timestamp DESC, id DESC"
+    if limite is not None:
+        ordem += " LIMIT ?"
+        parametros.append(limite)
+
+    if not incluir_arquivo:
+        sql = f"SELECT id, timestamp, username, acao, detalhes FROM main.logs{where}{ordem}"
+        with conexao() as conn:
+            return conn.execute(sql, parametros).fetchall()
+
+    # Cada tabela é paginada pelo próprio índice e só a página resultante é intercalada
+    # e descompactada. Os registros arquivados mantêm o id original (logs usa
+    # AUTOINCREMENT, sem reuso), o que deixa o cursor (timestamp, id) válido nas duas
+    paginas = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT id, timestamp, username, acao, detalhes, {arquivado} AS arquivado "
+        f"FROM {tabela}{where}{ordem})"
+        for arquivado, tabela in enumerate(_tabelas_logs(True))
+    )
+    sql = ("SELECT id, timestamp, username, acao, "
+           "CASE WHEN arquivado THEN descompactar(detalhes) ELSE detalhes END "
+           f"FROM ({paginas}){ordem}")
+    with conexao() as conn:
+        return conn.execute(sql, parametros * 2 + parametros[-1:] * (limite is not None)).fetchall()
+
+
+def _filtros_resumo_logs(usuarios, acoes, data_inicio, data_fim, incluir_arquivo):
+    """Coluna de contagem, cláusula WHERE e parâmetros dos filtros sobre um resumo dos logs"""
+    condicoes, parametros = _filtros_logs(usuarios, acoes, data_inicio, data_fim, coluna_data='dia')
+    contagem = "ativos + arquivados" if incluir_arquivo else "ativos"
+    condicoes.append(f"{contagem} > 0")
+    return contagem, " WHERE " + " AND ".join(condicoes), parametros
+
+
+def resumir_logs(usuarios=None, acoes=None, data_inicio=None, data_fim=None, incluir_arquivo=False):
+    """Estatísticas dos logs filtrados a partir do resumo diário
+
+    Retorna total, período (primeiro e último dia com ações, como `date`) e as
+    contagens por usuário e por ação, em ordem decrescente.
+    """
+    contagem, where, parametros = _filtros_resumo_logs(usuarios, acoes, data_inicio, data_fim, incluir_arquivo)
+
+    total, inicio, fim = 0, None, None
+    por_usuario = {}
+    por_acao = {}
+    with conexao() as conn:
+        for dia_inicio, dia_fim, username, acao, quantidade in conn.execute(
+            f"""SELECT MIN(dia), MAX(dia), username, acao, SUM({contagem})
+                FROM logs_resumo_diario{where} GROUP BY username, acao""",
+            parametros
+        ):
+            total += quantidade
+            inicio = min(inicio or dia_inicio, dia_inicio)
+            fim = max(fim or dia_fim, dia_fim)
+            por_usuario[username] = por_usuario.get(username, 0) + quantidade
+            por_acao[acao] = por_acao.get(acao, 0) + quantidade
+
+    return {
+        'total': total,
+        'inicio': date.fromisoformat(inicio) if inicio else None,
+        'fim': date.fromisoformat(fim) if fim else None,
+        'por_usuario': sorted(por_usuario.items(), key=itemgetter(1), reverse=True),
+        'por_acao': sorted(por_acao.items(), key=itemgetter(1), reverse=True),
+    }
+
+
+def serie_atividade_logs(usuarios=None, acoes=None, data_inicio=None, data_fim=None, incluir_arquivo=False,
+                         granularidade='dia'):
+    """Número de ações filtradas por período, em ordem
+
+    `granularidade` 'dia' ('AAAA-MM-DD', do resumo diário), 'hora' ('AAAA-MM-DD HH:00')
+    ou 'hora_do_dia' (0 a 23, somando todos os dias), as duas últimas do resumo por hora.
+    """
+    contagem, where, parametros = _filtros_resumo_logs(usuarios, acoes, data_inicio, data_fim, incluir_arquivo)
+    tabela, periodo, agrupamento = {
+        'dia': ('logs_resumo_diario', "dia", "dia"),
+        'hora': ('logs_resumo_horario', "dia || printf(' %02d:00', hora)", "dia, hora"),
+        'hora_do_dia': ('logs_resumo_horario', "hora", "hora"),
+    }[granularidade]
+    with conexao() as conn:
+        return conn.execute(
+            f"SELECT {periodo}, SUM({contagem}) FROM {tabela}{where} GROUP BY {agrupamento} ORDER BY {agrupamento}",
+            parametros
+        ).fetchall()
+
+
+def _valores_distintos_logs(coluna, incluir_arquivo=False):
+    """Valores distintos de uma coluna indexada dos logs via skip-scan (um salto por valor)"""
+    valores = set()
+    with conexao() as conn:
+        for tabela in _tabelas_logs(incluir_arquivo):
+            valores.update(linha[0] for linha in conn.execute(f'''
+                WITH RECURSIVE distintos(valor) AS (
+                    SELECT MIN({coluna}) FROM {tabela}
+                    UNION ALL
+                    SELECT (SELECT MIN({coluna}) FROM {tabela} WHERE {coluna} > distintos.valor)
+                    FROM distintos WHERE distintos.valor IS NOT NULL
+                )
+                SELECT valor FROM distintos WHERE valor IS NOT NULL'''))
+    return sorted(valores)
+
+
+def listar_usuarios_logs(incluir_arquivo=False):
+    """Usuários que possuem ações registradas"""
+    return _valores_distintos_logs('username', incluir_arquivo)
+
+
+def listar_acoes_logs(incluir_arquivo=False):
+    """Tipos de ação registrados"""
+    return _valores_distintos_logs('acao', incluir_arquivo)
+
+
+def arquivar_logs(idade_dias=None, tamanho_lote=TAMANHO_LOTE_ARQUIVAMENTO):
+    """Move os logs mais antigos que `idade_dias` (padrão RETENCAO_LOGS_DIAS) para o arquivo
+
+    Cada lote é copiado para o arquivo e apagado do banco principal em uma transação
+    curta, seguida de um passo de vacuum incremental, para não bloquear as gravações
+    do app por muito tempo. Em WAL a transação não é atômica entre os dois bancos: a
+    cópia vem antes da remoção e é idempotente (INSERT OR IGNORE), de modo que uma
+    interrupção no meio é corrigida pela execução seguinte. Retorna o número de
+    registros arquivados.
+    """
+    idade_dias = RETENCAO_LOGS_DIAS if idade_dias is None else idade_dias
+    corte = (datetime.now(timezone.utc) - timedelta(days=idade_dias)).strftime('%Y-%m-%d %H:%M:%S')
+    descarregar_logs()
+
+    arquivados = 0
+    with conexao() as conn:
+        # Sem vacuum incremental (banco antigo não convertido) as páginas livres são só reaproveitadas
+        incremental = _vacuum_incremental_ativo(conn)
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                linhas = conn.execute(
+                    '''SELECT id, timestamp, username, acao, detalhes FROM main.logs
+                       WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?''',
+                    (corte, tamanho_lote)
+                ).fetchall()
+                if linhas:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO arquivo.logs (id, timestamp, username, acao, detalhes) VALUES (?, ?, ?, ?, ?)",
+                        [(id_log, timestamp, username, acao, _compactar(detalhes))
+                         for id_log, timestamp, username, acao, detalhes in linhas]
+                    )
+                    # O lote é exatamente o início da ordem (timestamp, id) abaixo do corte
+                    lote = "FROM main.logs WHERE timestamp < ? AND (timestamp, id) <= (?, ?)"
+                    parametros_lote = (corte, linhas[-1][1], linhas[-1][0])
+                    # Nos resumos, as ações do lote passam a arquivadas (o gatilho de remoção
+                    # as desconta das ativas)
+                    for tabela, periodo in RESUMOS_LOGS.items():
+                        chave = (*periodo, 'username', 'acao')
+                        conn.execute(
+                            f'''UPDATE {tabela} SET arquivados = arquivados + lote.total
+                                FROM (SELECT {_periodo_logs(periodo)}, username, acao, COUNT(*) AS total
+                                      {lote} GROUP BY {', '.join(chave)}) AS lote
+                                WHERE {' AND '.join(f"{tabela}.{coluna} = lote.{coluna}" for coluna in chave)}''',
+                            parametros_lote
+                        )
+                    conn.execute(f"DELETE {lote}", parametros_lote)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if not linhas:
+                break
+            arquivados += len(linhas)
+            if incremental:
+                conn.execute(f"PRAGMA main.incremental_vacuum({PAGINAS_VACUUM_POR_PASSO})").fetchall()
+
+        # Devolve o restante das páginas livres, também em passos curtos
+        while incremental and conn.execute("PRAGMA main.freelist_count").fetchone()[0]:
+            conn.execute(f"PRAGMA main.incremental_vacuum({PAGINAS_VACUUM_POR_PASSO})").fetchall()
+
+    return arquivados
+
+
+def estatisticas_logs():
+    """Registros e tamanho (bytes) dos logs ativos e arquivados"""
+    with conexao() as conn:
+        def tamanho(esquema):
+            paginas = conn.execute(f"PRAGMA {esquema}.page_count").fetchone()[0]
+            return paginas * conn.execute(f"PRAGMA {esquema}.page_size").fetchone()[0]
+
+        return {
+            'ativos': conn.execute("SELECT COUNT(*) FROM main.logs").fetchone()[0],
+            'arquivados': conn.execute("SELECT COUNT(*) FROM arquivo.logs").fetchone()[0],
+            'tamanho_banco': tamanho('main'),
+            'tamanho_arquivo': tamanho('arquivo'),
+            'vacuum_incremental': _vacuum_incremental_ativo(conn),
+        }
+
+
+# Colunas escalares da tabela riscos (os fatores ficam em fatores_mitigacao)
+CAMPOS_RISCO = (
+    'risco_chave', 'descricao', 'impacto_nivel', 'impacto_valor',
+    'probabilidade_nivel', 'probabilidade_valor', 'risco_inerente', 'classificacao',
+    'justificativa_fator_probabilidade', 'contexto_especifico',
+    'personalizado', 'editado', 'criado_por', 'data_criacao', 'data_edicao'
+)
+CAMPOS_TEXTO = ('descricao', 'justificativa_fator_probabilidade', 'contexto_especifico')
+CAMPOS_BOOLEANOS = ('personalizado', 'editado')
+# Colunas cujo texto entra na busca textual (ver SQL_INDEXAR_RISCOS)
+CAMPOS_BUSCA = ('risco_chave', 'descricao', 'justificativa_fator_probabilidade', 'contexto_especifico')
+
+SQL_INSERIR_RISCO = (
+    f"INSERT INTO riscos (projeto_id, {', '.join(CAMPOS_RISCO)}) "
+    f"VALUES ({', '.join('?' * (len(CAMPOS_RISCO) + 1))})"
+)
+SQL_GRAVAR_FATOR = (
+    "INSERT OR REPLACE INTO fatores_mitigacao (risco_id, modalidade_id, fator, justificativa) "
+    "VALUES (?, ?, ?, ?)"
+)
+
+
+def _valores_risco(risco):
+    """Valores das colunas escalares de um risco, na ordem de CAMPOS_RISCO"""
+    valores = []
+    for campo in CAMPOS_RISCO:
+        valor = risco.get(campo)
+        if campo in CAMPOS_BOOLEANOS:
+            valor = int(bool(valor))
+        valores.append(valor)
+    return valores
+
+
+def _linhas_fatores(risco_id, risco, ids_modalidades, ids_com_padrao):
+    """Linhas de fatores_mitigacao de um risco para as modalidades conhecidas
+
+    Modalidades com fator padrão que não se aplicam ao risco recebem fator NULL.
+    """
+    fatores = risco.get('modalidades', {})
+    justificativas = risco.get('justificativas_modalidades', {})
+    linhas = [(risco_id, ids_modalidades[modalidade], fator, justificativas.get(modalidade, ""))
+              for modalidade, fator in fatores.items()
+              if modalidade in ids_modalidades]
+    linhas.extend((risco_id, modalidade_id, None, "")
+                  for modalidade, modalidade_id in ids_com_padrao.items()
+                  if modalidade not in fatores)
+    return linhas
+
+
+def _inserir_fatores(conn, risco_id, risco, projeto_id):
+    """Insere os fatores de mitigação de um risco do projeto"""
+    conn.executemany(SQL_GRAVAR_FATOR, _linhas_fatores(risco_id, risco, *_modalidades_projeto(conn, projeto_id)))
+
+
+def _ids_modalidades(conn, projeto_id):
+    """Mapa nome -> id das modalidades cadastradas no projeto"""
+    return dict(conn.execute("SELECT nome, id FROM modalidades WHERE projeto_id = ?", (projeto_id,)).fetchall())
+
+
+def _modalidades_projeto(conn, projeto_id):
+    """Mapas nome -> id de todas as modalidades do projeto e das que têm fator padrão"""
+    ids_modalidades = {}
+    ids_com_padrao = {}
+    for nome, modalidade_id, fator_padrao in conn.execute(
+        "SELECT nome, id, fator_padrao FROM modalidades WHERE projeto_id = ?", (projeto_id,)
+    ):
+        ids_modalidades[nome] = modalidade_id
+        if fator_padrao is not None:
+            ids_com_padrao[nome] = modalidade_id
+    return ids_modalidades, ids_com_padrao
+
+
+# Documento de busca de cada risco: justificativas explícitas do risco ou, sem linha
+# própria, a justificativa padrão da modalidade
+SQL_INDEXAR_RISCOS = '''
+    INSERT OR REPLACE INTO busca_riscos (rowid, risco_chave, descricao, contexto, justificativas, aspectos)
+    SELECT r.id, r.risco_chave, r.descricao,
+           COALESCE(r.contexto_especifico, '') ||
+           CASE WHEN r.justificativa_fator_probabilidade IS NOT r.contexto_especifico
+                THEN ' ' || COALESCE(r.justificativa_fator_probabilidade, '') ELSE '' END,
+           (SELECT group_concat(NULLIF(CASE WHEN f.risco_id IS NULL THEN m.justificativa_padrao
+                                            ELSE f.justificativa END, ''), ' ')
+            FROM modalidades m
+            LEFT JOIN fatores_mitigacao f ON f.risco_id = r.id AND f.modalidade_id = m.id
+            WHERE m.projeto_id = r.projeto_id),
+           (SELECT a.texto FROM aspectos_riscos a WHERE a.risco_chave = r.risco_chave)
+    FROM riscos r
+    WHERE {condicao}
+'''
+
+# Peso de cada coluna de busca_riscos no ranking BM25
+PESOS_BUSCA = (10.0, 4.0, 2.0, 1.0, 1.0)
+
+# Sufixos removidos dos termos da busca (sem acentos), do mais longo ao mais curto, para
+# que variantes da mesma palavra (contingência, contingenciamento) se encontrem pelo prefixo
+SUFIXOS_BUSCA = (
+    'amentos', 'imentos', 'amento', 'imento', 'encias', 'ancias', 'idades', 'mente', 'acoes', 'icoes',
+    'encia', 'ancia', 'idade', 'acao', 'icao', 'oes', 'aes', 'ais', 'eis', 'es', 'os', 'as', 's', 'a', 'o', 'e'
+)
+TAMANHO_MINIMO_RADICAL = 4
+
+
+def _indexar_riscos(conn, condicao, parametros=()):
+    """(Re)indexa na busca textual os riscos que atendem à condição SQL sobre `r` (riscos)"""
+    conn.execute(SQL_INDEXAR_RISCOS.format(condicao=condicao), parametros)
+
+
+def _radical(termo):
+    for sufixo in SUFIXOS_BUSCA:
+        if termo.endswith(sufixo) and len(termo) - len(sufixo) >= TAMANHO_MINIMO_RADICAL:
+            return termo[:-len(sufixo)]
+    return termo
+
+
+def _consulta_busca(texto):
+    """Consulta FTS5 (todos os termos, por prefixo do radical) a partir do texto digitado"""
+    normalizado = unicodedata.normalize('NFKD', texto.lower())
+    normalizado = ''.join(caractere for caractere in normalizado if not unicodedata.combining(caractere))
+    return ' '.join(f'"{_radical(termo)}"*' for termo in re.findall(r'\w+', normalizado))
+
+
+def buscar_riscos(projeto_id, texto, limite=None):
+    """Ids dos riscos do projeto que contêm todos os termos de `texto`, do mais ao menos relevante
+
+    A busca cobre nome, descrição, contexto, justificativas das modalidades e os
+    aspectos do risco, sem diferenciar maiúsculas nem acentos; o ranking é o BM25
+    com PESOS_BUSCA por coluna.
+    """
+    consulta = _consulta_busca(texto)
+    if not consulta:
+        return []
+
+    sql = f'''SELECT b.rowid FROM busca_riscos b JOIN riscos r ON r.id = b.rowid
+              WHERE busca_riscos MATCH ? AND r.projeto_id = ?
+              ORDER BY bm25(busca_riscos, {', '.join(map(str, PESOS_BUSCA))})'''
+    parametros = [consulta, projeto_id]
+    if limite is not None:
+        sql += " LIMIT ?"
+        parametros.append(limite)
+    with conexao() as conn:
+        return [linha[0] for linha in conn.execute(sql, parametros)]
+
+
+# Aspectos já registrados em cada banco neste processo (o app os registra a cada execução do script)
+_aspectos_registrados = {}
+
+
+def registrar_aspectos_riscos(aspectos):
+    """Grava o texto dos aspectos de cada risco ({risco_chave: texto}) e reindexa os que mudaram
+
+    Só consulta o banco na primeira chamada do processo (ou quando os aspectos mudam).
+    """
+    if _aspectos_registrados.get(CAMINHO_BANCO) == aspectos:
+        return
+    with conexao() as conn:
+        gravados = dict(conn.execute("SELECT risco_chave, texto FROM aspectos_riscos"))
+    alterados = {chave: texto for chave, texto in aspectos.items() if gravados.get(chave) != texto}
+    if alterados:
+        with transacao() as conn:
+            conn.executemany("INSERT OR REPLACE INTO aspectos_riscos (risco_chave, texto) VALUES (?, ?)",
+                             alterados.items())
+            _indexar_riscos(conn, "r.risco_chave IN (SELECT value FROM json_each(?))", (json.dumps(list(alterados)),))
+    _aspectos_registrados[CAMINHO_BANCO] = dict(aspectos)
+
+
+def _marcar_alteracao(conn, projeto_id):
+    """Incrementa a versão do projeto (uma vez por gravação, na mesma transação)"""
+    conn.execute("UPDATE projetos SET versao = versao + 1 WHERE id = ?", (projeto_id,))
+
+
+def estado_projeto(projeto_id):
+    """(nome, versão) do projeto, ou None se ele não existir"""
+    with conexao() as conn:
+        return conn.execute("SELECT nome, versao FROM projetos WHERE id = ?", (projeto_id,)).fetchone()
+
+
+def obter_ou_criar_projeto(nome, usuario=None):
+    """Id do projeto com o nome informado, cadastrando-o se ainda não existir"""
+    with transacao() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO projetos (nome, criado_por, data_criacao) VALUES (?, ?, ?)",
+            (nome, usuario, datetime.now().strftime('%d/%m/%Y %H:%M'))
+        )
+        return conn.execute("SELECT id FROM projetos WHERE nome = ?", (nome,)).fetchone()[0]
+
+
+def listar_projetos():
+    """Lista (id, nome) de todos os projetos, em ordem alfabética"""
+    with conexao() as conn:
+        return conn.execute("SELECT id, nome FROM projetos ORDER BY nome").fetchall()
+
+
+def carregar_registro_riscos(projeto_id):
+    """Carrega riscos e modalidades persistidos do projeto no formato usado no session_state
+
+    Os riscos vêm em um RegistroRiscos compacto, montado risco a risco: os
+    dicionários intermediários de cada risco são descartados logo em seguida. Os
+    fatores padrão ficam no índice do registro; só os fatores explícitos são lidos.
+    """
+    with conexao() as conn:
+        modalidades = conn.execute(
+            "SELECT id, nome, fator_padrao, justificativa_padrao FROM modalidades WHERE projeto_id = ? ORDER BY posicao",
+            (projeto_id,)
+        ).fetchall()
+        nomes_modalidades = {modalidade_id: nome for modalidade_id, nome, _, _ in modalidades}
+
+        riscos = RegistroRiscos(indice=IndiceModalidades(
+            nomes_modalidades.values(),
+            [fator_padrao for _, _, fator_padrao, _ in modalidades],
+            [justificativa_padrao for _, _, _, justificativa_padrao in modalidades]
+        ))
+        riscos_por_id = {}
+        for linha in conn.execute(
+            f"SELECT id, {', '.join(CAMPOS_RISCO)} FROM riscos WHERE projeto_id = ? ORDER BY id", (projeto_id,)
+        ):
+            risco = {'id': linha[0]}
+            for campo, valor in zip(CAMPOS_RISCO, linha[1:]):
+                if campo in CAMPOS_BOOLEANOS:
+                    if valor:
+                        risco[campo] = True
+                elif valor is not None or campo in CAMPOS_TEXTO:
+                    risco[campo] = valor if valor is not None else ""
+            riscos.append(risco)
+            riscos_por_id[risco['id']] = riscos[-1]
+
+        # Uma única varredura indexada dos fatores explícitos, na ordem das modalidades
+        fatores = conn.execute('''SELECT f.risco_id, f.modalidade_id, f.fator, f.justificativa
+                                  FROM modalidades m JOIN fatores_mitigacao f ON f.modalidade_id = m.id
+                                  WHERE m.projeto_id = ?
+                                  ORDER BY f.risco_id, m.posicao''', (projeto_id,))
+        for risco_id, avaliacoes in groupby(fatores, key=itemgetter(0)):
+            risco = riscos_por_id.get(risco_id)
+            if risco is not None:
+                fatores = risco['modalidades']
+                justificativas = risco['justificativas_modalidades']
+                for _, modalidade_id, fator, justificativa in avaliacoes:
+                    fatores[nomes_modalidades[modalidade_id]] = fator
+                    justificativas[nomes_modalidades[modalidade_id]] = justificativa
+
+    return riscos, list(nomes_modalidades.values())
+
+
+def _apagar_registro(conn, projeto_id):
+    conn.execute("DELETE FROM fatores_mitigacao WHERE risco_id IN (SELECT id FROM riscos WHERE projeto_id = ?)",
+                 (projeto_id,))
+    conn.execute("DELETE FROM riscos WHERE projeto_id = ?", (projeto_id,))
+    conn.execute("DELETE FROM modalidades WHERE projeto_id = ?", (projeto_id,))
+
+
+def salvar_registro_riscos(projeto_id, riscos, modalidades):
+    """Substitui todo o registro persistido do projeto (usado ao semear, recarregar ou limpar os dados)"""
+    with transacao() as conn:
+        _apagar_registro(conn, projeto_id)
+        conn.executemany("INSERT INTO modalidades (projeto_id, nome, posicao) VALUES (?, ?, ?)",
+                         [(projeto_id, modalidade, posicao) for posicao, modalidade in enumerate(modalidades)])
+        ids_modalidades = _ids_modalidades(conn, projeto_id)
+
+        for risco in riscos:
+            risco['id'] = conn.execute(SQL_INSERIR_RISCO, (projeto_id, *_valores_risco(risco))).lastrowid
+            conn.executemany(SQL_GRAVAR_FATOR, _linhas_fatores(risco['id'], risco, ids_modalidades, {}))
+        _indexar_riscos(conn, "r.projeto_id = ?", (projeto_id,))
+        _marcar_alteracao(conn, projeto_id)
+
+
+def limpar_registro_riscos(projeto_id):
+    """Remove o registro persistido do projeto, fazendo com que a planilha original seja recarregada"""
+    with transacao() as conn:
+        _apagar_registro(conn, projeto_id)
+        _marcar_alteracao(conn, projeto_id)
+
+
+def inserir_risco_db(projeto_id, risco):
+    """Persiste um novo risco do projeto e seus fatores, retornando o id gerado"""
+    with transacao() as conn:
+        risco_id = conn.execute(SQL_INSERIR_RISCO, (projeto_id, *_valores_risco(risco))).lastrowid
+        _inserir_fatores(conn, risco_id, risco, projeto_id)
+        _indexar_riscos(conn, "r.id = ?", (risco_id,))
+        _marcar_alteracao(conn, projeto_id)
+
+    return risco_id
+
+
+def remover_risco_db(risco_id):
+    """Remove um risco persistido (os fatores e o documento de busca saem em cascata)"""
+    with transacao() as conn:
+        linha = conn.execute("SELECT projeto_id FROM riscos WHERE id = ?", (risco_id,)).fetchone()
+        if linha is not None:
+            conn.execute("DELETE FROM riscos WHERE id = ?", (risco_id,))
+            _marcar_alteracao(conn, linha[0])
+
+
+def inserir_riscos_em_lote(projeto_id, riscos):
+    """Persiste vários riscos do projeto em uma única transação, preenchendo risco['id']
+
+    Os ids são reservados de uma vez (a transação é IMMEDIATE), o que permite
+    inserir riscos e fatores com executemany em vez de um comando por risco.
+    """
+    if not riscos:
+        return
+
+    with transacao() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        ultimo_id = conn.execute('''SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'riscos'), 0),
+                                               COALESCE((SELECT MAX(id) FROM riscos), 0))''').fetchone()[0]
+        for deslocamento, risco in enumerate(riscos, 1):
+            risco['id'] = ultimo_id + deslocamento
+
+        conn.executemany(
+            f"INSERT INTO riscos (id, projeto_id, {', '.join(CAMPOS_RISCO)}) "
+            f"VALUES ({', '.join('?' * (len(CAMPOS_RISCO) + 2))})",
+            [(risco['id'], projeto_id, *_valores_risco(risco)) for risco in riscos]
+        )
+
+        modalidades_projeto = _modalidades_projeto(conn, projeto_id)
+        conn.executemany(
+            SQL_GRAVAR_FATOR,
+            [linha for risco in riscos for linha in _linhas_fatores(risco['id'], risco, *modalidades_projeto)]
+        )
+        _indexar_riscos(conn, "r.id BETWEEN ? AND ?", (ultimo_id + 1, ultimo_id + len(riscos)))
+        _marcar_alteracao(conn, projeto_id)
+
+
+def atualizar_risco_db(risco_anterior, risco):
+    """Grava apenas as colunas e os fatores de mitigação que mudaram na edição"""
+    alteracoes = {
+        campo: valor
+        for campo, valor, valor_anterior in zip(CAMPOS_RISCO, _valores_risco(risco), _valores_risco(risco_anterior))
+        if valor != valor_anterior
+    }
+
+    fatores = risco.get('modalidades', {})
+    fatores_anteriores = risco_anterior.get('modalidades', {})
+    justificativas = risco.get('justificativas_modalidades', {})
+    justificativas_anteriores = risco_anterior.get('justificativas_modalidades', {})
+    fatores_alterados = [
+        (modalidade, fator, justificativas.get(modalidade, ""))
+        for modalidade, fator in fatores.items()
+        if fator != fatores_anteriores.get(modalidade)
+        or justificativas.get(modalidade, "") != justificativas_anteriores.get(modalidade, "")
+    ]
+    # Modalidades que deixaram de se aplicar ao risco ficam com fator NULL
+    fatores_alterados.extend((modalidade, None, "") for modalidade in fatores_anteriores if modalidade not in fatores)
+
+    if not alteracoes and not fatores_alterados:
+        return
+
+    with transacao() as conn:
+        projeto_id = conn.execute("SELECT projeto_id FROM riscos WHERE id = ?", (risco['id'],)).fetchone()[0]
+        if alteracoes:
+            atribuicoes = ", ".join(f"{campo} = ?" for campo in alteracoes)
+            conn.execute(f"UPDATE riscos SET {atribuicoes} WHERE id = ?", (*alteracoes.values(), risco['id']))
+
+        if fatores_alterados:
+            ids_modalidades = _ids_modalidades(conn, projeto_id)
+            conn.executemany(
+                SQL_GRAVAR_FATOR,
+                [(risco['id'], ids_modalidades[modalidade], fator, justificativa)
+                 for modalidade, fator, justificativa in fatores_alterados
+                 if modalidade in ids_modalidades]
+            )
+
+        if fatores_alterados or not alteracoes.keys().isdisjoint(CAMPOS_BUSCA):
+            _indexar_riscos(conn, "r.id = ?", (risco['id'],))
+        _marcar_alteracao(conn, projeto_id)
+
+
+def adicionar_modalidade_db(projeto_id, modalidade, fator_padrao, justificativa_padrao=""):
+    """Cadastra uma modalidade no projeto com o fator padrão para todos os seus riscos
+
+    Nenhuma linha de fatores_mitigacao é criada: o padrão fica na própria modalidade.
+    """
+    with transacao() as conn:
+        conn.execute(
+            '''INSERT INTO modalidades (projeto_id, nome, posicao, fator_padrao, justificativa_padrao)
+               SELECT ?, ?, COALESCE(MAX(posicao), -1) + 1, ?, ? FROM modalidades WHERE projeto_id = ?''',
+            (projeto_id, modalidade, fator_padrao, justificativa_padrao, projeto_id)
+        )
+        if justificativa_padrao:
+            _indexar_riscos(conn, "r.projeto_id = ?", (projeto_id,))
+        _marcar_alteracao(conn, projeto_id)
+
+
+def remover_modalidade_db(projeto_id, modalidade):
+    """Remove uma modalidade do projeto e os fatores associados a ela"""
+    with transacao() as conn:
+        # Riscos cujo documento de busca contém uma justificativa desta modalidade
+        reindexar = conn.execute(
+            '''SELECT r.id FROM modalidades m
+               JOIN riscos r ON r.projeto_id = m.projeto_id
+               LEFT JOIN fatores_mitigacao f ON f.risco_id = r.id AND f.modalidade_id = m.id
+               WHERE m.projeto_id = ? AND m.nome = ?
+                 AND length(CASE WHEN f.risco_id IS NULL THEN m.justificativa_padrao ELSE f.justificativa END) > 0''',
+            (projeto_id, modalidade)
+        ).fetchall()
+        conn.execute(
+            '''DELETE FROM fatores_mitigacao
+               WHERE modalidade_id = (SELECT id FROM modalidades WHERE projeto_id = ? AND nome = ?)''',
+            (projeto_id, modalidade)
+        )
+        conn.execute("DELETE FROM modalidades WHERE projeto_id = ? AND nome = ?", (projeto_id, modalidade))
+        if reindexar:
+            _indexar_riscos(conn, "r.id IN (SELECT value FROM json_each(?))",
+                            (json.dumps([risco_id for risco_id, in reindexar]),))
+        _marcar_alteracao(conn, projeto_id)
+
+
+# Risco residual de cada modalidade de cada projeto, com a posição da modalidade no
+# ranking do projeto (1 = menor risco residual; empates na ordem das modalidades)
+SQL_RESIDUAL_POR_PROJETO = '''
+    WITH por_modalidade AS (
+        SELECT m.projeto_id, m.nome AS modalidade, m.posicao,
+               COUNT(*) AS riscos_aplicaveis,
+               SUM(r.risco_inerente) AS risco_inerente_aplicavel,
+               SUM(r.risco_inerente * COALESCE(f.fator, m.fator_padrao)) AS risco_residual_total
+        FROM modalidades m
+        JOIN riscos r ON r.projeto_id = m.projeto_id
+        LEFT JOIN fatores_mitigacao f ON f.risco_id = r.id AND f.modalidade_id = m.id
+        -- Vale o fator explícito do risco (NULL = não aplicável) ou, na falta de linha
+        -- própria, o padrão da modalidade
+        WHERE CASE WHEN f.risco_id IS NULL THEN m.fator_padrao ELSE f.fator END IS NOT NULL
+        GROUP BY m.id
+    )
+    SELECT *, ROW_NUMBER() OVER (
+        PARTITION BY projeto_id ORDER BY risco_residual_total, posicao
+    ) AS ranking
+    FROM por_modalidade
+'''
+
+
+def resumir_portfolio():
+    """Agregados por modalidade sobre todos os projetos, calculados no próprio SQLite
+
+    Retorna linhas (modalidade, projetos, riscos_aplicaveis, risco_inerente_aplicavel,
+    risco_residual_total, projetos_melhor), em que projetos_melhor é o número de
+    projetos em que a modalidade tem o menor risco residual.
+    """
+    with conexao() as conn:
+        return conn.execute(f'''
+            WITH residual AS ({SQL_RESIDUAL_POR_PROJETO})
+            SELECT modalidade, COUNT(*), SUM(riscos_aplicaveis), SUM(risco_inerente_aplicavel),
+                   SUM(risco_residual_total), SUM(ranking = 1)
+            FROM residual
+            GROUP BY modalidade
+            ORDER BY SUM(risco_residual_total)
+        ''').fetchall()
+
+
+def resumir_projetos():
+    """Resumo de cada projeto: (id, nome, total_riscos, riscos_altos, risco_inerente_total,
+    melhor_modalidade, risco_residual_melhor)"""
+    with conexao() as conn:
+        return conn.execute(f'''
+            WITH residual AS ({SQL_RESIDUAL_POR_PROJETO}),
+            totais AS (
+                SELECT projeto_id, COUNT(*) AS total_riscos, SUM(classificacao = 'Alto') AS riscos_altos,
+                       SUM(risco_inerente) AS risco_inerente_total
+                FROM riscos
+                GROUP BY projeto_id
+            )
+            SELECT p.id, p.nome, COALESCE(t.total_riscos, 0), COALESCE(t.riscos_altos, 0),
+                   COALESCE(t.risco_inerente_total, 0), r.modalidade, r.risco_residual_total
+            FROM projetos p
+            LEFT JOIN totais t ON t.projeto_id = p.id
+            LEFT JOIN residual r ON r.projeto_id = p.id AND r.ranking = 1
+            ORDER BY p.nome
+        ''').fetchall()
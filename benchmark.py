@@ -0,0 +1,326 @@
+"""Benchmark do dashboard com registros sintéticos no formato da metodologia SAROI
+
+Gera registros de riscos com a mesma estrutura de `inicializar_dados` em escalas
+crescentes (de 8 riscos x 6 modalidades a 50 mil riscos x 200 modalidades), mede
+as operações principais e grava os tempos em JSON para comparação entre versões.
+
+Uso:
+    python benchmark.py                                  # todas as escalas padrão
+    python benchmark.py --escalas 8x6,1000x20 --repeticoes 5
+    python benchmark.py --saida nova.json --comparar anterior.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import banco_dados
+from graficos import criar_heatmap_modalidades_melhorado, criar_heatmap_eficacia_melhorado
+from motor_riscos import AgregadosModalidades, MatrizRiscos, calcular_risco_inerente, classificar_risco
+from exportacao import FORMATOS_EXPORTACAO, formatos_disponiveis
+from relatorio import Document, construir_relatorio_word
+from registro_riscos import RegistroRiscos
+from sensibilidade import analisar_sensibilidade
+
+ESCALAS_PADRAO = [(8, 6), (100, 10), (1000, 20), (5000, 50), (20000, 100), (50000, 200)]
+
+NIVEIS_IMPACTO = [("Muito baixo", 1), ("Baixo", 2), ("Médio", 5), ("Alto", 8), ("Muito alto", 10)]
+NIVEIS_PROBABILIDADE = [("Muito baixa", 1), ("Baixa", 2), ("Média", 5), ("Alta", 8), ("Muito alta", 10)]
+FATORES = [round(0.1 * k, 1) for k in range(11)]
+
+# Tamanho máximo (riscos x modalidades) de cada operação; acima disso ela é pulada,
+# pois o custo (memória ou tempo) deixa de ser representativo do uso interativo
+LIMITES_CELULAS = {
+    'heatmap': 1_000_000,
+    'relatorio_word': 20_000,
+    'exportacao': 2_000_000,
+}
+
+# Registros de log por risco na base sintética de auditoria (limitado ao máximo abaixo)
+LOGS_POR_RISCO = 20
+MAX_LOGS = 1_000_000
+
+
+def gerar_registro(num_riscos, num_modalidades, semente=0):
+    """Registro sintético (riscos, modalidades) no formato de `inicializar_dados`"""
+    rng = np.random.default_rng(semente)
+    modalidades = [f"Modalidade sintética {j + 1:03d}" for j in range(num_modalidades)]
+    justificativas = [f"Justificativa padrão {k}" for k in range(10)]
+
+    impactos = rng.integers(0, len(NIVEIS_IMPACTO), num_riscos)
+    probabilidades = rng.integers(0, len(NIVEIS_PROBABILIDADE), num_riscos)
+    fatores = rng.integers(0, len(FATORES), (num_riscos, num_modalidades))
+    textos = rng.integers(0, len(justificativas), (num_riscos, num_modalidades))
+
+    riscos = []
+    for i in range(num_riscos):
+        impacto_nivel, impacto_valor = NIVEIS_IMPACTO[impactos[i]]
+        probabilidade_nivel, probabilidade_valor = NIVEIS_PROBABILIDADE[probabilidades[i]]
+        risco_inerente = calcular_risco_inerente(impacto_valor, probabilidade_valor)
+        riscos.append({
+            'risco_chave': f"Risco sintético {i + 1}",
+            'descricao': f"Descrição do risco sintético {i + 1}",
+            'impacto_nivel': impacto_nivel,
+            'impacto_valor': impacto_valor,
+            'probabilidade_nivel': probabilidade_nivel,
+            'probabilidade_valor': probabilidade_valor,
+            'risco_inerente': risco_inerente,
+            'classificacao': classificar_risco(risco_inerente)[0],
+            'justificativa_fator_probabilidade': "",
+            'contexto_especifico': f"Contexto do risco sintético {i + 1}",
+            'modalidades': {mod: FATORES[f] for mod, f in zip(modalidades, fatores[i])},
+            'justificativas_modalidades': {mod: justificativas[t] for mod, t in zip(modalidades, textos[i])}
+        })
+    return RegistroRiscos(riscos), modalidades
+
+
+def cronometrar(funcao, repeticoes):
+    """Tempos (s) de `repeticoes` execuções de `funcao`"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def _popular_logs(total):
+    usuarios = banco_dados.USUARIOS_PADRAO
+    acoes = ["Cadastrou risco", "Editou risco", "Adicionou modalidade", "Removeu modalidade", "Login"]
+    rng = np.random.default_rng(1)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    segundos = np.sort(rng.integers(0, 365 * 24 * 3600, total))
+    with banco_dados.transacao() as conn:
+        conn.executemany(banco_dados.SQL_INSERIR_LOG, (
+            (
+                datetime.fromtimestamp(base + int(s), timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                usuarios[k % len(usuarios)],
+                acoes[k % len(acoes)],
+                '{"risco": "sintético"}'
+            )
+            for k, s in enumerate(segundos)
+        ))
+
+
+def medir_consultas_logs(num_riscos, repeticoes, diretorio):
+    """Tempos das consultas do visualizador de logs sobre uma base de auditoria sintética"""
+    total = min(num_riscos * LOGS_POR_RISCO, MAX_LOGS)
+    banco_dados.CAMINHO_BANCO = os.path.join(diretorio, f"logs_{num_riscos}.db")
+    banco_dados.init_db()
+    _popular_logs(total)
+
+    primeira_pagina = banco_dados.obter_logs(limite=50)
+    ultimo = primeira_pagina[-1]
+    consultas = {
+        'logs_primeira_pagina': lambda: banco_dados.obter_logs(limite=50),
+        'logs_pagina_seguinte': lambda: banco_dados.obter_logs(cursor=(ultimo[1], ultimo[0]), limite=50),
+        'logs_filtro_usuario_periodo': lambda: banco_dados.obter_logs(
+            usuarios=["SPU 2"], data_inicio="2024-03-01", data_fim="2024-03-31", limite=50
+        ),
+        'logs_resumo': lambda: banco_dados.resumir_logs(),
+        'logs_atividade_diaria': lambda: banco_dados.serie_atividade_logs(),
+        'logs_opcoes_filtro': lambda: (banco_dados.listar_usuarios_logs(), banco_dados.listar_acoes_logs()),
+    }
+    resultados = {nome: cronometrar(consulta, repeticoes) for nome, consulta in consultas.items()}
+    return total, resultados
+
+
+def executar_escala(num_riscos, num_modalidades, repeticoes, operacoes, sem_limites, diretorio):
+    """Executa as operações selecionadas em uma escala e retorna os resultados"""
+    celulas = num_riscos * num_modalidades
+    resultado = {'riscos': num_riscos, 'modalidades': num_modalidades, 'operacoes': {}}
+
+    inicio = time.perf_counter()
+    riscos, modalidades = gerar_registro(num_riscos, num_modalidades)
+    resultado['geracao_s'] = time.perf_counter() - inicio
+
+    def registrar(nome, tempos, **extras):
+        resultado['operacoes'][nome] = {
+            'min_s': min(tempos),
+            'mediana_s': statistics.median(tempos),
+            'media_s': statistics.fmean(tempos),
+            'repeticoes': len(tempos),
+            **extras
+        }
+        print(f"  {nome:<32} mediana {statistics.median(tempos) * 1000:10.2f} ms")
+
+    def permitido(nome):
+        if nome not in operacoes:
+            return False
+        limite = LIMITES_CELULAS.get(nome)
+        if not sem_limites and limite is not None and celulas > limite:
+            resultado['operacoes'][nome] = {'pulado': f"{celulas} células acima do limite de {limite}"}
+            print(f"  {nome:<32} pulado (acima de {limite} células)")
+            return False
+        return True
+
+    matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+    if permitido('agregacao'):
+        registrar('matriz_construcao', cronometrar(lambda: MatrizRiscos.de_riscos(riscos, modalidades), repeticoes))
+        registrar('agregacao_total', cronometrar(matriz.agregar, repeticoes))
+        metade = np.arange(0, num_riscos, 2)
+        registrar('agregacao_filtrada', cronometrar(lambda: matriz.agregar(metade), repeticoes))
+
+        # Edição de um risco com os agregados mantidos incrementalmente (caminho da aba de edição)
+        agregados = AgregadosModalidades.de_riscos(riscos, modalidades)
+        editado = dict(riscos[0], modalidades={modalidade: 0.5 for modalidade in modalidades})
+
+        def editar_risco():
+            agregados.atualizar_risco(riscos[0], editado)
+            agregados.resultado()
+            agregados.atualizar_risco(editado, riscos[0])
+
+        registrar('agregacao_incremental', cronometrar(editar_risco, repeticoes))
+
+    if permitido('sensibilidade'):
+        perturbacoes = analisar_sensibilidade(riscos, modalidades, matriz=matriz).perturbacoes
+        registrar('sensibilidade', cronometrar(
+            lambda: analisar_sensibilidade(riscos, modalidades, matriz=matriz), repeticoes
+        ), perturbacoes=perturbacoes)
+
+    if permitido('heatmap'):
+        nomes = [r['risco_chave'] for r in riscos]
+        residuais = matriz.residuais
+        eficacias = (1 - matriz.fatores) * 100 * matriz.aplicavel
+        registrar('heatmap_residual', cronometrar(
+            lambda: criar_heatmap_modalidades_melhorado(nomes, modalidades, residuais), repeticoes
+        ))
+        registrar('heatmap_eficacia', cronometrar(
+            lambda: criar_heatmap_eficacia_melhorado(nomes, modalidades, eficacias), repeticoes
+        ))
+
+    if permitido('relatorio_word'):
+        if Document is None:
+            resultado['operacoes']['relatorio_word'] = {'pulado': "python-docx não instalado"}
+        else:
+            identificacao = {'nome': "Benchmark", 'unidade': "Unidade", 'orgao': "SPU", 'email': ""}
+            tamanhos = []
+
+            def gerar_relatorio():
+                tamanhos.append(len(construir_relatorio_word(riscos, modalidades, "Benchmark", identificacao)))
+
+            registrar('relatorio_word', cronometrar(gerar_relatorio, repeticoes), bytes=tamanhos[-1])
+
+    if permitido('exportacao'):
+        # Mesmos exportadores do botão "Exportar dados" da barra lateral, gravando em disco
+        caminho = os.path.join(diretorio, "exportacao")
+        for nome in formatos_disponiveis():
+            exportador, extensao, _ = FORMATOS_EXPORTACAO[nome]
+
+            def exportar():
+                with open(caminho, 'wb') as arquivo:
+                    exportador(riscos, modalidades, arquivo)
+
+            registrar(f'exportacao_{extensao}', cronometrar(exportar, repeticoes), bytes=os.path.getsize(caminho))
+        os.remove(caminho)
+
+    if permitido('logs'):
+        total_logs, consultas = medir_consultas_logs(num_riscos, repeticoes, diretorio)
+        for nome, tempos in consultas.items():
+            registrar(nome, tempos, registros_log=total_logs)
+
+    return resultado
+
+
+def metadados():
+    """Informações do ambiente e da versão do código medida"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    versoes = {}
+    for modulo in ('numpy', 'pandas', 'plotly', 'docx'):
+        try:
+            versoes[modulo] = getattr(__import__(modulo), '__version__', 'desconhecida')
+        except ImportError:
+            versoes[modulo] = None
+
+    return {
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'processadores': os.cpu_count(),
+        'bibliotecas': versoes
+    }
+
+
+def comparar(atual, anterior, tolerancia):
+    """Lista as operações mais lentas que na execução anterior além da tolerância (fração)"""
+    indice_anterior = {(e['riscos'], e['modalidades']): e['operacoes'] for e in anterior['escalas']}
+    regressoes = []
+    for escala in atual['escalas']:
+        operacoes_anteriores = indice_anterior.get((escala['riscos'], escala['modalidades']), {})
+        for nome, dados in escala['operacoes'].items():
+            antes = operacoes_anteriores.get(nome, {}).get('mediana_s')
+            agora = dados.get('mediana_s')
+            if antes and agora and agora > antes * (1 + tolerancia):
+                regressoes.append((escala['riscos'], escala['modalidades'], nome, antes, agora))
+    return regressoes
+
+
+def interpretar_escalas(texto):
+    escalas = []
+    for parte in texto.split(','):
+        riscos, modalidades = parte.lower().split('x')
+        escalas.append((int(riscos), int(modalidades)))
+    return escalas
+
+
+def main(argv=None):
+    todas_operacoes = ['agregacao', 'sensibilidade', 'heatmap', 'relatorio_word', 'exportacao', 'logs']
+    parser = argparse.ArgumentParser(description="Benchmark do dashboard de avaliação de riscos SAROI")
+    parser.add_argument('--escalas', type=interpretar_escalas, default=ESCALAS_PADRAO,
+                        help="lista RISCOSxMODALIDADES separada por vírgulas (ex.: 8x6,1000x20)")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--operacoes', default=','.join(todas_operacoes),
+                        help=f"operações a medir, separadas por vírgulas ({', '.join(todas_operacoes)})")
+    parser.add_argument('--sem-limites', action='store_true',
+                        help="não pula operações acima dos limites de tamanho")
+    parser.add_argument('--saida', default='benchmark_resultados.json')
+    parser.add_argument('--comparar', help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="aumento relativo da mediana considerado regressão (padrão 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    operacoes = set(args.operacoes.split(','))
+    desconhecidas = operacoes - set(todas_operacoes)
+    if desconhecidas:
+        parser.error(f"operações desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+    resultados = {'metadados': metadados(), 'escalas': []}
+    with tempfile.TemporaryDirectory() as diretorio:
+        for num_riscos, num_modalidades in args.escalas:
+            print(f"{num_riscos} riscos x {num_modalidades} modalidades")
+            resultados['escalas'].append(executar_escala(
+                num_riscos, num_modalidades, args.repeticoes, operacoes, args.sem_limites, diretorio
+            ))
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo), args.tolerancia)
+        for riscos, modalidades, nome, antes, agora in regressoes:
+            print(f"REGRESSÃO {riscos}x{modalidades} {nome}: {antes * 1000:.2f} ms -> {agora * 1000:.2f} ms")
+        if regressoes:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Exportação do registro de riscos em JSON, JSON Lines, CSV (formato longo) e Parquet
+
+Todos os exportadores gravam em um arquivo binário aberto, lote a lote, sem montar
+o conteúdo inteiro em memória.
+"""
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from motor_riscos import MatrizRiscos
+from registro_riscos import como_dict
+
+# Parquet é opcional: depende do pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Riscos serializados por lote
+TAMANHO_LOTE_EXPORTACAO = 2000
+
+COLUNAS_FORMATO_LONGO = ['Id', 'Risco', 'Modalidade', 'Fator', 'Risco_Inerente', 'Risco_Residual']
+
+
+def _texto(destino):
+    """Camada de texto UTF-8 sobre o arquivo binário (desacoplada ao final, sem fechá-lo)"""
+    return io.TextIOWrapper(destino, encoding='utf-8', newline='', write_through=True)
+
+
+def _lotes(sequencia, tamanho_lote):
+    for inicio in range(0, len(sequencia), tamanho_lote):
+        yield sequencia[inicio:inicio + tamanho_lote]
+
+
+def exportar_json(riscos, modalidades, destino, tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    """Documento {"riscos": [...], "modalidades": [...]}, gravado lote a lote"""
+    saida = _texto(destino)
+    saida.write('{\n  "riscos": [')
+    primeiro = True
+    for lote in _lotes(riscos, tamanho_lote):
+        texto = ',\n    '.join(json.dumps(como_dict(risco), ensure_ascii=False) for risco in lote)
+        saida.write(('\n    ' if primeiro else ',\n    ') + texto)
+        primeiro = False
+    saida.write('\n  ],\n  "modalidades": ' + json.dumps(list(modalidades), ensure_ascii=False) + '\n}\n')
+    saida.detach()
+
+
+def exportar_jsonl(riscos, modalidades, destino, tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    """JSON Lines: a primeira linha traz as modalidades e cada linha seguinte, um risco"""
+    saida = _texto(destino)
+    saida.write(json.dumps({'modalidades': list(modalidades)}, ensure_ascii=False) + '\n')
+    for lote in _lotes(riscos, tamanho_lote):
+        saida.write(''.join(json.dumps(como_dict(risco), ensure_ascii=False) + '\n' for risco in lote))
+    saida.detach()
+
+
+def lotes_formato_longo(riscos, modalidades, tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    """DataFrames com uma linha por par (risco, modalidade aplicável) e o risco residual"""
+    modalidades = list(modalidades)
+    categorias = pd.CategoricalDtype(modalidades)
+    for lote in _lotes(riscos, tamanho_lote):
+        matriz = MatrizRiscos.de_riscos(lote, modalidades)
+        linhas, colunas = np.nonzero(matriz.aplicavel)
+        fatores = matriz.fatores[linhas, colunas]
+        inerente = matriz.inerente[linhas]
+        ids = pd.array([risco.get('id') for risco in lote], dtype='Int64')
+        nomes = np.array([risco['risco_chave'] for risco in lote], dtype=object)
+        yield pd.DataFrame({
+            'Id': ids[linhas],
+            'Risco': nomes[linhas],
+            'Modalidade': pd.Categorical.from_codes(colunas, dtype=categorias),
+            'Fator': fatores,
+            'Risco_Inerente': inerente,
+            'Risco_Residual': inerente * fatores,
+        }, columns=COLUNAS_FORMATO_LONGO)
+
+
+def exportar_csv_longo(riscos, modalidades, destino, tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    """CSV em formato longo (risco, modalidade, fator, inerente, residual)"""
+    saida = _texto(destino)
+    cabecalho = True
+    for df in lotes_formato_longo(riscos, modalidades, tamanho_lote):
+        df.to_csv(saida, index=False, header=cabecalho)
+        cabecalho = False
+    if cabecalho:
+        saida.write(','.join(COLUNAS_FORMATO_LONGO) + '\n')
+    saida.detach()
+
+
+def exportar_parquet(riscos, modalidades, destino, tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    """Parquet (colunar, compactado) no formato longo, um grupo de linhas por lote"""
+    if pq is None:
+        raise ImportError("A biblioteca 'pyarrow' é necessária para exportar em Parquet")
+    esquema = pa.schema([
+        ('Id', pa.int64()),
+        ('Risco', pa.string()),
+        ('Modalidade', pa.dictionary(pa.int32(), pa.string())),
+        ('Fator', pa.float64()),
+        ('Risco_Inerente', pa.float64()),
+        ('Risco_Residual', pa.float64()),
+    ])
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as escritor:
+        for df in lotes_formato_longo(riscos, modalidades, tamanho_lote):
+            escritor.write_table(pa.Table.from_pandas(df, schema=esquema, preserve_index=False))
+
+
+# Formato -> (exportador, extensão, tipo MIME)
+FORMATOS_EXPORTACAO = {
+    'JSON': (exportar_json, 'json', 'application/json'),
+    'JSON Lines': (exportar_jsonl, 'jsonl', 'application/x-ndjson'),
+    'CSV (formato longo)': (exportar_csv_longo, 'csv', 'text/csv'),
+    'Parquet': (exportar_parquet, 'parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def formatos_disponiveis():
+    """Formatos cujas dependências estão instaladas"""
+    return [nome for nome in FORMATOS_EXPORTACAO if nome != 'Parquet' or pq is not None]
@@ -0,0 +1,313 @@
+"""Construção de gráficos Plotly e cache de figuras endereçado por conteúdo"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Limite de memória do cache de figuras (estimado pelo tamanho do JSON de cada figura)
+LIMITE_CACHE_FIGURAS_MB = float(os.environ.get('SAROI_CACHE_FIGURAS_MB', 256))
+
+
+def _atualizar_digest(h, parte):
+    """Alimenta o hash com uma parte dos dados (arrays, DataFrames, coleções ou escalares)"""
+    if isinstance(parte, np.ndarray):
+        h.update(f"nd{parte.dtype}{parte.shape}".encode())
+        if parte.dtype == object:
+            h.update("\x1f".join(map(str, parte.ravel())).encode())
+        else:
+            h.update(np.ascontiguousarray(parte).tobytes())
+    elif isinstance(parte, (pd.DataFrame, pd.Series)):
+        h.update(f"pd{parte.shape}".encode())
+        colunas = parte.columns if isinstance(parte, pd.DataFrame) else [parte.name]
+        _atualizar_digest(h, [str(c) for c in colunas])
+        h.update(pd.util.hash_pandas_object(parte, index=True).values.tobytes())
+    elif isinstance(parte, (list, tuple)):
+        h.update(b"[")
+        for item in parte:
+            _atualizar_digest(h, item)
+        h.update(b"]")
+    elif isinstance(parte, Mapping):
+        h.update(b"{")
+        for chave in sorted(parte, key=str):
+            _atualizar_digest(h, chave)
+            _atualizar_digest(h, parte[chave])
+        h.update(b"}")
+    else:
+        h.update(f"{type(parte).__name__}:{parte!r}\x1e".encode())
+
+
+def digest_dados(*partes):
+    """Hash (hex) do conteúdo dos dados usados para montar um gráfico ou relatório"""
+    h = hashlib.blake2b(digest_size=20)
+    for parte in partes:
+        _atualizar_digest(h, parte)
+    return h.hexdigest()
+
+
+class CacheFiguras:
+    """Cache LRU de figuras Plotly compartilhado por todas as sessões do processo
+
+    As entradas são endereçadas pelo hash dos dados de entrada e contabilizadas
+    pelo tamanho da figura serializada em JSON; as menos usadas são descartadas
+    quando o total passa do limite. As figuras devolvidas são compartilhadas e
+    não devem ser alteradas por quem as recebe.
+    """
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.total_bytes = 0
+        self.acertos = 0
+        self.faltas = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, construtor):
+        """Retorna a figura em cache para `chave` ou a constrói com `construtor()`"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada[0]
+            self.faltas += 1
+
+        figura = construtor()
+        tamanho = len(pio.to_json(figura, validate=False))
+
+        if tamanho <= self.limite_bytes:
+            with self._lock:
+                if chave not in self._entradas:
+                    self._entradas[chave] = (figura, tamanho)
+                    self.total_bytes += tamanho
+                    while self.total_bytes > self.limite_bytes:
+                        _, (_, tamanho_removido) = self._entradas.popitem(last=False)
+                        self.total_bytes -= tamanho_removido
+        return figura
+
+    def limpar(self):
+        """Descarta todas as figuras em cache"""
+        with self._lock:
+            self._entradas.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+CACHE_FIGURAS = CacheFiguras(int(LIMITE_CACHE_FIGURAS_MB * 1024 * 1024))
+
+
+def figura_em_cache(tipo, dados, construtor):
+    """Figura do tipo informado para os dados dados, construída apenas se não estiver em cache"""
+    return CACHE_FIGURAS.obter((tipo, digest_dados(dados)), construtor)
+
+
+def rotulo_risco(nome):
+    """Rótulo curto do risco para os eixos dos mapas de calor"""
+    if len(nome) > 30:
+        # Tentar quebrar em palavras-chave
+        palavras = nome.split()
+        if len(palavras) > 3:
+            return " ".join(palavras[:3]) + "..."
+        return nome[:30] + "..."
+    return nome
+
+
+def rotulo_modalidade(mod):
+    """Rótulo curto da modalidade para os eixos dos mapas de calor"""
+    if len(mod) > 25:
+        # Abreviar modalidades longas
+        if "Permuta" in mod:
+            return mod.replace("Permuta por ", "P.").replace(" (terreno", "(t.")
+        elif "Build to Suit" in mod:
+            return "Build to Suit (União)"
+        elif "Contratação" in mod:
+            return "Contrat. c/ dação"
+        return mod[:25] + "..."
+    return mod
+
+
+def criar_heatmap_modalidades_melhorado(nomes_riscos, modalidades, residuais):
+    """Cria heatmap melhorado com mais clareza visual
+
+    `residuais` é a matriz riscos x modalidades de risco residual (zero onde não se aplica).
+    """
+    residuais = np.asarray(residuais, dtype=float)
+    textos = np.where(residuais > 0, np.char.mod("%.1f", residuais), "0")
+
+    # Criar figura com customização melhorada
+    fig = go.Figure(data=go.Heatmap(
+        z=residuais,
+        x=[rotulo_modalidade(mod) for mod in modalidades],
+        y=[rotulo_risco(nome) for nome in nomes_riscos],
+        colorscale=[
+            [0.0, '#00ff00'],    # Verde para risco zero/muito baixo
+            [0.3, '#90EE90'],    # Verde claro
+            [0.5, '#ffff00'],    # Amarelo para risco médio
+            [0.7, '#FFA500'],    # Laranja
+            [1.0, '#ff0000']     # Vermelho para risco alto
+        ],
+        showscale=True,
+        colorbar=dict(
+            title="Risco Residual",
+            tickmode="linear",
+            tick0=0,
+            dtick=10
+        ),
+        text=textos,
+        texttemplate="%{text}",
+        textfont={"size": 10, "color": "black"},
+        hoverongaps=False,
+        hovertemplate="<b>%{y}</b><br>" +
+                      "Modalidade: %{x}<br>" +
+                      "Risco Residual: %{z:.1f}<br>" +
+                      "<extra></extra>"
+    ))
+
+    # Melhorar layout
+    fig.update_layout(
+        title={
+            'text': "Mapa de Calor: Risco Residual por Modalidade",
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 16, 'color': 'darkblue'}
+        },
+        xaxis_title="Modalidades de Contratação",
+        yaxis_title="Riscos Identificados",
+        width=1000,
+        height=700,
+        font=dict(size=11),
+        xaxis=dict(tickangle=45, side="bottom"),
+        yaxis=dict(autorange="reversed"),  # Inverter ordem para melhor leitura
+        margin=dict(l=200, r=100, t=100, b=150)
+    )
+
+    return fig
+
+
+def criar_heatmap_eficacia_melhorado(nomes_riscos, modalidades, eficacias):
+    """Cria heatmap de eficácia melhorado
+
+    `eficacias` é a matriz riscos x modalidades de redução percentual (zero onde não se aplica).
+    """
+    eficacias = np.asarray(eficacias, dtype=float)
+    textos = np.where(eficacias > 0, np.char.add(np.char.mod("%.0f", eficacias), "%"), "0%")
+
+    # Criar figura
+    fig = go.Figure(data=go.Heatmap(
+        z=eficacias,
+        x=[rotulo_modalidade(mod) for mod in modalidades],
+        y=[rotulo_risco(nome) for nome in nomes_riscos],
+        colorscale='RdYlGn',  # Vermelho-Amarelo-Verde (invertido para eficácia)
+        showscale=True,
+        colorbar=dict(
+            title="Eficácia (%)",
+            tickmode="linear",
+            tick0=0,
+            dtick=20
+        ),
+        text=textos,
+        texttemplate="%{text}",
+        textfont={"size": 10, "color": "black"},
+        hoverongaps=False,
+        hovertemplate="<b>%{y}</b><br>" +
+                      "Modalidade: %{x}<br>" +
+                      "Eficácia: %{z:.1f}%<br>" +
+                      "<extra></extra>"
+    ))
+
+    # Layout
+    fig.update_layout(
+        title={
+            'text': "Mapa de Calor: Eficácia de Mitigação por Modalidade",
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 16, 'color': 'darkblue'}
+        },
+        xaxis_title="Modalidades de Contratação",
+        yaxis_title="Riscos Identificados",
+        width=1000,
+        height=700,
+        font=dict(size=11),
+        xaxis=dict(tickangle=45, side="bottom"),
+        yaxis=dict(autorange="reversed"),
+        margin=dict(l=200, r=100, t=100, b=150)
+    )
+
+    return fig
+
+
+def criar_faixas_simulacao(resumo):
+    """Faixas de percentis (P5-P95 e P25-P75) do risco residual simulado por modalidade
+
+    `resumo` é o DataFrame de ResultadoSimulacao.como_dataframe().
+    """
+    modalidades = [rotulo_modalidade(mod) for mod in resumo['Modalidade']]
+    fig = go.Figure(go.Box(
+        x=modalidades,
+        lowerfence=resumo['P5'],
+        q1=resumo['P25'],
+        median=resumo['P50'],
+        q3=resumo['P75'],
+        upperfence=resumo['P95'],
+        mean=resumo['Media'],
+        marker_color='#007bff',
+        name="Risco Residual"
+    ))
+    fig.update_layout(
+        title="Distribuição Simulada do Risco Residual Acumulado (P5 - P25 - P50 - P75 - P95)",
+        xaxis_title="Modalidades de Contratação",
+        yaxis_title="Risco Residual Total",
+        xaxis=dict(tickangle=45),
+        showlegend=False
+    )
+    return fig
+
+
+def criar_tornado_sensibilidade(entradas, vantagem, modalidade_melhor):
+    """Gráfico de tornado da vantagem da melhor modalidade sob cada perturbação
+
+    `entradas` é o DataFrame de ResultadoSensibilidade.entradas(), já ordenado pela
+    amplitude; as barras partem da vantagem atual e cruzam o zero quando a melhor
+    modalidade muda.
+    """
+    rotulos = [
+        f"{posicao}. {rotulo_risco(risco)} - {parametro}{' ⚠️' if inverte else ''}"
+        for posicao, (risco, parametro, inverte) in enumerate(
+            zip(entradas['Risco'], entradas['Parametro'], entradas['Inverte']), 1
+        )
+    ]
+    fig = go.Figure()
+    for coluna_vantagem, coluna_valor, nome, cor in (
+        ('Vantagem_Abaixo', 'Valor_Abaixo', "Um passo abaixo", '#007bff'),
+        ('Vantagem_Acima', 'Valor_Acima', "Um passo acima", '#fd7e14'),
+    ):
+        fig.add_trace(go.Bar(
+            y=rotulos,
+            x=entradas[coluna_vantagem] - vantagem,
+            base=vantagem,
+            orientation='h',
+            name=nome,
+            marker_color=cor,
+            customdata=np.column_stack([entradas['Valor'], entradas[coluna_valor], entradas['Nova_Melhor']]),
+            hovertemplate="%{y}<br>Valor: %{customdata[0]} → %{customdata[1]}"
+                          "<br>Vantagem: %{x:.2f}<br>Nova melhor: %{customdata[2]}<extra></extra>"
+        ))
+    fig.add_vline(x=0, line_dash='dash', line_color='#dc3545',
+                  annotation_text="Inversão do ranking", annotation_position='top')
+    fig.add_vline(x=vantagem, line_color='#6c757d')
+    fig.update_layout(
+        title=f"Sensibilidade da Vantagem de '{rotulo_modalidade(modalidade_melhor)}' no Ranking",
+        xaxis_title="Vantagem de Score sobre a 2ª colocada",
+        yaxis=dict(autorange='reversed'),
+        barmode='overlay',
+        height=max(400, 28 * len(rotulos) + 150),
+        margin=dict(l=320)
+    )
+    return fig
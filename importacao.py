@@ -0,0 +1,282 @@
+"""Importação em lote de riscos a partir de planilhas Excel (.xlsx) ou CSV"""
+import csv
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from banco_dados import inserir_riscos_em_lote
+from motor_riscos import ESCALAS_IMPACTO, ESCALAS_PROBABILIDADE, calcular_risco_inerente, classificar_riscos
+
+# Linhas lidas, validadas e gravadas por vez
+TAMANHO_LOTE_IMPORTACAO = 5000
+
+# Nomes aceitos (normalizados: minúsculas, sem acentos) para as colunas fixas da planilha
+COLUNAS_FIXAS = {
+    'risco_chave': ('risco', 'risco chave', 'nome do risco'),
+    'descricao': ('descricao', 'justificativa do risco'),
+    'impacto': ('impacto', 'impacto nivel', 'impacto valor'),
+    'probabilidade': ('probabilidade', 'probabilidade nivel', 'probabilidade valor'),
+    'contexto_especifico': ('contexto', 'contexto especifico', 'justificativa probabilidade',
+                            'justificativa fator probabilidade'),
+}
+PREFIXO_JUSTIFICATIVA = 'justificativa - '
+
+
+def normalizar_texto(serie):
+    """Textos em minúsculas, sem acentos e sem espaços nas pontas (vetorizado)"""
+    return (serie.fillna('').astype(str).str.strip().str.lower()
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.replace('_', ' ', regex=False))
+
+
+def _normalizar_nome(nome):
+    return normalizar_texto(pd.Series([nome])).iloc[0]
+
+
+def _numeros(serie):
+    """Converte textos numéricos (aceitando vírgula decimal) em float; o que não for número vira NaN"""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    texto = serie.astype(str).str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce')
+
+
+def _valores_escala(serie, escala):
+    """Valor numérico de cada célula, informada pelo nome do nível ou pelo próprio valor (NaN se inválida)"""
+    # Aceita o nível no masculino ou no feminino ("Alto"/"Alta", "Médio"/"Média")
+    def sem_genero(textos):
+        return textos.str.replace(r'a\b', 'o', regex=True)
+
+    nomes = pd.Series(list(escala))
+    por_nome = dict(zip(sem_genero(normalizar_texto(nomes)), (dados['valor'] for dados in escala.values())))
+    valores = sem_genero(normalizar_texto(serie)).map(por_nome)
+    numeros = _numeros(serie)
+    validos = numeros.isin([dados['valor'] for dados in escala.values()])
+    return valores.where(valores.notna(), numeros.where(validos))
+
+
+class ResultadoImportacao:
+    """Resumo da importação: riscos gravados, linhas rejeitadas (com o motivo) e colunas ignoradas"""
+
+    def __init__(self):
+        self.riscos = []
+        self.rejeitadas = []
+        self.colunas_ignoradas = []
+        self.linhas_lidas = 0
+
+    @property
+    def importados(self):
+        return len(self.riscos)
+
+
+class ImportadorRiscos:
+    """Valida e grava em lotes os riscos de uma planilha no registro de um projeto
+
+    A planilha deve ter as colunas Risco, Impacto e Probabilidade (nível da escala
+    SAROI ou o valor correspondente) e, opcionalmente, Descrição, Contexto, uma
+    coluna com o fator de mitigação (0 a 1) de cada modalidade do projeto e
+    colunas "Justificativa - <modalidade>". Células de fator vazias indicam que a
+    modalidade não se aplica ao risco.
+    """
+
+    def __init__(self, projeto_id, modalidades, usuario=None, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+        self.projeto_id = projeto_id
+        self.modalidades = list(modalidades)
+        self.usuario = usuario
+        self.tamanho_lote = tamanho_lote
+        self._colunas = None
+
+    def _mapear_colunas(self, colunas, resultado):
+        """Associa as colunas da planilha aos campos do risco e às modalidades do projeto"""
+        fixas = {nome: campo for campo, nomes in COLUNAS_FIXAS.items() for nome in nomes}
+        modalidades = {_normalizar_nome(mod): mod for mod in self.modalidades}
+        mapa = {'fatores': {}, 'justificativas': {}}
+
+        for coluna in colunas:
+            nome = _normalizar_nome(coluna)
+            if nome in fixas and fixas[nome] not in mapa:
+                mapa[fixas[nome]] = coluna
+            elif nome in modalidades:
+                mapa['fatores'][modalidades[nome]] = coluna
+            elif nome.startswith(PREFIXO_JUSTIFICATIVA) and nome[len(PREFIXO_JUSTIFICATIVA):] in modalidades:
+                mapa['justificativas'][modalidades[nome[len(PREFIXO_JUSTIFICATIVA):]]] = coluna
+            else:
+                resultado.colunas_ignoradas.append(str(coluna))
+
+        faltando = [campo for campo in ('risco_chave', 'impacto', 'probabilidade') if campo not in mapa]
+        if faltando:
+            raise ValueError(f"Colunas obrigatórias ausentes na planilha: {', '.join(faltando)}")
+        return mapa
+
+    def processar_lote(self, lote, resultado):
+        """Valida um lote (DataFrame indexado pelo número da linha na planilha), grava os
+        riscos válidos e registra as linhas rejeitadas"""
+        if self._colunas is None:
+            self._colunas = self._mapear_colunas(lote.columns, resultado)
+        mapa = self._colunas
+        resultado.linhas_lidas += len(lote)
+
+        texto = {
+            campo: lote[mapa[campo]].fillna('').astype(str).str.strip() if campo in mapa
+            else pd.Series('', index=lote.index)
+            for campo in ('risco_chave', 'descricao', 'contexto_especifico')
+        }
+        impacto = _valores_escala(lote[mapa['impacto']], ESCALAS_IMPACTO)
+        probabilidade = _valores_escala(lote[mapa['probabilidade']], ESCALAS_PROBABILIDADE)
+
+        modalidades = list(mapa['fatores'])
+        fatores = np.full((len(lote), len(modalidades)), np.nan)
+        fator_invalido = np.zeros(len(lote), dtype=bool)
+        for j, modalidade in enumerate(modalidades):
+            coluna = lote[mapa['fatores'][modalidade]]
+            valores = _numeros(coluna).to_numpy(dtype=float)
+            preenchido = coluna.notna().to_numpy() & (coluna.astype(str).str.strip() != '').to_numpy()
+            fator_invalido |= preenchido & ~((valores >= 0) & (valores <= 1))
+            fatores[:, j] = np.where(preenchido, valores, np.nan)
+
+        # Motivos de rejeição, avaliados para o lote inteiro de uma vez
+        motivos = [
+            (texto['risco_chave'].eq('').to_numpy(), "nome do risco vazio"),
+            (impacto.isna().to_numpy(), "impacto fora da escala SAROI"),
+            (probabilidade.isna().to_numpy(), "probabilidade fora da escala SAROI"),
+            (fator_invalido, "fator de mitigação fora do intervalo 0 a 1"),
+        ]
+        rejeitada = np.zeros(len(lote), dtype=bool)
+        for mascara, _ in motivos:
+            rejeitada |= mascara
+        for posicao in np.flatnonzero(rejeitada):
+            resultado.rejeitadas.append((
+                int(lote.index[posicao]),
+                "; ".join(motivo for mascara, motivo in motivos if mascara[posicao])
+            ))
+
+        validas = np.flatnonzero(~rejeitada)
+        if len(validas) == 0:
+            return
+
+        impacto_valor = impacto.to_numpy()[validas].astype(int)
+        probabilidade_valor = probabilidade.to_numpy()[validas].astype(int)
+        risco_inerente = calcular_risco_inerente(impacto_valor, probabilidade_valor)
+        classificacao = classificar_riscos(risco_inerente)
+        nome_impacto = {dados['valor']: nome for nome, dados in ESCALAS_IMPACTO.items()}
+        nome_probabilidade = {dados['valor']: nome for nome, dados in ESCALAS_PROBABILIDADE.items()}
+        nomes = texto['risco_chave'].to_numpy()[validas]
+        descricoes = texto['descricao'].to_numpy()[validas]
+        contextos = texto['contexto_especifico'].to_numpy()[validas]
+        justificativas = {
+            modalidade: lote[coluna].fillna('').astype(str).str.strip().to_numpy()[validas]
+            for modalidade, coluna in mapa['justificativas'].items()
+        }
+        data_criacao = datetime.now().strftime("%d/%m/%Y %H:%M")
+
+        riscos = []
+        fatores_validos = fatores[validas].tolist()
+        for k in range(len(validas)):
+            fatores_risco = {
+                modalidade: fator
+                for modalidade, fator in zip(modalidades, fatores_validos[k])
+                if fator == fator  # descarta NaN (modalidade não aplicável)
+            }
+            riscos.append({
+                'risco_chave': nomes[k],
+                'descricao': descricoes[k],
+                'justificativa_fator_probabilidade': contextos[k],
+                'contexto_especifico': contextos[k],
+                'impacto_nivel': nome_impacto[impacto_valor[k]],
+                'impacto_valor': int(impacto_valor[k]),
+                'probabilidade_nivel': nome_probabilidade[probabilidade_valor[k]],
+                'probabilidade_valor': int(probabilidade_valor[k]),
+                'risco_inerente': int(risco_inerente[k]),
+                'classificacao': classificacao[k],
+                'modalidades': fatores_risco,
+                'justificativas_modalidades': {
+                    modalidade: justificativas[modalidade][k] if modalidade in justificativas else ""
+                    for modalidade in fatores_risco
+                },
+                'personalizado': True,
+                'criado_por': self.usuario,
+                'data_criacao': data_criacao
+            })
+
+        inserir_riscos_em_lote(self.projeto_id, riscos)
+        resultado.riscos.extend(riscos)
+
+    def importar(self, lotes, progresso=None):
+        """Processa uma sequência de lotes produzida por um dos leitores abaixo"""
+        resultado = ResultadoImportacao()
+        self._colunas = None
+        for lote in lotes:
+            self.processar_lote(lote, resultado)
+            if progresso is not None:
+                progresso(resultado)
+        return resultado
+
+
+def _detectar_separador(amostra):
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ','
+
+
+def ler_csv_em_lotes(arquivo, tamanho_lote=TAMANHO_LOTE_IMPORTACAO, separador=None, encoding='utf-8-sig'):
+    """Gera DataFrames lendo o CSV em blocos; o separador é detectado se omitido"""
+    if isinstance(arquivo, (bytes, bytearray)):
+        arquivo = io.BytesIO(arquivo)
+    if separador is None:
+        inicio = arquivo.read(64 * 1024)
+        arquivo.seek(0)
+        amostra = inicio.decode(encoding, errors='ignore') if isinstance(inicio, bytes) else inicio
+        separador = _detectar_separador(amostra.splitlines()[0] if amostra else "")
+
+    # Linha 1 é o cabeçalho; os dados começam na linha 2 da planilha
+    linha = 2
+    leitor = pd.read_csv(arquivo, sep=separador, dtype=str, keep_default_na=False,
+                         chunksize=tamanho_lote, encoding=encoding)
+    for lote in leitor:
+        lote.index = pd.RangeIndex(linha, linha + len(lote))
+        yield lote
+        linha += len(lote)
+
+
+def ler_excel_em_lotes(arquivo, tamanho_lote=TAMANHO_LOTE_IMPORTACAO, planilha=None):
+    """Gera DataFrames lendo o .xlsx em modo somente leitura, linha a linha (linhas vazias são puladas)"""
+    from openpyxl import load_workbook
+
+    if isinstance(arquivo, (bytes, bytearray)):
+        arquivo = io.BytesIO(arquivo)
+    livro = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        folha = livro[planilha] if planilha else livro.active
+        linhas = folha.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        colunas = [str(c).strip() if c is not None else f"Coluna {k + 1}" for k, c in enumerate(cabecalho)]
+
+        bloco, numeros = [], []
+        for numero, valores in enumerate(linhas, start=2):
+            if all(v is None for v in valores):
+                continue
+            valores = tuple(valores[:len(colunas)])
+            bloco.append(valores + (None,) * (len(colunas) - len(valores)))
+            numeros.append(numero)
+            if len(bloco) >= tamanho_lote:
+                yield pd.DataFrame(bloco, columns=colunas, index=numeros)
+                bloco, numeros = [], []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=colunas, index=numeros)
+    finally:
+        livro.close()
+
+
+def ler_planilha_em_lotes(nome_arquivo, arquivo, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+    """Escolhe o leitor pelo tipo do arquivo (.xlsx/.xlsm ou .csv/.txt)"""
+    extensao = nome_arquivo.lower().rsplit('.', 1)[-1]
+    if extensao in ('xlsx', 'xlsm'):
+        return ler_excel_em_lotes(arquivo, tamanho_lote)
+    if extensao in ('csv', 'txt'):
+        return ler_csv_em_lotes(arquivo, tamanho_lote)
+    raise ValueError(f"Formato de arquivo não suportado: .{extensao}")
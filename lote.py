@@ -0,0 +1,178 @@
+"""Processamento em lote (sem interface) de registros de riscos exportados
+
+Lê registros exportados pelo dashboard em JSON ou JSON Lines (arquivos ou
+diretórios com eles), recalcula risco inerente e classificação de cada risco,
+agrega o risco residual por modalidade e grava o ranking de cada projeto em JSON
+ou CSV, opcionalmente com o relatório Word. Os arquivos são distribuídos entre
+processos, um projeto por vez em cada processo.
+
+Uso:
+    python lote.py exportacoes/ --saida rankings.json
+    python lote.py projeto_a.json projeto_b.jsonl --saida rankings.csv --processos 4
+    python lote.py exportacoes/ --relatorios relatorios/ --nome "Fulano" --unidade "SPU"
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from motor_riscos import MatrizRiscos, calcular_risco_inerente, classificar_risco
+from registro_riscos import RegistroRiscos
+from relatorio import Document, construir_relatorio_word
+
+EXTENSOES_REGISTRO = ('.json', '.jsonl')
+
+COLUNAS_CSV = ['Projeto', 'Posicao', 'Modalidade', 'Risco_Residual_Total', 'Risco_Inerente_Aplicavel',
+               'Eficacia_Percentual', 'Classificacao', 'Riscos_Aplicaveis', 'Score']
+
+
+def listar_arquivos(caminhos):
+    """Arquivos de registro informados diretamente ou encontrados (recursivamente) nos diretórios"""
+    arquivos = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            for raiz, diretorios, nomes in os.walk(caminho):
+                diretorios.sort()
+                arquivos.extend(os.path.join(raiz, nome) for nome in sorted(nomes)
+                                if nome.lower().endswith(EXTENSOES_REGISTRO))
+        else:
+            arquivos.append(caminho)
+    return arquivos
+
+
+def ler_registro(caminho):
+    """Riscos (RegistroRiscos) e modalidades de um arquivo exportado em JSON ou JSON Lines"""
+    with open(caminho, encoding='utf-8') as arquivo:
+        if caminho.lower().endswith('.jsonl'):
+            modalidades = json.loads(arquivo.readline())['modalidades']
+            riscos = RegistroRiscos(json.loads(linha) for linha in arquivo if linha.strip())
+        else:
+            documento = json.load(arquivo)
+            modalidades = documento['modalidades']
+            riscos = RegistroRiscos(documento['riscos'])
+    return riscos, modalidades
+
+
+def recalcular_riscos(riscos):
+    """Recalcula risco inerente e classificação a partir dos valores de impacto e probabilidade"""
+    for risco in riscos:
+        impacto = risco.get('impacto_valor')
+        probabilidade = risco.get('probabilidade_valor')
+        if impacto is not None and probabilidade is not None:
+            risco['risco_inerente'] = calcular_risco_inerente(impacto, probabilidade)
+            risco['classificacao'] = classificar_risco(risco['risco_inerente'])[0]
+
+
+def processar_arquivo(caminho, diretorio_relatorios=None, identificacao=None):
+    """Ranking das modalidades de um registro exportado (executado em um processo do pool)
+
+    Retorna um dicionário pequeno (os riscos ficam no processo), com 'erro' em vez
+    do ranking se o arquivo não puder ser processado.
+    """
+    inicio = time.perf_counter()
+    projeto = os.path.splitext(os.path.basename(caminho))[0]
+    resultado_arquivo = {'arquivo': caminho, 'projeto': projeto}
+    try:
+        riscos, modalidades = ler_registro(caminho)
+        recalcular_riscos(riscos)
+        resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar()
+        # Modalidades sem riscos aplicáveis têm residual zero e não podem ser recomendadas
+        ranking = resultado.ordenadas(somente_aplicaveis=True)
+
+        resultado_arquivo.update(
+            riscos=len(riscos),
+            modalidade_recomendada=ranking[0][0] if ranking else None,
+            ranking=[{'modalidade': modalidade, **dados} for modalidade, dados in ranking]
+        )
+
+        if diretorio_relatorios is not None:
+            destino = os.path.join(diretorio_relatorios, f"relatorio_riscos_{projeto}.docx")
+            conteudo = construir_relatorio_word(riscos, modalidades, projeto, identificacao)
+            with open(destino, 'wb') as arquivo:
+                arquivo.write(conteudo)
+            resultado_arquivo['relatorio'] = destino
+    except Exception as e:
+        resultado_arquivo['erro'] = f"{type(e).__name__}: {e}"
+
+    resultado_arquivo['tempo'] = time.perf_counter() - inicio
+    return resultado_arquivo
+
+
+def processar_arquivos(arquivos, processos=None, diretorio_relatorios=None, identificacao=None):
+    """Processa os arquivos em um pool de processos, gerando os resultados na ordem dos arquivos"""
+    processos = processos or os.cpu_count() or 1
+    argumentos = (arquivos, [diretorio_relatorios] * len(arquivos), [identificacao] * len(arquivos))
+    if processos == 1 or len(arquivos) == 1:
+        yield from map(processar_arquivo, *argumentos)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(processos, len(arquivos))) as executor:
+        yield from executor.map(processar_arquivo, *argumentos)
+
+
+def gravar_csv(resultados, destino):
+    """Ranking de todos os projetos em formato longo (uma linha por projeto e modalidade)"""
+    with open(destino, 'w', encoding='utf-8', newline='') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(COLUNAS_CSV)
+        for resultado in resultados:
+            for posicao, dados in enumerate(resultado.get('ranking', ()), 1):
+                escritor.writerow([
+                    resultado['projeto'], posicao, dados['modalidade'], dados['risco_residual_total'],
+                    dados['risco_inerente_aplicavel'], dados['eficacia_percentual'], dados['classificacao'],
+                    dados['riscos_aplicaveis'], dados['score']
+                ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ranking em lote de modalidades SAROI a partir de registros exportados")
+    parser.add_argument('caminhos', nargs='+', help="arquivos .json/.jsonl exportados ou diretórios com eles")
+    parser.add_argument('--saida', default='rankings.json', help="arquivo de resultados (.json ou .csv)")
+    parser.add_argument('--processos', type=int, default=None,
+                        help="processos em paralelo (padrão: número de núcleos)")
+    parser.add_argument('--relatorios', metavar='DIRETORIO', help="gera o relatório Word de cada projeto no diretório")
+    parser.add_argument('--nome', default='', help="responsável indicado nos relatórios")
+    parser.add_argument('--unidade', default='', help="unidade indicada nos relatórios")
+    parser.add_argument('--orgao', default='')
+    parser.add_argument('--email', default='')
+    args = parser.parse_args(argv)
+
+    if args.processos is not None and args.processos < 1:
+        parser.error("--processos deve ser pelo menos 1")
+    if args.relatorios:
+        if Document is None:
+            parser.error("--relatorios exige a biblioteca python-docx: pip install python-docx")
+        os.makedirs(args.relatorios, exist_ok=True)
+
+    arquivos = listar_arquivos(args.caminhos)
+    if not arquivos:
+        parser.error("nenhum arquivo .json ou .jsonl encontrado")
+
+    identificacao = {'nome': args.nome, 'unidade': args.unidade, 'orgao': args.orgao, 'email': args.email}
+    inicio = time.perf_counter()
+    resultados = []
+    for resultado in processar_arquivos(arquivos, args.processos, args.relatorios, identificacao):
+        resultados.append(resultado)
+        if 'erro' in resultado:
+            print(f"ERRO {resultado['arquivo']}: {resultado['erro']}", file=sys.stderr)
+        else:
+            print(f"{resultado['projeto']}: {resultado['riscos']} riscos, "
+                  f"modalidade recomendada: {resultado['modalidade_recomendada']} ({resultado['tempo']:.2f} s)")
+
+    if args.saida.lower().endswith('.csv'):
+        gravar_csv(resultados, args.saida)
+    else:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+
+    falhas = sum('erro' in resultado for resultado in resultados)
+    print(f"{len(resultados) - falhas} de {len(resultados)} projetos processados em "
+          f"{time.perf_counter() - inicio:.1f} s; resultados gravados em {args.saida}")
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
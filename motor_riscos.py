@@ -0,0 +1,367 @@
+"""Motor vetorizado de cálculo de risco inerente e residual (metodologia SAROI)"""
+import numpy as np
+import pandas as pd
+
+from registro_riscos import RegistroRiscos
+
+# Limites superiores das faixas de classificação (Baixo <= 10 < Médio <= 25 < Alto)
+LIMITES_CLASSIFICACAO = np.array([10, 25])
+CLASSIFICACOES = np.array(["Baixo", "Médio", "Alto"], dtype=object)
+
+# Escalas de avaliação baseadas na metodologia SAROI
+ESCALAS_IMPACTO = {
+    "Muito baixo": {
+        "valor": 1,
+        "descricao": "Degradação de operações causando impactos mínimos nos objetivos"
+    },
+    "Baixo": {
+        "valor": 2,
+        "descricao": "Degradação de operações causando impactos pequenos nos objetivos"
+    },
+    "Médio": {
+        "valor": 5,
+        "descricao": "Interrupção de operações causando impactos significativos mas recuperáveis"
+    },
+    "Alto": {
+        "valor": 8,
+        "descricao": "Interrupção de operações causando impactos de reversão muito difícil"
+    },
+    "Muito alto": {
+        "valor": 10,
+        "descricao": "Paralisação de operações causando impactos irreversíveis/catastróficos"
+    }
+}
+
+ESCALAS_PROBABILIDADE = {
+    "Muito baixa": {
+        "valor": 1,
+        "descricao": "Evento improvável de ocorrer. Não há elementos que indiquem essa possibilidade"
+    },
+    "Baixa": {
+        "valor": 2,
+        "descricao": "Evento raro de ocorrer. Poucos elementos indicam essa possibilidade"
+    },
+    "Média": {
+        "valor": 5,
+        "descricao": "Evento possível de ocorrer. Elementos indicam moderadamente essa possibilidade"
+    },
+    "Alta": {
+        "valor": 8,
+        "descricao": "Evento provável de ocorrer. Elementos indicam consistently essa possibilidade"
+    },
+    "Muito alta": {
+        "valor": 10,
+        "descricao": "Evento praticamente certo de ocorrer. Elementos indicam claramente essa possibilidade"
+    }
+}
+
+
+def calcular_risco_inerente(impacto, probabilidade):
+    """Calcula o risco inerente (Impacto x Probabilidade)"""
+    return impacto * probabilidade
+
+
+def classificar_risco(valor_risco):
+    """Classifica o risco baseado no valor calculado"""
+    if valor_risco <= 10:
+        return "Baixo", "#28a745"
+    elif valor_risco <= 25:
+        return "Médio", "#ffc107"
+    else:
+        return "Alto", "#dc3545"
+
+
+def classificar_riscos(valores):
+    """Classifica um vetor de valores de risco de uma só vez"""
+    return CLASSIFICACOES[np.searchsorted(LIMITES_CLASSIFICACAO, np.asarray(valores, dtype=float))]
+
+
+def calcular_eficacia(risco_residual_total, risco_inerente_aplicavel):
+    """Eficácia (%) de cada modalidade: redução do risco inerente aplicável (zero sem riscos aplicáveis)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(
+            risco_inerente_aplicavel > 0,
+            (risco_inerente_aplicavel - risco_residual_total) / risco_inerente_aplicavel * 100,
+            0.0
+        )
+
+
+def calcular_score(eficacia_percentual, risco_residual_total):
+    """Score do ranking da aba de comparação (maior é melhor)"""
+    return eficacia_percentual - risco_residual_total / 10
+
+
+class MatrizRiscos:
+    """Vetor de riscos inerentes e matriz riscos x modalidades de fatores de mitigação
+
+    Os fatores ausentes (risco sem avaliação para a modalidade) ficam zerados em
+    `fatores` e marcados como não aplicáveis em `aplicavel`.
+    """
+
+    def __init__(self, inerente, fatores, aplicavel, modalidades):
+        self.inerente = np.asarray(inerente, dtype=float)
+        self.fatores = np.asarray(fatores, dtype=float)
+        self.aplicavel = np.asarray(aplicavel, dtype=bool)
+        self.modalidades = list(modalidades)
+
+    @classmethod
+    def de_riscos(cls, riscos, modalidades):
+        """Monta a matriz a partir da lista de riscos no formato do session_state"""
+        modalidades = list(modalidades)
+        if isinstance(riscos, RegistroRiscos):
+            # Registro compacto: os fatores já estão em arrays, sem dicionários a percorrer
+            return cls(*riscos.matriz_fatores(modalidades), modalidades)
+        indice_modalidade = {modalidade: j for j, modalidade in enumerate(modalidades)}
+        n, m = len(riscos), len(modalidades)
+
+        inerente = np.fromiter((r['risco_inerente'] for r in riscos), dtype=float, count=n)
+        fatores = np.zeros((n, m))
+        aplicavel = np.zeros((n, m), dtype=bool)
+
+        for i, risco in enumerate(riscos):
+            for modalidade, fator in risco['modalidades'].items():
+                j = indice_modalidade.get(modalidade)
+                if j is not None:
+                    fatores[i, j] = fator
+                    aplicavel[i, j] = True
+
+        return cls(inerente, fatores, aplicavel, modalidades)
+
+    def __len__(self):
+        return len(self.inerente)
+
+    def atualizar_risco(self, i, risco):
+        """Refaz em O(modalidades) a linha do risco de índice i após uma edição"""
+        fatores = risco['modalidades']
+        self.inerente[i] = risco['risco_inerente']
+        for j, modalidade in enumerate(self.modalidades):
+            fator = fatores.get(modalidade)
+            self.aplicavel[i, j] = fator is not None
+            self.fatores[i, j] = 0.0 if fator is None else fator
+
+    @property
+    def residuais(self):
+        """Matriz de riscos residuais (zero onde a modalidade não se aplica)"""
+        return self.inerente[:, None] * self.fatores * self.aplicavel
+
+    def agregar(self, indices=None):
+        """Agrega, em uma única chamada, os resultados de todas as modalidades
+
+        `indices` restringe o cálculo a um subconjunto de riscos (filtros das abas).
+        """
+        inerente = self.inerente
+        fatores = self.fatores
+        aplicavel = self.aplicavel
+        if indices is not None:
+            indices = np.asarray(indices, dtype=int)
+            inerente = inerente[indices]
+            fatores = fatores[indices]
+            aplicavel = aplicavel[indices]
+
+        return ResultadoModalidades.de_somas(
+            self.modalidades, *self.somas(inerente, fatores, aplicavel),
+            total_riscos=len(inerente),
+            risco_inerente_total=float(inerente.sum())
+        )
+
+    @staticmethod
+    def somas(inerente, fatores, aplicavel):
+        """Somas por modalidade: residual, inerente aplicável, riscos aplicáveis e reduções (%)"""
+        return (
+            inerente @ (fatores * aplicavel),
+            inerente @ aplicavel,
+            aplicavel.sum(axis=0),
+            ((1 - fatores) * aplicavel).sum(axis=0) * 100
+        )
+
+
+class ResultadoModalidades:
+    """Resultado agregado por modalidade: totais, eficácia, classificação e rankings"""
+
+    def __init__(self, modalidades, risco_residual_total, risco_inerente_aplicavel,
+                 eficacia_percentual, riscos_aplicaveis, eficacia_media_individual,
+                 total_riscos, risco_inerente_total):
+        self.modalidades = list(modalidades)
+        self.risco_residual_total = risco_residual_total
+        self.risco_inerente_aplicavel = risco_inerente_aplicavel
+        self.eficacia_percentual = eficacia_percentual
+        self.riscos_aplicaveis = riscos_aplicaveis
+        self.eficacia_media_individual = eficacia_media_individual
+        self.total_riscos = total_riscos
+        self.risco_inerente_total = risco_inerente_total
+
+        self.classificacao = classificar_riscos(risco_residual_total)
+        # Score considerando eficácia e risco residual (ranking da aba de comparação)
+        self.score = calcular_score(eficacia_percentual, risco_residual_total)
+        # Ordem crescente de risco residual (ordenação estável, como sorted())
+        self.ranking = np.argsort(risco_residual_total, kind='stable')
+        self.ranking_score = np.argsort(-self.score, kind='stable')
+
+    @classmethod
+    def de_somas(cls, modalidades, residual_total, inerente_aplicavel, riscos_aplicaveis, soma_reducoes,
+                 total_riscos, risco_inerente_total):
+        """Calcula eficácias e médias a partir das somas por modalidade"""
+        eficacia = calcular_eficacia(residual_total, inerente_aplicavel)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eficacia_media = np.where(riscos_aplicaveis > 0, soma_reducoes / riscos_aplicaveis, np.nan)
+
+        return cls(
+            modalidades=modalidades,
+            risco_residual_total=residual_total,
+            risco_inerente_aplicavel=inerente_aplicavel,
+            eficacia_percentual=eficacia,
+            riscos_aplicaveis=riscos_aplicaveis,
+            eficacia_media_individual=eficacia_media,
+            total_riscos=total_riscos,
+            risco_inerente_total=risco_inerente_total
+        )
+
+    def __len__(self):
+        return len(self.modalidades)
+
+    @property
+    def indice_melhor(self):
+        """Índice da modalidade de menor risco residual acumulado"""
+        return int(np.argmin(self.risco_residual_total))
+
+    @property
+    def indice_pior(self):
+        """Índice da modalidade de maior risco residual acumulado"""
+        return int(np.argmax(self.risco_residual_total))
+
+    def dados(self, j):
+        """Dicionário com os resultados da modalidade de índice j"""
+        return {
+            'risco_residual_total': float(self.risco_residual_total[j]),
+            'risco_inerente_aplicavel': float(self.risco_inerente_aplicavel[j]),
+            'eficacia_percentual': float(self.eficacia_percentual[j]),
+            'classificacao': self.classificacao[j],
+            'riscos_aplicaveis': int(self.riscos_aplicaveis[j]),
+            'score': float(self.score[j])
+        }
+
+    def ordenadas(self, somente_aplicaveis=False):
+        """Lista (modalidade, dados) em ordem crescente de risco residual"""
+        return [
+            (self.modalidades[j], self.dados(j))
+            for j in self.ranking
+            if not somente_aplicaveis or self.riscos_aplicaveis[j] > 0
+        ]
+
+    def como_dataframe(self):
+        """Resultados em um DataFrame (uma linha por modalidade)"""
+        return pd.DataFrame({
+            'Modalidade': self.modalidades,
+            'Risco_Residual_Total': self.risco_residual_total,
+            'Risco_Inerente_Total': self.risco_inerente_aplicavel,
+            'Eficacia_Percentual': self.eficacia_percentual,
+            'Classificacao_Total': self.classificacao,
+            'Riscos_Aplicaveis': self.riscos_aplicaveis,
+            'Score': self.score
+        })
+
+
+class AgregadosModalidades:
+    """Somas por modalidade mantidas incrementalmente a cada alteração do registro
+
+    Criar, editar ou remover um risco e adicionar ou remover uma modalidade custam
+    O(modalidades), sem percorrer todos os riscos; `resultado()` monta o
+    ResultadoModalidades a partir das somas.
+    """
+
+    # Casas decimais mantidas no resultado: descarta o resíduo de ponto flutuante
+    # acumulado nas somas e subtrações sucessivas (preserva empates no ranking)
+    CASAS_DECIMAIS = 9
+
+    def __init__(self, modalidades):
+        self.modalidades = list(modalidades)
+        self._indice = {modalidade: j for j, modalidade in enumerate(self.modalidades)}
+        m = len(self.modalidades)
+        self.residual_total = np.zeros(m)
+        self.inerente_aplicavel = np.zeros(m)
+        self.riscos_aplicaveis = np.zeros(m, dtype=int)
+        self.soma_reducoes = np.zeros(m)
+        self.total_riscos = 0
+        self.risco_inerente_total = 0.0
+        self.contagem_classificacao = {classe: 0 for classe in CLASSIFICACOES}
+
+    @classmethod
+    def de_riscos(cls, riscos, modalidades):
+        """Agregados de todo o registro (cálculo completo, vetorizado)"""
+        agregados = cls(modalidades)
+        agregados.adicionar_riscos(riscos)
+        return agregados
+
+    def _somar(self, riscos, sinal):
+        if not riscos:
+            return
+        matriz = MatrizRiscos.de_riscos(riscos, self.modalidades)
+        residual, inerente_aplicavel, aplicaveis, reducoes = MatrizRiscos.somas(
+            matriz.inerente, matriz.fatores, matriz.aplicavel
+        )
+        self.residual_total += sinal * residual
+        self.inerente_aplicavel += sinal * inerente_aplicavel
+        self.riscos_aplicaveis += sinal * aplicaveis
+        self.soma_reducoes += sinal * reducoes
+        self.total_riscos += sinal * len(riscos)
+        self.risco_inerente_total += sinal * float(matriz.inerente.sum())
+        for risco in riscos:
+            self.contagem_classificacao[risco['classificacao']] = (
+                self.contagem_classificacao.get(risco['classificacao'], 0) + sinal
+            )
+
+    def adicionar_riscos(self, riscos):
+        self._somar(riscos, 1)
+
+    def remover_riscos(self, riscos):
+        self._somar(riscos, -1)
+
+    def adicionar_risco(self, risco):
+        self._somar([risco], 1)
+
+    def remover_risco(self, risco):
+        self._somar([risco], -1)
+
+    def atualizar_risco(self, anterior, atual):
+        """Substitui a contribuição do risco antes da edição pela do risco editado"""
+        self._somar([anterior], -1)
+        self._somar([atual], 1)
+
+    def adicionar_modalidade(self, modalidade, fator_padrao=None):
+        """Nova modalidade ao final; com `fator_padrao`, aplicada a todos os riscos com esse fator"""
+        self._indice[modalidade] = len(self.modalidades)
+        self.modalidades.append(modalidade)
+        if fator_padrao is None:
+            novas = (0.0, 0.0, 0, 0.0)
+        else:
+            novas = (
+                self.risco_inerente_total * fator_padrao,
+                self.risco_inerente_total,
+                self.total_riscos,
+                (1 - fator_padrao) * 100 * self.total_riscos
+            )
+        self.residual_total = np.append(self.residual_total, novas[0])
+        self.inerente_aplicavel = np.append(self.inerente_aplicavel, novas[1])
+        self.riscos_aplicaveis = np.append(self.riscos_aplicaveis, novas[2])
+        self.soma_reducoes = np.append(self.soma_reducoes, novas[3])
+
+    def remover_modalidade(self, modalidade):
+        j = self._indice[modalidade]
+        del self.modalidades[j]
+        self._indice = {modalidade: k for k, modalidade in enumerate(self.modalidades)}
+        self.residual_total = np.delete(self.residual_total, j)
+        self.inerente_aplicavel = np.delete(self.inerente_aplicavel, j)
+        self.riscos_aplicaveis = np.delete(self.riscos_aplicaveis, j)
+        self.soma_reducoes = np.delete(self.soma_reducoes, j)
+
+    def resultado(self):
+        """ResultadoModalidades equivalente a MatrizRiscos.agregar() sobre todo o registro"""
+        return ResultadoModalidades.de_somas(
+            self.modalidades,
+            np.round(self.residual_total, self.CASAS_DECIMAIS),
+            np.round(self.inerente_aplicavel, self.CASAS_DECIMAIS),
+            self.riscos_aplicaveis.copy(),
+            np.round(self.soma_reducoes, self.CASAS_DECIMAIS),
+            total_riscos=self.total_riscos,
+            risco_inerente_total=round(self.risco_inerente_total, self.CASAS_DECIMAIS)
+        )
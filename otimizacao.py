@@ -0,0 +1,297 @@
+"""Escolha ótima de modalidades para o portfólio ou por grupo de riscos
+
+Cada grupo de riscos (o portfólio inteiro, uma classificação, um nível de impacto ou
+cada risco isoladamente) recebe uma modalidade, minimizando o risco residual
+acumulado. Restrições:
+
+- modalidades excluídas não podem ser escolhidas;
+- `limite_residual`: nenhum risco do grupo pode ficar com risco residual acima do limite;
+- `max_modalidades`: no máximo k modalidades distintas no conjunto dos grupos.
+
+Como na aba de comparação, um risco ao qual a modalidade não se aplica não soma risco
+residual a ela, e uma modalidade que não se aplica a nenhum risco de um grupo não pode
+ser escolhida para ele (seu residual zero não indica mitigação). Sem limite de modalidades, cada grupo escolhe a sua melhor opção
+(solução exata direta). Com o limite, o problema é combinatório (k-medianas): é
+resolvido de forma exata por enumeração das combinações, quando elas são poucas, ou
+por branch-and-bound com limite de tempo; a heurística gulosa com trocas é a opção
+rápida para instâncias grandes (e a solução inicial do branch-and-bound).
+"""
+import math
+import time
+from itertools import combinations, islice
+
+import numpy as np
+import pandas as pd
+
+from motor_riscos import MatrizRiscos
+
+# Acima desse número de combinações de k modalidades a enumeração exata é evitada
+LIMITE_ENUMERACAO = 200_000
+# Elementos (grupos x combinações x k) avaliados por lote na enumeração
+ELEMENTOS_POR_LOTE = 1_000_000
+# Tempo máximo (segundos) do branch-and-bound; esgotado, fica a melhor solução encontrada
+TEMPO_LIMITE_PADRAO = 2.0
+
+METODOS = ('auto', 'heuristico')
+
+# Agrupamentos oferecidos: chave -> (rótulo, campo do risco; None = portfólio inteiro)
+AGRUPAMENTOS = {
+    'portfolio': ("Portfólio inteiro (uma modalidade)", None),
+    'classificacao': ("Por classificação do risco", 'classificacao'),
+    'impacto': ("Por nível de impacto", 'impacto_nivel'),
+    'probabilidade': ("Por nível de probabilidade", 'probabilidade_nivel'),
+    'risco': ("Por risco (individual)", 'risco_chave'),
+}
+
+
+def _custos(residuais, aplicavel, grupos, num_grupos, viaveis_por_risco):
+    """Residual acumulado e viabilidade de cada par (grupo, modalidade), com os riscos agrupados
+
+    O par é inviável se algum risco do grupo viola o limite ou se a modalidade não se
+    aplica a nenhum risco do grupo.
+    """
+    ordem = np.argsort(grupos, kind='stable')
+    inicios = np.searchsorted(grupos[ordem], np.arange(num_grupos))
+    custos = np.add.reduceat(residuais[ordem], inicios, axis=0)
+    viaveis = np.logical_and.reduceat(viaveis_por_risco[ordem], inicios, axis=0)
+    viaveis &= np.logical_or.reduceat(aplicavel[ordem], inicios, axis=0)
+    return np.where(viaveis, custos, np.inf)
+
+
+def _avaliar(custos, selecao):
+    """(grupos sem modalidade viável, residual total) usando só as modalidades selecionadas"""
+    melhores = custos[:, list(selecao)].min(axis=1) if len(selecao) else np.full(len(custos), np.inf)
+    inviaveis = np.isinf(melhores)
+    return int(inviaveis.sum()), float(melhores[~inviaveis].sum())
+
+
+def resolver_guloso(custos, k, candidatas):
+    """Heurística: adiciona a modalidade de maior ganho até k e depois tenta trocas 1 a 1"""
+    num_grupos = len(custos)
+    atual = np.full(num_grupos, np.inf)
+    selecao = []
+    for _ in range(min(k, len(candidatas))):
+        restantes = [m for m in candidatas if m not in selecao]
+        novos = np.minimum(atual[:, None], custos[:, restantes])
+        inviaveis = np.isinf(novos).sum(axis=0)
+        totais = np.where(np.isinf(novos), 0.0, novos).sum(axis=0)
+        escolha = np.lexsort((totais, inviaveis))[0]
+        if selecao and (inviaveis[escolha], totais[escolha]) >= _avaliar(custos, selecao):
+            break
+        selecao.append(restantes[escolha])
+        atual = novos[:, escolha]
+
+    # Busca local: troca uma modalidade escolhida por outra enquanto houver melhora
+    melhor = _avaliar(custos, selecao)
+    melhorou = True
+    while melhorou:
+        melhorou = False
+        for posicao in range(len(selecao)):
+            for m in candidatas:
+                if m in selecao:
+                    continue
+                tentativa = selecao[:posicao] + [m] + selecao[posicao + 1:]
+                valor = _avaliar(custos, tentativa)
+                if valor < melhor:
+                    selecao, melhor, melhorou = tentativa, valor, True
+    return sorted(selecao)
+
+
+def resolver_enumeracao(custos, k, candidatas, elementos_por_lote=ELEMENTOS_POR_LOTE):
+    """Exato: avalia todas as combinações de k modalidades (em lotes vetorizados)"""
+    k = min(k, len(candidatas))
+    melhor_valor, melhor_selecao = (math.inf, math.inf), []
+    iterador = combinations(candidatas, k)
+    lote = max(1, elementos_por_lote // max(len(custos) * k, 1))
+    while True:
+        combinacoes = np.array(list(islice(iterador, lote)), dtype=int).reshape(-1, k)
+        if not len(combinacoes):
+            break
+        melhores = custos[:, combinacoes].min(axis=2)
+        inviaveis = np.isinf(melhores).sum(axis=0)
+        totais = np.where(np.isinf(melhores), 0.0, melhores).sum(axis=0)
+        j = np.lexsort((totais, inviaveis))[0]
+        if (inviaveis[j], totais[j]) < melhor_valor:
+            melhor_valor, melhor_selecao = (inviaveis[j], totais[j]), list(combinacoes[j])
+    # Menos de k modalidades nunca é melhor: incluir uma a mais não aumenta o mínimo de nenhum grupo
+    return sorted(int(m) for m in melhor_selecao)
+
+
+def resolver_branch_and_bound(custos, k, candidatas, tempo_limite=TEMPO_LIMITE_PADRAO):
+    """Exato com poda (retorna a melhor solução achada e se a busca terminou no tempo)
+
+    O limite inferior de um ramo é, para cada grupo, o menor custo entre as modalidades
+    já escolhidas e as que ainda podem entrar; a solução gulosa é a incumbente inicial.
+    """
+    selecao_inicial = resolver_guloso(custos, k, candidatas)
+    melhor = {'valor': _avaliar(custos, selecao_inicial), 'selecao': selecao_inicial}
+
+    # Candidatas na ordem de custo total (as boas primeiro aceleram a poda)
+    candidatas = sorted(candidatas, key=lambda m: _avaliar(custos, [m]))
+    # sufixos[p]: menor custo de cada grupo entre as candidatas p em diante
+    sufixos = np.full((len(candidatas) + 1, len(custos)), np.inf)
+    for p in range(len(candidatas) - 1, -1, -1):
+        sufixos[p] = np.minimum(sufixos[p + 1], custos[:, candidatas[p]])
+
+    prazo = time.perf_counter() + tempo_limite
+    estado = {'completo': True}
+
+    def valor(vetor):
+        inviaveis = np.isinf(vetor)
+        return int(inviaveis.sum()), float(vetor[~inviaveis].sum())
+
+    def buscar(posicao, selecao, atual):
+        if time.perf_counter() > prazo:
+            estado['completo'] = False
+            return
+        if valor(np.minimum(atual, sufixos[posicao])) >= melhor['valor']:
+            return
+        if len(selecao) == k or posicao == len(candidatas):
+            atual_valor = valor(atual)
+            if atual_valor < melhor['valor']:
+                melhor['valor'], melhor['selecao'] = atual_valor, sorted(selecao)
+            return
+        m = candidatas[posicao]
+        buscar(posicao + 1, selecao + [m], np.minimum(atual, custos[:, m]))
+        buscar(posicao + 1, selecao, atual)
+
+    buscar(0, [], np.full(len(custos), np.inf))
+    return melhor['selecao'], estado['completo']
+
+
+def otimizar_modalidades(riscos, modalidades, agrupamento='portfolio', max_modalidades=None,
+                         limite_residual=None, excluidas=(), metodo='auto', matriz=None,
+                         tempo_limite=TEMPO_LIMITE_PADRAO):
+    """Modalidade de menor risco residual para cada grupo de riscos, sob as restrições dadas
+
+    `agrupamento` é uma chave de AGRUPAMENTOS. Com `metodo='auto'` a solução é exata
+    (enumeração ou branch-and-bound; se o tempo se esgotar, fica a melhor encontrada
+    e `exato` é falso); 'heuristico' usa apenas o guloso com trocas. `matriz`
+    reaproveita uma MatrizRiscos já montada para `riscos` e `modalidades`.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método desconhecido: {metodo}")
+    if matriz is None:
+        matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+    modalidades = list(modalidades)
+
+    campo = AGRUPAMENTOS[agrupamento][1]
+    if campo is None:
+        nomes_grupos, grupos = ["Portfólio"], np.zeros(len(riscos), dtype=int)
+    elif agrupamento == 'risco':
+        # Um grupo por risco, mesmo que dois riscos tenham o mesmo nome
+        nomes_grupos = [f"{i + 1}. {risco[campo]}" for i, risco in enumerate(riscos)]
+        grupos = np.arange(len(riscos))
+    else:
+        nomes_grupos, grupos = np.unique(np.array([str(r.get(campo, '')) for r in riscos], dtype=object),
+                                         return_inverse=True)
+        nomes_grupos = list(nomes_grupos)
+    grupos = np.asarray(grupos, dtype=int).reshape(-1)
+
+    residuais = matriz.residuais
+    viaveis = np.ones(residuais.shape, dtype=bool)
+    if limite_residual is not None:
+        viaveis &= residuais <= limite_residual
+    excluidas = set(excluidas)
+    candidatas = [j for j, modalidade in enumerate(modalidades) if modalidade not in excluidas]
+
+    custos = np.full((len(nomes_grupos), len(modalidades)), np.inf)
+    if len(riscos):
+        custos = _custos(residuais, matriz.aplicavel, grupos, len(nomes_grupos), viaveis)
+    custos[:, [j for j in range(len(modalidades)) if j not in candidatas]] = np.inf
+
+    k = len(nomes_grupos) if max_modalidades is None else max_modalidades
+    inicio = time.perf_counter()
+    if not candidatas:
+        selecao, exato, usado = [], True, 'sem candidatas'
+    elif k >= min(len(nomes_grupos), len(candidatas)):
+        # O limite não restringe: cada grupo escolhe a sua melhor modalidade
+        selecao, exato, usado = candidatas, True, 'direto'
+    elif metodo == 'heuristico':
+        selecao, exato, usado = resolver_guloso(custos, k, candidatas), False, 'guloso'
+    elif math.comb(len(candidatas), k) <= LIMITE_ENUMERACAO:
+        selecao, exato, usado = resolver_enumeracao(custos, k, candidatas), True, 'enumeração'
+    else:
+        selecao, exato = resolver_branch_and_bound(custos, k, candidatas, tempo_limite)
+        usado = 'branch-and-bound'
+    tempo = time.perf_counter() - inicio
+
+    escolhas = np.full(len(nomes_grupos), -1)
+    if len(selecao):
+        colunas = np.asarray(selecao)
+        subcustos = custos[:, colunas]
+        escolhas = np.where(np.isinf(subcustos.min(axis=1)), -1, colunas[np.argmin(subcustos, axis=1)])
+
+    return ResultadoOtimizacao(
+        modalidades, nomes_grupos, grupos, escolhas, custos, residuais, matriz.inerente,
+        matriz.aplicavel.any(axis=0), candidatas, usado, exato, tempo
+    )
+
+
+class ResultadoOtimizacao:
+    """Modalidade escolhida por grupo, com o residual obtido e a comparação com a melhor modalidade única"""
+
+    def __init__(self, modalidades, nomes_grupos, grupos, escolhas, custos, residuais, inerente,
+                 aplicadas, candidatas, metodo, exato, tempo):
+        self.modalidades = modalidades
+        self.nomes_grupos = nomes_grupos
+        self.grupos = grupos
+        self.escolhas = escolhas
+        self.metodo = metodo
+        self.exato = exato
+        self.tempo = tempo
+
+        self.atribuidos = escolhas >= 0
+        self.residual_grupos = np.where(self.atribuidos, custos[np.arange(len(escolhas)), np.maximum(escolhas, 0)], np.nan)
+        self.inerente_grupos = np.bincount(grupos, weights=inerente, minlength=len(nomes_grupos))
+        self.riscos_grupos = np.bincount(grupos, minlength=len(nomes_grupos))
+        self.residual_total = float(np.nansum(self.residual_grupos))
+
+        # Referência: a melhor modalidade única permitida para todos os riscos (sem o limite por
+        # risco), entre as que se aplicam a algum risco
+        totais = residuais.sum(axis=0)
+        self.modalidade_unica = None
+        self.residual_modalidade_unica = np.nan
+        aplicaveis = [j for j in candidatas if aplicadas[j]]
+        if aplicaveis:
+            j = min(aplicaveis, key=lambda j: totais[j])
+            self.modalidade_unica = modalidades[j]
+            self.residual_modalidade_unica = float(totais[j])
+
+        # Residual de cada risco na modalidade do seu grupo
+        escolha_risco = escolhas[grupos] if len(grupos) else np.empty(0, dtype=int)
+        self.residual_riscos = np.where(
+            escolha_risco >= 0, residuais[np.arange(len(grupos)), np.maximum(escolha_risco, 0)], np.nan
+        )
+        self.escolha_riscos = escolha_risco
+
+    @property
+    def viavel(self):
+        """Se todos os grupos receberam uma modalidade que respeita as restrições"""
+        return bool(self.atribuidos.all())
+
+    @property
+    def modalidades_usadas(self):
+        return [self.modalidades[j] for j in sorted(set(self.escolhas[self.atribuidos].tolist()))]
+
+    def _nome(self, j):
+        return self.modalidades[j] if j >= 0 else None
+
+    def como_dataframe(self):
+        """Uma linha por grupo: modalidade escolhida, riscos, inerente e residual"""
+        return pd.DataFrame({
+            'Grupo': self.nomes_grupos,
+            'Modalidade': [self._nome(j) for j in self.escolhas],
+            'Riscos': self.riscos_grupos,
+            'Risco_Inerente': self.inerente_grupos,
+            'Risco_Residual': self.residual_grupos,
+        })
+
+    def riscos_dataframe(self, nomes_riscos):
+        """Uma linha por risco: grupo, modalidade atribuída e risco residual"""
+        return pd.DataFrame({
+            'Risco': nomes_riscos,
+            'Grupo': np.asarray(self.nomes_grupos, dtype=object)[self.grupos] if len(self.grupos) else [],
+            'Modalidade': [self._nome(j) for j in self.escolha_riscos],
+            'Risco_Residual': self.residual_riscos,
+        })
@@ -0,0 +1,425 @@
+"""Representação compacta do registro de riscos
+
+Cada risco é um `Risco` com `__slots__` que se comporta como o dicionário usado
+originalmente (risco['modalidades'][nome], .get, .update, dict(risco)...). Os
+nomes de modalidades são convertidos em ids inteiros compartilhados pelo registro,
+os fatores de mitigação ficam em um array contíguo de floats (NaN = modalidade não
+aplicável) e os textos são internados (sys.intern), de modo que textos repetidos,
+como as justificativas padrão, ocupam memória uma única vez.
+"""
+import math
+import sys
+from array import array
+from collections.abc import MutableMapping
+
+import numpy as np
+
+# Campos escalares de um risco (os mesmos das colunas da tabela `riscos`)
+CAMPOS = (
+    'id', 'risco_chave', 'descricao', 'impacto_nivel', 'impacto_valor',
+    'probabilidade_nivel', 'probabilidade_valor', 'risco_inerente', 'classificacao',
+    'justificativa_fator_probabilidade', 'contexto_especifico',
+    'personalizado', 'editado', 'criado_por', 'data_criacao', 'data_edicao'
+)
+_CAMPOS = frozenset(CAMPOS)
+NAO_APLICAVEL = math.nan
+
+# Colunas de modalidades removidas toleradas no índice antes de compactá-lo
+COLUNAS_MORTAS_TOLERADAS = 16
+
+
+class _Ausente:
+    """Marca um campo que o risco não possui (equivale à chave ausente no dicionário)"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return '<ausente>'
+
+
+AUSENTE = _Ausente()
+
+
+def _internar(valor):
+    return sys.intern(valor) if type(valor) is str else valor
+
+
+class IndiceModalidades:
+    """Ids inteiros dos nomes de modalidades, compartilhados pelos riscos de um registro
+
+    Cada coluna pode ter um fator e uma justificativa padrão, valendo para todo risco
+    sem valor explícito naquela posição (inclusive os criados antes da coluna). Uma
+    modalidade removida deixa a coluna sem nome (None), de modo que adicionar ou
+    remover modalidades não exige percorrer os riscos; o RegistroRiscos troca o
+    índice por um compacto quando as colunas mortas se acumulam (ver `compactar`).
+    """
+
+    __slots__ = ('nomes', 'ids', 'fatores_padrao', 'justificativas_padrao')
+
+    def __init__(self, nomes=(), fatores_padrao=None, justificativas_padrao=None):
+        self.nomes = []
+        self.ids = {}
+        self.fatores_padrao = []
+        self.justificativas_padrao = []
+        for posicao, nome in enumerate(nomes):
+            self.adicionar(
+                nome,
+                fatores_padrao[posicao] if fatores_padrao is not None else None,
+                justificativas_padrao[posicao] if justificativas_padrao is not None else None
+            )
+
+    def adicionar(self, nome, fator_padrao=None, justificativa_padrao=None):
+        """Nova coluna para `nome` (a anterior, se houver, é descartada) e seu id"""
+        self.remover(nome)
+        j = self.ids[nome] = len(self.nomes)
+        self.nomes.append(_internar(nome))
+        self.fatores_padrao.append(NAO_APLICAVEL if fator_padrao is None else float(fator_padrao))
+        self.justificativas_padrao.append(AUSENTE if justificativa_padrao is None else _internar(justificativa_padrao))
+        return j
+
+    def remover(self, nome):
+        """Descarta a coluna de `nome` em todos os riscos do registro"""
+        j = self.ids.pop(nome, None)
+        if j is not None:
+            self.nomes[j] = None
+
+    def id_modalidade(self, nome):
+        """Id do nome, atribuindo o próximo livre (sem padrão) na primeira ocorrência"""
+        j = self.ids.get(nome)
+        if j is None:
+            j = self.adicionar(nome)
+        return j
+
+    def __len__(self):
+        return len(self.nomes)
+
+    @property
+    def colunas_mortas(self):
+        return len(self.nomes) - len(self.ids)
+
+
+class FatoresRisco(MutableMapping):
+    """Visão {modalidade: fator} sobre o array de fatores de um risco"""
+
+    __slots__ = ('_risco',)
+
+    def __init__(self, risco):
+        self._risco = risco
+
+    def _valores(self):
+        fatores = self._risco._fatores
+        return [*fatores, *self._risco._indice.fatores_padrao[len(fatores):]]
+
+    def __getitem__(self, nome):
+        indice = self._risco._indice
+        j = indice.ids.get(nome)
+        if j is None:
+            raise KeyError(nome)
+        fatores = self._risco._fatores
+        fator = fatores[j] if j < len(fatores) else indice.fatores_padrao[j]
+        if fator != fator:
+            raise KeyError(nome)
+        return fator
+
+    def __setitem__(self, nome, fator):
+        indice = self._risco._indice
+        j = indice.id_modalidade(nome)
+        fatores = self._risco._fatores
+        if j >= len(fatores):
+            fatores.extend(indice.fatores_padrao[len(fatores):j + 1])
+        fatores[j] = NAO_APLICAVEL if fator is None else float(fator)
+
+    def __delitem__(self, nome):
+        self[nome]
+        self[nome] = None
+
+    def __iter__(self):
+        nomes = self._risco._indice.nomes
+        return (nome for nome, fator in zip(nomes, self._valores()) if nome is not None and fator == fator)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        nomes = self._risco._indice.nomes
+        return [(nome, fator) for nome, fator in zip(nomes, self._valores()) if nome is not None and fator == fator]
+
+    def values(self):
+        return [fator for _, fator in self.items()]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class JustificativasRisco(MutableMapping):
+    """Visão {modalidade: justificativa} sobre a lista de textos internados de um risco"""
+
+    __slots__ = ('_risco',)
+
+    def __init__(self, risco):
+        self._risco = risco
+
+    def _valores(self):
+        textos = self._risco._justificativas
+        return [*textos, *self._risco._indice.justificativas_padrao[len(textos):]]
+
+    def __getitem__(self, nome):
+        indice = self._risco._indice
+        j = indice.ids.get(nome)
+        if j is None:
+            raise KeyError(nome)
+        textos = self._risco._justificativas
+        texto = textos[j] if j < len(textos) else indice.justificativas_padrao[j]
+        if texto is AUSENTE:
+            raise KeyError(nome)
+        return texto
+
+    def __setitem__(self, nome, texto):
+        indice = self._risco._indice
+        j = indice.id_modalidade(nome)
+        textos = self._risco._justificativas
+        if j >= len(textos):
+            textos.extend(indice.justificativas_padrao[len(textos):j + 1])
+        textos[j] = _internar(texto)
+
+    def __delitem__(self, nome):
+        self[nome]
+        self[nome] = AUSENTE
+
+    def __iter__(self):
+        nomes = self._risco._indice.nomes
+        return (nome for nome, texto in zip(nomes, self._valores()) if nome is not None and texto is not AUSENTE)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        nomes = self._risco._indice.nomes
+        return [(nome, texto) for nome, texto in zip(nomes, self._valores())
+                if nome is not None and texto is not AUSENTE]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class Risco(MutableMapping):
+    """Risco com campos em `__slots__`, compatível com o dicionário de risco original
+
+    As chaves 'modalidades' e 'justificativas_modalidades' devolvem visões mutáveis
+    sobre os arrays do risco; atribuir um dicionário a elas substitui todo o conteúdo
+    (modalidades fora do dicionário deixam de se aplicar, mesmo as que têm padrão).
+    Chaves fora de CAMPOS são guardadas em um dicionário à parte.
+    """
+
+    __slots__ = CAMPOS + ('_indice', '_fatores', '_justificativas', '_extras')
+
+    def __init__(self, dados=(), indice=None):
+        for campo in CAMPOS:
+            object.__setattr__(self, campo, AUSENTE)
+        self._indice = indice if indice is not None else IndiceModalidades()
+        self._fatores = array('d')
+        self._justificativas = []
+        self._extras = None
+        self.update(dados)
+
+    def __getitem__(self, chave):
+        if chave in _CAMPOS:
+            valor = getattr(self, chave)
+            if valor is AUSENTE:
+                raise KeyError(chave)
+            return valor
+        if chave == 'modalidades':
+            return FatoresRisco(self)
+        if chave == 'justificativas_modalidades':
+            return JustificativasRisco(self)
+        if self._extras and chave in self._extras:
+            return self._extras[chave]
+        raise KeyError(chave)
+
+    def get(self, chave, padrao=None):
+        if chave in _CAMPOS:
+            valor = getattr(self, chave)
+            return padrao if valor is AUSENTE else valor
+        try:
+            return self[chave]
+        except KeyError:
+            return padrao
+
+    def __setitem__(self, chave, valor):
+        if chave in _CAMPOS:
+            setattr(self, chave, _internar(valor))
+        elif chave == 'modalidades':
+            itens = list(valor.items())
+            self._fatores = array('d', [NAO_APLICAVEL]) * len(self._indice)
+            fatores = FatoresRisco(self)
+            for nome, fator in itens:
+                fatores[nome] = fator
+        elif chave == 'justificativas_modalidades':
+            itens = list(valor.items())
+            self._justificativas = [AUSENTE] * len(self._indice)
+            justificativas = JustificativasRisco(self)
+            for nome, texto in itens:
+                justificativas[nome] = texto
+        else:
+            if self._extras is None:
+                self._extras = {}
+            self._extras[chave] = valor
+
+    def __delitem__(self, chave):
+        if chave in _CAMPOS:
+            self[chave]
+            setattr(self, chave, AUSENTE)
+        elif chave == 'modalidades':
+            self._fatores = array('d', [NAO_APLICAVEL]) * len(self._indice)
+        elif chave == 'justificativas_modalidades':
+            self._justificativas = [AUSENTE] * len(self._indice)
+        elif self._extras and chave in self._extras:
+            del self._extras[chave]
+        else:
+            raise KeyError(chave)
+
+    def __iter__(self):
+        for campo in CAMPOS:
+            if getattr(self, campo) is not AUSENTE:
+                yield campo
+        yield 'modalidades'
+        yield 'justificativas_modalidades'
+        if self._extras:
+            yield from self._extras
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        """Cópia independente (os arrays de fatores e justificativas não são compartilhados)"""
+        copia = Risco.__new__(Risco)
+        for campo in self.__slots__:
+            object.__setattr__(copia, campo, getattr(self, campo))
+        copia._fatores = array('d', self._fatores)
+        copia._justificativas = list(self._justificativas)
+        copia._extras = dict(self._extras) if self._extras else None
+        return copia
+
+    def reindexado(self, indice, colunas):
+        """Cópia sobre outro índice, cuja coluna k é a coluna colunas[k] (crescentes) do índice atual"""
+        copia = self.copy()
+        copia._indice = indice
+        # Colunas além do array do risco seguem o padrão: as mantidas formam um prefixo
+        copia._fatores = array('d', [self._fatores[j] for j in colunas if j < len(self._fatores)])
+        copia._justificativas = [self._justificativas[j] for j in colunas if j < len(self._justificativas)]
+        return copia
+
+    def como_dict(self):
+        """Dicionário comum (com dicionários aninhados), p. ex. para serializar em JSON"""
+        dados = {campo: valor for campo in CAMPOS if (valor := getattr(self, campo)) is not AUSENTE}
+        dados['modalidades'] = dict(FatoresRisco(self).items())
+        dados['justificativas_modalidades'] = dict(JustificativasRisco(self).items())
+        if self._extras:
+            dados.update(self._extras)
+        return dados
+
+    def __repr__(self):
+        return f"Risco({self.como_dict()!r})"
+
+    def __reduce__(self):
+        return (Risco, (self.como_dict(),))
+
+
+def como_dict(risco):
+    """Dicionário comum de um risco, seja ele um `Risco` ou já um dicionário"""
+    return risco.como_dict() if isinstance(risco, Risco) else risco
+
+
+class RegistroRiscos(list):
+    """Lista de riscos que converte cada item inserido em `Risco` com o índice do registro"""
+
+    __slots__ = ('indice',)
+
+    def __init__(self, riscos=(), indice=None):
+        self.indice = indice if indice is not None else IndiceModalidades()
+        super().__init__(self._converter(risco) for risco in riscos)
+
+    def _converter(self, risco):
+        if isinstance(risco, Risco) and risco._indice is self.indice:
+            return risco
+        return Risco(risco, self.indice)
+
+    def append(self, risco):
+        super().append(self._converter(risco))
+
+    def insert(self, posicao, risco):
+        super().insert(posicao, self._converter(risco))
+
+    def extend(self, riscos):
+        super().extend(self._converter(risco) for risco in riscos)
+
+    def __iadd__(self, riscos):
+        self.extend(riscos)
+        return self
+
+    def __add__(self, riscos):
+        return RegistroRiscos([*self, *riscos], self.indice)
+
+    def __setitem__(self, posicao, valor):
+        if isinstance(posicao, slice):
+            super().__setitem__(posicao, [self._converter(risco) for risco in valor])
+        else:
+            super().__setitem__(posicao, self._converter(valor))
+
+    def __getitem__(self, posicao):
+        if isinstance(posicao, slice):
+            return RegistroRiscos(super().__getitem__(posicao), self.indice)
+        return super().__getitem__(posicao)
+
+    def copy(self):
+        return RegistroRiscos(self, self.indice)
+
+    def __reduce__(self):
+        return (RegistroRiscos, ([risco.como_dict() for risco in self],))
+
+    def adicionar_modalidade(self, nome, fator_padrao=None, justificativa_padrao=None):
+        """Inclui a modalidade em todos os riscos com o fator padrão, em O(1) amortizado"""
+        self.indice.adicionar(nome, fator_padrao, justificativa_padrao)
+        self._compactar_se_necessario()
+
+    def remover_modalidade(self, nome):
+        """Retira a modalidade de todos os riscos, em O(1) amortizado"""
+        self.indice.remover(nome)
+        self._compactar_se_necessario()
+
+    def _compactar_se_necessario(self):
+        # Compactar só quando as colunas mortas superam as vivas mantém o custo amortizado
+        # de cada adição ou remoção em O(riscos), sem crescimento ilimitado das colunas
+        if self.indice.colunas_mortas > max(COLUNAS_MORTAS_TOLERADAS, len(self.indice.ids)):
+            self.compactar()
+
+    def compactar(self):
+        """Troca o índice por um só com as colunas vivas, reescrevendo os riscos do registro
+
+        Os riscos são substituídos por cópias sobre o novo índice; o índice antigo não é
+        alterado, de modo que cópias e referências a riscos antigos continuam válidas.
+        """
+        antigo = self.indice
+        colunas = [j for j, nome in enumerate(antigo.nomes) if nome is not None]
+        self.indice = IndiceModalidades(
+            [antigo.nomes[j] for j in colunas],
+            [antigo.fatores_padrao[j] for j in colunas],
+            [antigo.justificativas_padrao[j] for j in colunas]
+        )
+        for i, risco in enumerate(self):
+            super().__setitem__(i, risco.reindexado(self.indice, colunas))
+
+    def matriz_fatores(self, modalidades):
+        """Arrays (inerente, fatores, aplicável) na ordem de `modalidades`, sem percorrer dicionários"""
+        n = len(self)
+        inerente = np.fromiter((risco.risco_inerente for risco in self), dtype=float, count=n)
+        tabela = np.empty((n, len(self.indice) + 1))
+        tabela[:, :-1] = self.indice.fatores_padrao
+        tabela[:, -1] = np.nan
+        for i, risco in enumerate(self):
+            if risco._fatores:
+                tabela[i, :len(risco._fatores)] = np.frombuffer(risco._fatores, dtype=float)
+        # A última coluna (sempre NaN) representa modalidades ausentes do índice
+        colunas = [self.indice.ids.get(modalidade, len(self.indice)) for modalidade in modalidades]
+        fatores = tabela[:, colunas]
+        aplicavel = ~np.isnan(fatores)
+        return inerente, np.where(aplicavel, fatores, 0.0), aplicavel
@@ -0,0 +1,716 @@
+"""Geração de relatórios Word em segundo plano, com cache pelo conteúdo dos dados
+
+Também gera, sem a interface, os relatórios de vários projetos do banco de uma vez,
+distribuídos entre processos, gravando-os em um diretório ou em um arquivo .zip:
+
+    python relatorio.py --saida relatorios/
+    python relatorio.py --saida relatorios_trimestre.zip --processos 4 --nome "Fulano" --unidade "SPU"
+    python relatorio.py --projeto "Projeto A" --projeto "Projeto B" --saida - > relatorios.zip
+"""
+import argparse
+import copy
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from banco_dados import carregar_registro_riscos, init_db, resumir_projetos
+from graficos import digest_dados
+from motor_riscos import MatrizRiscos, classificar_risco
+
+# É necessário instalar a biblioteca python-docx para gerar o relatório Word
+try:
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.oxml.shared import OxmlElement, qn
+except ImportError:
+    Document = None
+
+# Relatórios gerados simultaneamente e relatórios concluídos mantidos em memória
+TRABALHADORES_RELATORIO = int(os.environ.get('SAROI_TRABALHADORES_RELATORIO', 2))
+MAX_RELATORIOS_EM_CACHE = int(os.environ.get('SAROI_MAX_RELATORIOS', 16))
+
+
+def _sem_progresso(fracao, etapa):
+    pass
+
+
+def construir_relatorio_word(riscos, modalidades, nome_projeto, identificacao, progresso=None, data_geracao=None):
+    """Gera relatório completo e amplo em formato Word e retorna o conteúdo do .docx
+
+    `progresso(fracao, etapa)`, se informado, é chamado a cada seção gerada.
+    `data_geracao` é a data e hora impressas no relatório (padrão: agora).
+    """
+    if Document is None:
+        raise ImportError("Para gerar relatórios Word, instale a biblioteca python-docx: pip install python-docx")
+    if progresso is None:
+        progresso = _sem_progresso
+    if data_geracao is None:
+        data_geracao = datetime.now()
+    
+    # Criar documento
+    doc = Document()
+    
+    # Título principal com nome do projeto
+    title = doc.add_heading(f'RELATÓRIO EXECUTIVO DE AVALIAÇÃO DE RISCOS - {nome_projeto}', 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # Subtítulo
+    subtitle = doc.add_heading("Metodologia - Análise Comparativa de Modalidades de Contratação", level=1)
+    subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # NOVO: Nome do Projeto como título dentro do documento
+    doc.add_heading(f"Projeto: {nome_projeto}", level=2)
+    doc.add_paragraph()
+    
+    # Informações do relatório com identificação
+    info_para = doc.add_paragraph()
+    info_para.add_run("Data da Análise: ").bold = True
+    info_para.add_run(f"{data_geracao.strftime('%d/%m/%Y às %H:%M')}")
+    info_para.add_run("\nMetodologia: ").bold = True
+    info_para.add_run("Roteiro de Auditoria de Gestão de Riscos - SAROI")
+    info_para.add_run("\nVersão do Sistema: ").bold = True
+    info_para.add_run("2.0 - Análise Ampliada")
+    
+    # Adicionar informações do responsável
+    info_para.add_run("\n\nRESPONSÁVEL PELA ANÁLISE:").bold = True
+    info_para.add_run(f"\nNome: {identificacao['nome']}")
+    info_para.add_run(f"\nUnidade: {identificacao['unidade']}")
+    if identificacao['orgao']:
+        info_para.add_run(f"\nÓrgão: {identificacao['orgao']}")
+    if identificacao['email']:
+        info_para.add_run(f"\nE-mail: {identificacao['email']}")
+    
+    doc.add_paragraph()
+    
+    progresso(0.05, "Resumo executivo")
+    
+    # 1. RESUMO EXECUTIVO
+    doc.add_heading('1. RESUMO EXECUTIVO', level=1)
+    
+    total_riscos = len(riscos)
+    riscos_altos = sum(1 for r in riscos if r['classificacao'] == 'Alto')
+    riscos_medios = sum(1 for r in riscos if r['classificacao'] == 'Médio')
+    riscos_baixos = sum(1 for r in riscos if r['classificacao'] == 'Baixo')
+    
+    # Resultados por modalidade calculados pelo motor vetorizado
+    matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+    resultado = matriz.agregar()
+    risco_inerente_total = resultado.risco_inerente_total
+    dados_comparativos = {
+        modalidade: resultado.dados(j) for j, modalidade in enumerate(resultado.modalidades)
+    }
+    risco_acumulado_por_modalidade = {
+        modalidade: dados['risco_residual_total'] for modalidade, dados in dados_comparativos.items()
+    }
+    
+    melhor_modalidade = resultado.modalidades[resultado.indice_melhor]
+    pior_modalidade = resultado.modalidades[resultado.indice_pior]
+    
+    # Tabela de Métricas Principais
+    doc.add_paragraph("MÉTRICAS PRINCIPAIS DO PROJETO:")
+    
+    df_metricas = pd.DataFrame({
+        "Métrica": ["Total de Riscos Analisados", "Riscos ALTOS", "Riscos MÉDIOS", "Riscos BAIXOS", "Risco Inerente Total"],
+        "Valor": [
+            f"{total_riscos}",
+            f"{riscos_altos} ({riscos_altos/total_riscos*100:.1f}%)",
+            f"{riscos_medios} ({riscos_medios/total_riscos*100:.1f}%)",
+            f"{riscos_baixos} ({riscos_baixos/total_riscos*100:.1f}%)",
+            f"{risco_inerente_total:.1f} pontos"
+        ]
+    })
+    
+    # Create a table and add data from the DataFrame
+    table_metrics = doc.add_table(df_metricas.shape[0] + 1, df_metricas.shape[1])
+    table_metrics.style = 'Table Grid'
+    
+    # Add headers
+    for j in range(df_metricas.shape[-1]):
+        table_metrics.cell(0, j).text = df_metricas.columns[j]
+    
+    # Add rows
+    for i in range(df_metricas.shape[0]):
+        row_cells = table_metrics.rows[i + 1].cells
+        for j in range(df_metricas.shape[-1]):
+            cell = row_cells[j]
+            cell.text = str(df_metricas.values[i, j])
+    
+            # Apply cell shading based on risk classification
+            if df_metricas.values[i, 0] == "Riscos ALTOS":
+                shading_color = 'FFDDE6' # Light Red
+            elif df_metricas.values[i, 0] == "Riscos MÉDIOS":
+                shading_color = 'FFF2CC' # Light Yellow
+            elif df_metricas.values[i, 0] == "Riscos BAIXOS":
+                shading_color = 'D4EDDA' # Light Green
+            else:
+                shading_color = None
+    
+            if shading_color:
+                tc = cell._element.tcPr
+                tc_shd = OxmlElement('w:shd')
+                tc_shd.set(qn('w:val'), 'clear')
+                tc_shd.set(qn('w:fill'), shading_color)
+                tc.append(tc_shd)
+    
+    # Space before next paragraph
+    doc.add_paragraph()
+    
+    resumo = f"""
+    RESULTADO DA ANÁLISE COMPARATIVA:
+    • MODALIDADE RECOMENDADA: {melhor_modalidade}
+      - Risco Residual: {risco_acumulado_por_modalidade[melhor_modalidade]:.1f} pontos
+    • MODALIDADE DE MAIOR RISCO: {pior_modalidade}
+      - Risco Residual: {risco_acumulado_por_modalidade[pior_modalidade]:.1f} pontos
+    • DIFERENÇA DE RISCO: {risco_acumulado_por_modalidade[pior_modalidade] - risco_acumulado_por_modalidade[melhor_modalidade]:.1f} pontos
+    """
+    doc.add_paragraph(resumo)
+    
+    progresso(0.15, "Metodologia")
+    
+    # 2. METODOLOGIA DETALHADA
+    doc.add_heading('2. METODOLOGIA E CRITÉRIOS DE AVALIAÇÃO', level=1)
+    metodologia = """
+    A avaliação seguiu rigorosamente a metodologia estabelecida no "Roteiro de Auditoria de 
+    Gestão de Riscos", aplicando escalas quantitativas padronizadas e critérios objetivos.
+    
+    2.1 ESCALAS DE AVALIAÇÃO
+    
+    IMPACTO (Consequências para os objetivos):
+    • Muito baixo (1): Degradação mínima das operações
+    • Baixo (2): Degradação pequena, facilmente recuperável
+    • Médio (5): Interrupção significativa mas recuperável
+    • Alto (8): Interrupção grave, reversão muito difícil
+    • Muito alto (10): Paralisação com impactos irreversíveis
+    
+    PROBABILIDADE (Chance de ocorrência):
+    • Muito baixa (1): Evento improvável, sem elementos indicativos
+    • Baixa (2): Evento raro, poucos elementos indicam possibilidade
+    • Média (5): Evento possível, elementos moderadamente indicativos
+    • Alta (8): Evento provável, elementos consistentemente indicativos
+    • Muito alta (10): Evento praticamente certo, elementos claramente indicativos
+    
+    2.2 CÁLCULO DO RISCO INERENTE
+    
+    O risco inerente é calculado pela multiplicação: IMPACTO × PROBABILIDADE
+    
+    2.3 CLASSIFICAÇÃO DOS RISCOS
+    
+    • BAIXO: Risco inerente ≤ 10 pontos
+    • MÉDIO: Risco inerente entre 11 e 25 pontos  
+    • ALTO: Risco inerente > 25 pontos
+    
+    2.4 CÁLCULO DO RISCO RESIDUAL
+    
+    Para cada modalidade, o risco residual é calculado aplicando-se o fator de mitigação:
+    RISCO RESIDUAL = RISCO INERENTE × FATOR DE MITIGAÇÃO
+    
+    Onde o fator de mitigação varia de 0,0 (elimina totalmente o risco) a 1,0 (não mitiga o risco).
+    """
+    doc.add_paragraph(metodologia)
+    
+    progresso(0.2, "Análise detalhada dos riscos")
+    
+    # 3. ANÁLISE DETALHADA DOS RISCOS
+    doc.add_heading('3. ANÁLISE DETALHADA DOS RISCOS IDENTIFICADOS', level=1)
+    
+    for i, risco in enumerate(riscos, 1):
+        progresso(0.2 + 0.5 * (i - 1) / len(riscos), f"Análise detalhada dos riscos ({i}/{len(riscos)})")
+        doc.add_heading(f'3.{i} {risco["risco_chave"]}', level=2)
+    
+        # Avaliação quantitativa
+        aval_para = doc.add_paragraph()
+        aval_para.add_run("\nAVALIAÇÃO QUANTITATIVA:").bold = True
+        aval_para.add_run(f"\n• Impacto: {risco['impacto_valor']} ({risco['impacto_nivel']})\n")
+        aval_para.add_run("Justificativa do risco: ").bold = True
+        aval_para.add_run(risco.get("descricao", ""))
+        aval_para.add_run(f"\n\n• Probabilidade: {risco['probabilidade_valor']} ({risco['probabilidade_nivel']})\n")
+        aval_para.add_run("Justificativa de Probabilidade de ocorrência: ").bold = True
+        aval_para.add_run(risco.get("contexto_especifico", ""))
+        aval_para.add_run(f"\n\n• Risco Inerente: {risco['risco_inerente']} pontos")
+        aval_para.add_run(f"\n• Classificação: {risco['classificacao']}")
+    
+        # Análise por modalidade - AGORA EM TABELA
+        doc.add_heading('3.x Análise por Modalidade', level=3)
+    
+        table = doc.add_table(rows=1, cols=5)
+        table.style = 'Table Grid'
+    
+        hdr_cells = table.rows[0].cells
+        hdr_cells[0].text = 'Modalidade'
+        hdr_cells[1].text = 'Fator de Mitigação'
+        hdr_cells[2].text = 'Risco Residual'
+        hdr_cells[3].text = 'Eficácia (%)'
+        hdr_cells[4].text = 'Justificativa'
+    
+        justificativas_modalidades = risco.get("justificativas_modalidades", {})
+        for modalidade, fator in risco['modalidades'].items():
+            risco_residual = risco['risco_inerente'] * fator
+            eficacia = (1 - fator) * 100
+    
+            row_cells = table.add_row().cells
+            row_cells[0].text = modalidade
+            row_cells[1].text = f"{fator:.1f}"
+            row_cells[2].text = f"{risco_residual:.1f} ({classificar_risco(risco_residual)[0]})"
+            row_cells[3].text = f"{eficacia:.1f}%"
+            row_cells[4].text = justificativas_modalidades.get(modalidade, "")
+    
+    progresso(0.7, "Análise comparativa das modalidades")
+    
+    # 4. ANÁLISE COMPARATIVA DAS MODALIDADES
+    doc.add_heading('4. ANÁLISE COMPARATIVA DAS MODALIDADES', level=1)
+    
+    # Tabela comparativa principal
+    doc.add_heading('4.1 Quadro Comparativo Consolidado', level=2)
+    
+    table = doc.add_table(rows=1, cols=6)
+    table.style = 'Table Grid'
+    hdr_cells = table.rows[0].cells
+    hdr_cells[0].text = 'Ranking'
+    hdr_cells[1].text = 'Modalidade'
+    hdr_cells[2].text = 'Risco Residual Total'
+    hdr_cells[3].text = 'Eficácia Mitigação (%)'
+    hdr_cells[4].text = 'Classificação Final'
+    hdr_cells[5].text = 'Riscos Aplicáveis'
+    
+    # Ordenar modalidades por risco residual
+    modalidades_ordenadas = resultado.ordenadas()
+    
+    for i, (modalidade, dados) in enumerate(modalidades_ordenadas, 1):
+        row_cells = table.add_row().cells
+        row_cells[0].text = f"{i}º"
+        row_cells[1].text = modalidade
+        row_cells[2].text = f"{dados['risco_residual_total']:.1f}"
+        row_cells[3].text = f"{dados['eficacia_percentual']:.1f}%"
+        row_cells[4].text = dados['classificacao']
+        row_cells[5].text = f"{dados['riscos_aplicaveis']}/{total_riscos}"
+    
+    # 4.2 Análise de Performance
+    doc.add_heading('4.2 Análise de Performance por Modalidade', level=2)
+    
+    for i, (modalidade, dados) in enumerate(modalidades_ordenadas, 1):
+        posicao_texto = "RECOMENDADA" if i == 1 else "NÃO RECOMENDADA" if i == len(modalidades_ordenadas) else f"{i}ª COLOCADA"
+    
+        performance_para = doc.add_paragraph()
+        performance_para.add_run(f"{modalidade} - {posicao_texto}").bold = True
+        performance_para.add_run(f"""
+        • Risco Residual Total: {dados['risco_residual_total']:.1f} pontos
+        • Eficácia de Mitigação: {dados['eficacia_percentual']:.1f}%
+        • Classificação de Risco: {dados['classificacao']}
+        • Redução Absoluta do Risco: {dados['risco_inerente_aplicavel'] - dados['risco_residual_total']:.1f} pontos
+        • Riscos Aplicáveis: {dados['riscos_aplicaveis']} de {total_riscos} riscos
+        """)
+    
+    progresso(0.75, "Matriz detalhada de riscos")
+    
+    # 5. MATRIZ DETALHADA DE RISCOS
+    doc.add_heading('5. MATRIZ DETALHADA DE RISCOS POR MODALIDADE', level=1)
+    
+    # Criar tabela expandida
+    num_cols = 3 + len(modalidades)
+    table = doc.add_table(rows=1, cols=num_cols)
+    table.style = 'Table Grid'
+    
+    # Cabeçalhos
+    hdr_cells = table.rows[0].cells
+    hdr_cells[0].text = 'Risco'
+    hdr_cells[1].text = 'Impacto'
+    hdr_cells[2].text = 'Probabilidade'
+    for i, modalidade in enumerate(modalidades):
+        col_name = modalidade[:15] + "..." if len(modalidade) > 15 else modalidade
+        hdr_cells[3 + i].text = col_name
+    
+    # Dados por risco
+    residuais = matriz.residuais
+    for indice, risco in enumerate(riscos):
+        row_cells = table.add_row().cells
+        risco_name = risco['risco_chave'][:25] + "..." if len(risco['risco_chave']) > 25 else risco['risco_chave']
+        row_cells[0].text = risco_name
+        row_cells[1].text = str(risco['impacto_valor'])
+        row_cells[2].text = str(risco['probabilidade_valor'])
+    
+        for i in range(len(matriz.modalidades)):
+            if matriz.aplicavel[indice, i]:
+                row_cells[3 + i].text = f"{residuais[indice, i]:.1f}"
+            else:
+                row_cells[3 + i].text = "N/A"
+    
+    # Linha de totais
+    row_cells = table.add_row().cells
+    row_cells[0].text = "TOTAL ACUMULADO"
+    row_cells[1].text = "-"
+    row_cells[2].text = "-"
+    
+    for i, modalidade in enumerate(modalidades):
+        if modalidade in dados_comparativos:
+            row_cells[3 + i].text = f"{dados_comparativos[modalidade]['risco_residual_total']:.1f}"
+        else:
+            row_cells[3 + i].text = "N/A"
+    
+    progresso(0.85, "Recomendações e conclusões")
+    
+    # 6. RECOMENDAÇÕES E CONCLUSÕES
+    doc.add_heading('6. RECOMENDAÇÕES EXECUTIVAS', level=1)
+    
+    melhor_modalidade_dados = dados_comparativos[melhor_modalidade]
+    pior_modalidade_dados = dados_comparativos[pior_modalidade]
+    
+    recomendacoes = f"""
+    6.1 MODALIDADE RECOMENDADA
+    
+    Com base na análise quantitativa realizada, recomenda-se a adoção da modalidade:
+    "{melhor_modalidade}"
+    
+    JUSTIFICATIVAS TÉCNICAS:
+    • Menor risco residual acumulado: {melhor_modalidade_dados['risco_residual_total']:.1f} pontos
+    • Maior eficácia de mitigação: {melhor_modalidade_dados['eficacia_percentual']:.1f}%
+    • Classificação de Risco: {melhor_modalidade_dados['classificacao']}
+    • Redução Absoluta do Risco: {melhor_modalidade_dados['risco_inerente_aplicavel'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos
+    • Riscos Aplicáveis: {melhor_modalidade_dados['riscos_aplicaveis']} de {total_riscos} riscos
+    
+    6.2 MODALIDADES NÃO RECOMENDADAS
+    
+    A modalidade de maior risco identificada é:
+    "{pior_modalidade}"
+    
+    RAZÕES PARA NÃO RECOMENDAÇÃO:
+    • Maior risco residual acumulado: {pior_modalidade_dados['risco_residual_total']:.1f} pontos
+    • Menor eficácia de mitigação: {pior_modalidade_dados['eficacia_percentual']:.1f}%
+    • Classificação de Risco: {pior_modalidade_dados['classificacao']}
+    
+    6.3 IMPACTO DA ESCOLHA DA MODALIDADE
+    
+    A diferença entre a melhor e pior modalidade é de {pior_modalidade_dados['risco_residual_total'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos de risco, 
+    representando {(pior_modalidade_dados['risco_residual_total'] - melhor_modalidade_dados['risco_residual_total'])/risco_inerente_total*100:.1f}% 
+    do risco total do projeto.
+    
+    Esta diferença demonstra a importância crítica da escolha adequada da modalidade de contratação 
+    para o sucesso do empreendimento.
+    """
+    doc.add_paragraph(recomendacoes)
+    
+    # 7. CONCLUSÕES FINAIS
+    doc.add_heading('7. CONCLUSÕES E CONSIDERAÇÕES FINAIS', level=1)
+    
+    conclusoes = f"""
+    A presente análise, baseada na metodologia consolidada do SAROI, permitiu uma avaliação 
+    objetiva e fundamentada das modalidades de contratação disponíveis para o projeto.
+    
+    PRINCIPAIS RESULTADOS:
+    
+    1. RISCO TOTAL DO PROJETO: {risco_inerente_total:.1f} pontos (antes da mitigação)
+    
+    2. ESTRATÉGIA ÓTIMA IDENTIFICADA: {melhor_modalidade}
+        - Reduz o risco total para {melhor_modalidade_dados['risco_residual_total']:.1f} pontos
+        - Eficácia de mitigação de {melhor_modalidade_dados['eficacia_percentual']:.1f}%
+        - Redução absoluta de {melhor_modalidade_dados['risco_inerente_aplicavel'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos de risco
+    
+    3. AMPLITUDE DE VARIAÇÃO: As modalidades analisadas apresentam variação de risco residual 
+        de {pior_modalidade_dados['risco_residual_total'] - melhor_modalidade_dados['risco_residual_total']:.1f} pontos, 
+        evidenciando a relevância da escolha estratégica.
+    
+    4. CONFORMIDADE METODOLÓGICA: A análise seguiu integralmente os preceitos estabelecidos 
+        pelo SAROI para gestão de riscos em projetos públicos, garantindo objetividade e 
+        fundamentação técnica para a tomada de decisão.
+    
+    CONSIDERAÇÕES PARA IMPLEMENTAÇÃO:
+    
+    • A modalidade recomendada deve ser implementada observando-se os aspectos específicos 
+      identificados na análise de cada risco.
+    • Recomenda-se o monitoramento contínuo dos fatores de risco durante a execução do projeto.
+    • Os resultados desta análise devem ser revisados caso ocorram mudanças significativas 
+      no contexto do projeto ou nas condições de mercado.
+    
+    Esta análise fornece base técnica sólida e metodologicamente consistente para a tomada 
+    de decisão, em total conformidade com as melhores práticas de gestão de riscos estabelecidas 
+    pelos órgãos de controle.
+    """
+    doc.add_paragraph(conclusoes)
+    
+    # ANEXOS
+    doc.add_heading('ANEXOS', level=1)
+    
+    # Anexo I - Escalas utilizadas
+    doc.add_heading('ANEXO I - Escalas de Avaliação Utilizadas', level=2)
+    
+    escalas_texto = """
+    ESCALA DE IMPACTO:
+    1 - Muito baixo: Degradação de operações causando impactos mínimos nos objetivos
+    2 - Baixo: Degradação de operações causando impactos pequenos nos objetivos  
+    5 - Médio: Interrupção de operações causando impactos significativos mas recuperáveis
+    8 - Alto: Interrupção de operações causando impactos de reversão muito difícil
+    10 - Muito alto: Paralisação de operações causando impactos irreversíveis/catastróficos
+    
+    ESCALA DE PROBABILIDADE:
+    1 - Muito baixa: Evento improvável de ocorrer. Não há elementos que indiquem essa possibilidade
+    2 - Baixa: Evento raro de ocorrer. Poucos elementos indicam essa possibilidade
+    5 - Média: Evento possível de ocorrer. Elementos indicam moderadamente essa possibilidade  
+    8 - Alta: Evento provável de ocorrer. Elementos indicam consistentemente essa possibilidade
+    10 - Muito alta: Evento praticamente certo de ocorrer. Elementos indicam claramente essa possibilidade
+    """
+    doc.add_paragraph(escalas_texto)
+    
+    # Rodapé
+    doc.add_paragraph()
+    doc.add_paragraph("_" * 50)
+    rodape = doc.add_paragraph()
+    rodape.add_run("Relatório gerado automaticamente pelo Sistema de Avaliação de Riscos SAROI v2.0").italic = True
+    rodape.add_run(f"\nData e hora: {data_geracao.strftime('%d/%m/%Y às %H:%M')}")
+    rodape.add_run(f"\nResponsável: {identificacao['nome']} - {identificacao['unidade']}")
+    if identificacao['orgao']:
+        rodape.add_run(f"\nUnidade: {identificacao['unidade']}")
+    rodape.add_run(f"\nTotal de páginas estimadas: {len(doc.paragraphs) // 20 + 1}")
+    
+    progresso(0.95, "Salvando documento")
+    
+    # Salvar em buffer
+    buffer = BytesIO()
+    doc.save(buffer)
+    progresso(1.0, "Concluído")
+    return buffer.getvalue()
+
+
+class TarefaRelatorio:
+    """Estado de um relatório em geração: progresso, etapa atual, conteúdo ou erro"""
+
+    def __init__(self, chave):
+        self.chave = chave
+        self.progresso = 0.0
+        self.etapa = "Aguardando na fila"
+        self.conteudo = None
+        self.data_geracao = None
+        self.erro = None
+        self.concluida = threading.Event()
+
+    @property
+    def finalizada(self):
+        return self.concluida.is_set()
+
+    def atualizar(self, fracao, etapa):
+        self.progresso = min(max(fracao, 0.0), 1.0)
+        self.etapa = etapa
+
+
+class GerenciadorRelatorios:
+    """Executa a geração de relatórios em threads e guarda os concluídos em cache
+
+    Os relatórios são endereçados pelo hash de (riscos, modalidades, identificação,
+    nome do projeto): um pedido repetido para os mesmos dados reaproveita a tarefa em
+    andamento ou o .docx já gerado, que traz a data e hora da sua geração (guardada
+    em `data_geracao` na tarefa). Tarefas que falharam são refeitas no próximo pedido.
+    """
+
+    def __init__(self, trabalhadores=TRABALHADORES_RELATORIO, max_relatorios=MAX_RELATORIOS_EM_CACHE):
+        self.max_relatorios = max_relatorios
+        self._executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='relatorio')
+        self._tarefas = OrderedDict()
+        self._chaves_versoes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def solicitar(self, riscos, modalidades, nome_projeto, identificacao, versao=None):
+        """Retorna a tarefa do relatório para estes dados, iniciando-a se necessário
+
+        `versao`, se informada, identifica o estado dos dados para quem pede (p. ex. a
+        sessão e sua versão dos dados): um pedido repetido para a mesma versão
+        reaproveita a tarefa sem calcular o hash nem copiar os dados, que só são lidos
+        quando o relatório precisa ser gerado.
+        """
+        if versao is not None:
+            versao = (versao, nome_projeto, tuple(sorted(identificacao.items())))
+            with self._lock:
+                tarefa = self._tarefas.get(self._chaves_versoes.get(versao))
+                if tarefa is not None and tarefa.erro is None:
+                    self._tarefas.move_to_end(tarefa.chave)
+                    return tarefa
+
+        chave = digest_dados(riscos, modalidades, identificacao, nome_projeto)
+        with self._lock:
+            if versao is not None:
+                self._chaves_versoes[versao] = chave
+                while len(self._chaves_versoes) > 4 * self.max_relatorios:
+                    self._chaves_versoes.popitem(last=False)
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None and tarefa.erro is None:
+                self._tarefas.move_to_end(chave)
+                return tarefa
+
+            tarefa = TarefaRelatorio(chave)
+            self._tarefas[chave] = tarefa
+            self._descartar_excedentes()
+
+        # Cópia dos dados: a sessão pode alterá-los enquanto o relatório é gerado
+        dados = copy.deepcopy((riscos, list(modalidades), identificacao))
+        self._executor.submit(self._executar, tarefa, *dados, nome_projeto)
+        return tarefa
+
+    def obter(self, chave):
+        """Tarefa com a chave informada, ou None se não existir mais"""
+        with self._lock:
+            return self._tarefas.get(chave)
+
+    def _descartar_excedentes(self):
+        excedente = len(self._tarefas) - self.max_relatorios
+        for chave in [c for c, t in self._tarefas.items() if t.finalizada][:max(excedente, 0)]:
+            del self._tarefas[chave]
+
+    def _executar(self, tarefa, riscos, modalidades, identificacao, nome_projeto):
+        try:
+            tarefa.data_geracao = datetime.now()
+            tarefa.conteudo = construir_relatorio_word(
+                riscos, modalidades, nome_projeto, identificacao, progresso=tarefa.atualizar,
+                data_geracao=tarefa.data_geracao
+            )
+        except Exception as e:
+            tarefa.erro = str(e) or type(e).__name__
+        finally:
+            tarefa.concluida.set()
+
+
+GERENCIADOR_RELATORIOS = GerenciadorRelatorios()
+
+
+def nome_arquivo_relatorio(nome_projeto):
+    """Nome do .docx de um projeto (só letras, dígitos, '.', '-' e '_')"""
+    nome = re.sub(r'[^\w.-]+', '_', nome_projeto).strip('_') or 'Projeto'
+    return f"relatorio_riscos_{nome}.docx"
+
+
+def construir_relatorio_projeto(projeto_id, nome_projeto, identificacao):
+    """Relatório Word de um projeto persistido no banco (executado em um processo do pool)"""
+    riscos, modalidades = carregar_registro_riscos(projeto_id)
+    return construir_relatorio_word(riscos, modalidades, nome_projeto, identificacao)
+
+
+def gerar_relatorios_projetos(projetos, identificacao, processos=None):
+    """Gera os relatórios dos projetos [(id, nome, total de riscos)] em um pool de processos
+
+    Produz (nome do projeto, conteúdo do .docx, erro) à medida que cada relatório fica
+    pronto. Os projetos maiores são enviados primeiro, para que um projeto grande não
+    fique por último sozinho em um processo enquanto os demais já terminaram. Cada
+    processo lê o seu projeto do banco: só o id vai para o processo e só o .docx volta.
+    """
+    projetos = sorted(projetos, key=lambda projeto: projeto[2], reverse=True)
+    processos = min(processos or os.cpu_count() or 1, len(projetos))
+    if processos <= 1:
+        for projeto_id, nome, _ in projetos:
+            try:
+                yield nome, construir_relatorio_projeto(projeto_id, nome, identificacao), None
+            except Exception as e:
+                yield nome, None, f"{type(e).__name__}: {e}"
+        return
+
+    # 'spawn': os processos abrem as próprias conexões, sem herdar as do pool deste processo
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+        futuros = {
+            executor.submit(construir_relatorio_projeto, projeto_id, nome, identificacao): nome
+            for projeto_id, nome, _ in projetos
+        }
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result(), None
+            except Exception as e:
+                yield futuros[futuro], None, f"{type(e).__name__}: {e}"
+
+
+@contextmanager
+def destino_relatorios(destino):
+    """Função gravar(nome_arquivo, conteúdo) para um diretório ou um .zip
+
+    `destino` é o caminho de um diretório, o caminho de um arquivo .zip ou um arquivo
+    binário já aberto, que recebe o .zip como fluxo (inclusive a saída padrão, sem
+    posicionamento). Nomes repetidos recebem um sufixo numérico.
+    """
+    usados = set()
+
+    def nome_livre(nome):
+        base, extensao = os.path.splitext(nome)
+        candidato, n = nome, 1
+        while candidato in usados:
+            n += 1
+            candidato = f"{base}_{n}{extensao}"
+        usados.add(candidato)
+        return candidato
+
+    if isinstance(destino, str) and not destino.lower().endswith('.zip'):
+        os.makedirs(destino, exist_ok=True)
+
+        def gravar(nome, conteudo):
+            caminho = os.path.join(destino, nome_livre(nome))
+            with open(caminho, 'wb') as arquivo:
+                arquivo.write(conteudo)
+            return caminho
+
+        yield gravar
+        return
+
+    # O .docx já é compactado: os membros são apenas armazenados no .zip
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_STORED) as pacote:
+        def gravar(nome, conteudo):
+            nome = nome_livre(nome)
+            pacote.writestr(nome, conteudo)
+            return nome
+
+        yield gravar
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatórios Word de vários projetos SAROI do banco, em paralelo")
+    parser.add_argument('--saida', required=True,
+                        help="diretório, arquivo .zip ou '-' para o .zip na saída padrão")
+    parser.add_argument('--projeto', action='append', metavar='NOME',
+                        help="projeto a incluir (pode ser repetido; padrão: todos com riscos)")
+    parser.add_argument('--processos', type=int, default=None,
+                        help="processos em paralelo (padrão: número de núcleos)")
+    parser.add_argument('--nome', default='', help="responsável indicado nos relatórios")
+    parser.add_argument('--unidade', default='', help="unidade indicada nos relatórios")
+    parser.add_argument('--orgao', default='')
+    parser.add_argument('--email', default='')
+    args = parser.parse_args(argv)
+
+    if Document is None:
+        parser.error("a geração de relatórios exige a biblioteca python-docx: pip install python-docx")
+    if args.processos is not None and args.processos < 1:
+        parser.error("--processos deve ser pelo menos 1")
+
+    init_db()
+    projetos = [(projeto_id, nome, total) for projeto_id, nome, total, *_ in resumir_projetos()]
+    if args.projeto:
+        inexistentes = set(args.projeto) - {nome for _, nome, _ in projetos}
+        if inexistentes:
+            parser.error(f"projetos inexistentes: {', '.join(sorted(inexistentes))}")
+        projetos = [projeto for projeto in projetos if projeto[1] in args.projeto]
+    projetos = [projeto for projeto in projetos if projeto[2] > 0]
+    if not projetos:
+        parser.error("nenhum projeto com riscos persistidos")
+
+    identificacao = {'nome': args.nome, 'unidade': args.unidade, 'orgao': args.orgao, 'email': args.email}
+    destino = sys.stdout.buffer if args.saida == '-' else args.saida
+    inicio = time.perf_counter()
+    falhas = 0
+    with destino_relatorios(destino) as gravar:
+        for nome, conteudo, erro in gerar_relatorios_projetos(projetos, identificacao, args.processos):
+            if erro is not None:
+                falhas += 1
+                print(f"ERRO {nome}: {erro}", file=sys.stderr)
+            else:
+                arquivo = gravar(nome_arquivo_relatorio(nome), conteudo)
+                print(f"{nome}: {arquivo} ({len(conteudo) / 1024:.0f} KB)", file=sys.stderr)
+
+    print(f"{len(projetos) - falhas} de {len(projetos)} relatórios gerados em "
+          f"{time.perf_counter() - inicio:.1f} s", file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Análise de sensibilidade do ranking de modalidades (gráfico de tornado)
+
+Cada entrada da avaliação (impacto e probabilidade de cada risco e cada fator de
+mitigação aplicável) é deslocada um passo para baixo e para cima, uma de cada vez,
+e o ranking por Score é recalculado. O resultado mede a vantagem da melhor
+modalidade (seu Score menos o maior Score das demais) em cada perturbação: uma
+vantagem negativa significa que outra modalidade passa a ser a melhor.
+
+As perturbações são avaliadas em lote a partir das somas por modalidade: mudar o
+risco inerente de um risco desloca todas as somas de uma vez, e mudar um fator
+altera só a coluna da sua modalidade.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from motor_riscos import MatrizRiscos, calcular_eficacia, calcular_score
+from simulacao import niveis_adjacentes
+
+# Passo aplicado aos fatores de mitigação (o mesmo dos controles de cadastro e edição)
+PASSO_FATOR = 0.1
+
+# Elementos (perturbações x modalidades) avaliados por lote nas perturbações de risco inerente
+ELEMENTOS_POR_LOTE = int(os.environ.get('SAROI_ELEMENTOS_LOTE_SENSIBILIDADE', 250_000))
+
+# Tipos de entrada perturbada
+IMPACTO, PROBABILIDADE, FATOR = 0, 1, 2
+NOMES_TIPOS = ('Impacto', 'Probabilidade', 'Fator')
+
+
+def _scores(residual, inerente_aplicavel):
+    return calcular_score(calcular_eficacia(residual, inerente_aplicavel), residual)
+
+
+def _avaliar_inerente(residual, inerente_aplicavel, deltas, fatores_aplicaveis, aplicavel, melhor, elementos_por_lote):
+    """Vantagem e nova melhor modalidade quando o risco inerente de cada risco muda em `deltas`"""
+    n, m = aplicavel.shape
+    vantagem = np.empty(n)
+    nova_melhor = np.empty(n, dtype=int)
+    lote = max(1, elementos_por_lote // max(m, 1))
+    for inicio in range(0, n, lote):
+        fim = min(inicio + lote, n)
+        delta = deltas[inicio:fim, None]
+        scores = _scores(
+            residual + delta * fatores_aplicaveis[inicio:fim],
+            inerente_aplicavel + delta * aplicavel[inicio:fim]
+        )
+        nova_melhor[inicio:fim] = np.argmax(scores, axis=1)
+        score_melhor = scores[:, melhor].copy()
+        scores[:, melhor] = -np.inf
+        vantagem[inicio:fim] = score_melhor - scores.max(axis=1)
+    return vantagem, nova_melhor
+
+
+def _avaliar_fatores(residual, inerente_aplicavel, scores, ordem, inerente, colunas, deltas):
+    """Vantagem e nova melhor modalidade quando o fator (risco, `colunas`) muda em `deltas`
+
+    Só o Score da modalidade alterada muda, então basta compará-lo aos três maiores
+    Scores originais (ordem[0] é a melhor).
+    """
+    melhor = ordem[0]
+    segunda = ordem[1]
+    score_melhor = scores[melhor]
+    score_segunda = scores[segunda]
+    score_terceira = scores[ordem[2]] if len(ordem) > 2 else -np.inf
+
+    novo_residual = residual[colunas] + inerente * deltas
+    novo_score = _scores(novo_residual, inerente_aplicavel[colunas])
+
+    e_melhor = colunas == melhor
+    # Maior Score entre as demais modalidades (excluída a coluna alterada), com seu índice
+    rival = np.where(e_melhor, segunda, melhor)
+    score_rival = np.where(e_melhor, score_segunda, score_melhor)
+    # Em empates prevalece o menor índice, como em np.argmax
+    vence = (novo_score > score_rival) | ((novo_score == score_rival) & (colunas < rival))
+    nova_melhor = np.where(vence, colunas, rival)
+
+    # Vantagem da melhor original: contra a segunda se ela foi a alterada; senão contra
+    # o maior entre o novo Score e o melhor Score não alterado
+    outros = np.where(colunas == segunda, score_terceira, score_segunda)
+    vantagem = np.where(
+        e_melhor,
+        novo_score - score_segunda,
+        score_melhor - np.maximum(novo_score, outros)
+    )
+    return vantagem, nova_melhor
+
+
+def analisar_sensibilidade(riscos, modalidades, indices=None, matriz=None, passo_fator=PASSO_FATOR,
+                           elementos_por_lote=ELEMENTOS_POR_LOTE):
+    """Perturba cada entrada um passo para baixo e para cima e mede o efeito no ranking
+
+    Impacto e probabilidade vão aos níveis adjacentes da escala SAROI (o risco inerente
+    é reescalado na mesma proporção) e os fatores aplicáveis variam `passo_fator`,
+    limitados a [0, 1]. `indices` restringe a análise a um subconjunto de riscos e
+    `matriz` reaproveita uma MatrizRiscos já montada para `riscos` e `modalidades`.
+    """
+    if matriz is None:
+        matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+    if indices is None:
+        indices = np.arange(len(matriz))
+    indices = np.asarray(indices, dtype=int)
+
+    inerente = matriz.inerente[indices]
+    aplicavel = matriz.aplicavel[indices]
+    fatores_aplicaveis = matriz.fatores[indices] * aplicavel
+    impacto = np.fromiter((riscos[i]['impacto_valor'] for i in indices), dtype=float, count=len(indices))
+    probabilidade = np.fromiter((riscos[i]['probabilidade_valor'] for i in indices), dtype=float, count=len(indices))
+    nomes_riscos = [riscos[i]['risco_chave'] for i in indices]
+
+    residual, inerente_aplicavel = MatrizRiscos.somas(inerente, fatores_aplicaveis, aplicavel)[:2]
+    scores = _scores(residual, inerente_aplicavel)
+    ordem = np.argsort(-scores, kind='stable')
+
+    entradas = {'tipo': [], 'risco': [], 'modalidade': [], 'valor': [], 'valor_abaixo': [], 'valor_acima': [],
+                'vantagem_abaixo': [], 'vantagem_acima': [], 'melhor_abaixo': [], 'melhor_acima': []}
+
+    def registrar(tipo, risco, modalidade, valor, abaixo, acima, resultado_abaixo, resultado_acima):
+        entradas['tipo'].append(np.full(len(risco), tipo))
+        entradas['risco'].append(risco)
+        entradas['modalidade'].append(modalidade)
+        entradas['valor'].append(valor)
+        entradas['valor_abaixo'].append(abaixo)
+        entradas['valor_acima'].append(acima)
+        entradas['vantagem_abaixo'].append(resultado_abaixo[0])
+        entradas['vantagem_acima'].append(resultado_acima[0])
+        entradas['melhor_abaixo'].append(resultado_abaixo[1])
+        entradas['melhor_acima'].append(resultado_acima[1])
+
+    if len(scores) >= 2:
+        riscos_analisados = np.arange(len(indices))
+        sem_modalidade = np.full(len(indices), -1)
+        for tipo, valores in ((IMPACTO, impacto), (PROBABILIDADE, probabilidade)):
+            abaixo, acima = niveis_adjacentes(valores)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                proporcao_abaixo = np.where(valores > 0, abaixo / valores, 1.0)
+                proporcao_acima = np.where(valores > 0, acima / valores, 1.0)
+            registrar(
+                tipo, riscos_analisados, sem_modalidade, valores, abaixo, acima,
+                *(_avaliar_inerente(residual, inerente_aplicavel, inerente * (proporcao - 1),
+                                    fatores_aplicaveis, aplicavel, ordem[0], elementos_por_lote)
+                  for proporcao in (proporcao_abaixo, proporcao_acima))
+            )
+
+        linhas, colunas = np.nonzero(aplicavel)
+        fatores = fatores_aplicaveis[linhas, colunas]
+        abaixo = np.clip(fatores - passo_fator, 0.0, 1.0)
+        acima = np.clip(fatores + passo_fator, 0.0, 1.0)
+        registrar(
+            FATOR, linhas, colunas, fatores, abaixo, acima,
+            *(_avaliar_fatores(residual, inerente_aplicavel, scores, ordem, inerente[linhas], colunas, novo - fatores)
+              for novo in (abaixo, acima))
+        )
+
+    return ResultadoSensibilidade(
+        list(modalidades), nomes_riscos, scores, int(ordem[0]) if len(ordem) else -1,
+        **{chave: np.concatenate(partes) if partes else np.empty(0) for chave, partes in entradas.items()}
+    )
+
+
+class ResultadoSensibilidade:
+    """Efeito de cada entrada perturbada sobre a vantagem da melhor modalidade do ranking"""
+
+    def __init__(self, modalidades, nomes_riscos, scores, melhor, tipo, risco, modalidade, valor,
+                 valor_abaixo, valor_acima, vantagem_abaixo, vantagem_acima, melhor_abaixo, melhor_acima):
+        self.modalidades = modalidades
+        self.nomes_riscos = nomes_riscos
+        self.scores = scores
+        self.melhor = melhor
+        self.tipo = tipo.astype(int)
+        self.risco = risco.astype(int)
+        self.modalidade = modalidade.astype(int)
+        self.valor = valor
+        self.valor_abaixo = valor_abaixo
+        self.valor_acima = valor_acima
+        self.vantagem_abaixo = vantagem_abaixo
+        self.vantagem_acima = vantagem_acima
+        self.melhor_abaixo = melhor_abaixo.astype(int)
+        self.melhor_acima = melhor_acima.astype(int)
+
+        outros = np.delete(scores, melhor) if len(scores) >= 2 else np.empty(0)
+        self.vantagem = float(scores[melhor] - outros.max()) if len(outros) else np.nan
+        self.amplitude = np.maximum(np.abs(vantagem_abaixo - self.vantagem), np.abs(vantagem_acima - self.vantagem))
+        self.inverte_abaixo = self.melhor_abaixo != melhor
+        self.inverte_acima = self.melhor_acima != melhor
+
+    @property
+    def modalidade_melhor(self):
+        return self.modalidades[self.melhor] if self.melhor >= 0 else None
+
+    @property
+    def perturbacoes(self):
+        """Número de perturbações efetivas (entradas já no limite da escala não variam)"""
+        return int((self.valor_abaixo != self.valor).sum() + (self.valor_acima != self.valor).sum())
+
+    @property
+    def inversoes(self):
+        """Número de perturbações que trocam a melhor modalidade"""
+        return int(self.inverte_abaixo.sum() + self.inverte_acima.sum())
+
+    def entradas(self, limite=None, somente_inversoes=False):
+        """DataFrame das entradas, da maior para a menor amplitude (uma linha por entrada)"""
+        selecao = np.flatnonzero(self.inverte_abaixo | self.inverte_acima) if somente_inversoes \
+            else np.arange(len(self.tipo))
+        if limite is not None and limite < len(selecao):
+            selecao = selecao[np.argpartition(-self.amplitude[selecao], limite - 1)[:limite]]
+        selecao = selecao[np.argsort(-self.amplitude[selecao], kind='stable')]
+
+        modalidades = np.asarray(self.modalidades, dtype=object)
+        nova_melhor = np.where(
+            self.inverte_abaixo[selecao], self.melhor_abaixo[selecao],
+            np.where(self.inverte_acima[selecao], self.melhor_acima[selecao], -1)
+        )
+        return pd.DataFrame({
+            'Risco': np.asarray(self.nomes_riscos, dtype=object)[self.risco[selecao]],
+            'Parametro': [
+                NOMES_TIPOS[tipo] if tipo != FATOR else f"Fator - {self.modalidades[j]}"
+                for tipo, j in zip(self.tipo[selecao], self.modalidade[selecao])
+            ],
+            'Valor': self.valor[selecao],
+            'Valor_Abaixo': self.valor_abaixo[selecao],
+            'Valor_Acima': self.valor_acima[selecao],
+            'Vantagem_Abaixo': self.vantagem_abaixo[selecao],
+            'Vantagem_Acima': self.vantagem_acima[selecao],
+            'Amplitude': self.amplitude[selecao],
+            'Inverte': nova_melhor >= 0,
+            'Nova_Melhor': np.where(nova_melhor >= 0, modalidades[np.maximum(nova_melhor, 0)], ''),
+        })
@@ -0,0 +1,206 @@
+"""Simulação de Monte Carlo da incerteza do risco residual por modalidade"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from motor_riscos import MatrizRiscos
+
+# Níveis da escala SAROI de impacto e probabilidade
+ESCALA_SAROI = np.array([1, 2, 5, 8, 10], dtype=float)
+
+# Valores sorteados por lote (amostras x fatores aplicáveis): lotes pequenos cabem no cache do processador
+ELEMENTOS_POR_LOTE = int(os.environ.get('SAROI_ELEMENTOS_LOTE_SIMULACAO', 250_000))
+
+PERCENTIS_PADRAO = (5, 25, 50, 75, 95)
+
+
+def niveis_adjacentes(valores, escala=ESCALA_SAROI):
+    """Níveis imediatamente abaixo e acima de cada valor na escala (o próprio valor nas pontas)"""
+    valores = np.asarray(valores, dtype=float)
+    posicao = np.searchsorted(escala, valores)
+    abaixo = np.where(posicao > 0, escala[np.maximum(posicao - 1, 0)], valores)
+    acima_posicao = np.searchsorted(escala, valores, side='right')
+    acima = np.where(acima_posicao < len(escala), escala[np.minimum(acima_posicao, len(escala) - 1)], valores)
+    return abaixo, acima
+
+
+def amostrar_triangular(rng, minimo, moda, maximo, tamanho, dtype=np.float64):
+    """Amostras da distribuição triangular (aceita mínimo == máximo)
+
+    Usa a representação mínimo + (1 - c)·amplitude·min(U1, U2) + c·amplitude·max(U1, U2),
+    com c a posição relativa da moda, que dispensa raízes e desvios condicionais.
+    """
+    minimo, moda, maximo = (np.asarray(v, dtype=dtype) for v in (minimo, moda, maximo))
+    peso_maximo = moda - minimo
+    peso_minimo = maximo - moda
+
+    u1 = rng.random(tamanho, dtype=dtype)
+    u2 = rng.random(tamanho, dtype=dtype)
+    menor = np.minimum(u1, u2)
+    maior = np.maximum(u1, u2, out=u2)
+    menor *= peso_minimo
+    maior *= peso_maximo
+    menor += maior
+    menor += minimo
+    return menor
+
+
+def amostrar_niveis(rng, valor, abaixo, acima, espalhamento, tamanho, dtype=np.float64):
+    """Amostras discretas: o próprio nível ou, com probabilidade `espalhamento` cada, o adjacente"""
+    valor, abaixo, acima, espalhamento = (
+        np.asarray(v, dtype=dtype) for v in (valor, abaixo, acima, espalhamento)
+    )
+    u = rng.random(tamanho, dtype=dtype)
+    # Soma dos deslocamentos em vez de np.where: evita seleções com broadcast, bem mais lentas
+    return valor + (u < espalhamento) * (abaixo - valor) + (u > 1 - espalhamento) * (acima - valor)
+
+
+class ModeloIncerteza:
+    """Distribuições de impacto, probabilidade e fatores de mitigação de cada risco
+
+    Impacto e probabilidade variam entre os níveis adjacentes da escala SAROI:
+    `distribuicao='niveis'` sorteia o nível vizinho com probabilidade `espalhamento`
+    (para cada lado) e `distribuicao='triangular'` usa uma triangular contínua entre
+    os vizinhos com moda no valor avaliado (com espalhamento zero o valor fica fixo
+    nos dois casos). Cada fator de mitigação segue uma
+    triangular (`fatores_min`, fator avaliado, `fatores_max`) limitada a [0, 1].
+    Todos os parâmetros são arrays e podem ser ajustados valor a valor.
+    """
+
+    def __init__(self, impacto, probabilidade, fatores, aplicavel, modalidades,
+                 espalhamento_impacto, espalhamento_probabilidade, fatores_min, fatores_max,
+                 distribuicao='niveis'):
+        if distribuicao not in ('niveis', 'triangular'):
+            raise ValueError(f"Distribuição desconhecida: {distribuicao}")
+        self.impacto = np.asarray(impacto, dtype=float)
+        self.probabilidade = np.asarray(probabilidade, dtype=float)
+        self.fatores = np.asarray(fatores, dtype=float)
+        self.aplicavel = np.asarray(aplicavel, dtype=bool)
+        self.modalidades = list(modalidades)
+        n = len(self.impacto)
+        self.espalhamento_impacto = np.broadcast_to(np.asarray(espalhamento_impacto, dtype=float), (n,))
+        self.espalhamento_probabilidade = np.broadcast_to(np.asarray(espalhamento_probabilidade, dtype=float), (n,))
+        self.fatores_min = np.broadcast_to(np.asarray(fatores_min, dtype=float), self.fatores.shape)
+        self.fatores_max = np.broadcast_to(np.asarray(fatores_max, dtype=float), self.fatores.shape)
+        self.distribuicao = distribuicao
+
+    @classmethod
+    def de_riscos(cls, riscos, modalidades, espalhamento=0.2, amplitude_fatores=0.1, distribuicao='niveis'):
+        """Modelo com a mesma incerteza para todos os riscos, centrado nos valores avaliados"""
+        matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+        impacto = np.fromiter((r['impacto_valor'] for r in riscos), dtype=float, count=len(riscos))
+        probabilidade = np.fromiter((r['probabilidade_valor'] for r in riscos), dtype=float, count=len(riscos))
+        return cls(
+            impacto, probabilidade, matriz.fatores, matriz.aplicavel, matriz.modalidades,
+            espalhamento_impacto=espalhamento,
+            espalhamento_probabilidade=espalhamento,
+            fatores_min=np.clip(matriz.fatores - amplitude_fatores, 0.0, 1.0),
+            fatores_max=np.clip(matriz.fatores + amplitude_fatores, 0.0, 1.0),
+            distribuicao=distribuicao
+        )
+
+    def __len__(self):
+        return len(self.impacto)
+
+    def _amostrar_escala(self, rng, valores, espalhamento, tamanho, dtype):
+        abaixo, acima = niveis_adjacentes(valores)
+        if self.distribuicao == 'triangular':
+            # Sem espalhamento a triangular degenera no próprio valor
+            abaixo = np.where(espalhamento > 0, abaixo, valores)
+            acima = np.where(espalhamento > 0, acima, valores)
+            return amostrar_triangular(rng, abaixo, valores, acima, tamanho, dtype)
+        return amostrar_niveis(rng, valores, abaixo, acima, espalhamento, tamanho, dtype)
+
+    def simular_totais(self, amostras, semente=None, elementos_por_lote=ELEMENTOS_POR_LOTE):
+        """Matriz amostras x modalidades de risco residual acumulado, sorteada em lotes"""
+        rng = np.random.default_rng(semente)
+        dtype = np.float32
+        n, m = self.fatores.shape
+        linhas, colunas = np.nonzero(self.aplicavel)
+
+        # Somente os fatores aplicáveis são sorteados; a soma por modalidade é um produto de matrizes
+        indicador = np.zeros((len(linhas), m), dtype=dtype)
+        indicador[np.arange(len(linhas)), colunas] = 1
+        fatores = self.fatores[linhas, colunas]
+        fatores_min = np.minimum(self.fatores_min[linhas, colunas], fatores)
+        fatores_max = np.maximum(self.fatores_max[linhas, colunas], fatores)
+
+        totais = np.empty((amostras, m), dtype=float)
+        lote = max(1, elementos_por_lote // max(len(linhas) + 2 * n, 1))
+        for inicio in range(0, amostras, lote):
+            tamanho = min(lote, amostras - inicio)
+            impacto = self._amostrar_escala(rng, self.impacto, self.espalhamento_impacto, (tamanho, n), dtype)
+            probabilidade = self._amostrar_escala(
+                rng, self.probabilidade, self.espalhamento_probabilidade, (tamanho, n), dtype
+            )
+            inerente = impacto * probabilidade
+            fator = amostrar_triangular(rng, fatores_min, fatores, fatores_max, (tamanho, len(linhas)), dtype)
+            totais[inicio:inicio + tamanho] = (inerente[:, linhas] * fator) @ indicador
+        return totais
+
+
+def _simular_parte(modelo, amostras, semente):
+    return modelo.simular_totais(amostras, semente)
+
+
+def simular(modelo, amostras=100_000, semente=None, processos=None, percentis=PERCENTIS_PADRAO):
+    """Executa a simulação de Monte Carlo e resume as distribuições por modalidade
+
+    Com `processos` > 1 as amostras são divididas entre processos, cada um com uma
+    semente independente derivada de `semente` (resultado reprodutível).
+    """
+    if not processos or processos <= 1:
+        totais = modelo.simular_totais(amostras, semente)
+    else:
+        sementes = np.random.SeedSequence(semente).spawn(processos)
+        partes = [amostras // processos + (1 if k < amostras % processos else 0) for k in range(processos)]
+        # 'spawn' evita herdar por fork o estado das threads do servidor (Streamlit, gravação de logs)
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+            totais = np.concatenate(list(executor.map(
+                _simular_parte, [modelo] * processos, partes, sementes
+            )))
+    return ResultadoSimulacao(modelo.modalidades, totais, modelo.aplicavel.sum(axis=0), percentis)
+
+
+class ResultadoSimulacao:
+    """Distribuição simulada do risco residual acumulado de cada modalidade"""
+
+    def __init__(self, modalidades, totais, riscos_aplicaveis, percentis=PERCENTIS_PADRAO):
+        self.modalidades = list(modalidades)
+        self.totais = totais
+        self.riscos_aplicaveis = np.asarray(riscos_aplicaveis)
+        self.percentis = tuple(percentis)
+
+        self.media = totais.mean(axis=0)
+        self.desvio_padrao = totais.std(axis=0)
+        self.valores_percentis = np.percentile(totais, self.percentis, axis=0)
+
+        # Probabilidade de cada modalidade ser a de menor risco residual, entre as que têm riscos aplicáveis
+        candidatas = np.flatnonzero(self.riscos_aplicaveis > 0)
+        if len(candidatas) == 0:
+            candidatas = np.arange(len(self.modalidades))
+        melhores = candidatas[np.argmin(totais[:, candidatas], axis=1)]
+        self.probabilidade_melhor = np.bincount(melhores, minlength=len(self.modalidades)) / len(totais)
+
+    @property
+    def amostras(self):
+        return len(self.totais)
+
+    def percentil(self, p):
+        """Valores do percentil p (um dos calculados) para cada modalidade"""
+        return self.valores_percentis[self.percentis.index(p)]
+
+    def como_dataframe(self):
+        """Resumo em um DataFrame (uma linha por modalidade), ordenado pela chance de ser a melhor"""
+        df = pd.DataFrame({
+            'Modalidade': self.modalidades,
+            'Media': self.media,
+            'Desvio_Padrao': self.desvio_padrao,
+            **{f'P{p}': valores for p, valores in zip(self.percentis, self.valores_percentis)},
+            'Prob_Melhor': self.probabilidade_melhor * 100
+        })
+        return df.sort_values(['Prob_Melhor', 'Media'], ascending=[False, True], kind='stable')
@@ -0,0 +1,58 @@
+"""Configuração comum dos testes: módulos da raiz no caminho e banco SQLite temporário"""
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# CAMINHO_BANCO é lido na importação de banco_dados: os testes nunca tocam o riscos.db
+os.environ['SAROI_DB'] = os.path.join(tempfile.mkdtemp(prefix='saroi_testes_'), 'riscos.db')
+os.environ.pop('SAROI_DB_ARQUIVO_LOGS', None)
+
+ESCALA = (1, 2, 5, 8, 10)
+
+
+def criar_riscos(n, modalidades, semente=0, proporcao_aplicavel=0.7):
+    """Lista de riscos aleatórios (dicionários no formato do session_state)"""
+    from motor_riscos import calcular_risco_inerente, classificar_risco
+
+    aleatorio = random.Random(semente)
+    riscos = []
+    for i in range(n):
+        impacto = aleatorio.choice(ESCALA)
+        probabilidade = aleatorio.choice(ESCALA)
+        inerente = calcular_risco_inerente(impacto, probabilidade)
+        riscos.append({
+            'risco_chave': f"Risco {i}",
+            'descricao': f"Descrição do risco {i}",
+            'impacto_nivel': str(impacto),
+            'impacto_valor': impacto,
+            'probabilidade_nivel': str(probabilidade),
+            'probabilidade_valor': probabilidade,
+            'risco_inerente': inerente,
+            'classificacao': classificar_risco(inerente)[0],
+            'modalidades': {
+                modalidade: round(aleatorio.random(), 1)
+                for modalidade in modalidades
+                if aleatorio.random() < proporcao_aplicavel
+            },
+        })
+    return riscos
+
+
+@pytest.fixture
+def modalidades():
+    return ["Empreitada", "Contratação Integrada", "Semi-integrada", "Concessão", "PPP"]
+
+
+@pytest.fixture(scope='session')
+def banco():
+    """Módulo banco_dados com o banco temporário inicializado"""
+    import banco_dados
+
+    banco_dados.init_db()
+    return banco_dados
@@ -0,0 +1,159 @@
+"""API local: respostas das rotas, erros e validação do cache de projetos pela versão no banco"""
+import asyncio
+import json
+
+import pytest
+
+from api import ServicoApi, atender_conexao
+from conftest import criar_riscos
+from motor_riscos import ESCALAS_IMPACTO, ESCALAS_PROBABILIDADE, MatrizRiscos
+
+NIVEIS_IMPACTO = {escala['valor']: nivel for nivel, escala in ESCALAS_IMPACTO.items()}
+NIVEIS_PROBABILIDADE = {escala['valor']: nivel for nivel, escala in ESCALAS_PROBABILIDADE.items()}
+
+
+@pytest.fixture
+def projeto(banco, modalidades, request):
+    """Projeto persistido com riscos aleatórios: (id, riscos)"""
+    projeto_id = banco.obter_ou_criar_projeto(f"API {request.node.name}")
+    riscos = criar_riscos(25, modalidades, 7)
+    for risco in riscos:
+        risco['impacto_nivel'] = NIVEIS_IMPACTO[risco['impacto_valor']]
+        risco['probabilidade_nivel'] = NIVEIS_PROBABILIDADE[risco['probabilidade_valor']]
+    banco.salvar_registro_riscos(projeto_id, riscos, modalidades)
+    return projeto_id, riscos
+
+
+def requisitar(servico, metodo, alvo, corpo=b'', usuario='teste api'):
+    status, resposta, _ = asyncio.run(servico.despachar(metodo, alvo, {'x-usuario': usuario}, corpo))
+    return status, json.loads(resposta) if resposta else None
+
+
+def test_ranking_pela_conexao_http(projeto, modalidades):
+    projeto_id, riscos = projeto
+
+    async def consultar():
+        servidor = await asyncio.start_server(
+            lambda leitor, escritor: atender_conexao(ServicoApi(), leitor, escritor), '127.0.0.1', 0
+        )
+        async with servidor:
+            porta = servidor.sockets[0].getsockname()[1]
+            leitor, escritor = await asyncio.open_connection('127.0.0.1', porta)
+            escritor.write(f"GET /projetos/{projeto_id}/ranking?criterio=score HTTP/1.1\r\n"
+                           "Host: teste\r\nConnection: close\r\n\r\n".encode('latin-1'))
+            resposta = await leitor.read()
+            escritor.close()
+            return resposta
+
+    cabecalho, _, corpo = asyncio.run(consultar()).partition(b'\r\n\r\n')
+    assert cabecalho.startswith(b'HTTP/1.1 200 OK')
+    assert b'Content-Type: application/json' in cabecalho
+    dados = json.loads(corpo)
+
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar()
+    esperado = [modalidades[j] for j in resultado.ranking_score if resultado.riscos_aplicaveis[j] > 0]
+    assert dados['criterio'] == 'score'
+    assert [item['modalidade'] for item in dados['ranking']] == esperado
+    assert dados['modalidade_recomendada'] == esperado[0]
+    assert [item['posicao'] for item in dados['ranking']] == list(range(1, len(esperado) + 1))
+
+
+def test_ranking_residual_por_classificacao(projeto, modalidades):
+    projeto_id, riscos = projeto
+    status, dados = requisitar(ServicoApi(), 'GET', f"/projetos/{projeto_id}/ranking?classificacao=Alto,Médio")
+
+    assert status == 200
+    indices = [i for i, risco in enumerate(riscos) if risco['classificacao'] in ("Alto", "Médio")]
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar(indices)
+    assert dados['total_riscos'] == len(indices)
+    assert [item['modalidade'] for item in dados['ranking']] == [
+        nome for nome, _ in resultado.ordenadas(somente_aplicaveis=True)
+    ]
+    for item, (_, esperado) in zip(dados['ranking'], resultado.ordenadas(somente_aplicaveis=True)):
+        assert item['risco_residual_total'] == pytest.approx(esperado['risco_residual_total'])
+
+
+@pytest.mark.parametrize('metodo, alvo, corpo, status', [
+    ('GET', "/projetos/999999/ranking", b'', 404),
+    ('GET', "/projetos/999999", b'', 404),
+    ('GET', "/inexistente", b'', 404),
+    ('DELETE', "/projetos/{id}/ranking", b'', 405),
+    ('GET', "/projetos/{id}/ranking?criterio=outro", b'', 400),
+    ('GET', "/projetos/{id}/agregados?classificacao=Enorme", b'', 400),
+    ('GET', "/projetos/{id}/riscos?limite=0", b'', 400),
+    ('GET', "/projetos/{id}/riscos/999999", b'', 404),
+    ('POST', "/projetos/{id}/riscos", b'{"risco_chave": ', 400),
+    ('POST', "/projetos/{id}/riscos", b'[1, 2]', 400),
+    ('POST', "/projetos/{id}/riscos", b'{"risco_chave": "Sem niveis"}', 400),
+    ('POST', "/projetos/{id}/riscos",
+     '{"risco_chave": "X", "impacto_nivel": "Alto", "probabilidade_nivel": "Alta", "modalidades": {"Nenhuma": 0.5}}'
+     .encode('utf-8'), 400),
+    ('PATCH', "/projetos/{id}/riscos/{risco}", b'{"modalidades": {"Empreitada": 2}}', 400),
+])
+def test_erros_viram_json(projeto, metodo, alvo, corpo, status):
+    projeto_id, riscos = projeto
+    alvo = alvo.format(id=projeto_id, risco=riscos[0]['id'])
+    servico = ServicoApi()
+    versao = requisitar(servico, 'GET', f"/projetos/{projeto_id}")[1]['versao']
+
+    resposta = requisitar(servico, metodo, alvo, corpo)
+    assert resposta[0] == status
+    assert resposta[1]['erro']
+    # Pedidos recusados não gravam nada
+    assert requisitar(servico, 'GET', f"/projetos/{projeto_id}")[1]['versao'] == versao
+
+
+def test_alteracao_pela_api_atualiza_o_cache(banco, projeto, modalidades):
+    projeto_id, riscos = projeto
+    servico = ServicoApi()
+    antes = requisitar(servico, 'GET', f"/projetos/{projeto_id}/agregados")[1]
+    cacheado = servico.cache._projetos[projeto_id]
+    assert requisitar(servico, 'GET', f"/projetos/{projeto_id}/agregados")[1] == antes
+
+    risco_id = riscos[0]['id']
+    status, editado = requisitar(servico, 'PATCH', f"/projetos/{projeto_id}/riscos/{risco_id}",
+                                 json.dumps({'impacto_nivel': "Muito alto", 'probabilidade_nivel': "Muito alta",
+                                             'modalidades': {m: 1.0 for m in modalidades}}).encode('utf-8'))
+    assert status == 200
+    assert editado['risco_inerente'] == 100 and editado['classificacao'] == "Alto"
+
+    depois = requisitar(servico, 'GET', f"/projetos/{projeto_id}/agregados")[1]
+    # O projeto em cache foi atualizado no lugar (sem recarga) e as respostas guardadas, descartadas
+    assert servico.cache._projetos[projeto_id] is cacheado
+    assert depois['versao'] == antes['versao'] + 1
+    riscos[0].update(impacto_valor=10, probabilidade_valor=10, risco_inerente=100,
+                     modalidades={m: 1.0 for m in modalidades})
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar()
+    assert [item['risco_residual_total'] for item in depois['modalidades']] == pytest.approx(
+        list(resultado.risco_residual_total))
+
+    # Criação e remoção também valem para o cache e para o banco
+    status, criado = requisitar(servico, 'POST', f"/projetos/{projeto_id}/riscos", json.dumps(
+        {'risco_chave': "Novo", 'impacto_nivel': "Baixo", 'probabilidade_nivel': "Baixa"}).encode('utf-8'))
+    assert status == 201
+    assert requisitar(servico, 'GET', f"/projetos/{projeto_id}")[1]['total_riscos'] == len(riscos) + 1
+    assert requisitar(servico, 'DELETE', f"/projetos/{projeto_id}/riscos/{criado['id']}")[0] == 204
+    assert requisitar(servico, 'GET', f"/projetos/{projeto_id}/riscos/{criado['id']}")[0] == 404
+    registro, _ = banco.carregar_registro_riscos(projeto_id)
+    assert len(registro) == len(riscos)
+    assert registro[0]['risco_inerente'] == 100
+
+
+def test_gravacao_de_outro_processo_recarrega_o_projeto(banco, projeto, modalidades):
+    projeto_id, riscos = projeto
+    servico = ServicoApi()
+    antes = requisitar(servico, 'GET', f"/projetos/{projeto_id}/ranking")[1]
+    cacheado = servico.cache._projetos[projeto_id]
+
+    # Edição feita fora da API (como pelo dashboard): só a versão no banco avisa o cache
+    anterior = dict(riscos[1], modalidades=dict(riscos[1]['modalidades']))
+    riscos[1]['modalidades'] = {modalidades[-1]: 0.0}
+    banco.atualizar_risco_db(anterior, riscos[1])
+
+    depois = requisitar(servico, 'GET', f"/projetos/{projeto_id}/ranking")[1]
+    assert servico.cache._projetos[projeto_id] is not cacheado
+    assert depois['versao'] > antes['versao']
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar()
+    assert [item['modalidade'] for item in depois['ranking']] == [
+        nome for nome, _ in resultado.ordenadas(somente_aplicaveis=True)
+    ]
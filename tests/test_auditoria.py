@@ -0,0 +1,104 @@
+"""Auditoria por diferenças: o estado reconstruído é sempre o risco gravado"""
+import json
+import random
+
+from auditoria import (TAMANHO_MINIMO_TEXTO, aplicar_diferenca, auditar_risco, diferenca, reconstruir_estado,
+                       serializar)
+from conftest import criar_riscos
+from registro_riscos import Risco
+
+TEXTO_LONGO = "Justificativa longa o bastante para ser deduplicada no repositório de textos. " * 2
+
+
+def editar(risco, aleatorio, modalidades):
+    """Cópia do risco com alterações aleatórias em campos, fatores e justificativas"""
+    novo = json.loads(json.dumps(risco))
+    if aleatorio.random() < 0.5:
+        novo['descricao'] = TEXTO_LONGO + str(aleatorio.random())
+    if aleatorio.random() < 0.3:
+        novo.pop('impacto_nivel', None)
+    if aleatorio.random() < 0.3:
+        novo['contexto_especifico'] = None
+    for modalidade in modalidades:
+        sorteio = aleatorio.random()
+        if sorteio < 0.2:
+            novo['modalidades'].pop(modalidade, None)
+        elif sorteio < 0.5:
+            novo['modalidades'][modalidade] = round(aleatorio.random(), 1)
+    novo['justificativas_modalidades'] = {modalidade: TEXTO_LONGO for modalidade in novo['modalidades']
+                                          if aleatorio.random() < 0.5}
+    return novo
+
+
+def repositorio(*auditorias):
+    """Funções obter_estado e obter_textos sobre os objetos gravados pelas auditorias"""
+    estados, textos = {}, {}
+    for _, textos_auditoria, estados_auditoria in auditorias:
+        textos.update(textos_auditoria)
+        estados.update(estados_auditoria)
+    return estados.__getitem__, lambda chaves: {chave: textos[chave] for chave in chaves}
+
+
+def test_diferenca_aplicada_reproduz_o_novo_estado(modalidades):
+    aleatorio = random.Random(0)
+    for risco in criar_riscos(40, modalidades, 1):
+        novo = editar(risco, aleatorio, modalidades)
+        assert aplicar_diferenca(risco, diferenca(risco, novo)) == novo
+        assert diferenca(risco, risco) == {}
+
+
+def test_reconstruir_criacao_e_edicoes(modalidades):
+    aleatorio = random.Random(1)
+    for risco in criar_riscos(20, modalidades, 2):
+        criacao = auditar_risco(risco)
+        assert reconstruir_estado(criacao[0], *repositorio(criacao)) == risco
+
+        anterior = risco
+        for _ in range(3):
+            novo = editar(anterior, aleatorio, modalidades)
+            edicao = auditar_risco(novo, anterior)
+            assert reconstruir_estado(edicao[0], *repositorio(edicao)) == novo
+            anterior = novo
+
+
+def test_textos_longos_deduplicados(modalidades):
+    risco = criar_riscos(1, modalidades, 3)[0]
+    risco['descricao'] = TEXTO_LONGO
+    risco['justificativas_modalidades'] = {modalidade: TEXTO_LONGO for modalidade in modalidades}
+    detalhes, textos, estados = auditar_risco(risco)
+
+    assert len(TEXTO_LONGO) >= TAMANHO_MINIMO_TEXTO
+    assert [texto for _, texto in textos] == [TEXTO_LONGO]
+    assert TEXTO_LONGO not in estados[0][1]
+    # Estados iguais têm o mesmo hash, independentemente da ordem das chaves
+    invertido = dict(reversed(list(risco.items())))
+    assert auditar_risco(invertido)[2] == estados
+    assert serializar(risco) == serializar(invertido)
+
+
+def test_risco_compacto_igual_ao_dicionario(modalidades):
+    risco = criar_riscos(1, modalidades, 4)[0]
+    assert auditar_risco(Risco(risco))[2] == auditar_risco(dict(risco, justificativas_modalidades={}))[2]
+
+
+def test_registro_antigo_devolvido_como_esta():
+    detalhes = {'detalhes': {'risco_chave': "Antigo"}}
+    assert reconstruir_estado(detalhes, None, None) == {'risco_chave': "Antigo"}
+
+
+def test_estado_do_log_no_banco_e_no_arquivo(banco, modalidades):
+    aleatorio = random.Random(5)
+    risco = criar_riscos(1, modalidades, 6)[0]
+    novo = editar(risco, aleatorio, modalidades)
+    banco.registrar_alteracao_risco('auditoria', 'Criou risco', risco, durabilidade='sincrono')
+    banco.registrar_alteracao_risco('auditoria', 'Editou risco', novo, risco, durabilidade='sincrono')
+
+    edicao, criacao = [linha[0] for linha in banco.obter_logs(usuarios=['auditoria'])]
+    assert banco.estado_risco_log(criacao) == risco
+    assert banco.estado_risco_log(edicao) == novo
+
+    # Os registros arquivados continuam reconstruíveis (idade negativa: arquiva inclusive os de agora)
+    banco.arquivar_logs(idade_dias=-1)
+    assert not banco.obter_logs(usuarios=['auditoria'])
+    assert banco.estado_risco_log(criacao) == risco
+    assert banco.estado_risco_log(edicao) == novo
@@ -0,0 +1,223 @@
+"""Consultas do banco: log de ações (paginação por chave e arquivamento) e busca textual dos riscos"""
+from datetime import datetime, timedelta, timezone
+
+
+def inserir_logs(banco, usuario, timestamps):
+    with banco.transacao() as conn:
+        conn.executemany(
+            "INSERT INTO logs (timestamp, username, acao, detalhes) VALUES (?, ?, ?, ?)",
+            [(timestamp, usuario, f"Ação {i % 3}", '{}') for i, timestamp in enumerate(timestamps)]
+        )
+
+
+def paginar(banco, limite, **filtros):
+    """Todas as páginas de obter_logs concatenadas, seguindo o cursor (timestamp, id)"""
+    linhas = []
+    cursor = None
+    while True:
+        pagina = banco.obter_logs(cursor=cursor, limite=limite, **filtros)
+        assert len(pagina) <= limite
+        linhas.extend(pagina)
+        if len(pagina) < limite:
+            return linhas
+        cursor = (pagina[-1][1], pagina[-1][0])
+
+
+def test_paginas_cobrem_todos_os_logs_sem_repetir(banco):
+    # Vários registros no mesmo segundo: o id desempata a ordem e o cursor
+    timestamps = [f"2024-03-{1 + i // 7:02d} 10:00:00" for i in range(50)]
+    inserir_logs(banco, 'paginacao', timestamps)
+
+    completo = banco.obter_logs(usuarios=['paginacao'])
+    assert len(completo) == 50
+    assert [(t, i) for i, t, *_ in completo] == sorted(((t, i) for i, t, *_ in completo), reverse=True)
+    for limite in (1, 7, 10, 49, 50, 60):
+        assert paginar(banco, limite, usuarios=['paginacao']) == completo
+
+
+def test_paginas_com_filtros(banco):
+    inserir_logs(banco, 'filtros', [f"2024-04-{1 + i % 20:02d} 08:30:00" for i in range(40)])
+
+    filtros = {'usuarios': ['filtros'], 'acoes': ['Ação 1'], 'data_inicio': '2024-04-05', 'data_fim': '2024-04-15'}
+    completo = banco.obter_logs(**filtros)
+    assert completo
+    assert all(acao == 'Ação 1' and '2024-04-05' <= timestamp[:10] <= '2024-04-15'
+               for _, timestamp, _, acao, _ in completo)
+    assert paginar(banco, 3, **filtros) == completo
+
+
+def test_paginas_incluindo_logs_arquivados(banco):
+    agora = datetime.now(timezone.utc)
+    timestamps = [(agora - timedelta(days=400 - i * 10)).strftime('%Y-%m-%d %H:%M:%S') for i in range(30)]
+    inserir_logs(banco, 'arquivo', timestamps)
+    completo = banco.obter_logs(usuarios=['arquivo'])
+
+    assert banco.arquivar_logs(idade_dias=200) > 0
+    assert len(banco.obter_logs(usuarios=['arquivo'])) < len(completo)
+    assert banco.obter_logs(usuarios=['arquivo'], incluir_arquivo=True) == completo
+    assert paginar(banco, 4, usuarios=['arquivo'], incluir_arquivo=True) == completo
+
+
+def risco_busca(**campos):
+    return {'impacto_nivel': "Alto", 'impacto_valor': 8, 'probabilidade_nivel': "Média", 'probabilidade_valor': 5,
+            'risco_inerente': 40, 'classificacao': "Alto", **campos}
+
+
+def criar_projeto_busca(banco, nome):
+    projeto_id = banco.obter_ou_criar_projeto(nome)
+    riscos = [
+        risco_busca(risco_chave=f"{nome} - Atraso na obra", descricao="Contingência orçamentária insuficiente",
+                    modalidades={"Empreitada": 0.5}, justificativas_modalidades={"Empreitada": "Cronograma rígido"}),
+        risco_busca(risco_chave=f"{nome} - Licenciamento", descricao="Demora na licença ambiental do projeto",
+                    contexto_especifico="Área de preservação", modalidades={"Empreitada": 0.8}),
+        risco_busca(risco_chave=f"{nome} - Projeto", descricao="Falhas no projeto básico", modalidades={}),
+    ]
+    banco.salvar_registro_riscos(projeto_id, riscos, ["Empreitada"])
+    return projeto_id, [risco['id'] for risco in riscos]
+
+
+def test_busca_sem_acentos_e_por_radical(banco):
+    projeto_id, (atraso, licenca, projeto) = criar_projeto_busca(banco, "Busca")
+
+    assert banco.buscar_riscos(projeto_id, "contingenciamento") == [atraso]
+    assert banco.buscar_riscos(projeto_id, "ORCAMENTARIA") == [atraso]
+    assert banco.buscar_riscos(projeto_id, "licenças") == [licenca]
+    assert banco.buscar_riscos(projeto_id, "preservação") == [licenca]
+    assert banco.buscar_riscos(projeto_id, "cronograma") == [atraso]
+    # Todos os termos precisam estar presentes
+    assert banco.buscar_riscos(projeto_id, "licença cronograma") == []
+    assert banco.buscar_riscos(projeto_id, "  ") == []
+    # O nome do risco pesa mais que as demais colunas
+    assert banco.buscar_riscos(projeto_id, "projeto") == [projeto, licenca]
+
+
+def test_busca_isolada_por_projeto_e_atualizada(banco):
+    projeto_id, (atraso, licenca, _) = criar_projeto_busca(banco, "Busca A")
+    outro_id, _ = criar_projeto_busca(banco, "Busca B")
+    assert banco.buscar_riscos(projeto_id, "atraso") == [atraso]
+    assert len(banco.buscar_riscos(outro_id, "atraso")) == 1
+
+    anterior = risco_busca(id=atraso, risco_chave="Busca A - Atraso na obra",
+                           descricao="Contingência orçamentária insuficiente", modalidades={"Empreitada": 0.5},
+                           justificativas_modalidades={"Empreitada": "Cronograma rígido"})
+    banco.atualizar_risco_db(anterior, dict(anterior, descricao="Chuvas intensas",
+                                            justificativas_modalidades={"Empreitada": "Sazonalidade"}))
+    assert banco.buscar_riscos(projeto_id, "chuva") == [atraso]
+    assert banco.buscar_riscos(projeto_id, "sazonal") == [atraso]
+    assert banco.buscar_riscos(projeto_id, "contingência") == []
+
+    banco.adicionar_modalidade_db(projeto_id, "Integrada", 0.6, "Matriz de riscos compartilhada")
+    assert len(banco.buscar_riscos(projeto_id, "compartilhada")) == 3
+
+    banco.registrar_aspectos_riscos({"Busca A - Licenciamento": "Órgão ambiental estadual"})
+    assert banco.buscar_riscos(projeto_id, "estadual") == [licenca]
+
+    banco.remover_risco_db(licenca)
+    assert banco.buscar_riscos(projeto_id, "licença") == []
+
+
+def test_arquivar_logs_move_os_antigos(banco):
+    agora = datetime.now(timezone.utc)
+    antigos = [(agora - timedelta(days=300, hours=i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(12)]
+    recentes = [(agora - timedelta(days=3, hours=i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(5)]
+    with banco.transacao() as conn:
+        conn.executemany(
+            "INSERT INTO logs (timestamp, username, acao, detalhes) VALUES (?, 'retencao', 'Ação', ?)",
+            [(timestamp, f'{{"n": {i}}}') for i, timestamp in enumerate(antigos + recentes)]
+        )
+    completo = banco.obter_logs(usuarios=['retencao'])
+    ids_antigos = {id_log for id_log, timestamp, *_ in completo if timestamp in antigos}
+
+    assert banco.arquivar_logs(idade_dias=200, tamanho_lote=5) >= len(antigos)
+
+    with banco.conexao() as conn:
+        ativos = {linha[0] for linha in conn.execute("SELECT id FROM main.logs WHERE username = 'retencao'")}
+        arquivados = {linha[0] for linha in conn.execute("SELECT id FROM arquivo.logs WHERE username = 'retencao'")}
+    assert arquivados == ids_antigos
+    assert not ativos & arquivados
+    assert len(ativos) == len(recentes)
+
+    # Só a consulta com o arquivo vê os registros movidos, com os detalhes descompactados
+    assert [linha[1] for linha in banco.obter_logs(usuarios=['retencao'])] == sorted(recentes, reverse=True)
+    assert banco.obter_logs(usuarios=['retencao'], incluir_arquivo=True) == completo
+    assert banco.resumir_logs(usuarios=['retencao'])['total'] == len(recentes)
+    assert banco.resumir_logs(usuarios=['retencao'], incluir_arquivo=True)['total'] == len(completo)
+    assert 'retencao' in banco.listar_usuarios_logs()
+
+    # Uma segunda execução não encontra mais nada a arquivar
+    assert banco.arquivar_logs(idade_dias=200) == 0
+    assert banco.obter_logs(usuarios=['retencao'], incluir_arquivo=True) == completo
+    assert banco.resumir_logs(usuarios=['retencao'], incluir_arquivo=True)['total'] == len(completo)
+
+
+def test_arquivamento_interrompido_e_refeito(banco):
+    # Cópia feita sem a remoção (interrupção entre os dois bancos): a execução seguinte completa
+    antigo = (datetime.now(timezone.utc) - timedelta(days=400)).strftime('%Y-%m-%d %H:%M:%S')
+    inserir_logs(banco, 'interrompido', [antigo] * 3)
+    completo = banco.obter_logs(usuarios=['interrompido'])
+    id_log, timestamp, username, acao, detalhes = completo[0]
+    with banco.transacao() as conn:
+        conn.execute("INSERT INTO arquivo.logs (id, timestamp, username, acao, detalhes) VALUES (?, ?, ?, ?, ?)",
+                     (id_log, timestamp, username, acao, banco._compactar(detalhes)))
+
+    banco.arquivar_logs(idade_dias=200)
+    assert banco.obter_logs(usuarios=['interrompido']) == []
+    assert banco.obter_logs(usuarios=['interrompido'], incluir_arquivo=True) == completo
+    assert banco.resumir_logs(usuarios=['interrompido'], incluir_arquivo=True)['total'] == 3
+
+
+def contagens_resumo(banco, tabela, periodo):
+    """Contagens (ativos, arquivados) do resumo e as mesmas contagens por GROUP BY sobre os logs"""
+    chave = ", ".join((*periodo, 'username', 'acao'))
+    with banco.conexao() as conn:
+        resumo = {linha[:-2]: linha[-2:] for linha in conn.execute(
+            f"SELECT {chave}, ativos, arquivados FROM {tabela} WHERE ativos + arquivados > 0")}
+        direto = {}
+        for posicao, esquema in enumerate(('main', 'arquivo')):
+            for *grupo, total in conn.execute(
+                f"SELECT {banco._periodo_logs(periodo)}, username, acao, COUNT(*) FROM {esquema}.logs GROUP BY {chave}"
+            ):
+                contagens = list(direto.get(tuple(grupo), (0, 0)))
+                contagens[posicao] = total
+                direto[tuple(grupo)] = tuple(contagens)
+    return resumo, direto
+
+
+def conferir_resumos(banco):
+    for tabela, periodo in banco.RESUMOS_LOGS.items():
+        resumo, direto = contagens_resumo(banco, tabela, periodo)
+        assert resumo == direto, tabela
+
+    with banco.conexao() as conn:
+        por_dia = conn.execute("""SELECT dia, COUNT(*) FROM (
+                                      SELECT date(timestamp) AS dia FROM main.logs WHERE username LIKE 'resumo%'
+                                      UNION ALL
+                                      SELECT date(timestamp) FROM arquivo.logs WHERE username LIKE 'resumo%')
+                                  GROUP BY dia ORDER BY dia""").fetchall()
+    usuarios = ['resumo 1', 'resumo 2']
+    assert banco.serie_atividade_logs(usuarios=usuarios, incluir_arquivo=True) == por_dia
+    assert sum(total for _, total in banco.serie_atividade_logs(usuarios=usuarios, granularidade='hora',
+                                                                incluir_arquivo=True)) == sum(t for _, t in por_dia)
+    estatisticas = banco.resumir_logs(usuarios=usuarios, incluir_arquivo=True)
+    assert estatisticas['total'] == sum(total for _, total in por_dia)
+    assert str(estatisticas['inicio']) == por_dia[0][0] and str(estatisticas['fim']) == por_dia[-1][0]
+
+
+def test_resumos_iguais_ao_group_by_dos_logs(banco):
+    agora = datetime.now(timezone.utc)
+    with banco.transacao() as conn:
+        conn.executemany(
+            "INSERT INTO logs (timestamp, username, acao, detalhes) VALUES (?, ?, ?, NULL)",
+            [((agora - timedelta(days=i % 300, hours=i % 24)).strftime('%Y-%m-%d %H:%M:%S'),
+              f"resumo {i % 2 + 1}", f"Ação {i % 3}") for i in range(200)]
+        )
+    banco.registrar_acao('resumo 1', 'Login', durabilidade='sincrono')
+    conferir_resumos(banco)
+
+    banco.arquivar_logs(idade_dias=100, tamanho_lote=17)
+    conferir_resumos(banco)
+
+    # Remoções diretas também são descontadas dos resumos
+    with banco.transacao() as conn:
+        conn.execute("DELETE FROM logs WHERE username = 'resumo 2' AND acao = 'Ação 1'")
+    conferir_resumos(banco)
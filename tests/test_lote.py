@@ -0,0 +1,101 @@
+"""Processamento em lote de registros exportados"""
+import csv
+import json
+
+import pytest
+
+import lote
+from conftest import criar_riscos
+from exportacao import exportar_json, exportar_jsonl
+from motor_riscos import MatrizRiscos
+
+
+def exportar(caminho, riscos, modalidades):
+    with open(caminho, 'wb') as destino:
+        (exportar_jsonl if caminho.suffix == '.jsonl' else exportar_json)(riscos, modalidades, destino)
+    return str(caminho)
+
+
+def test_ranking_igual_ao_do_motor(tmp_path, modalidades):
+    riscos = criar_riscos(30, modalidades, 1)
+    esperado = MatrizRiscos.de_riscos(riscos, modalidades).agregar().ordenadas(somente_aplicaveis=True)
+
+    for extensao in ('.json', '.jsonl'):
+        resultado = lote.processar_arquivo(exportar(tmp_path / f"projeto{extensao}", riscos, modalidades))
+        assert 'erro' not in resultado
+        assert resultado['projeto'] == 'projeto'
+        assert resultado['riscos'] == 30
+        assert [dados['modalidade'] for dados in resultado['ranking']] == [nome for nome, _ in esperado]
+        for dados, (_, dados_esperados) in zip(resultado['ranking'], esperado):
+            assert dados == pytest.approx({'modalidade': dados['modalidade'], **dados_esperados})
+        assert resultado['modalidade_recomendada'] == esperado[0][0]
+
+
+def test_modalidade_sem_riscos_aplicaveis_nao_e_recomendada(tmp_path, modalidades):
+    # A modalidade sem riscos tem residual zero, mas não pode liderar o ranking
+    riscos = criar_riscos(10, modalidades[1:], 2, proporcao_aplicavel=1.0)
+    resultado = lote.processar_arquivo(exportar(tmp_path / "projeto.json", riscos, modalidades))
+
+    assert resultado['modalidade_recomendada'] != modalidades[0]
+    assert modalidades[0] not in [dados['modalidade'] for dados in resultado['ranking']]
+
+
+def test_sem_modalidade_aplicavel_nao_recomenda(tmp_path, modalidades):
+    riscos = criar_riscos(5, modalidades, 3, proporcao_aplicavel=0.0)
+    resultado = lote.processar_arquivo(exportar(tmp_path / "projeto.json", riscos, modalidades))
+    assert resultado['modalidade_recomendada'] is None
+    assert resultado['ranking'] == []
+
+
+def test_risco_inerente_e_classificacao_recalculados(tmp_path, modalidades):
+    riscos = criar_riscos(3, modalidades, 4)
+    for risco in riscos:
+        risco['impacto_valor'] = risco['probabilidade_valor'] = 10
+        risco['risco_inerente'], risco['classificacao'] = 1, "Baixo"
+    lido, _ = lote.ler_registro(exportar(tmp_path / "projeto.jsonl", riscos, modalidades))
+    lote.recalcular_riscos(lido)
+    assert [(risco['risco_inerente'], risco['classificacao']) for risco in lido] == [(100, "Alto")] * 3
+
+
+def test_arquivo_invalido_vira_erro(tmp_path):
+    caminho = tmp_path / "quebrado.json"
+    caminho.write_text("{", encoding='utf-8')
+    resultado = lote.processar_arquivo(str(caminho))
+    assert resultado['erro'].startswith('JSONDecodeError')
+    assert 'ranking' not in resultado
+
+
+def test_main_grava_csv_e_json_na_ordem_dos_arquivos(tmp_path, modalidades, capsys):
+    diretorio = tmp_path / "exportacoes"
+    (diretorio / "sub").mkdir(parents=True)
+    exportar(diretorio / "b.json", criar_riscos(8, modalidades, 5), modalidades)
+    exportar(diretorio / "sub" / "a.jsonl", criar_riscos(6, modalidades, 6), modalidades)
+    (diretorio / "ignorado.txt").write_text("", encoding='utf-8')
+
+    assert lote.listar_arquivos([str(diretorio)]) == [str(diretorio / "b.json"), str(diretorio / "sub" / "a.jsonl")]
+
+    saida_json = tmp_path / "rankings.json"
+    assert lote.main([str(diretorio), '--saida', str(saida_json), '--processos', '2']) == 0
+    resultados = json.loads(saida_json.read_text(encoding='utf-8'))
+    assert [resultado['projeto'] for resultado in resultados] == ['b', 'a']
+
+    saida_csv = tmp_path / "rankings.csv"
+    assert lote.main([str(diretorio), '--saida', str(saida_csv), '--processos', '1']) == 0
+    with open(saida_csv, encoding='utf-8', newline='') as arquivo:
+        linhas = list(csv.DictReader(arquivo))
+    assert list(linhas[0]) == lote.COLUNAS_CSV
+    assert [(linha['Projeto'], linha['Modalidade']) for linha in linhas] == [
+        (resultado['projeto'], dados['modalidade']) for resultado in resultados for dados in resultado['ranking']
+    ]
+
+
+def test_main_com_falha_retorna_1(tmp_path, capsys):
+    caminho = tmp_path / "quebrado.json"
+    caminho.write_text("[]", encoding='utf-8')
+    assert lote.main([str(caminho), '--saida', str(tmp_path / "saida.json")]) == 1
+    assert "ERRO" in capsys.readouterr().err
+
+
+def test_processos_invalidos(tmp_path):
+    with pytest.raises(SystemExit):
+        lote.main([str(tmp_path), '--processos', '0'])
@@ -0,0 +1,116 @@
+"""Cálculo vetorizado do motor de riscos contra a fórmula escalar da aba de comparação"""
+import numpy as np
+import pytest
+
+from conftest import criar_riscos
+from motor_riscos import (AgregadosModalidades, MatrizRiscos, calcular_risco_inerente, classificar_risco,
+                          classificar_riscos)
+from registro_riscos import RegistroRiscos
+
+
+def agregar_escalar(riscos, modalidades):
+    """Residual, inerente aplicável, eficácia e Score de cada modalidade, risco a risco"""
+    resultados = {}
+    for modalidade in modalidades:
+        residual = inerente_aplicavel = 0.0
+        aplicaveis = 0
+        for risco in riscos:
+            if modalidade in risco['modalidades']:
+                residual += risco['risco_inerente'] * risco['modalidades'][modalidade]
+                inerente_aplicavel += risco['risco_inerente']
+                aplicaveis += 1
+        eficacia = (inerente_aplicavel - residual) / inerente_aplicavel * 100 if inerente_aplicavel > 0 else 0.0
+        resultados[modalidade] = {
+            'risco_residual_total': residual,
+            'risco_inerente_aplicavel': inerente_aplicavel,
+            'eficacia_percentual': eficacia,
+            'classificacao': classificar_risco(residual)[0],
+            'riscos_aplicaveis': aplicaveis,
+            'score': eficacia - residual / 10,
+        }
+    return resultados
+
+
+def comparar(resultado, esperado):
+    assert len(resultado) == len(esperado)
+    for modalidade, dados in resultado.ordenadas():
+        for campo, valor in esperado[modalidade].items():
+            if isinstance(valor, float):
+                assert dados[campo] == pytest.approx(valor), (modalidade, campo)
+            else:
+                assert dados[campo] == valor, (modalidade, campo)
+
+
+@pytest.mark.parametrize('semente', range(5))
+def test_agregar_igual_a_formula_escalar(modalidades, semente):
+    riscos = criar_riscos(60, modalidades, semente)
+    comparar(MatrizRiscos.de_riscos(riscos, modalidades).agregar(), agregar_escalar(riscos, modalidades))
+
+
+def test_agregar_registro_compacto_igual_a_lista(modalidades):
+    riscos = criar_riscos(40, modalidades, 7)
+    comparar(MatrizRiscos.de_riscos(RegistroRiscos(riscos), modalidades).agregar(),
+             agregar_escalar(riscos, modalidades))
+
+
+def test_agregar_subconjunto_de_indices(modalidades):
+    riscos = criar_riscos(50, modalidades, 3)
+    indices = [1, 4, 9, 20, 33, 49]
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar(indices)
+    comparar(resultado, agregar_escalar([riscos[i] for i in indices], modalidades))
+    assert resultado.total_riscos == len(indices)
+
+
+def test_ranking_em_ordem_crescente_de_residual(modalidades):
+    riscos = criar_riscos(30, modalidades, 11)
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar()
+    residuais = [dados['risco_residual_total'] for _, dados in resultado.ordenadas()]
+    assert residuais == sorted(residuais)
+    assert resultado.ordenadas()[0][0] == modalidades[resultado.indice_melhor]
+
+
+def test_ordenadas_somente_aplicaveis_exclui_modalidade_sem_riscos(modalidades):
+    riscos = criar_riscos(20, modalidades[:-1], 5, proporcao_aplicavel=1.0)
+    resultado = MatrizRiscos.de_riscos(riscos, modalidades).agregar()
+    # Sem riscos aplicáveis o residual é zero: lidera o ranking completo, mas não o filtrado
+    assert resultado.ordenadas()[0][0] == modalidades[-1]
+    assert modalidades[-1] not in [nome for nome, _ in resultado.ordenadas(somente_aplicaveis=True)]
+
+
+def test_classificar_riscos_igual_a_escalar():
+    valores = [0, 1, 10, 10.5, 25, 25.01, 40, 100]
+    assert list(classificar_riscos(valores)) == [classificar_risco(v)[0] for v in valores]
+
+
+def test_atualizar_risco_igual_a_matriz_refeita(modalidades):
+    riscos = criar_riscos(25, modalidades, 2)
+    matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+
+    riscos[7]['impacto_valor'] = 10
+    riscos[7]['risco_inerente'] = calcular_risco_inerente(10, riscos[7]['probabilidade_valor'])
+    riscos[7]['modalidades'] = {modalidades[0]: 0.2, modalidades[3]: 0.9}
+    matriz.atualizar_risco(7, riscos[7])
+
+    refeita = MatrizRiscos.de_riscos(riscos, modalidades)
+    np.testing.assert_array_equal(matriz.inerente, refeita.inerente)
+    np.testing.assert_array_equal(matriz.fatores, refeita.fatores)
+    np.testing.assert_array_equal(matriz.aplicavel, refeita.aplicavel)
+
+
+def test_agregados_incrementais_iguais_ao_calculo_completo(modalidades):
+    riscos = criar_riscos(40, modalidades, 9)
+    agregados = AgregadosModalidades.de_riscos(riscos[:30], modalidades)
+
+    agregados.adicionar_riscos(riscos[30:])
+    agregados.remover_risco(riscos[3])
+    editado = dict(riscos[10], modalidades={modalidades[1]: 0.4})
+    agregados.atualizar_risco(riscos[10], editado)
+    agregados.adicionar_modalidade("Nova", fator_padrao=0.5)
+    agregados.remover_modalidade(modalidades[2])
+
+    atuais = [editado if i == 10 else risco for i, risco in enumerate(riscos) if i != 3]
+    for risco in atuais:
+        risco['modalidades'] = {**risco['modalidades'], "Nova": 0.5}
+    restantes = [m for m in modalidades if m != modalidades[2]] + ["Nova"]
+    assert agregados.modalidades == restantes
+    comparar(agregados.resultado(), agregar_escalar(atuais, restantes))
@@ -0,0 +1,141 @@
+"""Otimizador de modalidades contra a busca exaustiva em instâncias pequenas"""
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+import otimizacao
+from conftest import criar_riscos
+from motor_riscos import MatrizRiscos
+from otimizacao import AGRUPAMENTOS, otimizar_modalidades
+
+MODALIDADES = [f"Modalidade {j}" for j in range(7)]
+
+
+def forca_bruta(riscos, modalidades, agrupamento, k, limite_residual=None, excluidas=()):
+    """(grupos sem modalidade, residual total) ótimo, avaliando todas as seleções de k modalidades"""
+    matriz = MatrizRiscos.de_riscos(riscos, modalidades)
+    residuais = matriz.residuais
+    campo = AGRUPAMENTOS[agrupamento][1]
+    if campo is None:
+        rotulos = [0] * len(riscos)
+    elif agrupamento == 'risco':
+        rotulos = list(range(len(riscos)))
+    else:
+        rotulos = [str(risco[campo]) for risco in riscos]
+    grupos = {}
+    for i, rotulo in enumerate(rotulos):
+        grupos.setdefault(rotulo, []).append(i)
+
+    def custo(riscos_grupo, j):
+        valores = residuais[riscos_grupo, j]
+        if not matriz.aplicavel[riscos_grupo, j].any():
+            return np.inf
+        if limite_residual is not None and (valores > limite_residual).any():
+            return np.inf
+        return valores.sum()
+
+    candidatas = [j for j, modalidade in enumerate(modalidades) if modalidade not in excluidas]
+    melhor = (np.inf, np.inf)
+    for selecao in combinations(candidatas, min(k, len(candidatas))):
+        minimos = [min(custo(riscos_grupo, j) for j in selecao) for riscos_grupo in grupos.values()]
+        inviaveis = sum(np.isinf(minimos))
+        melhor = min(melhor, (inviaveis, sum(valor for valor in minimos if not np.isinf(valor))))
+    return melhor
+
+
+def valor(resultado):
+    return int((~resultado.atribuidos).sum()), resultado.residual_total
+
+
+def conferir_otimo(resultado, esperado):
+    inviaveis, total = valor(resultado)
+    assert inviaveis == esperado[0]
+    assert total == pytest.approx(esperado[1])
+
+
+@pytest.mark.parametrize('agrupamento', ['portfolio', 'classificacao', 'impacto', 'probabilidade', 'risco'])
+@pytest.mark.parametrize('k', [1, 2, 3])
+def test_otimo_igual_a_forca_bruta(agrupamento, k):
+    riscos = criar_riscos(14, MODALIDADES, 20 + k)
+    resultado = otimizar_modalidades(riscos, MODALIDADES, agrupamento, max_modalidades=k)
+
+    assert resultado.exato
+    assert len(resultado.modalidades_usadas) <= k
+    conferir_otimo(resultado, forca_bruta(riscos, MODALIDADES, agrupamento, k))
+
+
+def test_branch_and_bound_igual_a_forca_bruta(monkeypatch):
+    monkeypatch.setattr(otimizacao, 'LIMITE_ENUMERACAO', 0)
+    riscos = criar_riscos(16, MODALIDADES, 31)
+    for k in (2, 3, 4):
+        resultado = otimizar_modalidades(riscos, MODALIDADES, 'risco', max_modalidades=k, tempo_limite=30)
+        assert resultado.metodo == 'branch-and-bound'
+        assert resultado.exato
+        conferir_otimo(resultado, forca_bruta(riscos, MODALIDADES, 'risco', k))
+
+
+def test_heuristica_nunca_melhor_que_o_otimo():
+    riscos = criar_riscos(16, MODALIDADES, 32)
+    for k in (1, 2, 3):
+        resultado = otimizar_modalidades(riscos, MODALIDADES, 'risco', max_modalidades=k, metodo='heuristico')
+        assert not resultado.exato
+        assert len(resultado.modalidades_usadas) <= k
+        inviaveis, total = valor(resultado)
+        otimo = forca_bruta(riscos, MODALIDADES, 'risco', k)
+        assert inviaveis > otimo[0] or (inviaveis == otimo[0] and total >= otimo[1] - 1e-9)
+
+
+def test_restricoes_de_limite_e_exclusao():
+    riscos = criar_riscos(14, MODALIDADES, 33)
+    excluidas = MODALIDADES[:2]
+    resultado = otimizar_modalidades(riscos, MODALIDADES, 'classificacao', max_modalidades=2,
+                                     limite_residual=30, excluidas=excluidas)
+
+    assert not set(resultado.modalidades_usadas) & set(excluidas)
+    atribuidos = ~np.isnan(resultado.residual_riscos)
+    assert (resultado.residual_riscos[atribuidos] <= 30).all()
+    conferir_otimo(resultado, forca_bruta(riscos, MODALIDADES, 'classificacao', 2, 30, excluidas))
+
+
+def test_sem_limite_cada_grupo_escolhe_a_melhor():
+    riscos = criar_riscos(14, MODALIDADES, 34)
+    resultado = otimizar_modalidades(riscos, MODALIDADES, 'risco')
+    residuais = MatrizRiscos.de_riscos(riscos, MODALIDADES).residuais
+
+    assert resultado.metodo == 'direto'
+    aplicaveis = MatrizRiscos.de_riscos(riscos, MODALIDADES).aplicavel
+    np.testing.assert_allclose(resultado.residual_riscos, np.where(aplicaveis, residuais, np.inf).min(axis=1))
+    assert resultado.residual_total <= resultado.residual_modalidade_unica
+
+
+def test_modalidade_sem_riscos_aplicaveis_nao_e_escolhida():
+    # M3 não se aplica a nenhum risco: seu residual zero não pode vencer
+    riscos = [
+        {'risco_chave': "A", 'risco_inerente': 20, 'modalidades': {"M1": 0.5, "M2": 0.3}},
+        {'risco_chave': "B", 'risco_inerente': 10, 'modalidades': {"M1": 0.4}},
+    ]
+    modalidades = ["M1", "M2", "M3"]
+
+    # No portfólio, M2 se aplica a A e B não soma residual a ela (como na aba de comparação)
+    portfolio = otimizar_modalidades(riscos, modalidades)
+    assert portfolio.modalidades_usadas == ["M2"]
+    assert portfolio.residual_total == pytest.approx(6)
+    assert portfolio.modalidade_unica == "M2"
+
+    por_risco = otimizar_modalidades(riscos, modalidades, 'risco')
+    assert [modalidades[j] for j in por_risco.escolhas] == ["M2", "M1"]
+    assert por_risco.residual_total == pytest.approx(10)
+
+    com_limite = otimizar_modalidades(riscos, modalidades, limite_residual=5)
+    assert not com_limite.viavel
+    assert com_limite.modalidades_usadas == []
+
+    somente_m3 = otimizar_modalidades(riscos, modalidades, 'risco', excluidas=["M1", "M2"])
+    assert not somente_m3.atribuidos.any()
+    assert somente_m3.modalidade_unica is None
+
+
+def test_metodo_desconhecido():
+    with pytest.raises(ValueError):
+        otimizar_modalidades(criar_riscos(3, MODALIDADES), MODALIDADES, metodo='exato')
@@ -0,0 +1,96 @@
+"""Registro compacto de riscos: mesmo comportamento do dicionário de risco original"""
+import pickle
+
+from conftest import criar_riscos
+from motor_riscos import MatrizRiscos
+from registro_riscos import RegistroRiscos, Risco, como_dict
+
+
+def test_risco_equivale_ao_dicionario(modalidades):
+    for dados in criar_riscos(20, modalidades, 1):
+        dados['justificativas_modalidades'] = {modalidade: f"Justificativa {modalidade}"
+                                               for modalidade in dados['modalidades']}
+        risco = Risco(dados)
+        assert risco.como_dict() == dados
+        assert dict(risco['modalidades']) == dados['modalidades']
+        assert risco.get('contexto_especifico') is None
+        assert risco.get('contexto_especifico', '') == ''
+
+
+def test_alteracoes_de_fatores_e_campos(modalidades):
+    registro = RegistroRiscos(criar_riscos(5, modalidades, 2))
+    risco = registro[0]
+    risco['modalidades'][modalidades[0]] = 0.3
+    del risco['modalidades'][modalidades[0]]
+    risco['modalidades'] = {modalidades[1]: 0.6}
+    risco['descricao'] = "Nova descrição"
+    risco['campo_extra'] = 1
+
+    assert dict(risco['modalidades']) == {modalidades[1]: 0.6}
+    assert risco['descricao'] == "Nova descrição"
+    assert risco['campo_extra'] == 1
+    # A cópia não compartilha os fatores com o original
+    copia = risco.copy()
+    copia['modalidades'][modalidades[1]] = 0.1
+    assert risco['modalidades'][modalidades[1]] == 0.6
+
+
+def test_pickle_preserva_o_registro(modalidades):
+    registro = RegistroRiscos(criar_riscos(10, modalidades, 3))
+    restaurado = pickle.loads(pickle.dumps(registro))
+    assert isinstance(restaurado, RegistroRiscos)
+    assert [como_dict(risco) for risco in restaurado] == [como_dict(risco) for risco in registro]
+    assert all(risco._indice is restaurado.indice for risco in restaurado)
+
+
+def test_matriz_do_registro_igual_a_da_lista(modalidades):
+    riscos = criar_riscos(30, modalidades, 4)
+    compacta = MatrizRiscos.de_riscos(RegistroRiscos(riscos), modalidades)
+    original = MatrizRiscos.de_riscos(riscos, modalidades)
+    assert (compacta.inerente == original.inerente).all()
+    assert (compacta.fatores == original.fatores).all()
+    assert (compacta.aplicavel == original.aplicavel).all()
+
+
+def test_adicionar_e_remover_modalidades_como_dicionarios(modalidades):
+    riscos = criar_riscos(15, modalidades, 5)
+    registro = RegistroRiscos(riscos)
+    modelo = [dict(risco, modalidades=dict(risco['modalidades'])) for risco in riscos]
+
+    for ciclo in range(60):
+        nome = f"Temporária {ciclo}"
+        fator = None if ciclo % 3 == 0 else round(ciclo % 10 / 10, 1)
+        registro.adicionar_modalidade(nome, fator)
+        if fator is not None:
+            for risco in modelo:
+                risco['modalidades'][nome] = fator
+        # Um valor explícito prevalece sobre o padrão
+        registro[ciclo % 15]['modalidades'][nome] = 0.9
+        modelo[ciclo % 15]['modalidades'][nome] = 0.9
+        if ciclo % 4:
+            registro.remover_modalidade(nome)
+            for risco in modelo:
+                risco['modalidades'].pop(nome, None)
+
+        assert [dict(risco['modalidades']) for risco in registro] == [risco['modalidades'] for risco in modelo]
+
+    # A compactação mantém as colunas mortas limitadas
+    assert registro.indice.colunas_mortas <= max(16, len(registro.indice.ids))
+    assert all(risco._indice is registro.indice for risco in registro)
+
+
+def test_compactar_preserva_padroes_e_riscos_antigos(modalidades):
+    registro = RegistroRiscos(criar_riscos(4, modalidades, 6))
+    registro.adicionar_modalidade("Padrão", 0.5, "Justificativa padrão")
+    registro.remover_modalidade(modalidades[0])
+    antigo = registro[0]
+    antes = [como_dict(risco) for risco in registro]
+
+    registro.compactar()
+
+    assert registro.indice.colunas_mortas == 0
+    assert [como_dict(risco) for risco in registro] == antes
+    assert registro[1]['modalidades']["Padrão"] == 0.5
+    assert registro[1]['justificativas_modalidades']["Padrão"] == "Justificativa padrão"
+    # Referências obtidas antes da compactação continuam válidas
+    assert como_dict(antigo) == antes[0]
@@ -0,0 +1,43 @@
+"""Cache de relatórios Word do GerenciadorRelatorios"""
+import pytest
+
+from conftest import criar_riscos
+from relatorio import Document, GerenciadorRelatorios
+
+pytestmark = pytest.mark.skipif(Document is None, reason="python-docx não instalado")
+
+IDENTIFICACAO = {'nome': "Fulano", 'unidade': "SPU", 'orgao': "", 'email': ""}
+
+
+def concluir(tarefa):
+    assert tarefa.concluida.wait(60)
+    assert tarefa.erro is None
+    return tarefa
+
+
+def test_pedido_repetido_devolve_o_mesmo_relatorio(modalidades):
+    gerenciador = GerenciadorRelatorios(trabalhadores=1)
+    riscos = criar_riscos(6, modalidades, 1)
+    tarefa = concluir(gerenciador.solicitar(riscos, modalidades, "Projeto", IDENTIFICACAO))
+    assert tarefa.conteudo.startswith(b'PK')
+    assert tarefa.data_geracao is not None
+
+    # Mesmos dados (em outro objeto): o .docx guardado, com a data da geração original
+    repetida = gerenciador.solicitar(criar_riscos(6, modalidades, 1), list(modalidades), "Projeto", dict(IDENTIFICACAO))
+    assert repetida is tarefa
+
+    riscos[0]['descricao'] = "Outra descrição"
+    alterada = concluir(gerenciador.solicitar(riscos, modalidades, "Projeto", IDENTIFICACAO))
+    assert alterada.chave != tarefa.chave
+    assert gerenciador.solicitar(riscos, modalidades, "Outro projeto", IDENTIFICACAO).chave != alterada.chave
+
+
+def test_versao_reaproveita_a_tarefa_sem_ler_os_dados(modalidades):
+    gerenciador = GerenciadorRelatorios(trabalhadores=1)
+    riscos = criar_riscos(4, modalidades, 2)
+    tarefa = concluir(gerenciador.solicitar(riscos, modalidades, "Projeto", IDENTIFICACAO, versao=('sessao', 1, 0)))
+
+    # Com a mesma versão os dados não são lidos (nem para o hash nem para a cópia)
+    assert gerenciador.solicitar(None, None, "Projeto", IDENTIFICACAO, versao=('sessao', 1, 0)) is tarefa
+    # Outra versão com os mesmos dados cai no cache por conteúdo
+    assert gerenciador.solicitar(riscos, modalidades, "Projeto", IDENTIFICACAO, versao=('sessao', 1, 1)) is tarefa
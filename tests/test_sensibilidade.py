@@ -0,0 +1,74 @@
+"""Análise de sensibilidade contra o ranking recalculado do zero em cada perturbação"""
+import copy
+
+import numpy as np
+import pytest
+
+from conftest import criar_riscos
+from motor_riscos import MatrizRiscos, calcular_risco_inerente
+from sensibilidade import FATOR, IMPACTO, PROBABILIDADE, analisar_sensibilidade
+
+
+def scores_perturbados(riscos, modalidades, tipo, i, j, valor):
+    """Scores de todas as modalidades com uma entrada do risco i alterada para `valor`"""
+    riscos = copy.deepcopy(riscos)
+    risco = riscos[i]
+    if tipo == FATOR:
+        risco['modalidades'][modalidades[j]] = valor
+    else:
+        risco['impacto_valor' if tipo == IMPACTO else 'probabilidade_valor'] = valor
+        risco['risco_inerente'] = calcular_risco_inerente(risco['impacto_valor'], risco['probabilidade_valor'])
+    return MatrizRiscos.de_riscos(riscos, modalidades).agregar().score
+
+
+def conferir(resultado, riscos, modalidades, indices):
+    melhor = resultado.melhor
+    assert len(resultado.tipo) > 0
+    for k in range(len(resultado.tipo)):
+        i = indices[resultado.risco[k]]
+        for valor, vantagem, nova_melhor in (
+            (resultado.valor_abaixo[k], resultado.vantagem_abaixo[k], resultado.melhor_abaixo[k]),
+            (resultado.valor_acima[k], resultado.vantagem_acima[k], resultado.melhor_acima[k]),
+        ):
+            scores = scores_perturbados(riscos, modalidades, resultado.tipo[k], i, resultado.modalidade[k], valor)
+            assert vantagem == pytest.approx(scores[melhor] - np.delete(scores, melhor).max())
+            assert scores[nova_melhor] == pytest.approx(scores.max())
+
+
+@pytest.mark.parametrize('semente', range(3))
+def test_vantagens_iguais_ao_recalculo(modalidades, semente):
+    riscos = criar_riscos(12, modalidades, semente)
+    resultado = analisar_sensibilidade(riscos, modalidades)
+
+    scores = MatrizRiscos.de_riscos(riscos, modalidades).agregar().score
+    assert resultado.melhor == int(np.argmax(scores))
+    assert set(resultado.tipo) == {IMPACTO, PROBABILIDADE, FATOR}
+    conferir(resultado, riscos, modalidades, list(range(len(riscos))))
+
+
+def test_subconjunto_de_riscos_e_lotes_pequenos(modalidades):
+    riscos = criar_riscos(20, modalidades, 8)
+    indices = [0, 3, 4, 11, 19]
+    subconjunto = [riscos[i] for i in indices]
+    resultado = analisar_sensibilidade(riscos, modalidades, indices=indices, elementos_por_lote=len(modalidades))
+
+    assert resultado.nomes_riscos == [risco['risco_chave'] for risco in subconjunto]
+    conferir(resultado, subconjunto, modalidades, list(range(len(indices))))
+
+
+def test_inversoes_e_entradas(modalidades):
+    riscos = criar_riscos(10, modalidades, 4)
+    resultado = analisar_sensibilidade(riscos, modalidades)
+    entradas = resultado.entradas()
+
+    assert len(entradas) == len(resultado.tipo)
+    assert list(entradas['Amplitude']) == sorted(entradas['Amplitude'], reverse=True)
+    assert int(entradas['Inverte'].sum()) == int((resultado.inverte_abaixo | resultado.inverte_acima).sum())
+    assert len(resultado.entradas(limite=3)) == 3
+    assert resultado.entradas(somente_inversoes=True)['Inverte'].all()
+
+
+def test_uma_modalidade_sem_perturbacoes(modalidades):
+    resultado = analisar_sensibilidade(criar_riscos(5, modalidades[:1], 2), modalidades[:1])
+    assert len(resultado.tipo) == 0
+    assert np.isnan(resultado.vantagem)